@@ -0,0 +1,48 @@
+"""add text search indexes
+
+Revision ID: 16d150137a4b
+Revises: ac32c8def835
+Create Date: 2026-10-18 10:12:41.208374
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "16d150137a4b"
+down_revision = "ac32c8def835"
+branch_labels = None
+depends_on = None
+
+SEARCHABLE_COLUMNS = [
+    ("songs", "name"),
+    ("songs", "genre"),
+    ("albums", "name"),
+    ("albums", "genre"),
+    ("playlists", "name"),
+    ("artists", "name"),
+]
+
+
+def search_vector(column):
+    # Must match src.database.search.search_vector for the indexes to be used
+    return sa.text(
+        "to_tsvector('simple', "
+        f"regexp_replace({column}, '[[:punct:][:space:]]+', ' ', 'g'))"
+    )
+
+
+def upgrade():
+    for table, column in SEARCHABLE_COLUMNS:
+        op.create_index(
+            f"ix_{table}_{column}_search",
+            table,
+            [search_vector(column)],
+            postgresql_using="gin",
+        )
+
+
+def downgrade():
+    for table, column in SEARCHABLE_COLUMNS:
+        op.drop_index(f"ix_{table}_{column}_search", table_name=table)
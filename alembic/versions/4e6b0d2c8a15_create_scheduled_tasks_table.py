@@ -0,0 +1,29 @@
+"""create scheduled_tasks table
+
+Revision ID: 4e6b0d2c8a15
+Revises: 7f3a9c1e5b62
+Create Date: 2026-10-18 19:41:07.362518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "4e6b0d2c8a15"
+down_revision = "7f3a9c1e5b62"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "scheduled_tasks",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("last_run", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade():
+    op.drop_table("scheduled_tasks")
@@ -0,0 +1,45 @@
+"""add score aggregates to albums
+
+Revision ID: 5a3f13dfdf41
+Revises: 16d150137a4b
+Create Date: 2026-10-18 11:02:17.593120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5a3f13dfdf41"
+down_revision = "16d150137a4b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "albums",
+        sa.Column("score_sum", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column(
+        "albums",
+        sa.Column("score_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.execute(
+        """
+        UPDATE albums SET
+            score_sum = aggregates.score_sum,
+            score_count = aggregates.score_count
+        FROM (
+            SELECT album_id, COALESCE(SUM(score), 0) AS score_sum,
+                COUNT(score) AS score_count
+            FROM reviews GROUP BY album_id
+        ) AS aggregates
+        WHERE albums.id = aggregates.album_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_column("albums", "score_count")
+    op.drop_column("albums", "score_sum")
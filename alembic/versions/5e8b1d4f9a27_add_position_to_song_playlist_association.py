@@ -0,0 +1,52 @@
+"""add position to song_playlist_association
+
+Revision ID: 5e8b1d4f9a27
+Revises: 9d2f6a1c7e43
+Create Date: 2026-10-18 18:41:52.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5e8b1d4f9a27"
+down_revision = "9d2f6a1c7e43"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "song_playlist_association",
+        sa.Column("position", sa.BigInteger(), nullable=True),
+    )
+    # Existing playlists keep the order they were listed in, by song id
+    op.execute(
+        """
+        UPDATE song_playlist_association AS entry
+        SET position = numbered.position
+        FROM (
+            SELECT playlist_id, song_id,
+                   row_number() OVER (PARTITION BY playlist_id ORDER BY song_id) * 1024
+                   AS position
+            FROM song_playlist_association
+        ) AS numbered
+        WHERE entry.playlist_id = numbered.playlist_id
+          AND entry.song_id = numbered.song_id
+        """
+    )
+    op.alter_column("song_playlist_association", "position", nullable=False)
+    op.create_index(
+        "ix_song_playlist_association_position",
+        "song_playlist_association",
+        ["playlist_id", "position"],
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_song_playlist_association_position",
+        table_name="song_playlist_association",
+    )
+    op.drop_column("song_playlist_association", "position")
@@ -0,0 +1,42 @@
+"""add trigram search indexes
+
+Revision ID: 7f3a9c1e5b62
+Revises: b4c7e2a9d1f3
+Create Date: 2026-10-18 21:04:37.519826
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7f3a9c1e5b62"
+down_revision = "b4c7e2a9d1f3"
+branch_labels = None
+depends_on = None
+
+SEARCHABLE_COLUMNS = [
+    ("songs", "name"),
+    ("songs", "genre"),
+    ("albums", "name"),
+    ("albums", "genre"),
+    ("playlists", "name"),
+    ("artists", "name"),
+]
+
+
+def upgrade():
+    # Backs the substring ILIKE of src.database.search.matches
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, column in SEARCHABLE_COLUMNS:
+        op.create_index(
+            f"ix_{table}_{column}_trgm",
+            table,
+            [sa.text(f"{column} gin_trgm_ops")],
+            postgresql_using="gin",
+        )
+
+
+def downgrade():
+    for table, column in SEARCHABLE_COLUMNS:
+        op.drop_index(f"ix_{table}_{column}_trgm", table_name=table)
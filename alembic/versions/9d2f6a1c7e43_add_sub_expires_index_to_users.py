@@ -0,0 +1,29 @@
+"""add sub_expires index to users
+
+Revision ID: 9d2f6a1c7e43
+Revises: 3c9e7b2a41d6
+Create Date: 2026-10-18 17:02:13.530417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9d2f6a1c7e43"
+down_revision = "3c9e7b2a41d6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_users_sub_expires",
+        "users",
+        ["sub_expires"],
+        postgresql_where=sa.text("sub_expires IS NOT NULL"),
+    )
+
+
+def downgrade():
+    op.drop_index("ix_users_sub_expires", table_name="users")
@@ -0,0 +1,27 @@
+"""add album parent index to comments
+
+Revision ID: b4c7e2a9d1f3
+Revises: 5e8b1d4f9a27
+Create Date: 2026-10-18 19:26:08.611942
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "b4c7e2a9d1f3"
+down_revision = "5e8b1d4f9a27"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_comments_album_parent",
+        "comments",
+        ["album_id", "parent_id", "id"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_comments_album_parent", table_name="comments")
@@ -0,0 +1,2 @@
+"""Benchmarks of the application, run as scripts, e.g.
+`python -m benchmarks.startup`. They are not part of the tests."""
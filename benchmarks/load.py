@@ -0,0 +1,350 @@
+"""Load test of the hot paths of the API.
+
+Usage:
+    python -m benchmarks.load [--scenario NAME ...] [--requests N]
+                              [--warmup N] [--concurrency N] [--workers N]
+                              [--url URL] [--seed SEED] [--output FILE]
+    python -m benchmarks.load --compare BEFORE AFTER
+
+Runs the scenarios of benchmarks/scenarios.py one after the other against
+the test database, filled by benchmarks.seed. Like the seed it runs with
+TESTING=1, and it starts the server as production does (python -m src.server)
+in the same environment, so that it uses the Firebase mocks and that database.
+It turns the entity cache on as production has it, and its workers listen to
+each other's invalidations. The periodic tasks of src/scheduler.py (e.g. the
+background jobs) do not run with TESTING, so they are not measured.
+With --url it sends the requests to a server already running instead. The
+requests are the same for the same seed and sizes of the data.
+
+For each scenario it reports the latencies (median, 95th and 99th
+percentiles), the requests per second and the statements each request sent
+to the database, from the X-DB-Queries and Server-Timing headers. With
+--output the results are written as JSON along with the commit they ran on,
+and --compare prints the changes between two of those files.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+import httpx
+
+from .scenarios import SCENARIOS, Request
+from src.constants import TESTING
+from src.database.access import engine
+
+from .seed import Sizes
+
+API_PREFIX = "/api/v3"
+
+# Seconds the server has to start answering
+STARTUP_TIMEOUT = 60
+
+_DB_TIME = re.compile(r"\bdb;dur=([0-9.]+)")
+
+# Compared by --compare, with the unit they are printed in
+COMPARED = (
+    ("p50", "ms"),
+    ("p95", "ms"),
+    ("p99", "ms"),
+    ("rps", ""),
+    ("queries_mean", ""),
+)
+
+
+class Sample(NamedTuple):
+    seconds: float
+    status: int
+    queries: Optional[int]
+    db_seconds: Optional[float]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, log):
+    """Starts the application in a server of its own, returns the process and
+    the url it answers at"""
+    port = _free_port()
+    env = {
+        **os.environ,
+        # TESTING turns the cache off, production has it on
+        "ENTITY_CACHE_ENABLED": os.environ.get("ENTITY_CACHE_ENABLED", "1"),
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "src.server", "--host", "127.0.0.1"]
+        + ["--port", str(port), "--workers", str(workers)],
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+def wait_until_up(url: str, process: subprocess.Popen, headers: dict):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited with code {process.returncode}")
+        try:
+            response = httpx.get(f"{url}{API_PREFIX}/health/db", headers=headers)
+            if response.status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"The server did not start in {STARTUP_TIMEOUT} seconds")
+
+
+def run_scenario(
+    url: str,
+    headers: dict,
+    name: str,
+    sizes: Sizes,
+    rng: random.Random,
+    requests: int,
+    concurrency: int,
+) -> List[Sample]:
+    """Sends about `requests` requests of the scenario from `concurrency`
+    clients, more if the last ones came in a list"""
+    requests_of = SCENARIOS[name](rng, sizes)
+    lock = threading.Lock()
+    remaining = [requests]
+    samples: List[Sample] = []
+
+    def send(http: httpx.Client, request: Request) -> Sample:
+        start = time.perf_counter()
+        response = http.request(
+            request.method,
+            request.path,
+            params=request.params,
+            json=request.json,
+            headers={"uid": request.uid},
+        )
+        seconds = time.perf_counter() - start
+        queries = response.headers.get("X-DB-Queries")
+        db_time = _DB_TIME.search(response.headers.get("Server-Timing", ""))
+        return Sample(
+            seconds,
+            response.status_code,
+            int(queries) if queries is not None else None,
+            float(db_time.group(1)) / 1000 if db_time else None,
+        )
+
+    def client():
+        with httpx.Client(base_url=f"{url}{API_PREFIX}", headers=headers) as http:
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    batch = next(requests_of)
+                    if isinstance(batch, Request):
+                        batch = [batch]
+                    remaining[0] -= len(batch)
+                sent = [send(http, request) for request in batch]
+                with lock:
+                    samples.extend(sent)
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        for future in [executor.submit(client) for _ in range(concurrency)]:
+            future.result()
+    return samples
+
+
+def percentile(values: List[float], percent: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+def summarize(samples: List[Sample], elapsed: float) -> dict:
+    times = [sample.seconds * 1000 for sample in samples]
+    queries = [sample.queries for sample in samples if sample.queries is not None]
+    db_times = [
+        sample.db_seconds * 1000 for sample in samples if sample.db_seconds is not None
+    ]
+    return {
+        "requests": len(samples),
+        "errors": sum(sample.status >= 400 for sample in samples),
+        "rps": len(samples) / elapsed,
+        "mean": statistics.mean(times),
+        "p50": percentile(times, 50),
+        "p95": percentile(times, 95),
+        "p99": percentile(times, 99),
+        "max": max(times),
+        "queries_mean": statistics.mean(queries) if queries else None,
+        "queries_max": max(queries) if queries else None,
+        "db_mean": statistics.mean(db_times) if db_times else None,
+    }
+
+
+def _commit() -> Optional[str]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], check=True, capture_output=True, text=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def _number(value, unit: str = "") -> str:
+    return "-" if value is None else f"{value:.1f}{unit}"
+
+
+def print_results(scenarios: Dict[str, dict]):
+    print(
+        f"{'scenario':<22} {'requests':>8} {'errors':>6} {'rps':>7} "
+        f"{'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8} {'db':>8}"
+    )
+    for name, result in scenarios.items():
+        print(
+            f"{name:<22} {result['requests']:>8} {result['errors']:>6} "
+            f"{result['rps']:>7.1f} {_number(result['p50'], 'ms'):>8} "
+            f"{_number(result['p95'], 'ms'):>8} {_number(result['p99'], 'ms'):>8} "
+            f"{_number(result['queries_mean']):>8} "
+            f"{_number(result['db_mean'], 'ms'):>8}"
+        )
+
+
+def compare(before: dict, after: dict):
+    """Prints the changes of the scenarios both results have"""
+    print(f"before: {before.get('commit')}, after: {after.get('commit')}")
+    if before.get("sizes") != after.get("sizes"):
+        print("The results were taken on data of different sizes")
+    print(f"{'scenario':<22} {'':<12} {'before':>10} {'after':>10} {'change':>8}")
+    for name, old in before["scenarios"].items():
+        new = after["scenarios"].get(name)
+        if new is None:
+            continue
+        for metric, unit in COMPARED:
+            if old[metric] is None or new[metric] is None:
+                continue
+            change = (
+                f"{(new[metric] - old[metric]) / old[metric] * 100:+.0f}%"
+                if old[metric]
+                else ""
+            )
+            print(
+                f"{name:<22} {metric:<12} {_number(old[metric], unit):>10} "
+                f"{_number(new[metric], unit):>10} {change:>8}"
+            )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load")
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="run only these, all of them by default",
+    )
+    parser.add_argument("--requests", type=int, default=1000, help="per scenario")
+    parser.add_argument(
+        "--warmup", type=int, default=100, help="requests per scenario not measured"
+    )
+    parser.add_argument("--concurrency", type=int, default=8, help="clients")
+    parser.add_argument("--workers", type=int, default=2, help="of the server")
+    parser.add_argument("--url", help="of a server already running")
+    parser.add_argument("--seed", type=int, default=0, help="of the requests")
+    parser.add_argument("--role", default="listener", help="of the requesters")
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="results to compare"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.compare:
+        with open(args.compare[0]) as before, open(args.compare[1]) as after:
+            compare(json.load(before), json.load(after))
+        return
+
+    if not TESTING:
+        raise SystemExit("Run it with TESTING=1, on the data of benchmarks.seed")
+    sizes = Sizes.measure(engine)
+    engine.dispose()
+    if not sizes.users:
+        raise SystemExit("The database is empty, fill it with benchmarks.seed")
+
+    headers = {"api_key": os.environ.get("API_KEY", "key"), "role": args.role}
+    process = None
+    log = tempfile.NamedTemporaryFile(prefix="benchmark-server-", suffix=".log")
+    url = args.url
+    scenarios = {}
+    try:
+        if url is None:
+            process, url = start_server(args.workers, log)
+            wait_until_up(url, process, headers)
+
+        for name in args.scenario or SCENARIOS:
+            warmup = random.Random(f"{args.seed}-{name}-warmup")
+            run_scenario(
+                url, headers, name, sizes, warmup, args.warmup, args.concurrency
+            )
+            rng = random.Random(f"{args.seed}-{name}")
+            start = time.perf_counter()
+            samples = run_scenario(
+                url, headers, name, sizes, rng, args.requests, args.concurrency
+            )
+            scenarios[name] = summarize(samples, time.perf_counter() - start)
+    except Exception:
+        if process is not None:
+            log.seek(0)
+            sys.stderr.write(log.read().decode(errors="replace")[-5000:])
+        raise
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        log.close()
+
+    print_results(scenarios)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "commit": _commit(),
+                    "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "settings": {
+                        "requests": args.requests,
+                        "warmup": args.warmup,
+                        "concurrency": args.concurrency,
+                        "workers": None if args.url else args.workers,
+                        "seed": args.seed,
+                        "role": args.role,
+                    },
+                    "sizes": sizes._asdict(),
+                    "scenarios": scenarios,
+                },
+                file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
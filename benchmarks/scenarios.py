@@ -0,0 +1,135 @@
+"""Scenarios of the load tests of benchmarks.load, over the data of
+benchmarks.seed.
+
+A scenario is a generator of the requests to send, each of them as made by a
+random user, or of lists of them that a client sends one after the other.
+The writes leave the database as they found it where they can: a song added
+to the favorites is removed by the next request of the same client.
+"""
+import random
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Union
+
+from .seed import SONGS_PER_ALBUM, WORDS, Sizes, blocked, premium_users, uid
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    uid: str
+    params: Optional[dict] = None
+    json: Optional[dict] = None
+
+
+def _user(rng: random.Random, sizes: Sizes) -> str:
+    return uid(rng.randrange(sizes.users))
+
+
+def _premium_user(rng: random.Random, sizes: Sizes) -> str:
+    # Can play every song, so that no write is refused for its subscription
+    return uid(rng.choice(premium_users(sizes.users)))
+
+
+def _visible(rng: random.Random, amount: int) -> int:
+    """Id of an album or song that is not blocked"""
+    while True:
+        resource_id = rng.randint(1, amount)
+        if not blocked(resource_id):
+            return resource_id
+
+
+def _visible_album(rng: random.Random, sizes: Sizes) -> int:
+    # The songs of a blocked album are not shown either
+    return _visible(rng, sizes.albums)
+
+
+def _visible_song(rng: random.Random, sizes: Sizes) -> int:
+    while True:
+        song_id = _visible(rng, sizes.songs)
+        if not blocked((song_id - 1) // SONGS_PER_ALBUM + 1):
+            return song_id
+
+
+def search_songs(rng: random.Random, sizes: Sizes) -> Iterator[Request]:
+    while True:
+        yield Request(
+            "GET",
+            "/songs/",
+            _user(rng, sizes),
+            params={"name": rng.choice(WORDS), "limit": 20},
+        )
+
+
+def album(rng: random.Random, sizes: Sizes) -> Iterator[Request]:
+    while True:
+        yield Request("GET", f"/albums/{_visible_album(rng, sizes)}", _user(rng, sizes))
+
+
+def playlist(rng: random.Random, sizes: Sizes) -> Iterator[Request]:
+    while True:
+        playlist_id = rng.randint(1, sizes.playlists)
+        yield Request("GET", f"/playlists/{playlist_id}", _user(rng, sizes))
+
+
+def _favorites(kind: str):
+    def scenario(rng: random.Random, sizes: Sizes) -> Iterator[Request]:
+        while True:
+            user = _user(rng, sizes)
+            yield Request("GET", f"/users/{user}/favorites/{kind}/", user)
+
+    scenario.__name__ = f"favorite_{kind}"
+    return scenario
+
+
+favorite_songs = _favorites("songs")
+favorite_albums = _favorites("albums")
+favorite_playlists = _favorites("playlists")
+
+
+def comments(rng: random.Random, sizes: Sizes) -> Iterator[Request]:
+    while True:
+        yield Request(
+            "GET",
+            f"/albums/{_visible_album(rng, sizes)}/comments/",
+            _user(rng, sizes),
+        )
+
+
+def favorite_song_writes(rng: random.Random, sizes: Sizes) -> Iterator[List[Request]]:
+    """Adds a song to the favorites of a user and removes it again"""
+    while True:
+        user = _premium_user(rng, sizes)
+        params = {"song_id": _visible_song(rng, sizes)}
+        path = f"/users/{user}/favorites/songs/"
+        yield [
+            Request("POST", path, user, params=params),
+            Request("DELETE", path, user, params=params),
+        ]
+
+
+def comment_writes(rng: random.Random, sizes: Sizes) -> Iterator[Request]:
+    """Comments albums. Unlike the other writes, they stay"""
+    while True:
+        yield Request(
+            "POST",
+            f"/albums/{_visible_album(rng, sizes)}/comments/",
+            _user(rng, sizes),
+            json={"text": " ".join(rng.choice(WORDS) for _ in range(12))},
+        )
+
+
+Scenario = Callable[[random.Random, Sizes], Iterator[Union[Request, List[Request]]]]
+
+SCENARIOS: Dict[str, Scenario] = {
+    scenario.__name__: scenario
+    for scenario in (
+        search_songs,
+        album,
+        playlist,
+        favorite_songs,
+        favorite_albums,
+        favorite_playlists,
+        comments,
+        favorite_song_writes,
+        comment_writes,
+    )
+}
@@ -0,0 +1,412 @@
+"""Data for the load tests of benchmarks.load.
+
+Usage:
+    python -m benchmarks.seed [--scale SCALE] [--seed SEED]
+
+Drops the tables of the test database (TEST_POSTGRES_URL, it only runs with
+TESTING=1), creates them again and fills them with generated rows, the same
+ones for the same scale and seed:
+
+    users        100k                 songs        1M, 10 for each album
+    artists      50k                  albums       100k
+    playlists    50k, 20 songs each   favorites    10 songs, 2 albums and
+    reviews      5 for each user                   1 playlist for each user
+    comments     5 for each album, in threads
+
+times the scale, so --scale 0.01 makes a database of a thousand users that
+loads in seconds. The rows are loaded with COPY and the tables analyzed
+afterwards, as the planner would find them in production.
+
+The ids are predictable, so that the scenarios pick rows without asking the
+database: users are user_0 to user_{n - 1} and the rest count from 1. Every
+tenth user is a premium subscriber (see `premium_users`) and one in a hundred
+albums and songs is blocked (see `blocked`), so that the scenarios can stick to
+what their requesters may see.
+"""
+import argparse
+import csv
+import datetime
+import io
+import json
+import random
+import sys
+import time
+from typing import Iterable, Iterator, NamedTuple, Sequence
+
+import sqlalchemy as sa
+
+import src.schemas  # noqa: F401, the models import it
+from src.database import models  # noqa: F401, so that Base knows every table
+from src.constants import TESTING
+from src.database.access import Base, engine
+
+# At scale 1
+USERS = 100_000
+ARTISTS = 50_000
+ALBUMS = 100_000
+SONGS_PER_ALBUM = 10
+PLAYLISTS = 50_000
+SONGS_PER_PLAYLIST = 20
+FAVORITE_SONGS = 10
+FAVORITE_ALBUMS = 2
+FAVORITE_PLAYLISTS = 1
+REVIEWS = 5
+COMMENTS = 5
+
+# Spacing of the positions of the songs of a playlist, as PlaylistModel does
+POSITION_GAP = 1024
+
+# Rows sent in each COPY
+CHUNK = 50_000
+
+# Words of the names, few enough that searching one matches many songs
+WORDS = (
+    "love night heart fire dream light blue rain summer road home city "
+    "dance wild gold river star moon sun time girl boy world song baby "
+    "shadow storm ocean young free lost"
+).split()
+GENRES = ("rock", "pop", "jazz", "blues", "metal", "folk", "reggae", "tango")
+LOCATIONS = ("Buenos Aires", "Rosario", "Cordoba", "Mendoza", "Salta")
+
+EPOCH = datetime.datetime(2022, 1, 1)
+# Of every subscription, so that none expires between two runs
+SUBSCRIPTION_EXPIRES = datetime.datetime(2100, 1, 1)
+
+
+class Sizes(NamedTuple):
+    users: int
+    artists: int
+    albums: int
+    songs: int
+    playlists: int
+
+    @classmethod
+    def scaled(cls, scale: float) -> "Sizes":
+        def scaled(amount):
+            return max(1, round(amount * scale))
+
+        albums = scaled(ALBUMS)
+        return cls(
+            users=scaled(USERS),
+            artists=scaled(ARTISTS),
+            albums=albums,
+            songs=albums * SONGS_PER_ALBUM,
+            playlists=scaled(PLAYLISTS),
+        )
+
+    @classmethod
+    def measure(cls, engine: sa.engine.Engine) -> "Sizes":
+        """Sizes of the data of a seeded database"""
+        with engine.connect() as connection:
+            return cls(
+                *(
+                    connection.execute(
+                        sa.text(f"SELECT count(*) FROM {table}")
+                    ).scalar()
+                    for table in cls._fields
+                )
+            )
+
+
+def uid(index: int) -> str:
+    return f"user_{index}"
+
+
+def premium_users(users: int) -> range:
+    """Indexes of the users with the highest subscription, which can play
+    every song"""
+    return range(0, users, 10)
+
+
+def blocked(resource_id: int) -> bool:
+    """Whether the album or song is blocked, one in a hundred"""
+    return resource_id % 100 == 0
+
+
+def words(rng: random.Random, amount: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(amount))
+
+
+def users(rng: random.Random, sizes: Sizes) -> Iterator[tuple]:
+    premium = premium_users(sizes.users)
+    for i in range(sizes.users):
+        sub_level = 2 if i in premium else rng.choice((0, 0, 1))
+        yield (
+            uid(i),
+            words(rng, 2).title(),
+            sub_level,
+            SUBSCRIPTION_EXPIRES if sub_level else None,
+            rng.choice(LOCATIONS),
+            rng.choice(GENRES),
+        )
+
+
+def artists(sizes: Sizes) -> Iterator[tuple]:
+    # Unique, and searchable by the number
+    for i in range(sizes.artists):
+        yield (f"artist {i}",)
+
+
+def creator(rng: random.Random, sizes: Sizes) -> str:
+    # A tenth of the users create all the albums
+    return uid(rng.randrange(0, sizes.users, 10))
+
+
+def albums(rng: random.Random, sizes: Sizes, creators: list) -> Iterator[tuple]:
+    for album_id in range(1, sizes.albums + 1):
+        yield (
+            album_id,
+            words(rng, 2).title(),
+            words(rng, 8),
+            blocked(album_id),
+            rng.choice(GENRES),
+            f"https://example.com/albums/{album_id}",
+            creators[album_id - 1],
+        )
+
+
+def songs(rng: random.Random, sizes: Sizes, creators: list) -> Iterator[tuple]:
+    for song_id in range(1, sizes.songs + 1):
+        album_id = (song_id - 1) // SONGS_PER_ALBUM + 1
+        yield (
+            song_id,
+            words(rng, rng.randint(1, 3)).title(),
+            words(rng, 8),
+            blocked(song_id),
+            rng.choice(GENRES),
+            f"https://example.com/songs/{song_id}",
+            rng.choice((0, 0, 0, 1, 2)),
+            album_id,
+            creators[album_id - 1],
+        )
+
+
+def song_artists(rng: random.Random, sizes: Sizes) -> Iterator[tuple]:
+    for song_id in range(1, sizes.songs + 1):
+        amount = 2 if rng.random() < 0.2 else 1
+        for artist in rng.sample(range(sizes.artists), min(amount, sizes.artists)):
+            yield (f"artist {artist}", song_id)
+
+
+def playlists(rng: random.Random, sizes: Sizes) -> Iterator[tuple]:
+    for playlist_id in range(1, sizes.playlists + 1):
+        yield (
+            playlist_id,
+            words(rng, 2).title(),
+            words(rng, 8),
+            False,
+            uid(rng.randrange(sizes.users)),
+        )
+
+
+def playlist_songs(rng: random.Random, sizes: Sizes) -> Iterator[tuple]:
+    amount = min(SONGS_PER_PLAYLIST, sizes.songs)
+    for playlist_id in range(1, sizes.playlists + 1):
+        picked = rng.sample(range(1, sizes.songs + 1), amount)
+        for position, song_id in enumerate(picked, start=1):
+            yield (playlist_id, song_id, position * POSITION_GAP)
+
+
+def colabs(rng: random.Random, sizes: Sizes) -> Iterator[tuple]:
+    for playlist_id in range(1, sizes.playlists + 1):
+        if rng.random() < 0.1:
+            yield (uid(rng.randrange(sizes.users)), playlist_id)
+
+
+def favorites(
+    rng: random.Random, sizes: Sizes, amount: int, total: int
+) -> Iterator[tuple]:
+    amount = min(amount, total)
+    for i in range(sizes.users):
+        for resource_id in rng.sample(range(1, total + 1), amount):
+            yield (uid(i), resource_id)
+
+
+def reviews(rng: random.Random, sizes: Sizes) -> Iterator[tuple]:
+    amount = min(REVIEWS, sizes.albums)
+    for i in range(sizes.users):
+        for album_id in rng.sample(range(1, sizes.albums + 1), amount):
+            yield (uid(i), album_id, rng.randint(1, 5), words(rng, 10))
+
+
+def comments(rng: random.Random, sizes: Sizes) -> Iterator[tuple]:
+    comment_id = 0
+    for album_id in range(1, sizes.albums + 1):
+        thread = []
+        for _ in range(rng.randint(0, 2 * COMMENTS)):
+            comment_id += 1
+            # Four in ten answer an earlier comment of the album
+            parent_id = rng.choice(thread) if thread and rng.random() < 0.4 else None
+            thread.append(comment_id)
+            yield (
+                comment_id,
+                words(rng, 12),
+                EPOCH + datetime.timedelta(minutes=comment_id),
+                uid(rng.randrange(sizes.users)),
+                album_id,
+                parent_id,
+            )
+
+
+def copy(connection, table: str, columns: Sequence[str], rows: Iterable[tuple]):
+    """Loads the rows with COPY, CHUNK of them at a time"""
+    cursor = connection.cursor()
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    loaded = 0
+    done = False
+    rows = iter(rows)
+    while not done:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        written = 0
+        for row in rows:
+            writer.writerow(_csv_values(row))
+            written += 1
+            if written == CHUNK:
+                break
+        else:
+            done = True
+        if written:
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            loaded += written
+    cursor.close()
+    return loaded
+
+
+def _csv_values(row: tuple) -> list:
+    # csv writes None as an empty unquoted field, which COPY reads as NULL
+    return [
+        ("t" if value else "f") if isinstance(value, bool) else value for value in row
+    ]
+
+
+def seed(engine: sa.engine.Engine, scale: float = 1.0, seed_value: int = 0) -> dict:
+    """Recreates the tables and fills them, returns the sizes"""
+    sizes = Sizes.scaled(scale)
+    rng = random.Random(seed_value)
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    creators = [creator(rng, sizes) for _ in range(sizes.albums)]
+    loads = (
+        (
+            "users",
+            ("id", "name", "sub_level", "sub_expires", "location", "interests"),
+            users(rng, sizes),
+        ),
+        ("artists", ("name",), artists(sizes)),
+        (
+            "albums",
+            ("id", "name", "description", "blocked", "genre", "file_url")
+            + ("creator_id",),
+            albums(rng, sizes, creators),
+        ),
+        (
+            "songs",
+            ("id", "name", "description", "blocked", "genre", "file_url")
+            + ("sub_level", "album_id", "creator_id"),
+            songs(rng, sizes, creators),
+        ),
+        (
+            "song_artist_association",
+            ("artist_name", "song_id"),
+            song_artists(rng, sizes),
+        ),
+        (
+            "playlists",
+            ("id", "name", "description", "blocked", "creator_id"),
+            playlists(rng, sizes),
+        ),
+        (
+            "song_playlist_association",
+            ("playlist_id", "song_id", "position"),
+            playlist_songs(rng, sizes),
+        ),
+        ("colab_playlist_association", ("user_id", "playlist_id"), colabs(rng, sizes)),
+        (
+            "song_favorites_association",
+            ("user_id", "song_id"),
+            favorites(rng, sizes, FAVORITE_SONGS, sizes.songs),
+        ),
+        (
+            "album_favorites_association",
+            ("user_id", "album_id"),
+            favorites(rng, sizes, FAVORITE_ALBUMS, sizes.albums),
+        ),
+        (
+            "playlist_favorite_association",
+            ("user_id", "playlist_id"),
+            favorites(rng, sizes, FAVORITE_PLAYLISTS, sizes.playlists),
+        ),
+        (
+            "reviews",
+            ("reviewer_id", "album_id", "score", "text"),
+            reviews(rng, sizes),
+        ),
+        (
+            "comments",
+            ("id", "text", "created_at", "commenter_id", "album_id", "parent_id"),
+            comments(rng, sizes),
+        ),
+    )
+
+    rows = {}
+    raw = engine.raw_connection()
+    try:
+        for table, columns, generated in loads:
+            start = time.perf_counter()
+            rows[table] = copy(raw, table, columns, generated)
+            print(
+                f"{table:<30} {rows[table]:>10} rows "
+                f"{time.perf_counter() - start:>7.1f}s",
+                file=sys.stderr,
+            )
+        raw.commit()
+    finally:
+        raw.close()
+
+    with engine.begin() as connection:
+        # The aggregates ReviewModel keeps up to date
+        connection.execute(
+            sa.text(
+                "UPDATE albums SET score_sum = scores.sum, score_count = scores.count "
+                "FROM (SELECT album_id, sum(score) AS sum, count(*) AS count "
+                "FROM reviews GROUP BY album_id) AS scores "
+                "WHERE albums.id = scores.album_id"
+            )
+        )
+        # So that the rows created through the API do not collide
+        for table in ("albums", "songs", "playlists", "comments"):
+            connection.execute(
+                sa.text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT coalesce(max(id), 0) + 1 FROM {table}), false)"
+                )
+            )
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(sa.text("ANALYZE"))
+
+    return {"scale": scale, "seed": seed_value, "rows": rows}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.seed")
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="1 is 100k users and 1M songs"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not TESTING:
+        raise SystemExit("It drops the tables of the database, run it with TESTING=1")
+    result = seed(engine, args.scale, args.seed)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Startup time of the application.
+
+Usage:
+    python -m benchmarks.startup [--runs N] [--path PATH] [--imports N]
+                                 [--output FILE]
+
+Every run is a fresh interpreter that imports src.main, runs its startup
+hooks and serves a first request, timing each step. It prints the median and
+the worst of each step over the runs and, with --imports, the modules that
+took the longest to import according to `python -X importtime`.
+
+The runs use the environment as is, so with TESTING=1 the application uses
+the Firebase mocks and the test database. With --output the results are also
+written as JSON, to compare them between commits.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Timestamps of a run, printed as JSON on the last line of its output
+RUN = """
+import json, sys, time
+from fastapi.testclient import TestClient
+start = time.perf_counter()
+from src.main import app
+imported = time.perf_counter()
+with TestClient(app) as client:
+    started = time.perf_counter()
+    response = client.get(sys.argv[1], headers=json.loads(sys.argv[2]))
+    served = time.perf_counter()
+print(json.dumps({
+    "status": response.status_code,
+    "import": imported - start,
+    "startup": started - imported,
+    "first_request": served - started,
+}))
+"""
+
+STEPS = ("import", "startup", "first_request")
+
+
+def run(path: str, headers: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", RUN, path, json.dumps(headers)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(amount: int):
+    """Modules that took the longest to import, submodules included"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.main"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        imports.append({"module": module.strip(), "seconds": int(cumulative) / 1e6})
+    imports.sort(key=lambda entry: entry["seconds"], reverse=True)
+    return imports[:amount]
+
+
+def summarize(runs):
+    summary = {}
+    for step in STEPS + ("total",):
+        times = [r["total"] if step == "total" else r[step] for r in runs]
+        summary[step] = {"median": statistics.median(times), "max": max(times)}
+    return summary
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--path", default="/api/v3/health/db", help="of the first request"
+    )
+    parser.add_argument("--uid", default="benchmark", help="of the first request")
+    parser.add_argument("--role", default="listener", help="of the first request")
+    parser.add_argument(
+        "--imports", type=int, default=0, help="show the N slowest imports"
+    )
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    headers = {
+        "api_key": os.environ.get("API_KEY", "key"),
+        "uid": args.uid,
+        "role": args.role,
+    }
+
+    runs = []
+    for _ in range(args.runs):
+        result = run(args.path, headers)
+        result["total"] = sum(result[step] for step in STEPS)
+        runs.append(result)
+        if result["status"] != 200:
+            print(f"The first request answered {result['status']}", file=sys.stderr)
+
+    summary = summarize(runs)
+    print(f"{'step':<15} {'median':>10} {'max':>10}")
+    for step, times in summary.items():
+        print(
+            f"{step:<15} {times['median'] * 1000:>8.0f}ms {times['max'] * 1000:>8.0f}ms"
+        )
+
+    imports = slowest_imports(args.imports) if args.imports else []
+    if imports:
+        print()
+        for entry in imports:
+            print(f"{entry['seconds'] * 1000:>8.0f}ms {entry['module']}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "path": args.path,
+                    "runs": runs,
+                    "summary": summary,
+                    "imports": imports,
+                },
+                file,
+                indent=2,
+            )
@@ -1,2 +1,2 @@
 #!/bin/sh
-uvicorn src.main:app --host 0.0.0.0 --port "${PORT:-8080}" --reload
+exec python -m src.server
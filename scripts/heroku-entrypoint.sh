@@ -4,4 +4,9 @@ datadog-agent run > /dev/null &
 /opt/datadog-agent/embedded/bin/trace-agent --config=/etc/datadog-agent/datadog.yaml > /dev/null &
 /opt/datadog-agent/embedded/bin/process-agent --config=/etc/datadog-agent/datadog.yaml > /dev/null &
 
-uvicorn src.main:app --host 0.0.0.0 --port "${PORT:-8080}"
\ No newline at end of file
+# The server serves the metrics of the jobs worker too
+export METRICS_DIR=/tmp/metrics
+
+# The supervisor of the server runs the jobs worker, and starts it again if
+# it exits
+exec python -m src.server --jobs
\ No newline at end of file
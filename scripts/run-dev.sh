@@ -1 +1 @@
-uvicorn src.main:app --reload
\ No newline at end of file
+SERVER_RELOAD=1 python -m src.server --host 127.0.0.1 --port 8000
\ No newline at end of file
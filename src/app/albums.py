@@ -1,99 +1,181 @@
+from typing import Optional, Union
 from src.exceptions import MessageException
 from fastapi import APIRouter
-from fastapi import Depends, File, UploadFile, Query
+from fastapi import Depends, File, Form, UploadFile, Query
 
+from starlette.concurrency import run_in_threadpool
 from src.firebase.access import get_bucket
-from sqlalchemy.orm import Session
-from src.database.access import get_db
+from src.firebase.uploads import signed_upload_url
 from src.database import models
+from src.database.search import TextMatch
 from src import roles, utils, schemas
-from src.roles import get_role
 from src.schemas import AlbumCreate, AlbumGet, AlbumUpdate
 
-from src.schemas.pagination import CustomPage
+from src.schemas.pagination import CustomPage, TotalKind
+from src.schemas.utils import serialize
+from src.utils.context import RequestContext, get_context
 
 router = APIRouter(tags=["albums"])
 
 
 @router.get("/albums/", response_model=CustomPage[schemas.Album])
-def get_albums(
+async def get_albums(
     creator: str = None,
-    role: roles.Role = Depends(get_role),
+    context: RequestContext = Depends(get_context),
     artist: str = None,
     genre: str = None,
     name: str = None,
-    pdb: Session = Depends(get_db),
+    match: TextMatch = Query(TextMatch.substring),
     limit: int = Query(50, ge=1, le=100),
-    offset: int = Query(0, ge=0),
+    include_total: TotalKind = Query(TotalKind.exact),
+    offset: Union[int, str] = Query(0),
+    sort_by: schemas.AlbumSort = Query(schemas.AlbumSort.id),
+    min_score: float = Query(None, ge=0),
 ):
-    """Returns all Albums"""
-    albums = models.AlbumModel.search(
-        pdb,
-        role=role,
+    """Returns all Albums. With `match=prefix` the text filters match word
+    prefixes and the albums are ordered by relevance, unless sorted by rating"""
+    albums = await models.AlbumModel.asearch(
+        context.pdb,
+        role=context.role,
         creator_id=creator,
         artist=artist,
         genre=genre,
         name=name,
+        match=match,
+        sort_by=sort_by,
+        min_score=min_score,
         limit=limit,
         offset=offset,
+        include_total=include_total,
     )
 
-    return albums
+    return await serialize(context.pdb, CustomPage[schemas.Album], albums)
 
 
 @router.get("/my_albums/", response_model=CustomPage[schemas.Album])
-def get_my_albums(
-    uid: str = Depends(utils.user.retrieve_uid),
-    pdb: Session = Depends(get_db),
+async def get_my_albums(
+    context: RequestContext = Depends(get_context),
     limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
     offset: int = Query(0, ge=0),
 ):
 
-    albums = models.AlbumModel.search(
-        pdb, role=roles.Role.admin(), creator_id=uid, limit=limit, offset=offset
+    albums = await models.AlbumModel.asearch(
+        context.pdb,
+        role=roles.Role.admin(),
+        creator_id=await context.get_uid(),
+        limit=limit,
+        offset=offset,
+        include_total=include_total,
     )
 
-    return albums
+    return await serialize(context.pdb, CustomPage[schemas.Album], albums)
 
 
 @router.get("/albums/{album_id}", response_model=AlbumGet)
-def get_album_by_id(
+async def get_album_by_id(
     album: models.AlbumModel = Depends(utils.album.get_album),
+    context: RequestContext = Depends(get_context),
 ):
-    """Returns an album by its id or 404 if not found"""
+    """Returns an album by its id or 404 if not found. Only its first songs
+    are included, the rest are in /albums/{album_id}/songs/ from the offsets
+    of the response"""
+
+    await context.pdb.run_sync(album.bound_songs, context.role)
+    return await serialize(context.pdb, AlbumGet, album)
+
 
-    return album
+@router.get("/albums/{album_id}/songs/", response_model=CustomPage[schemas.SongBase])
+async def get_album_songs(
+    album: models.AlbumModel = Depends(utils.album.get_album),
+    context: RequestContext = Depends(get_context),
+    limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
+    offset: Optional[str] = Query(None),
+):
+    songs = await models.SongModel.asearch(
+        context.pdb,
+        role=context.role,
+        album_id=album.id,
+        limit=limit,
+        offset=offset,
+        include_total=include_total,
+    )
+    return await serialize(context.pdb, CustomPage[schemas.SongBase], songs)
 
 
 @router.post("/albums/", response_model=AlbumGet)
-def post_album(
+async def post_album(
     album_create: AlbumCreate = Depends(utils.album.retrieve_album),
-    cover: UploadFile = File(...),
-    role: roles.Role = Depends(get_role),
-    pdb: Session = Depends(get_db),
+    cover: UploadFile = File(None),
+    context: RequestContext = Depends(get_context),
     bucket=Depends(get_bucket),
 ):
-    """Creates an album and returns its id. Songs_ids form is encoded like '["song_id_1", "song_id_2", ...]'"""
-    album = models.AlbumModel.create(
-        pdb, **album_create.dict(), role=role, file=cover.file, bucket=bucket
+    """Creates an album and returns its id. Songs_ids form is encoded like '["song_id_1", "song_id_2", ...]'.
+    The cover can be left out and uploaded through /albums/{album_id}/upload_url"""
+    album = await models.AlbumModel.acreate(
+        context.pdb,
+        **album_create.dict(),
+        role=context.role,
+        file=cover.file if cover is not None else None,
+        bucket=bucket,
     )
 
-    return album
+    return await serialize(context.pdb, AlbumGet, album)
+
+
+@router.post("/albums/{album_id}/upload_url", response_model=schemas.UploadUrl)
+async def get_album_upload_url(
+    album: models.AlbumModel = Depends(utils.album.get_album),
+    context: RequestContext = Depends(get_context),
+    bucket=Depends(get_bucket),
+):
+    """Returns a signed url to PUT the cover of the album to, then POST to
+    /albums/{album_id}/cover to finish the upload"""
+
+    uid = await context.get_uid()
+    if album.creator_id != uid and not context.role.can_edit_everything():
+        raise MessageException(
+            status_code=403,
+            detail=f"User {uid} attempted to edit album of user with ID {album.creator_id}",
+        )
+
+    return await run_in_threadpool(signed_upload_url, bucket, album.file_blob_name)
+
+
+@router.post("/albums/{album_id}/cover", response_model=AlbumGet)
+async def finalize_album_upload(
+    album: models.AlbumModel = Depends(utils.album.get_album),
+    context: RequestContext = Depends(get_context),
+    bucket=Depends(get_bucket),
+    upload_id: str = Form(...),
+):
+    """Records the cover uploaded to the url of /albums/{album_id}/upload_url,
+    `upload_id` is the one that came with the url"""
+
+    uid = await context.get_uid()
+    if album.creator_id != uid and not context.role.can_edit_everything():
+        raise MessageException(
+            status_code=403,
+            detail=f"User {uid} attempted to edit album of user with ID {album.creator_id}",
+        )
+
+    await context.pdb.run_sync(album.finalize_file, bucket, upload_id)
+    return await serialize(context.pdb, AlbumGet, album)
 
 
 @router.put("/albums/{album_id}")
-def update_album(
+async def update_album(
     album: models.AlbumModel = Depends(utils.album.get_album),
-    uid: str = Depends(utils.user.retrieve_uid),
-    role: roles.Role = Depends(get_role),
+    context: RequestContext = Depends(get_context),
     album_update: AlbumUpdate = Depends(utils.album.retrieve_album_update),
     cover: UploadFile = File(None),
-    pdb: Session = Depends(get_db),
     bucket=Depends(get_bucket),
 ):
     """Updates album by its id"""
 
-    if album.creator_id != uid and not role.can_edit_everything():
+    uid = await context.get_uid()
+    if album.creator_id != uid and not context.role.can_edit_everything():
         raise MessageException(
             status_code=403,
             detail=f"User {uid} attempted to edit album of user with ID {album.creator_id}",
@@ -101,25 +183,30 @@ def update_album(
 
     album_update = album_update.dict(exclude_none=True)
     if cover is not None:
-        album.update(pdb, **album_update, file=cover.file, bucket=bucket, role=role)
+        await album.aupdate(
+            context.pdb,
+            **album_update,
+            file=cover.file,
+            bucket=bucket,
+            role=context.role,
+        )
     else:
-        album.update(pdb, **album_update, role=role)
+        await album.aupdate(context.pdb, **album_update, role=context.role)
 
 
 @router.delete("/albums/{album_id}")
-def delete_album(
+async def delete_album(
     album: models.AlbumModel = Depends(utils.album.get_album),
-    uid: str = Depends(utils.user.retrieve_uid),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
     bucket=Depends(get_bucket),
-    role: roles.Role = Depends(get_role),
 ):
     """Deletes an album by its id"""
 
-    if uid != album.creator_id and not role.can_delete_everything():
+    uid = await context.get_uid()
+    if uid != album.creator_id and not context.role.can_delete_everything():
         raise MessageException(
             status_code=403,
             detail=f"User '{uid} attempted to delete album of user with ID {album.creator_id}",
         )
 
-    album.delete(pdb, bucket=bucket)
+    await album.adelete(context.pdb, bucket=bucket)
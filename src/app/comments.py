@@ -1,14 +1,16 @@
+from typing import Optional
+
 from src.exceptions import MessageException
 from src import utils
 from src import schemas
 from fastapi import APIRouter
 from fastapi import Depends
-from sqlalchemy.orm import Session
-from src.database.access import get_db
 from src.database import models
 from fastapi import Query
 
-from src.schemas.pagination import CustomPage
+from src.schemas.pagination import CustomPage, TotalKind
+from src.schemas.utils import serialize
+from src.utils.context import RequestContext, get_context
 
 router = APIRouter(tags=["comments"])
 
@@ -16,66 +18,116 @@ router = APIRouter(tags=["comments"])
 @router.get(
     "/albums/{album_id}/comments/", response_model=CustomPage[schemas.CommentGet]
 )
-def get_album_comments(
+async def get_album_comments(
     album: models.AlbumModel = Depends(utils.album.get_album),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
     limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
     offset: int = Query(0, ge=0),
+    window: dict = Depends(utils.comment.retrieve_thread_window),
 ):
-    return models.CommentModel.get_roots_by_album(
-        pdb, album, limit=limit, offset=offset
+    """Root comments of the album with their threads, `max_depth` levels of
+    comments and the first `responses_limit` responses of each. Cut threads
+    go on from the offsets in /albums/comments/{comment_id}/responses/"""
+    comments = await context.pdb.run_sync(
+        models.CommentModel.get_roots_by_album,
+        album,
+        limit=limit,
+        offset=offset,
+        include_total=include_total,
+    )
+    await context.pdb.run_sync(
+        models.CommentModel.load_threads, comments.items, **window
     )
+    return await serialize(context.pdb, CustomPage[schemas.CommentGet], comments)
+
+
+@router.get(
+    "/albums/comments/{comment_id}/responses/",
+    response_model=CustomPage[schemas.CommentGet],
+)
+async def get_comment_responses(
+    comment: models.CommentModel = Depends(utils.comment.get_comment),
+    context: RequestContext = Depends(get_context),
+    limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
+    offset: Optional[str] = Query(None),
+    window: dict = Depends(utils.comment.retrieve_thread_window),
+):
+    """Responses of the comment, the ones after the first of a comment are
+    paged from the offset in its `offsets`. Their threads are returned as in
+    /albums/{album_id}/comments/"""
+    responses = await models.CommentModel.asearch(
+        context.pdb,
+        parent_id=comment.id,
+        limit=limit,
+        offset=offset,
+        include_total=include_total,
+    )
+    await context.pdb.run_sync(
+        models.CommentModel.load_threads, responses.items, **window
+    )
+    return await serialize(context.pdb, CustomPage[schemas.CommentGet], responses)
 
 
 @router.post("/albums/{album_id}/comments/", response_model=schemas.CommentGet)
-def post_album_comment(
+async def post_album_comment(
     album: models.AlbumModel = Depends(utils.album.get_album),
     comment_info: schemas.CommentPost = Depends(utils.comment.retrieve_comment_post),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
 ):
 
-    comment = models.CommentModel.create(pdb, album=album, **comment_info.dict())
+    comment = await models.CommentModel.acreate(
+        context.pdb, album=album, **comment_info.dict()
+    )
 
-    return comment
+    return await serialize(context.pdb, schemas.CommentGet, comment)
 
 
 @router.put("/albums/comments/{comment_id}/", response_model=schemas.CommentGet)
-def edit_album_comment(
+async def edit_album_comment(
     comment_update: schemas.CommentUpdate,
     comment: models.CommentModel = Depends(utils.comment.get_comment),
-    pdb: Session = Depends(get_db),
-    uid: str = Depends(utils.user.retrieve_uid),
+    context: RequestContext = Depends(get_context),
 ):
+    uid = await context.get_uid()
     if comment.commenter_id != uid:
         raise MessageException(
             status_code=403, detail="You are not allowed to edit this comment"
         )
 
-    comment = comment.update(pdb, **comment_update.dict())
+    comment = await comment.aupdate(context.pdb, **comment_update.dict())
 
-    return comment
+    return await serialize(context.pdb, schemas.CommentGet, comment)
 
 
 @router.delete("/albums/comments/{comment_id}/")
-def delete_album_comment(
+async def delete_album_comment(
     comment: models.CommentModel = Depends(utils.comment.get_comment),
-    uid: str = Depends(utils.user.retrieve_uid),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
 ):
+    uid = await context.get_uid()
     if comment.commenter_id != uid:
         raise MessageException(
             status_code=403, detail="You are not allowed to delete this comment"
         )
 
-    comment.soft_delete(pdb)
+    await context.pdb.run_sync(comment.soft_delete)
 
 
 @router.get("/users/comments/", response_model=CustomPage[schemas.CommentGet])
-def get_user_comments(
-    uid: models.UserModel = Depends(utils.user.retrieve_uid),
-    pdb: Session = Depends(get_db),
+async def get_user_comments(
+    context: RequestContext = Depends(get_context),
     limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
     offset: int = Query(0, ge=0),
 ):
 
-    return models.CommentModel.search(pdb, commenter_id=uid, limit=limit, offset=offset)
+    comments = await models.CommentModel.asearch(
+        context.pdb,
+        commenter_id=await context.get_uid(),
+        limit=limit,
+        offset=offset,
+        include_total=include_total,
+    )
+    return await serialize(context.pdb, CustomPage[schemas.CommentGet], comments)
@@ -1,12 +1,11 @@
-from src.exceptions import MessageException
-from src import roles, utils, schemas
-from src.database.access import get_db
-from fastapi import APIRouter, status, Query
+from src import utils, schemas
+from fastapi import APIRouter, Query
 from fastapi import Depends
-from sqlalchemy.orm import Session
 from src.database import models
 
-from src.schemas.pagination import CustomPage
+from src.schemas.pagination import CustomPage, TotalKind
+from src.schemas.utils import serialize
+from src.utils.context import RequestContext, get_context
 
 router = APIRouter(tags=["favorites"])
 
@@ -14,115 +13,108 @@ router = APIRouter(tags=["favorites"])
 @router.get(
     "/users/{uid}/favorites/songs/", response_model=CustomPage[schemas.SongBase]
 )
-def get_favorite_songs(
-    user: models.UserModel = Depends(utils.user.retrieve_user),
-    role: roles.Role = Depends(roles.get_role),
+async def get_favorite_songs(
+    context: RequestContext = Depends(get_context),
     offset: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
 ):
-    return user.get_favorite_songs(role=role, offset=offset, limit=limit)
+    user = await context.get_user()
+    songs = await context.pdb.run_sync(
+        lambda _: user.get_favorite_songs(
+            role=context.role, offset=offset, limit=limit, include_total=include_total
+        )
+    )
+    return await serialize(context.pdb, CustomPage[schemas.SongBase], songs)
 
 
 @router.post("/users/{uid}/favorites/songs/", response_model=schemas.SongBase)
-def add_song_to_favorites(
+async def add_song_to_favorites(
     song: models.SongModel = Depends(utils.song.get_song),
-    user: models.UserModel = Depends(utils.user.retrieve_user),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
 ):
-    if song in user.favorite_songs:
-        raise MessageException(
-            status_code=status.HTTP_409_CONFLICT, detail="Song already in favorites"
-        )
-    user.add_favorite_song(pdb, song=song)
-    return song
+    user = await context.get_user()
+    await context.pdb.run_sync(user.add_favorite_song, song=song)
+    return await serialize(context.pdb, schemas.SongBase, song)
 
 
 @router.delete("/users/{uid}/favorites/songs/")
-def remove_song_from_favorites(
+async def remove_song_from_favorites(
     song: models.SongModel = Depends(utils.song.get_song),
-    user: models.UserModel = Depends(utils.user.retrieve_user),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
 ):
-    if song not in user.favorite_songs:
-        raise MessageException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Song not in favorites"
-        )
-    user.remove_favorite_song(pdb, song=song)
+    user = await context.get_user()
+    await context.pdb.run_sync(user.remove_favorite_song, song=song)
 
 
 @router.get("/users/{uid}/favorites/albums/", response_model=CustomPage[schemas.Album])
-def get_favorite_albums(
-    user: models.UserModel = Depends(utils.user.retrieve_user),
-    role: roles.Role = Depends(roles.get_role),
+async def get_favorite_albums(
+    context: RequestContext = Depends(get_context),
     offset: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
 ):
-    favorite_albums = user.get_favorite_albums(role=role, offset=offset, limit=limit)
+    user = await context.get_user()
+    favorite_albums = await context.pdb.run_sync(
+        lambda _: user.get_favorite_albums(
+            role=context.role, offset=offset, limit=limit, include_total=include_total
+        )
+    )
 
-    return favorite_albums
+    return await serialize(context.pdb, CustomPage[schemas.Album], favorite_albums)
 
 
 @router.post("/users/{uid}/favorites/albums/", response_model=schemas.AlbumBase)
-def add_album_to_favorites(
+async def add_album_to_favorites(
     album: models.AlbumModel = Depends(utils.album.get_album),
-    user: models.UserModel = Depends(utils.user.retrieve_user),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
 ):
-    if album in user.favorite_albums:
-        raise MessageException(
-            status_code=status.HTTP_409_CONFLICT, detail="Album already in favorites"
-        )
-    user.add_favorite_album(pdb, album=album)
-    return album
+    user = await context.get_user()
+    await context.pdb.run_sync(user.add_favorite_album, album=album)
+    return await serialize(context.pdb, schemas.AlbumBase, album)
 
 
 @router.delete("/users/{uid}/favorites/albums/")
-def remove_album_from_favorites(
+async def remove_album_from_favorites(
     album: models.AlbumModel = Depends(utils.album.get_album),
-    user: models.UserModel = Depends(utils.user.retrieve_user),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
 ):
-    if album not in user.favorite_albums:
-        raise MessageException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Album not in favorites"
-        )
-    return user.remove_favorite_album(pdb, album=album)
+    user = await context.get_user()
+    return await context.pdb.run_sync(user.remove_favorite_album, album=album)
 
 
 @router.get(
     "/users/{uid}/favorites/playlists/", response_model=CustomPage[schemas.PlaylistBase]
 )
-def get_favorite_playlists(
-    user: models.UserModel = Depends(utils.user.retrieve_user),
-    role: roles.Role = Depends(roles.get_role),
+async def get_favorite_playlists(
+    context: RequestContext = Depends(get_context),
     offset: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
 ):
-    return user.get_favorite_playlists(role=role, offset=offset, limit=limit)
+    user = await context.get_user()
+    playlists = await context.pdb.run_sync(
+        lambda _: user.get_favorite_playlists(
+            role=context.role, offset=offset, limit=limit, include_total=include_total
+        )
+    )
+    return await serialize(context.pdb, CustomPage[schemas.PlaylistBase], playlists)
 
 
 @router.post("/users/{uid}/favorites/playlists/", response_model=schemas.PlaylistBase)
-def add_playlist_to_favorites(
+async def add_playlist_to_favorites(
     playlist: models.PlaylistModel = Depends(utils.playlist.get_playlist),
-    user: models.UserModel = Depends(utils.user.retrieve_user),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
 ):
-    if playlist in user.favorite_playlists:
-        raise MessageException(
-            status_code=status.HTTP_409_CONFLICT, detail="Playlist already in favorites"
-        )
-    user.add_favorite_playlist(pdb, playlist=playlist)
-    return playlist
+    user = await context.get_user()
+    await context.pdb.run_sync(user.add_favorite_playlist, playlist=playlist)
+    return await serialize(context.pdb, schemas.PlaylistBase, playlist)
 
 
 @router.delete("/users/{uid}/favorites/playlists/")
-def remove_playlist_from_favorites(
+async def remove_playlist_from_favorites(
     playlist: models.PlaylistModel = Depends(utils.playlist.get_playlist),
-    user: models.UserModel = Depends(utils.user.retrieve_user),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
 ):
-    if playlist not in user.favorite_playlists:
-        raise MessageException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Playlist not in favorites"
-        )
-    return user.remove_favorite_playlist(pdb, playlist=playlist)
+    user = await context.get_user()
+    return await context.pdb.run_sync(user.remove_favorite_playlist, playlist=playlist)
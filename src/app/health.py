@@ -0,0 +1,53 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, status
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import payments, schemas
+from src.database import pool
+from src.database import invalidation
+from src.database.cache import entity_cache
+from src.database.access import get_db, async_engine
+from src.exceptions import MessageException
+
+router = APIRouter(tags=["health"])
+# Checks of readiness probes, which can rarely send the API key
+probes_router = APIRouter(tags=["health"])
+
+
+@probes_router.get("/health/db", response_model=schemas.DatabaseHealth)
+async def get_db_health(pdb: AsyncSession = Depends(get_db)):
+    """Readiness of the database, along with the state of the connection pool"""
+
+    try:
+        await pdb.execute(text("SELECT 1"))
+    except (exc.DBAPIError, exc.TimeoutError, OSError, asyncio.TimeoutError) as e:
+        raise MessageException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Database unavailable: {e.__class__.__name__}",
+        )
+
+    return {"status": "ok", "pool": pool.pool_status(async_engine)}
+
+
+@router.get("/health/payments", response_model=schemas.PaymentsHealth)
+async def get_payments_health():
+    """State of the circuit breaker of the payments service and the metrics
+    of the calls made to it by this process"""
+
+    client = payments.get_client()
+    return {"circuit": client.breaker.state, "operations": client.metrics.snapshot()}
+
+
+@router.get("/health/cache", response_model=schemas.EntityCacheHealth)
+async def get_cache_health():
+    """Counters of the entity cache of this process, see
+    src/database/cache.py, and the state and lag of its invalidations from
+    the other processes"""
+
+    return {
+        "enabled": entity_cache.enabled,
+        **entity_cache.stats(),
+        "bus": invalidation.listener.stats(),
+    }
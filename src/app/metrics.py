@@ -0,0 +1,39 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from src import metrics
+from src.database import pool
+from src.database.access import async_engine
+from src.database.cache import entity_cache
+
+router = APIRouter(tags=["metrics"])
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@metrics.registry.collector
+def collect_pool():
+    status = pool.pool_status(async_engine)
+    metrics.DB_POOL_CONNECTIONS.set(status["checked_out"], state="checked_out")
+    metrics.DB_POOL_CONNECTIONS.set(status["checked_in"], state="checked_in")
+    metrics.DB_POOL_CHECKOUTS.set(status["checkouts"])
+    metrics.DB_POOL_CONNECTS.set(status["connects"])
+    metrics.DB_POOL_TIMEOUTS.set(status["timeouts"])
+    metrics.DB_POOL_WAIT.set(status["wait_time_total"])
+
+
+@metrics.registry.collector
+def collect_entity_cache():
+    stats = entity_cache.stats()
+    metrics.ENTITY_CACHE_LOOKUPS.set(stats["hits"], result="hit")
+    metrics.ENTITY_CACHE_LOOKUPS.set(stats["misses"], result="miss")
+    for reason in ("evictions", "expirations", "invalidations"):
+        metrics.ENTITY_CACHE_REMOVALS.set(stats[reason], reason=reason[:-1])
+    metrics.ENTITY_CACHE_ENTRIES.set(stats["size"])
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Metrics of every worker process in the Prometheus text format"""
+
+    return Response(metrics.registry.render(), media_type=CONTENT_TYPE)
@@ -1,157 +1,251 @@
+from typing import Optional, Union
 from src.exceptions import MessageException
 from src import roles, utils, schemas
-from fastapi import Depends, status, APIRouter, Query
-from sqlalchemy.orm import Session
-from src.database.access import get_db
+from fastapi import Depends, Form, status, APIRouter, Query
 from src.database import models
-from src.roles import get_role
+from src.database.search import TextMatch
 
-from src.schemas.pagination import CustomPage
+from src.schemas.pagination import CustomPage, TotalKind
+from src.schemas.utils import serialize
+from src.utils.context import RequestContext, get_context
 
 router = APIRouter(tags=["playlists"])
 
 
 @router.get("/playlists/", response_model=CustomPage[schemas.PlaylistBase])
-def get_playlists(
+async def get_playlists(
     colab: str = None,
     name: str = None,
-    role: roles.Role = Depends(get_role),
-    pdb: Session = Depends(get_db),
+    match: TextMatch = Query(TextMatch.substring),
+    context: RequestContext = Depends(get_context),
     limit: int = Query(50, ge=1, le=100),
-    offset: int = Query(0, ge=0),
+    include_total: TotalKind = Query(TotalKind.exact),
+    offset: Union[int, str] = Query(0),
 ):
-    """Returns playlists either filtered by colab or all playlists"""
-
-    return models.PlaylistModel.search(
-        pdb, role=role, colab=colab, limit=limit, offset=offset, name=name
+    """Returns playlists either filtered by colab or all playlists. With
+    `match=prefix` the name matches word prefixes, ordered by relevance"""
+
+    playlists = await models.PlaylistModel.asearch(
+        context.pdb,
+        role=context.role,
+        colab=colab,
+        limit=limit,
+        offset=offset,
+        include_total=include_total,
+        name=name,
+        match=match,
     )
+    return await serialize(context.pdb, CustomPage[schemas.PlaylistBase], playlists)
 
 
 @router.get("/my_playlists/", response_model=CustomPage[schemas.PlaylistBase])
-def get_my_playlists(
-    uid: str = Depends(utils.user.retrieve_uid),
-    pdb: Session = Depends(get_db),
+async def get_my_playlists(
+    context: RequestContext = Depends(get_context),
     limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
     offset: int = Query(0, ge=0),
 ):
-    playlists = models.PlaylistModel.search(
-        pdb, colab=uid, role=roles.Role.admin(), limit=limit, offset=offset
+    playlists = await models.PlaylistModel.asearch(
+        context.pdb,
+        colab=await context.get_uid(),
+        role=roles.Role.admin(),
+        limit=limit,
+        offset=offset,
+        include_total=include_total,
     )
-    return playlists
+    return await serialize(context.pdb, CustomPage[schemas.PlaylistBase], playlists)
 
 
 @router.get("/playlists/{playlist_id}", response_model=schemas.PlaylistGet)
-def get_playlist_by_id(
+async def get_playlist_by_id(
     playlist: models.PlaylistModel = Depends(utils.playlist.get_playlist),
+    context: RequestContext = Depends(get_context),
 ):
-    """Returns a playlist by its id or 404 if not found"""
+    """Returns a playlist by its id or 404 if not found. Only its first songs
+    and colabs are included, the rest are in /playlists/{playlist_id}/songs/
+    and /playlists/{playlist_id}/colabs/ from the offsets of the response"""
+
+    await context.pdb.run_sync(playlist.bound_songs, context.role)
+    return await serialize(context.pdb, schemas.PlaylistGet, playlist)
+
 
-    return playlist
+@router.get(
+    "/playlists/{playlist_id}/songs/", response_model=CustomPage[schemas.SongBase]
+)
+async def get_playlist_songs(
+    playlist: models.PlaylistModel = Depends(utils.playlist.get_playlist),
+    context: RequestContext = Depends(get_context),
+    limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
+    offset: Optional[str] = Query(None),
+):
+    """Returns the songs of a playlist in its order. Offsets, as in
+    "position:song_id", are the position in the playlist and the id of the
+    last song of the previous page"""
+
+    songs = await context.pdb.run_sync(
+        playlist.get_songs,
+        role=context.role,
+        limit=limit,
+        offset=offset,
+        include_total=include_total,
+    )
+    return await serialize(context.pdb, CustomPage[schemas.SongBase], songs)
+
+
+@router.get(
+    "/playlists/{playlist_id}/colabs/", response_model=CustomPage[schemas.UserBase]
+)
+async def get_playlist_colabs(
+    playlist: models.PlaylistModel = Depends(utils.playlist.get_playlist),
+    context: RequestContext = Depends(get_context),
+    limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
+    offset: Optional[str] = Query(None),
+):
+    # Users are keyed by their uid, so are the offsets
+    colabs = await models.UserModel.asearch(
+        context.pdb,
+        colab_of=playlist.id,
+        limit=limit,
+        offset=offset,
+        include_total=include_total,
+    )
+    return await serialize(context.pdb, CustomPage[schemas.UserBase], colabs)
 
 
 @router.post("/playlists/", response_model=schemas.PlaylistBase)
-def post_playlist(
+async def post_playlist(
     playlist_create: schemas.PlaylistCreate = Depends(utils.playlist.retrieve_playlist),
-    role: roles.Role = Depends(get_role),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
 ):
     """Creates a playlist and returns its id. Songs_ids form is encoded like '["song_id_1", "song_id_2", ...]'.
     Colabs_ids form is encoded like '["colab_id_1", "colab_id_2", ...]'"""
-    playlist = models.PlaylistModel.create(pdb, **playlist_create.dict(), role=role)
+    playlist = await models.PlaylistModel.acreate(
+        context.pdb, **playlist_create.dict(), role=context.role
+    )
 
-    return playlist
+    return await serialize(context.pdb, schemas.PlaylistBase, playlist)
 
 
 @router.put("/playlists/{playlist_id}")
-def update_playlist(
+async def update_playlist(
     playlist: models.PlaylistModel = Depends(utils.playlist.get_playlist),
-    role: roles.Role = Depends(get_role),
+    context: RequestContext = Depends(get_context),
     playlist_update: schemas.PlaylistUpdate = Depends(
         utils.playlist.retrieve_playlist_update
     ),
-    pdb: Session = Depends(get_db),
-    uid: str = Depends(utils.user.retrieve_uid),
 ):
     """Updates playlist by its id"""
 
-    if not utils.playlist.can_edit_playlist(playlist, role, uid):
+    uid = await context.get_uid()
+    if not await context.pdb.run_sync(
+        utils.playlist.can_edit_playlist, playlist, context.role, uid
+    ):
         raise MessageException(
             status_code=status.HTTP_403_FORBIDDEN, detail="You can't edit this playlist"
         )
 
-    playlist.update(pdb, **playlist_update.dict(exclude_none=True), role=role)
+    await playlist.aupdate(
+        context.pdb, **playlist_update.dict(exclude_none=True), role=context.role
+    )
 
 
 @router.delete("/playlists/{playlist_id}")
-def delete_playlist(
+async def delete_playlist(
     playlist: models.PlaylistModel = Depends(utils.playlist.get_playlist),
-    uid: str = Depends(utils.user.retrieve_uid),
-    pdb: Session = Depends(get_db),
-    role: roles.Role = Depends(get_role),
+    context: RequestContext = Depends(get_context),
 ):
     """Deletes a playlist by its id"""
 
-    if playlist.creator_id != uid and not role.can_edit_everything():
+    uid = await context.get_uid()
+    if playlist.creator_id != uid and not context.role.can_edit_everything():
         raise MessageException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"User '{uid} attempted to delete playlist of user with ID {playlist.creator_id}",
         )
-    playlist.delete(pdb)
+    await playlist.adelete(context.pdb)
 
 
 @router.delete("/playlists/{playlist_id}/songs/{song_id}/")
-def remove_song_from_playlist(
+async def remove_song_from_playlist(
     song: models.SongModel = Depends(utils.song.get_song),
     playlist: models.PlaylistModel = Depends(utils.playlist.get_playlist),
-    uid: str = Depends(utils.user.retrieve_uid),
-    pdb: Session = Depends(get_db),
-    role: roles.Role = Depends(get_role),
+    context: RequestContext = Depends(get_context),
 ):
     """Removes a song from a playlist"""
 
-    if not utils.playlist.can_edit_playlist(playlist, role, uid):
+    uid = await context.get_uid()
+    if not await context.pdb.run_sync(
+        utils.playlist.can_edit_playlist, playlist, context.role, uid
+    ):
         raise MessageException(
             status_code=status.HTTP_403_FORBIDDEN, detail="You can't edit this playlist"
         )
 
-    playlist.remove_song(pdb, song)
+    await context.pdb.run_sync(playlist.remove_song, song)
 
 
 @router.post("/playlists/{playlist_id}/songs/")
-def add_song_to_playlist(
+async def add_song_to_playlist(
     song: models.SongModel = Depends(utils.song.get_song_from_form),
     playlist: models.PlaylistModel = Depends(utils.playlist.get_playlist),
-    uid: str = Depends(utils.user.retrieve_uid),
-    pdb: Session = Depends(get_db),
-    role: roles.Role = Depends(get_role),
+    index: Optional[int] = Form(None, ge=0),
+    context: RequestContext = Depends(get_context),
 ):
-    """Adds a song to a playlist"""
+    """Adds a song to a playlist, at the index (from 0) if given or else at
+    its end"""
+
+    uid = await context.get_uid()
+    if not await context.pdb.run_sync(
+        utils.playlist.can_edit_playlist, playlist, context.role, uid
+    ):
+        raise MessageException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="You can't edit this playlist"
+        )
+
+    await context.pdb.run_sync(playlist.add_song, song, index)
+
+    return {"id": playlist.id}
+
+
+@router.put("/playlists/{playlist_id}/songs/{song_id}/")
+async def move_playlist_song(
+    song: models.SongModel = Depends(utils.song.get_song),
+    playlist: models.PlaylistModel = Depends(utils.playlist.get_playlist),
+    index: int = Form(..., ge=0),
+    context: RequestContext = Depends(get_context),
+):
+    """Moves a song of a playlist to the index (from 0)"""
 
-    if not utils.playlist.can_edit_playlist(playlist, role, uid):
+    uid = await context.get_uid()
+    if not await context.pdb.run_sync(
+        utils.playlist.can_edit_playlist, playlist, context.role, uid
+    ):
         raise MessageException(
             status_code=status.HTTP_403_FORBIDDEN, detail="You can't edit this playlist"
         )
 
-    playlist.add_song(pdb, song)
+    await context.pdb.run_sync(playlist.move_song, song, index)
 
     return {"id": playlist.id}
 
 
 @router.post("/playlists/{playlist_id}/colabs/")
-def add_colab_to_playlist(
+async def add_colab_to_playlist(
     playlist: models.PlaylistModel = Depends(utils.playlist.get_playlist),
     colab: models.UserModel = Depends(utils.playlist.get_colab_from_form),
-    uid: str = Depends(utils.user.retrieve_uid),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
 ):
     """Adds a song to a playlist"""
 
+    uid = await context.get_uid()
     if uid != playlist.creator_id:
         raise MessageException(
             status_code=403,
             detail=f"User {uid} attempted to add a colab to playlist of user with ID {playlist.creator_id}",
         )
 
-    playlist.add_colab(pdb, colab)
+    await context.pdb.run_sync(playlist.add_colab, colab)
 
     return {"id": playlist.id}
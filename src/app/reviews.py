@@ -1,30 +1,30 @@
 from src.exceptions import MessageException
 from src import utils, schemas
-from src.database.access import get_db
 from fastapi import APIRouter
 from fastapi import Depends, Query
-from sqlalchemy.orm import Session
 from src.database import models
 
-from src.schemas.pagination import CustomPage
+from src.schemas.pagination import CustomPage, TotalKind
+from src.schemas.utils import serialize
+from src.utils.context import RequestContext, get_context
 
 router = APIRouter(tags=["reviews"])
 
 
 @router.post("/albums/{album_id}/reviews/", response_model=schemas.ReviewGet)
-def post_review(
+async def post_review(
     review_info: schemas.ReviewBase,
     album: models.AlbumModel = Depends(utils.album.get_album),
-    user: models.UserModel = Depends(utils.user.retrieve_user),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
 ):
+    user = await context.get_user()
     if review_info.text is None and review_info.score is None:
         raise MessageException(
             status_code=422, detail="Text and score cannot be None at the same time"
         )
 
-    review = models.ReviewModel.get(
-        pdb, album=album, reviewer=user, raise_if_not_found=False
+    review = await models.ReviewModel.aget(
+        context.pdb, album=album, reviewer=user, raise_if_not_found=False
     )
     if review:
         raise MessageException(
@@ -32,50 +32,61 @@ def post_review(
             detail=f"User {user.id} already reviewed in album {album.id}",
         )
 
-    review = models.ReviewModel.create(
-        pdb, album=album, **review_info.dict(), reviewer=user
+    review = await models.ReviewModel.acreate(
+        context.pdb, album=album, **review_info.dict(), reviewer=user
     )
 
-    return review
+    return await serialize(context.pdb, schemas.ReviewGet, review)
 
 
 @router.get("/albums/{album_id}/reviews/", response_model=CustomPage[schemas.ReviewGet])
-def get_reviews(
+async def get_reviews(
     album: models.AlbumModel = Depends(utils.album.get_album),
     limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
     offset: str = Query(None),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
 ):
-    return album.get_reviews(pdb, limit, offset)
+    reviews = await context.pdb.run_sync(
+        album.get_reviews, limit, offset, include_total
+    )
+    return await serialize(context.pdb, CustomPage[schemas.ReviewGet], reviews)
 
 
 @router.get("/albums/{album_id}/my_review/", response_model=schemas.ReviewBase)
-def get_my_review(review: models.ReviewModel = Depends(utils.review.get_review)):
-    return review
+async def get_my_review(
+    review: models.ReviewModel = Depends(utils.review.get_review),
+    context: RequestContext = Depends(get_context),
+):
+    return await serialize(context.pdb, schemas.ReviewBase, review)
 
 
 @router.put("/albums/{album_id}/reviews/")
-def edit_review(
+async def edit_review(
     review_info_update: schemas.ReviewUpdate,
     review: models.ReviewModel = Depends(utils.review.get_review),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
 ):
-    review.update(pdb, **review_info_update.dict(exclude_none=True))
+    await review.aupdate(context.pdb, **review_info_update.dict(exclude_none=True))
 
 
 @router.delete("/albums/{album_id}/reviews/")
-def delete_review(
+async def delete_review(
     review: models.ReviewModel = Depends(utils.review.get_review),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
 ):
-    review.delete(pdb)
+    await review.adelete(context.pdb)
 
 
 @router.get("/users/{uid}/reviews/", response_model=CustomPage[schemas.ReviewMyReviews])
-def get_reviews_of_user(
-    user: models.UserModel = Depends(utils.user.retrieve_user),
-    pdb: Session = Depends(get_db),
+async def get_reviews_of_user(
+    context: RequestContext = Depends(get_context),
     offset: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
 ):
-    return models.ReviewModel.get_by_reviewer(pdb, user, limit, offset)
+    user = await context.get_user()
+    reviews = await context.pdb.run_sync(
+        models.ReviewModel.get_by_reviewer, user, limit, offset, include_total
+    )
+    return await serialize(context.pdb, CustomPage[schemas.ReviewMyReviews], reviews)
@@ -1,127 +1,188 @@
+from typing import Union
 from src.exceptions import MessageException
 from src import roles, utils, schemas
 from fastapi import APIRouter
-from fastapi import Depends, File, UploadFile, status, Query
+from fastapi import Depends, File, Form, UploadFile, status, Query
 
+from starlette.concurrency import run_in_threadpool
 from src.firebase.access import get_bucket
-from sqlalchemy.orm import Session
-from src.database.access import get_db
+from src.firebase.uploads import signed_upload_url
 from src.database import models
-from src.roles import get_role
+from src.database.search import TextMatch
 
-from src.schemas.pagination import CustomPage
+from src.schemas.pagination import CustomPage, TotalKind
+from src.schemas.utils import serialize
+from src.utils.context import RequestContext, get_context
 
 router = APIRouter(tags=["songs"])
 
 
 @router.get("/songs/", response_model=CustomPage[schemas.SongBase])
-def get_songs(
+async def get_songs(
     creator: str = None,
-    role: roles.Role = Depends(get_role),
+    context: RequestContext = Depends(get_context),
     artist: str = None,
     genre: str = None,
     sub_level: int = None,
     name: str = None,
-    pdb: Session = Depends(get_db),
-    offset: int = Query(0, ge=0),
+    match: TextMatch = Query(TextMatch.substring),
+    playable: bool = False,
+    offset: Union[int, str] = Query(0),
     limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
 ):
-    """Returns all songs"""
+    """Returns all songs. With `playable` only the ones the requester's
+    subscription lets them play. With `match=prefix` the text filters match
+    word prefixes and the songs are ordered by relevance"""
 
-    songs = models.SongModel.search(
-        pdb,
-        role=role,
+    songs = await models.SongModel.asearch(
+        context.pdb,
+        role=context.role,
         creator_id=creator,
         artist=artist,
         genre=genre,
         sub_level=sub_level,
+        max_sub_level=context.max_sub_level() if playable else None,
         name=name,
+        match=match,
         limit=limit,
         offset=offset,
+        include_total=include_total,
     )
-    return songs
+    return await serialize(context.pdb, CustomPage[schemas.SongBase], songs)
 
 
 @router.get("/songs/{song_id}", response_model=schemas.SongGet)
-def get_song_by_id(
+async def get_song_by_id(
     song: models.SongModel = Depends(utils.song.get_song),
+    context: RequestContext = Depends(get_context),
 ):
     """Returns a song by its id or 404 if not found"""
 
-    return song
+    return await serialize(context.pdb, schemas.SongGet, song)
 
 
 @router.put("/songs/{song_id}")
-def update_song(
+async def update_song(
     song: models.SongModel = Depends(utils.song.get_song),
-    uid: str = Depends(utils.user.retrieve_uid),
-    role: roles.Role = Depends(get_role),
+    context: RequestContext = Depends(get_context),
     song_update: schemas.SongUpdate = Depends(utils.song.retrieve_song_update),
     file: UploadFile = None,
-    pdb: Session = Depends(get_db),
     bucket=Depends(get_bucket),
 ):
     """Updates song by its id"""
 
-    if song.creator_id != uid and not role.can_edit_everything():
+    uid = await context.get_uid()
+    if song.creator_id != uid and not context.role.can_edit_everything():
         raise MessageException(
             status_code=403,
             detail=f"User '{uid} attempted to edit song of user with ID {song.creator_id}",
         )
 
     if file is not None:
-        song.update(
-            pdb,
+        await song.aupdate(
+            context.pdb,
             **song_update.dict(exclude_none=True),
-            role=role,
+            role=context.role,
             file=file.file,
             bucket=bucket,
         )
     else:
-        song.update(pdb, **song_update.dict(exclude_none=True), role=role)
+        await song.aupdate(
+            context.pdb, **song_update.dict(exclude_none=True), role=context.role
+        )
 
 
 @router.post("/songs/", response_model=schemas.SongBase)
-def post_song(
+async def post_song(
     song_create: schemas.SongCreate = Depends(utils.song.retrieve_song),
-    file: UploadFile = File(...),
-    pdb: Session = Depends(get_db),
+    file: UploadFile = File(None),
+    context: RequestContext = Depends(get_context),
     bucket=Depends(get_bucket),
 ):
-    """Creates a song and returns its id. Artists form is encoded like '["artist1", "artist2", ...]'"""
-    new_song = models.SongModel.create(
-        pdb, **song_create.dict(), bucket=bucket, file=file.file
+    """Creates a song and returns its id. Artists form is encoded like '["artist1", "artist2", ...]'.
+    The file can be left out and uploaded through /songs/{song_id}/upload_url"""
+    new_song = await models.SongModel.acreate(
+        context.pdb,
+        **song_create.dict(),
+        bucket=bucket,
+        file=file.file if file is not None else None,
     )
 
-    return new_song
+    return await serialize(context.pdb, schemas.SongBase, new_song)
+
+
+@router.post("/songs/{song_id}/upload_url", response_model=schemas.UploadUrl)
+async def get_song_upload_url(
+    song: models.SongModel = Depends(utils.song.get_song),
+    context: RequestContext = Depends(get_context),
+    bucket=Depends(get_bucket),
+):
+    """Returns a signed url to PUT the file of the song to, then POST to
+    /songs/{song_id}/file to finish the upload"""
+
+    uid = await context.get_uid()
+    if song.creator_id != uid and not context.role.can_edit_everything():
+        raise MessageException(
+            status_code=403,
+            detail=f"User '{uid} attempted to edit song of user with ID {song.creator_id}",
+        )
+
+    return await run_in_threadpool(signed_upload_url, bucket, song.file_blob_name)
+
+
+@router.post("/songs/{song_id}/file", response_model=schemas.SongGet)
+async def finalize_song_upload(
+    song: models.SongModel = Depends(utils.song.get_song),
+    context: RequestContext = Depends(get_context),
+    bucket=Depends(get_bucket),
+    upload_id: str = Form(...),
+):
+    """Records the file uploaded to the url of /songs/{song_id}/upload_url,
+    `upload_id` is the one that came with the url"""
+
+    uid = await context.get_uid()
+    if song.creator_id != uid and not context.role.can_edit_everything():
+        raise MessageException(
+            status_code=403,
+            detail=f"User '{uid} attempted to edit song of user with ID {song.creator_id}",
+        )
+
+    await context.pdb.run_sync(song.finalize_file, bucket, upload_id)
+    return await serialize(context.pdb, schemas.SongGet, song)
 
 
 @router.delete("/songs/{song_id}")
-def delete_song(
+async def delete_song(
     song: models.SongModel = Depends(utils.song.get_song),
-    uid: str = Depends(utils.user.retrieve_uid),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
     bucket=Depends(get_bucket),
-    role: roles.Role = Depends(get_role),
 ):
     """Deletes a song by its id"""
 
-    if song.creator_id != uid and not role.can_delete_everything():
+    uid = await context.get_uid()
+    if song.creator_id != uid and not context.role.can_delete_everything():
         raise MessageException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"User '{uid} attempted to delete song of user with ID {song.creator_id}",
         )
 
-    song.delete(pdb, bucket=bucket, role=role)
+    await song.adelete(context.pdb, bucket=bucket, role=context.role)
 
 
 @router.get("/my_songs/", response_model=CustomPage[schemas.SongMySongs])
-def get_my_songs(
-    uid: str = Depends(utils.user.retrieve_uid),
-    pdb: Session = Depends(get_db),
+async def get_my_songs(
+    context: RequestContext = Depends(get_context),
     offset: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
 ):
-    return models.SongModel.search(
-        pdb, creator_id=uid, role=roles.Role.admin(), limit=limit, offset=offset
+    songs = await models.SongModel.asearch(
+        context.pdb,
+        creator_id=await context.get_uid(),
+        role=roles.Role.admin(),
+        limit=limit,
+        offset=offset,
+        include_total=include_total,
     )
+    return await serialize(context.pdb, CustomPage[schemas.SongMySongs], songs)
@@ -4,12 +4,9 @@ import datetime
 from fastapi import APIRouter, Depends, Body
 from typing import List
 
-from src import utils, schemas, roles
-from src.roles import get_role
+from src import utils, schemas
+from src.utils.context import RequestContext, get_context
 from src.utils.subscription import SUBSCRIPTIONS, SUB_LEVEL_FREE, SUB_LEVEL_GOD
-from sqlalchemy.orm import Session
-from src.database import models
-from src.database.access import get_db
 
 router = APIRouter(tags=["subscriptions"])
 
@@ -19,32 +16,32 @@ def get_time_now() -> datetime.datetime:
 
 
 @router.get("/subscriptions/", response_model=List[schemas.SubscriptionBase])
-def get_subscriptions():
+async def get_subscriptions():
     """Returns subscription prices"""
 
     return SUBSCRIPTIONS
 
 
 @router.post("/subscriptions/")
-def subscribe(
-    user: models.UserModel = Depends(utils.user.retrieve_user),
+async def subscribe(
     sub_level: int = Body(..., ge=SUB_LEVEL_FREE, le=SUB_LEVEL_GOD, embed=True),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
 ):
     """Subscribes user to a subscription level"""
 
-    utils.subscription.subscribe(user, sub_level, pdb)
+    user = await context.get_user()
+    await utils.subscription.subscribe(user, sub_level, context.pdb)
 
 
 @router.post("/subscriptions/revoke/")
-def refresh_subscription(
-    pdb: Session = Depends(get_db),
+async def refresh_subscription(
     now: datetime.datetime = Depends(get_time_now),
-    role: roles.Role = Depends(get_role),
+    context: RequestContext = Depends(get_context),
 ):
     """Refreshes subscription"""
-    if not role.can_revoke():
+    if not context.role.can_revoke():
         raise MessageException(
             status_code=403, detail="You are not allowed to revoke subscriptions"
         )
-    utils.subscription.revoke_subscription(pdb, now)
+    revoked = await context.pdb.run_sync(utils.subscription.revoke_subscription, now)
+    return {"revoked": revoked}
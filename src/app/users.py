@@ -1,114 +1,231 @@
 from src.exceptions import MessageException
 from src import roles, utils, schemas
-from src.database.access import get_db
 from typing import Optional
 from fastapi import APIRouter
-from fastapi import Depends, UploadFile, Query
-from sqlalchemy.orm import Session
+from fastapi import Depends, Form, Header, UploadFile, Query
 from src.firebase.access import get_bucket, get_auth
+from src.firebase.uploads import signed_upload_url
 from src.database import models
+from starlette.concurrency import run_in_threadpool
 
-from src.schemas.pagination import CustomPage
+from src.schemas.pagination import CustomPage, TotalKind
+from src.schemas.utils import serialize
+from src.utils.context import RequestContext, get_context
 
 router = APIRouter(tags=["users"])
 
 
 @router.get("/users/", response_model=CustomPage[schemas.UserGet])
-def get_all_users(
-    pdb: Session = Depends(get_db),
+async def get_all_users(
+    context: RequestContext = Depends(get_context),
     limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
     offset: Optional[str] = Query(None),
 ):
     """Returns all users"""
 
-    users = models.UserModel.search(pdb, limit=limit, offset=offset)
+    users = await models.UserModel.asearch(
+        context.pdb, limit=limit, offset=offset, include_total=include_total
+    )
 
-    return users
+    return await serialize(context.pdb, CustomPage[schemas.UserGet], users)
 
 
 @router.get("/users/{uid}", response_model=schemas.UserGetById)
-def get_user_by_id(uid: str, pdb: Session = Depends(get_db)):
-    """Returns a user by its id or 404 if not found"""
+async def get_user_by_id(uid: str, context: RequestContext = Depends(get_context)):
+    """Returns a user by its id or 404 if not found. Only their first songs,
+    albums and playlists are included, the rest are in /users/{uid}/songs/,
+    /users/{uid}/albums/ and /users/{uid}/playlists/ from the offsets of the
+    response"""
 
-    user = models.UserModel.get(pdb, _id=uid)
+    user = await models.UserModel.aget(context.pdb, _id=uid)
 
-    return user
+    return await serialize(context.pdb, schemas.UserGetById, user)
+
+
+@router.get("/users/{uid}/songs/", response_model=CustomPage[schemas.SongBase])
+async def get_user_songs(
+    uid: str,
+    context: RequestContext = Depends(get_context),
+    limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
+    offset: Optional[str] = Query(None),
+):
+    """Returns the songs of a user, after the id in `offset`"""
+    user = await models.UserModel.aget(context.pdb, _id=uid)
+    songs = await models.SongModel.asearch(
+        context.pdb,
+        role=context.role,
+        creator_id=user.id,
+        limit=limit,
+        offset=offset,
+        include_total=include_total,
+    )
+    return await serialize(context.pdb, CustomPage[schemas.SongBase], songs)
+
+
+@router.get("/users/{uid}/albums/", response_model=CustomPage[schemas.AlbumBase])
+async def get_user_albums(
+    uid: str,
+    context: RequestContext = Depends(get_context),
+    limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
+    offset: Optional[str] = Query(None),
+):
+    """Returns the albums of a user, after the id in `offset`"""
+    user = await models.UserModel.aget(context.pdb, _id=uid)
+    albums = await models.AlbumModel.asearch(
+        context.pdb,
+        role=context.role,
+        creator_id=user.id,
+        limit=limit,
+        offset=offset,
+        include_total=include_total,
+    )
+    return await serialize(context.pdb, CustomPage[schemas.AlbumBase], albums)
+
+
+@router.get("/users/{uid}/playlists/", response_model=CustomPage[schemas.PlaylistBase])
+async def get_user_playlists(
+    uid: str,
+    context: RequestContext = Depends(get_context),
+    limit: int = Query(50, ge=1, le=100),
+    include_total: TotalKind = Query(TotalKind.exact),
+    offset: Optional[str] = Query(None),
+):
+    """Returns the playlists of a user, after the id in `offset`"""
+    user = await models.UserModel.aget(context.pdb, _id=uid)
+    playlists = await models.PlaylistModel.asearch(
+        context.pdb,
+        role=context.role,
+        creator_id=user.id,
+        limit=limit,
+        offset=offset,
+        include_total=include_total,
+    )
+    return await serialize(context.pdb, CustomPage[schemas.PlaylistBase], playlists)
 
 
 @router.get("/my_user/", response_model=schemas.UserGetById)
-def get_my_user(user: models.UserModel = Depends(utils.user.retrieve_user)):
+async def get_my_user(
+    context: RequestContext = Depends(get_context),
+):
     """Returns own user"""
+    user = await context.get_user()
 
-    return user
+    return await serialize(context.pdb, schemas.UserGetById, user)
 
 
 @router.post("/users/", response_model=schemas.UserGetById)
-def post_user(
+async def post_user(
     user_info: schemas.UserCreate = Depends(utils.user.retrieve_user_info),
     img: UploadFile = None,
     bucket=Depends(get_bucket),
-    auth=Depends(get_auth),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
+    idempotency_key: Optional[str] = Header(None),
 ):
-    """Creates a user and returns its id"""
+    """Creates a user and returns its id. With an `Idempotency-Key` header the
+    creation of its wallet is retried when the payments service fails"""
 
-    wallet = utils.subscription.create_wallet(user_info.uid)
+    wallet = await utils.subscription.create_wallet(user_info.uid, idempotency_key)
 
     user_info = user_info.dict()
     user_info["id"] = user_info["uid"]
 
     if img:
-        user = models.UserModel.create(
-            pdb, **user_info, wallet=wallet, pfp=img.file, bucket=bucket
+        user = await models.UserModel.acreate(
+            context.pdb, **user_info, wallet=wallet, pfp=img.file, bucket=bucket
         )
-        auth.update_user(uid=user_info["id"], photo_url=user.pfp_url)
     else:
-        user = models.UserModel.create(pdb, **user_info, wallet=wallet)
+        user = await models.UserModel.acreate(context.pdb, **user_info, wallet=wallet)
 
-    auth.update_user(uid=user.id, display_name=user.name)
-    return user
+    await context.pdb.run_sync(models.JobModel.enqueue, "sync_auth_user", uid=user.id)
+    return await serialize(context.pdb, schemas.UserGetById, user)
 
 
 @router.put("/users/{uid_to_modify}", response_model=schemas.UserGetById)
-def put_user(
-    uid: str = Depends(utils.user.retrieve_uid),
+async def put_user(
+    context: RequestContext = Depends(get_context),
     user_to_modify: models.UserModel = Depends(utils.user.retrieve_user_to_modify),
     user_update: schemas.UserUpdate = Depends(utils.user.retrieve_user_update),
-    pdb: Session = Depends(get_db),
     img: Optional[UploadFile] = None,
     bucket=Depends(get_bucket),
-    auth=Depends(get_auth),
 ):
     """Updates a user and returns its id or 404 if not found or 403 if not authorized to update"""
-    if uid != user_to_modify.id:
+    if context.uid != user_to_modify.id:
         raise MessageException(
             status_code=403,
-            detail=f"User with id {uid} attempted to modify user of id {user_to_modify.id}",
+            detail=f"User with id {context.uid} attempted to modify user of id {user_to_modify.id}",
         )
 
     if img:
-        modified_user = user_to_modify.update(
-            pdb, **user_update.dict(exclude_none=True), pfp=img.file, bucket=bucket
+        modified_user = await user_to_modify.aupdate(
+            context.pdb,
+            **user_update.dict(exclude_none=True),
+            pfp=img.file,
+            bucket=bucket,
         )
-        auth.update_user(uid=uid, photo_url=modified_user.pfp_url)
     else:
-        modified_user = user_to_modify.update(
-            pdb, **user_update.dict(exclude_none=True)
+        modified_user = await user_to_modify.aupdate(
+            context.pdb, **user_update.dict(exclude_none=True)
+        )
+    if img or user_update.name is not None:
+        await context.pdb.run_sync(
+            models.JobModel.enqueue, "sync_auth_user", uid=context.uid
+        )
+
+    return await serialize(context.pdb, schemas.UserGetById, modified_user)
+
+
+@router.post("/users/{uid_to_modify}/upload_url", response_model=schemas.UploadUrl)
+async def get_pfp_upload_url(
+    context: RequestContext = Depends(get_context),
+    user_to_modify: models.UserModel = Depends(utils.user.retrieve_user_to_modify),
+    bucket=Depends(get_bucket),
+):
+    """Returns a signed url to PUT the profile picture of the user to, then
+    POST to /users/{uid}/pfp to finish the upload"""
+    if context.uid != user_to_modify.id:
+        raise MessageException(
+            status_code=403,
+            detail=f"User with id {context.uid} attempted to modify user of id {user_to_modify.id}",
+        )
+
+    return await run_in_threadpool(
+        signed_upload_url, bucket, user_to_modify.pfp_blob_name
+    )
+
+
+@router.post("/users/{uid_to_modify}/pfp", response_model=schemas.UserGetById)
+async def finalize_pfp_upload(
+    context: RequestContext = Depends(get_context),
+    user_to_modify: models.UserModel = Depends(utils.user.retrieve_user_to_modify),
+    bucket=Depends(get_bucket),
+    upload_id: str = Form(...),
+):
+    """Records the profile picture uploaded to the url of
+    /users/{uid}/upload_url, `upload_id` is the one that came with the url"""
+    if context.uid != user_to_modify.id:
+        raise MessageException(
+            status_code=403,
+            detail=f"User with id {context.uid} attempted to modify user of id {user_to_modify.id}",
         )
-    if user_update.name is not None:
-        auth.update_user(uid=uid, display_name=user_update.name)
 
-    return modified_user
+    await context.pdb.run_sync(user_to_modify.finalize_pfp, bucket, upload_id)
+    await context.pdb.run_sync(
+        models.JobModel.enqueue, "sync_auth_user", uid=context.uid
+    )
+    return await serialize(context.pdb, schemas.UserGetById, user_to_modify)
 
 
 @router.delete("/users/{uid_to_delete}")
-def delete_user(
+async def delete_user(
     uid_to_delete: str,
-    user: models.UserModel = Depends(utils.user.retrieve_user),
-    pdb: Session = Depends(get_db),
+    context: RequestContext = Depends(get_context),
     bucket=Depends(get_bucket),
 ):
     """Deletes a user given its id or 404 if not found or 403 if not authorized to delete"""
+    user = await context.get_user()
 
     if user.id != uid_to_delete:
         raise MessageException(
@@ -116,18 +233,20 @@ def delete_user(
             detail=f"User with id {user.id} attempted to delete user of id {uid_to_delete}",
         )
 
-    utils.user.give_ownership_of_playlists_to_colabs(user)
+    await context.pdb.run_sync(utils.user.give_ownership_of_playlists_to_colabs, user)
 
-    user.delete(pdb, bucket=bucket)
+    await user.adelete(context.pdb, bucket=bucket)
 
 
 @router.post("/users/make_artist/")
-def make_artist(
-    uid: str = Depends(utils.user.retrieve_uid),
-    role: roles.Role = Depends(roles.get_role),
+async def make_artist(
+    context: RequestContext = Depends(get_context),
     auth=Depends(get_auth),
 ):
-    if role != roles.Role.listener():
+    if context.role != roles.Role.listener():
         raise MessageException(status_code=405, detail="Not a listener")
 
-    auth.set_custom_user_claims(uid, {"role": str(roles.Role.artist())})
+    uid = await context.get_uid()
+    await run_in_threadpool(
+        auth.set_custom_user_claims, uid, {"role": str(roles.Role.artist())}
+    )
@@ -1,11 +1,119 @@
 import os
 
+_TRUE = ("1", "true", "yes", "on")
+_FALSE = ("0", "false", "no", "off")
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """Flag of the environment, e.g. 1/0, true/false, yes/no or on/off in any
+    case. Unset or empty is the default"""
+    value = os.environ.get(name, "").strip().lower()
+    if not value:
+        return default
+    if value in _TRUE:
+        return True
+    if value in _FALSE:
+        return False
+    raise ValueError(f"{name} must be one of {_TRUE + _FALSE}, not {value!r}")
+
+
 ENVIRONTMENT = str(os.environ.get("ENVIRONMENT", "dev"))
 API_KEY = os.environ.get("API_KEY", "key")
 API_KEY_NAME = "api_key"
 PAYMENTS_API_KEY = os.environ.get("PAYMENTS_API_KEY", "key")
-TESTING = int(os.environ.get("TESTING", False))
+TESTING = env_bool("TESTING", False)
 SUPPRESS_BLOB_ERRORS = False
 STORAGE_PATH = "https://storage.googleapis.com/rostov-spotifiuby.appspot.com/"
 AGORA_APP_ID = os.environ.get("AGORA_APP_ID", "")
 AGORA_APP_CERT = os.environ.get("AGORA_APP_CERT", "")
+
+# Connection pool of the database, sized per worker process
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 5))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = env_bool("DB_POOL_PRE_PING", True)
+DB_POOL_WARMUP = int(os.environ.get("DB_POOL_WARMUP", 2))
+# In milliseconds
+DB_STATEMENT_TIMEOUT = int(os.environ.get("DB_STATEMENT_TIMEOUT", 30000))
+# Fails any request that sends more statements than this, 0 disables the check
+MAX_STATEMENTS_PER_REQUEST = int(os.environ.get("MAX_STATEMENTS_PER_REQUEST", 0))
+# Statements slower than this many milliseconds are logged, 0 disables the log.
+# With SLOW_STATEMENT_EXPLAIN the log has the plans of the slow selects too,
+# which runs them again with EXPLAIN ANALYZE inside the request that sent them.
+# Off by default, it doubles the time of the slowest reads
+SLOW_STATEMENT_THRESHOLD = float(os.environ.get("SLOW_STATEMENT_THRESHOLD", 500))
+SLOW_STATEMENT_EXPLAIN = env_bool("SLOW_STATEMENT_EXPLAIN", False)
+# Direct uploads to the bucket, see src/firebase/uploads.py
+UPLOAD_URL_EXPIRATION = int(os.environ.get("UPLOAD_URL_EXPIRATION", 900))  # seconds
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", 50 * 1024 * 1024))  # bytes
+# Background jobs, see src/jobs
+JOBS_MAX_ATTEMPTS = int(os.environ.get("JOBS_MAX_ATTEMPTS", 8))
+JOBS_BACKOFF_BASE = float(os.environ.get("JOBS_BACKOFF_BASE", 5))  # seconds
+JOBS_BACKOFF_MAX = float(os.environ.get("JOBS_BACKOFF_MAX", 3600))  # seconds
+# Running jobs whose worker has not finished them in this time are run again
+JOBS_LEASE = float(os.environ.get("JOBS_LEASE", 300))  # seconds
+JOBS_BATCH_SIZE = int(os.environ.get("JOBS_BATCH_SIZE", 20))
+JOBS_POLL_INTERVAL = float(os.environ.get("JOBS_POLL_INTERVAL", 2))  # seconds
+# Payments service, see src/payments
+PAYMENTS_URL = os.environ.get(
+    "PAYMENTS_URL", "https://rostov-payments-server.herokuapp.com/api/v1"
+)
+PAYMENTS_POOL_SIZE = int(os.environ.get("PAYMENTS_POOL_SIZE", 10))
+PAYMENTS_CONNECT_TIMEOUT = float(os.environ.get("PAYMENTS_CONNECT_TIMEOUT", 2))
+# Total time a call may take, retries included
+PAYMENTS_DEADLINE = float(os.environ.get("PAYMENTS_DEADLINE", 10))
+PAYMENTS_RETRIES = int(os.environ.get("PAYMENTS_RETRIES", 2))
+PAYMENTS_BACKOFF_BASE = float(os.environ.get("PAYMENTS_BACKOFF_BASE", 0.2))
+# Consecutive failures that open the circuit, and seconds it stays open
+PAYMENTS_BREAKER_FAILURES = int(os.environ.get("PAYMENTS_BREAKER_FAILURES", 5))
+PAYMENTS_BREAKER_RESET = float(os.environ.get("PAYMENTS_BREAKER_RESET", 30))
+# Subscription levels, see src/utils/subscription.py
+SUB_LEVEL_FREE = 0
+SUB_LEVEL_PREMIUM = 1
+SUB_LEVEL_PRO = 2
+SUB_LEVEL_GOD = 3
+# Items of each nested collection in detail responses, the rest are paged
+# through the endpoint of the collection
+NESTED_LIMIT = int(os.environ.get("NESTED_LIMIT", 50))
+# Levels of comment responses in responses
+NESTED_DEPTH = int(os.environ.get("NESTED_DEPTH", 5))
+# Most levels of comments a thread endpoint can be asked for
+THREAD_MAX_DEPTH = int(os.environ.get("THREAD_MAX_DEPTH", 20))
+# Rows kept by the in-process cache of entities looked up by id, see
+# src/database/cache.py. It is off by default in tests
+ENTITY_CACHE_ENABLED = env_bool("ENTITY_CACHE_ENABLED", not TESTING)
+ENTITY_CACHE_SIZE = int(os.environ.get("ENTITY_CACHE_SIZE", 10000))
+ENTITY_CACHE_TTL = float(os.environ.get("ENTITY_CACHE_TTL", 30))  # seconds
+# Listener of the invalidations of the other processes, see
+# src/database/invalidation.py
+INVALIDATION_RECONNECT_DELAY = float(
+    os.environ.get("INVALIDATION_RECONNECT_DELAY", 5)
+)  # seconds
+# Users whose subscription is revoked per statement
+REVOKE_BATCH_SIZE = int(os.environ.get("REVOKE_BATCH_SIZE", 1000))
+# Periodic tasks of src/scheduler.py, every this many seconds (0 disables them)
+SCHEDULER_INTERVAL = float(os.environ.get("SCHEDULER_INTERVAL", 300))
+# Processes of the server, see src/server.py. The amount of workers defaults
+# to one for each CPU, as many as SERVER_WORKER_MEMORY (in MB) fits in
+SERVER_RELOAD = env_bool("SERVER_RELOAD", False)
+SERVER_WORKERS = int(os.environ.get("WEB_CONCURRENCY", 0))
+SERVER_WORKER_MEMORY = int(os.environ.get("SERVER_WORKER_MEMORY", 256))
+# Requests after which a worker is replaced, plus up to the jitter (0 never)
+SERVER_MAX_REQUESTS = int(os.environ.get("SERVER_MAX_REQUESTS", 10000))
+SERVER_MAX_REQUESTS_JITTER = int(os.environ.get("SERVER_MAX_REQUESTS_JITTER", 1000))
+# Seconds the requests being served get to finish when a worker stops
+SERVER_GRACEFUL_TIMEOUT = float(os.environ.get("SERVER_GRACEFUL_TIMEOUT", 25))
+# Whether the supervisor also runs the jobs worker of src/jobs
+SERVER_JOBS = env_bool("SERVER_JOBS", False)
+# Metrics served by GET /metrics, see src/metrics. The worker processes of
+# src/server.py add theirs up through files in METRICS_DIR (a temporary
+# directory when not set), written every METRICS_WRITE_INTERVAL seconds. The
+# jobs worker writes its own there too when it is set
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+METRICS_WRITE_INTERVAL = float(os.environ.get("METRICS_WRITE_INTERVAL", 5))
+# Scrapers and probes connecting from these networks (comma separated) read
+# /metrics and /health/db without the API key, the rest need it
+METRICS_ALLOWED_NETWORKS = os.environ.get(
+    "METRICS_ALLOWED_NETWORKS", "127.0.0.0/8,::1/128"
+)
@@ -1,11 +1,16 @@
 import os
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-import time
+from sqlalchemy.util import await_fallback
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
 
 from src.constants import TESTING
+from src.database import pool, unit_of_work
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,27 +24,53 @@ else:
     print("PROD DB")
     POSTGRES_URL = os.environ.get("POSTGRES_URL", "")
 
-engine = create_engine(POSTGRES_URL)
 
-for x in range(10):
-    try:
-        print("Trying to connect to DB - " + str(x))
-        engine.connect()
-        break
-    except:  # noqa: E722 # Want to catch all exceptions
-        time.sleep(1)
-        engine = create_engine(POSTGRES_URL)
+def async_url(url: str):
+    """Returns the same database url but using the asyncpg driver"""
+    return make_url(url).set(drivername="postgresql+asyncpg")
+
+
+# Engines connect lazily, the pool is warmed up when the application starts
+engine = create_engine(POSTGRES_URL, **pool.sync_engine_options())
+async_engine = create_async_engine(async_url(POSTGRES_URL), **pool.engine_options())
+pool.instrument(async_engine)
+
+
+def _dispose_after_fork():
+    """Workers forked by src/server.py open their own connections instead of
+    sharing those of the supervisor"""
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
 
+
+os.register_at_fork(after_in_child=_dispose_after_fork)
+
+# The sync session is kept for tooling that runs outside the event loop,
+# requests are served with AsyncSessionLocal through get_db
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+)
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
+async def get_db(request: Request):
+    """Session of the request. It is committed once, when the handler is done,
+    handlers that need to commit earlier do it explicitly"""
+    db = AsyncSessionLocal()
+    unit_of_work.track(request, db)
     try:
         yield db
-    except Exception as e:
-        db.close()
-        raise e
     finally:
-        db.close()
+        await db.close()
+
+
+def run_blocking(fn, *args, **kwargs):
+    """Runs a blocking call (e.g. a bucket upload) in a worker thread.
+    Meant to be called from sync code running inside AsyncSession.run_sync,
+    so that the event loop is not blocked while waiting for it"""
+    return await_fallback(run_in_threadpool(fn, *args, **kwargs))
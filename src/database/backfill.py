@@ -0,0 +1,20 @@
+"""Recomputes the denormalized columns of the database from their source rows.
+
+Usage: python -m src.database.backfill
+"""
+from src import schemas  # noqa: F401 # Loads the schemas before the models
+from src.database import models
+from src.database.access import SessionLocal
+
+
+def backfill(pdb):
+    models.AlbumModel.backfill_scores(pdb)
+
+
+if __name__ == "__main__":
+    pdb = SessionLocal()
+    try:
+        backfill(pdb)
+        print("Backfilled album scores")
+    finally:
+        pdb.close()
@@ -0,0 +1,233 @@
+"""In-process cache of the entities looked up by id on most requests, e.g.
+the song, album or playlist of the path and the user making the request.
+
+Entries hold the column values of a row, never ORM objects, which belong to
+the session that loaded them. A hit builds a new instance in the session of
+the request as if a query had loaded it, relationships unloaded. Entries are
+dropped after `ttl` seconds and the least recently used ones once there are
+more than `size`.
+
+Writes drop the entries of the rows they change: `CRUDMixin.save` and
+`delete`, and the statements that update rows behind the session (see
+`invalidate_all`). The entries are dropped again when the transaction ends,
+as another request may have cached the row between the write and its commit.
+Other processes are told about the writes once they commit, see
+src/database/invalidation.py.
+
+A lookup that misses reads the row and then stores it, and a drop can land
+in between: the row it read may be the one from before the write. So every
+drop is numbered, and a lookup only stores the row if none of the drops made
+since it started were of that row or its class.
+"""
+import copy
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from src.constants import ENTITY_CACHE_ENABLED, ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL
+
+# Rows (and whole classes) a session wrote, by key in `Session.info`
+_WRITTEN = "entity_cache_written"
+
+
+class EntityCache:
+    def __init__(
+        self,
+        size: int = ENTITY_CACHE_SIZE,
+        ttl: float = ENTITY_CACHE_TTL,
+        enabled: bool = ENTITY_CACHE_ENABLED,
+        clock=time.monotonic,
+    ):
+        self.size = size
+        self.ttl = ttl
+        self.enabled = enabled
+        self.clock = clock
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        # Number of the last drop, and of the last drop of each row (by
+        # identity key) or class made while lookups that started before it
+        # were still reading
+        self._generation = 0
+        self._dropped: Dict[object, int] = {}
+        self._cleared = 0
+        # Lookups reading the database, by the generation they started at
+        self._reading: Counter = Counter()
+        self.reset()
+
+    def reset(self):
+        """Drops every entry and zeroes the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.counters = {
+                "hits": 0,
+                "misses": 0,
+                "evictions": 0,
+                "expirations": 0,
+                "invalidations": 0,
+            }
+
+    def get(self, pdb: Session, cls, _id):
+        """The record of the id in the session, None if there is none. Read
+        from the cache if the session does not have it yet"""
+        key = identity_key(cls, _id)
+        if not self.enabled or key in pdb.identity_map:
+            return pdb.query(cls).get(_id)
+
+        values = self._lookup(key)
+        if values is not None:
+            return _attach(pdb, cls, values)
+
+        generation = self._start_reading()
+        try:
+            item = pdb.query(cls).get(_id)
+            # A session that wrote the row may hold changes that are not
+            # committed
+            written = self.written(pdb)
+            if item is not None and key not in written and cls not in written:
+                self._store(key, _values_of(item), generation)
+        finally:
+            self._stop_reading(generation)
+        return item
+
+    def invalidate(self, pdb: Session, cls, *ids):
+        """Drops the entries of the rows, now and once the transaction of the
+        session ends"""
+        pdb.info.setdefault(_WRITTEN, set()).update(
+            identity_key(cls, _id) for _id in ids
+        )
+        self.drop(cls, *ids)
+
+    def invalidate_all(self, pdb: Session, cls):
+        """Drops the entries of every row of the class, for statements that
+        change rows without going through the session, e.g. set-based updates"""
+        pdb.info.setdefault(_WRITTEN, set()).add(cls)
+        self.drop_all(cls)
+
+    def drop(self, cls, *ids):
+        """Drops the entries of the rows, outside of any session"""
+        keys = {identity_key(cls, _id) for _id in ids}
+        self._drop(lambda key: key in keys, keys)
+
+    def drop_all(self, cls):
+        self._drop(lambda key: key[0] is cls, [cls])
+
+    def clear(self):
+        """Drops every entry, keeping the counters"""
+        self._drop(lambda key: True)
+
+    @staticmethod
+    def written(pdb: Session):
+        """Identity keys of the rows, and classes, the transaction of the
+        session invalidated"""
+        return pdb.info.get(_WRITTEN, set())
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.counters, "size": len(self._entries)}
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            expires, values = entry
+            if expires <= self.clock():
+                del self._entries[key]
+                self.counters["expirations"] += 1
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return values
+
+    def _start_reading(self) -> int:
+        with self._lock:
+            self._reading[self._generation] += 1
+            return self._generation
+
+    def _stop_reading(self, generation: int):
+        with self._lock:
+            self._reading[generation] -= 1
+            if self._reading[generation]:
+                return
+            del self._reading[generation]
+            # Drops older than every lookup still reading no longer matter
+            oldest = min(self._reading, default=self._generation)
+            if generation < oldest:
+                self._dropped = {
+                    dropped: at for dropped, at in self._dropped.items() if at > oldest
+                }
+
+    def _store(self, key, values, generation: int):
+        """Stores the row read by a lookup that started at `generation`,
+        unless it was dropped since"""
+        with self._lock:
+            dropped = max(
+                self._cleared,
+                self._dropped.get(key, 0),
+                self._dropped.get(key[0], 0),
+            )
+            if dropped > generation:
+                return
+            self._entries[key] = (self.clock() + self.ttl, values)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def _drop(self, matches, dropped=None):
+        """Drops the entries that match, `dropped` are their keys or classes
+        (all of them if None) for the lookups reading meanwhile"""
+        with self._lock:
+            self._generation += 1
+            if self._reading:
+                if dropped is None:
+                    self._cleared = self._generation
+                else:
+                    for keys in dropped:
+                        self._dropped[keys] = self._generation
+            for key in [key for key in self._entries if matches(key)]:
+                del self._entries[key]
+                self.counters["invalidations"] += 1
+
+    def _end_transaction(self, pdb: Session):
+        for written in pdb.info.pop(_WRITTEN, ()):
+            if isinstance(written, tuple):
+                self._drop(lambda key: key == written, [written])
+            else:
+                self._drop(lambda key: key[0] is written, [written])
+
+
+def _values_of(item) -> dict:
+    """Copies of the loaded columns of the record"""
+    state = inspect(item)
+    return {
+        attr.key: copy.deepcopy(state.dict[attr.key])
+        for attr in state.mapper.column_attrs
+        if attr.key in state.dict
+    }
+
+
+def _attach(pdb: Session, cls, values: dict):
+    item = inspect(cls).class_manager.new_instance()
+    for key, value in values.items():
+        set_committed_value(item, key, copy.deepcopy(value))
+    make_transient_to_detached(item)
+    pdb.add(item)
+    return item
+
+
+entity_cache = EntityCache()
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _after_transaction(pdb: Session):
+    entity_cache._end_transaction(pdb)
@@ -0,0 +1,36 @@
+import json
+
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) of a statement, keeping its bound parameters"""
+
+    inherit_cache = False
+
+    def __init__(self, statement, analyze: bool = False):
+        self.statement = statement
+        self.analyze = analyze
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element: Explain, compiler, **kw):
+    options = "ANALYZE, FORMAT JSON" if element.analyze else "FORMAT JSON"
+    return f"EXPLAIN ({options}) " + compiler.process(element.statement, **kw)
+
+
+def explain(pdb: Session, statement, analyze: bool = False):
+    """Returns the plan of the statement as a dict"""
+    plan = pdb.execute(Explain(statement, analyze=analyze)).scalar()
+    # psycopg2 decodes the json column but asyncpg returns it as text
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def estimate_rows(pdb: Session, statement) -> int:
+    """Returns how many rows the planner expects the statement to return,
+    which only relies on table statistics instead of scanning the rows"""
+    return int(explain(pdb, statement)["Plan"]["Plan Rows"])
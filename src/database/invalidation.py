@@ -0,0 +1,190 @@
+"""Invalidation of the entity caches of every process, see
+src/database/cache.py.
+
+The transactions that invalidate cached rows publish their table and id
+with NOTIFY when they commit. Postgres delivers the message only if the
+transaction commits, and only after it does, to every process listening to
+the channel, so no process can cache the old row again once it gets the
+message. Each process listens on a connection of its own, outside of the
+pool, and drops the entries of the rows. Messages sent while a process was
+not listening are lost, so it drops all of its entries when it connects.
+
+The lag of the bus is the time from the commit of a write to the moment
+the other processes drop its entries. It is measured with the clocks of
+the processes, so with several machines it also includes their skew.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Optional
+
+import asyncpg
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from src.constants import INVALIDATION_RECONNECT_DELAY
+from src.database.access import POSTGRES_URL, Base
+from src.database.cache import EntityCache, entity_cache
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "entity_cache"
+# Tells the messages of this process apart, it already dropped their entries
+ORIGIN = uuid.uuid4().hex
+# Payloads must be shorter than 8000 bytes, bigger invalidations are sent
+# as invalidations of their whole tables
+MAX_PAYLOAD = 7000
+
+
+def message(written, sent: float) -> str:
+    """Payload of the invalidations of a transaction"""
+    rows = [
+        [key[0].__table__.name, key[1][0]] for key in written if isinstance(key, tuple)
+    ]
+    tables = sorted({cls.__table__.name for cls in written if isinstance(cls, type)})
+    payload = json.dumps(
+        {"origin": ORIGIN, "sent": sent, "rows": rows, "tables": tables}
+    )
+    if len(payload) > MAX_PAYLOAD:
+        tables = sorted({table for table, _ in rows} | set(tables))
+        payload = json.dumps(
+            {"origin": ORIGIN, "sent": sent, "rows": [], "tables": tables}
+        )
+    return payload
+
+
+@event.listens_for(Session, "before_commit")
+def _publish(pdb: Session):
+    if not entity_cache.enabled:
+        return
+    # Flushes now rather than in the commit, as the flush can invalidate rows
+    if pdb.new or pdb.dirty or pdb.deleted:
+        pdb.flush()
+    written = entity_cache.written(pdb)
+    if written:
+        pdb.execute(select(func.pg_notify(CHANNEL, message(written, time.time()))))
+
+
+def _new_origin():
+    """Workers forked by src/server.py import the application before forking,
+    each of them needs an origin of its own or they would ignore each other"""
+    global ORIGIN
+    ORIGIN = uuid.uuid4().hex
+
+
+os.register_at_fork(after_in_child=_new_origin)
+
+
+def listen_dsn() -> str:
+    """Url of the database for asyncpg itself"""
+    url = make_url(POSTGRES_URL).set(drivername="postgresql")
+    return url.render_as_string(hide_password=False)
+
+
+class InvalidationListener:
+    """Drops the entries of the entity cache of this process that the writes
+    of other processes invalidated"""
+
+    def __init__(
+        self,
+        cache: EntityCache = entity_cache,
+        dsn: Optional[str] = None,
+        reconnect_delay: float = INVALIDATION_RECONNECT_DELAY,
+    ):
+        self.cache = cache
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self.connected = False
+        self.reconnects = 0
+        self.messages = 0
+        # Seconds from the commit of a write to the drop of its entries
+        self.lag_last: Optional[float] = None
+        self.lag_max = 0.0
+        self.last_message_at: Optional[float] = None
+        self._tables = None
+        self._task: Optional[asyncio.Task] = None
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "reconnects": self.reconnects,
+            "messages": self.messages,
+            "lag_last": self.lag_last,
+            "lag_max": self.lag_max,
+            "last_message_at": self.last_message_at,
+        }
+
+    async def listen(self):
+        """Listens until the connection is lost"""
+        connection = await asyncpg.connect(self.dsn or listen_dsn())
+        closed = asyncio.Event()
+        connection.add_termination_listener(lambda _connection: closed.set())
+        try:
+            await connection.add_listener(CHANNEL, self._on_notification)
+            self.connected = True
+            self.cache.clear()
+            logger.info("Listening to the invalidations of the entity cache")
+            await closed.wait()
+        finally:
+            self.connected = False
+            if not connection.is_closed():
+                await connection.close()
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.listen()
+            except Exception:
+                logger.exception("Lost the invalidations of the entity cache")
+            self.reconnects += 1
+            await asyncio.sleep(self.reconnect_delay)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def _on_notification(self, _connection, _pid, _channel, payload: str):
+        try:
+            invalidation = json.loads(payload)
+        except ValueError:
+            logger.warning("Invalid invalidation message: %s", payload)
+            return
+        if invalidation.get("origin") == ORIGIN:
+            return
+
+        tables = self._classes_by_table()
+        for table, _id in invalidation.get("rows", []):
+            if table in tables:
+                self.cache.drop(tables[table], _id)
+        for table in invalidation.get("tables", []):
+            if table in tables:
+                self.cache.drop_all(tables[table])
+
+        now = time.time()
+        self.messages += 1
+        self.last_message_at = now
+        self.lag_last = max(now - invalidation.get("sent", now), 0.0)
+        self.lag_max = max(self.lag_max, self.lag_last)
+
+    def _classes_by_table(self):
+        if self._tables is None:
+            self._tables = {
+                mapper.local_table.name: mapper.class_
+                for mapper in Base.registry.mappers
+            }
+        return self._tables
+
+
+listener = InvalidationListener()
@@ -1,8 +1,10 @@
 from .album import AlbumModel
 from .artist import ArtistModel
+from .job import JobModel
 from .comment import CommentModel
 from .playlist import PlaylistModel
 from .review import ReviewModel
+from .scheduled_task import ScheduledTaskModel
 from .song import SongModel
 from .streaming import StreamingModel
 from .tables import (
@@ -1,21 +1,28 @@
 from src.exceptions import MessageException
 from typing import Optional
 
-from sqlalchemy import Column, ForeignKey, String
-from sqlalchemy.orm import relationship, Session, contains_eager
+from sqlalchemy import Column, Float, ForeignKey, Index, Integer, String
+from sqlalchemy import case, func, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import relationship, Session
 from sqlalchemy.sql import and_
 from . import templates, tables
+from .crud_template import count_total
+from src.database.search import TextMatch, matches, search_vector, trigram_index
 from .artist import ArtistModel
 from .song import SongModel
 from sqlalchemy.orm.query import Query
 from fastapi import status
-from sqlalchemy.sql import func
 
-from ...schemas.pagination import CustomPage
+from ..cache import entity_cache
+from src.constants import NESTED_LIMIT
+from src.schemas.loading import bound
+from ...schemas.pagination import CustomPage, TotalKind
 
 
 class AlbumModel(templates.ResourceWithFile):
     __tablename__ = "albums"
+    cached = True
 
     creator = relationship("UserModel", back_populates="albums")
     creator_id = Column(String, ForeignKey("users.id"), nullable=True)
@@ -35,21 +42,39 @@ class AlbumModel(templates.ResourceWithFile):
         back_populates="favorite_albums",
     )
 
+    # Aggregates of the scores of the reviews, kept up to date by the
+    # ReviewModel flush events so that listing albums does not load reviews
+    score_sum = Column(Integer, nullable=False, default=0, server_default="0")
+    score_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    @classmethod
+    def rating(cls):
+        """Average score of the album as a SQL expression, 0 if it has no scores"""
+        return case(
+            (cls.score_count > 0, cls.score_sum.cast(Float) / cls.score_count),
+            else_=0.0,
+        )
+
     @classmethod
     def search(cls, pdb: Session, **kwargs):
         query: Query = kwargs.pop("query", None)
         if query is None:
             query = pdb.query(cls)
 
+        min_score = kwargs.pop("min_score", None)
+        if min_score is not None:
+            query = query.filter(cls.rating() >= min_score)
+        if kwargs.pop("sort_by", None) == "rating":
+            kwargs["rank"] = cls.rating()
+
         artist_name = kwargs.pop("artist", None)
+        match = kwargs.get("match", TextMatch.substring)
         if artist_name is not None:
-            query = (
-                query.options(contains_eager("songs"))
-                .join(SongModel, full=True)
-                .filter(
-                    SongModel.artists.any(
-                        func.lower(ArtistModel.name).contains(artist_name.lower())
-                    )
+            # A subquery rather than a join, so that each album is a single row
+            # and the pages are not cut short by its repeated rows
+            query = query.filter(
+                cls.songs.any(
+                    SongModel.artists.any(matches(ArtistModel.name, artist_name, match))
                 )
             )
 
@@ -62,24 +87,13 @@ class AlbumModel(templates.ResourceWithFile):
         role = kwargs.pop("role")
         requester_id = kwargs.get("requester_id")
 
-        join_conditions = [SongModel.album_id == AlbumModel.id]
-        filters = [album_id == cls.id]
-        if not role.can_see_blocked():
-            join_conditions.append(SongModel.blocked == False)
-
-        albums = (
-            pdb.query(cls)
-            .options(contains_eager("songs"))
-            .join(cls.songs.and_(*join_conditions), full=True)
-            .filter(and_(True, *filters))
-            .all()
-        )
-
-        if len(albums) == 0:
+        # The songs are loaded by the responses that need them, see
+        # `bound_songs`
+        album = cls.lookup(pdb, album_id)
+        if album is None:
             raise MessageException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Album not found"
             )
-        album = albums[0]
         if (
             album.blocked
             and not role.can_see_blocked()
@@ -92,32 +106,81 @@ class AlbumModel(templates.ResourceWithFile):
 
     @property
     def score(self):
-        if self.scores_amount == 0:
+        if self.score_count == 0:
             return 0
-        return (
-            sum([review.score for review in self.reviews if review.score is not None])
-            / self.scores_amount
-        )
+        return self.score_sum / self.score_count
 
     @property
     def scores_amount(self):
-        return len(
-            [self.reviews for review in self.reviews if review.score is not None]
+        return self.score_count
+
+    @classmethod
+    def add_score(
+        cls, connection: Connection, album_id: int, score: int, amount: int = 1
+    ):
+        """Atomically adds (or removes, with a negative amount) a review score
+        to the aggregates of the album. Meant to be called while flushing"""
+        if score is None:
+            return None
+        statement = (
+            update(cls)
+            .where(cls.id == album_id)
+            .values(
+                score_sum=cls.score_sum + score * amount,
+                score_count=cls.score_count + amount,
+            )
+            .returning(cls.score_sum, cls.score_count)
+        )
+        return connection.execute(statement).first()
+
+    @classmethod
+    def backfill_scores(cls, pdb: Session):
+        """Recomputes the score aggregates of every album from its reviews"""
+        from .review import ReviewModel
+
+        reviews = pdb.query(ReviewModel).filter(ReviewModel.album_id == cls.id)
+        pdb.execute(
+            update(cls)
+            .values(
+                score_sum=reviews.with_entities(
+                    func.coalesce(func.sum(ReviewModel.score), 0)
+                ).scalar_subquery(),
+                score_count=reviews.with_entities(
+                    func.count(ReviewModel.score)
+                ).scalar_subquery(),
+            )
+            .execution_options(synchronize_session=False)
         )
+        entity_cache.invalidate_all(pdb, cls)
+        pdb.commit()
 
     def update(self, pdb: Session, **kwargs):
         songs_ids = kwargs.pop("songs_ids", None)
         role = kwargs.get("role")
 
         if songs_ids is not None:
-            songs = []
-            for song_id in songs_ids:
-                song = SongModel.get(pdb, song_id, role=role)
-                songs.append(song)
-            self.songs = songs
+            kwargs["songs"] = SongModel.get_many(pdb, ids=songs_ids, role=role)
+        songs = kwargs.get("songs")
+        if songs is not None and not role.can_see_blocked():
+            # Blocked songs are not seen by the role, so they are kept
+            kwargs["songs"] = songs + [
+                song for song in self.songs if song.blocked and song not in songs
+            ]
         return super().update(pdb, **kwargs)
 
-    def get_reviews(self, pdb: Session, limit: int, offset: Optional[str]):
+    def bound_songs(self, pdb: Session, role):
+        """Loads the first songs of the album for its response, without the
+        blocked ones unless the role can see them"""
+        filters = [] if role.can_see_blocked() else [SongModel.blocked == False]
+        bound(pdb, [self], "songs", NESTED_LIMIT, *filters)
+
+    def get_reviews(
+        self,
+        pdb: Session,
+        limit: int,
+        offset: Optional[str],
+        include_total: TotalKind = TotalKind.exact,
+    ):
         from .review import ReviewModel
         from .user import UserModel
 
@@ -134,6 +197,20 @@ class AlbumModel(templates.ResourceWithFile):
             items = query.filter(UserModel.id > offset).limit(limit).all()
         offset = items[-1].reviewer_id if len(items) > 0 else None
 
-        total = query.count()
+        total = count_total(query, include_total)
+
+        return CustomPage(
+            items=items,
+            limit=limit,
+            total=total,
+            offset=offset,
+            total_kind=include_total,
+        )
+
 
-        return CustomPage(items=items, limit=limit, total=total, offset=offset)
+# GIN indexes backing the prefix search of `matches`
+Index("ix_albums_name_search", search_vector(AlbumModel.name), postgresql_using="gin")
+Index("ix_albums_genre_search", search_vector(AlbumModel.genre), postgresql_using="gin")
+# and the trigram ones backing its substring search
+trigram_index(AlbumModel.__table__, "name")
+trigram_index(AlbumModel.__table__, "genre")
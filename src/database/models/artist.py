@@ -1,7 +1,11 @@
-from sqlalchemy import Column, String
+from typing import List
+
+from sqlalchemy import Column, Index, String
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import relationship, Session
 from . import tables
 from .crud_template import CRUDMixin
+from src.database.search import search_vector, trigram_index
 
 
 class ArtistModel(CRUDMixin):
@@ -19,8 +23,20 @@ class ArtistModel(CRUDMixin):
         return super().create(pdb, **kwargs)
 
     @classmethod
-    def get_or_create(cls, pdb: Session, name: str):
-        artist = pdb.query(cls).filter(cls.name == name).first()
-        if artist is None:
-            artist = cls.create(pdb, name=name)
-        return artist
+    def get_or_create_many(cls, pdb: Session, names: List[str]):
+        """The artists of the names, creating the missing ones. Takes one
+        insert and one select however many artists there are"""
+        names = list(dict.fromkeys(names))
+        if names:
+            pdb.execute(
+                insert(cls.__table__)
+                .values([{"name": name} for name in names])
+                .on_conflict_do_nothing()
+            )
+        return cls.get_many(pdb, ids=names)
+
+
+# GIN indexes backing the prefix search of `matches`
+Index("ix_artists_name_search", search_vector(ArtistModel.name), postgresql_using="gin")
+# and the trigram ones backing its substring search
+trigram_index(ArtistModel.__table__, "name")
@@ -1,13 +1,30 @@
 from src.exceptions import MessageException
 import datetime
+from typing import List
 from fastapi import status
-from sqlalchemy import Column, ForeignKey, Integer, String, TIMESTAMP
-from sqlalchemy.orm import relationship, Session
-from .crud_template import CRUDMixin
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    TIMESTAMP,
+    case,
+    cast,
+    exists,
+    func,
+    literal_column,
+    select,
+    true,
+)
+from sqlalchemy.orm import aliased, joinedload, relationship, Session
+from .crud_template import CRUDMixin, count_total
 from .user import UserModel
 from .album import AlbumModel
 from ... import roles
-from ...schemas.pagination import CustomPage
+from ...schemas.loading import bounded_of
+from ...schemas.pagination import CustomPage, TotalKind
 
 
 class CommentModel(CRUDMixin):
@@ -56,16 +73,24 @@ class CommentModel(CRUDMixin):
 
         limit = kwargs.pop("limit")
         offset = kwargs.pop("offset")
-        total = query.count()
+        include_total = kwargs.pop("include_total", TotalKind.exact)
+        total = count_total(query, include_total)
         items = query.order_by(cls.id).filter(cls.id > offset).limit(limit).all()
 
         offset = items[-1].id if items else None
 
-        return CustomPage(items=items, limit=limit, offset=offset, total=total)
+        return CustomPage(
+            items=items,
+            limit=limit,
+            offset=offset,
+            total=total,
+            total_kind=include_total,
+        )
 
     @classmethod
     def search(cls, pdb: Session, **kwargs):
         commenter_id = kwargs.pop("commenter_id", None)
+        parent_id = kwargs.pop("parent_id", None)
         query = kwargs.pop("query", None)
 
         if query is None:
@@ -73,6 +98,8 @@ class CommentModel(CRUDMixin):
 
         if commenter_id is not None:
             query = query.filter(cls.commenter_id == commenter_id)
+        if parent_id is not None:
+            query = query.filter(cls.parent_id == parent_id)
 
         return super().search(pdb, query=query, **kwargs)
 
@@ -88,6 +115,103 @@ class CommentModel(CRUDMixin):
             )
         return comment
 
+    @classmethod
+    def load_threads(
+        cls, pdb: Session, comments: List["CommentModel"], depth: int, limit: int
+    ):
+        """
+        Loads the threads under the comments (of the same album) with a
+        single recursive query: `depth` levels of comments counting them, the
+        first `limit` responses of each comment by id, and the commenter and
+        album of all of them.
+
+        The responses are kept as bounded collections (see `bound`), with the
+        offset of the next page of the comments whose responses were cut:
+        the id of the last response returned, or "0" for the comments of the
+        last level that have any.
+        """
+        if not comments:
+            return
+        album_id = comments[0].album_id
+
+        # Roots have rank 0, so that they always get their responses
+        thread = (
+            select(
+                cls.id,
+                cls.parent_id,
+                literal_column("1").label("depth"),
+                cast(literal_column("0"), BigInteger).label("rank"),
+            )
+            .where(cls.id.in_([comment.id for comment in comments]))
+            .cte("thread", recursive=True)
+        )
+        reply = aliased(cls)
+        # One response more than the limit tells whether there are more
+        responses = (
+            select(
+                reply.id,
+                reply.parent_id,
+                func.row_number().over(order_by=reply.id).label("rank"),
+            )
+            .where(reply.album_id == album_id, reply.parent_id == thread.c.id)
+            .order_by(reply.id)
+            .limit(limit + 1)
+            .lateral("responses")
+        )
+        thread = thread.union_all(
+            select(
+                responses.c.id,
+                responses.c.parent_id,
+                thread.c.depth + 1,
+                responses.c.rank,
+            )
+            .select_from(thread.join(responses, true()))
+            .where(thread.c.depth < depth, thread.c.rank <= limit)
+        )
+
+        # Only the comments of the last level need to know whether they have
+        # responses, the rest got them
+        has_responses = case(
+            (
+                thread.c.depth == depth,
+                exists().where(
+                    reply.album_id == album_id, reply.parent_id == thread.c.id
+                ),
+            ),
+            else_=False,
+        )
+        comment = aliased(cls)
+        rows = pdb.execute(
+            select(comment, thread.c.depth, thread.c.rank, has_responses)
+            .join(thread, thread.c.id == comment.id)
+            .options(joinedload(comment.commenter), joinedload(comment.album))
+            .order_by(thread.c.depth, comment.id)
+        ).all()
+
+        responses_of = {}
+        for response, _, _, _ in rows:
+            responses_of.setdefault(response.parent_id, []).append(response)
+        for comment, level, rank, more in rows:
+            if rank > limit:
+                continue
+            if level == depth:
+                bounded_of(comment)["responses"] = ([], "0" if more else None)
+                continue
+            items = responses_of.get(comment.id, [])
+            offset = None
+            if len(items) > limit:
+                offset = str(items[limit - 1].id) if limit else "0"
+            bounded_of(comment)["responses"] = (items[:limit], offset)
+
     def soft_delete(self, pdb: Session):
         self.text = None
-        pdb.commit()
+        pdb.flush()
+
+
+# Backs the responses of a comment in the thread of an album, by id
+Index(
+    "ix_comments_album_parent",
+    CommentModel.album_id,
+    CommentModel.parent_id,
+    CommentModel.id,
+)
@@ -1,11 +1,58 @@
 from src.exceptions import MessageException
 
+from sqlalchemy import and_, inspect, or_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from src.database.access import Base
+from src.database import invalidation  # noqa: F401 # Publishes the invalidations
+from src.database.cache import entity_cache
 from fastapi import status
 from sqlalchemy.orm.query import Query
 
-from src.schemas.pagination import CustomPage
+from src.database.explain import estimate_rows
+from src.schemas.pagination import CustomPage, TotalKind
+
+
+def count_total(query: Query, include_total: TotalKind = TotalKind.exact):
+    """Total of rows of a paginated query, computed as requested by the client."""
+    if include_total == TotalKind.none:
+        return None
+    if include_total == TotalKind.estimated:
+        return estimate_rows(query.session, query.order_by(None).statement)
+    return query.count()
+
+
+def decode_rank_cursor(offset: str, rank_type=float):
+    """Splits the cursor of a page ordered by rank in its rank and id"""
+    try:
+        rank, _id = offset.split(":")
+        return rank_type(rank), int(_id)
+    except ValueError:
+        raise MessageException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Invalid offset {offset}",
+        )
+
+
+def decode_id_cursor(column, offset):
+    """The cursor of a page ordered by id as an id, e.g. a rank cursor sent to
+    a page that has no rank is rejected instead of compared to the ids"""
+    if offset is None:
+        return None
+    try:
+        return column.type.python_type(offset)
+    except (TypeError, ValueError):
+        raise MessageException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Invalid offset {offset}",
+        )
+
+
+def _end(pdb: Session, commit: bool):
+    if commit:
+        pdb.commit()
+    else:
+        pdb.flush()
 
 
 class CRUDMixin(Base):
@@ -13,17 +60,21 @@ class CRUDMixin(Base):
 
     __abstract__ = True
 
+    # Whether lookups by id go through the entity cache, see
+    # src/database/cache.py
+    cached = False
+
     @classmethod
     def create(cls, pdb: Session, **kwargs):
         """Create a new record and save it the database."""
-        commit = kwargs.get("commit", True)
+        commit = kwargs.pop("commit", False)
         instance = cls(**kwargs)
         return instance.save(pdb, commit=commit)
 
     @classmethod
     def get(cls, pdb: Session, _id, raise_if_not_found=True, **kwargs):
         """Get a record by its id."""
-        item = pdb.query(cls).get(_id)
+        item = cls.lookup(pdb, _id)
         if item is None and raise_if_not_found:
             raise MessageException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -31,16 +82,31 @@ class CRUDMixin(Base):
             )
         return item
 
+    @classmethod
+    def lookup(cls, pdb: Session, _id):
+        """The record of the id or None, without any check"""
+        if cls.cached:
+            return entity_cache.get(pdb, cls, _id)
+        return pdb.query(cls).get(_id)
+
     @classmethod
     def get_many(cls, pdb: Session, *args, **kwargs):
-        ids = kwargs.pop("ids")
-        items = pdb.query(cls).filter(cls.id.in_(ids)).all()
+        """Get the records of the ids with a single query, in the order of the
+        ids and without repeating them. Subclasses add their checks as SQL
+        `filters`, a record filtered out counts as not found."""
+        ids = list(dict.fromkeys(kwargs.pop("ids")))
+        filters = kwargs.pop("filters", [])
+        if not ids:
+            return []
+        primary_key = inspect(cls).primary_key[0]
+        items = pdb.query(cls).filter(primary_key.in_(ids), *filters).all()
         if len(items) != len(ids):
             raise MessageException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Some items of {cls.__name__} not found",
             )
-        return items
+        by_id = {inspect(item).identity[0]: item for item in items}
+        return [by_id[_id] for _id in ids]
 
     @classmethod
     def search(cls, pdb: Session, **kwargs):
@@ -48,54 +114,139 @@ class CRUDMixin(Base):
         query: Query = kwargs.pop("query", None)
 
         do_pagination = kwargs.pop("do_pagination", True)
+        include_total = kwargs.pop("include_total", TotalKind.exact)
         if query is None:
             query = pdb.query(cls)
         if not do_pagination:
-            total = query.count()
             items = query.all()
-            offset = 0
-            limit = total
-            return CustomPage(items, offset, limit, total)
+            # Every row was fetched, so the exact total comes for free
+            total = None if include_total == TotalKind.none else len(items)
+            total_kind = TotalKind.none if total is None else TotalKind.exact
+            return CustomPage(
+                items=items,
+                total=total,
+                limit=len(items),
+                offset=0,
+                total_kind=total_kind,
+            )
 
-        total = query.count()
+        total = count_total(query, include_total)
         limit = kwargs.pop("limit")
         offset = kwargs.pop("offset")
-        if offset is None:
-            items = query.order_by(cls.id).limit(limit).all()
+        # Pages are ordered by an explicit rank (e.g. the rating of albums) or
+        # by the relevance of the text filters, if there is any
+        rank = kwargs.pop("rank", None)
+        relevance = kwargs.pop("relevance", [])
+        if rank is None and relevance:
+            rank = sum(relevance[1:], relevance[0])
+        # Integer offsets are ids of the previous page and keep the pages
+        # ordered by id, rank cursors are 'rank:id' strings
+        if rank is not None and (not offset or isinstance(offset, str)):
+            items, offset = cls._page_by_rank(query, rank, limit, offset)
         else:
-            items = query.order_by(cls.id).filter(cls.id > offset).limit(limit).all()
-        offset = items[-1].id if items else None
-
-        page = CustomPage(items=items, total=total, limit=limit, offset=offset)
+            offset = decode_id_cursor(inspect(cls).primary_key[0], offset)
+            if offset is None:
+                items = query.order_by(cls.id).limit(limit).all()
+            else:
+                items = (
+                    query.order_by(cls.id).filter(cls.id > offset).limit(limit).all()
+                )
+            offset = items[-1].id if items else None
+
+        page = CustomPage(
+            items=items,
+            total=total,
+            limit=limit,
+            offset=offset,
+            total_kind=include_total,
+        )
         return page
 
+    @classmethod
+    def _page_by_rank(cls, query: Query, rank, limit: int, offset):
+        """Page of the query ordered by rank, highest first."""
+        query = query.order_by(None)
+        if offset:
+            last_rank, last_id = decode_rank_cursor(offset)
+            query = query.filter(
+                or_(rank < last_rank, and_(rank == last_rank, cls.id > last_id))
+            )
+        ranked = rank.label("rank")
+        rows = query.add_columns(ranked).order_by(ranked.desc(), cls.id).limit(limit)
+
+        # The filters on collections are subqueries, so each row is an item and
+        # the cursor is the rank of the last one
+        rows = rows.all()
+        items = [item for item, _rank in rows]
+        offset = f"{rows[-1][1]!r}:{items[-1].id}" if rows else None
+        return items, offset
+
     def update(self, pdb: Session, **kwargs):
         """Update specific fields of a record."""
-        commit = kwargs.pop("commit", True)
+        commit = kwargs.pop("commit", False)
         for attr, value in kwargs.items():
             setattr(self, attr, value)
-        return commit and self.save(pdb) or self
+        return self.save(pdb, commit=commit)
 
-    def save(self, pdb: Session, commit: bool = True):
-        """Save the record."""
+    def save(self, pdb: Session, commit: bool = False):
+        """Save the record. It is only flushed unless `commit` is set, requests
+        commit all their changes at once when they are done."""
         pdb.add(self)
-        if commit:
-            pdb.commit()
-        else:
-            pdb.flush()
-            pdb.refresh(self)
+        self._invalidate(pdb)
+        _end(pdb, commit)
         return self
 
     def delete(self, pdb: Session, **kwargs):
         """Remove the record from the database."""
-        commit = kwargs.pop("commit", True)
+        commit = kwargs.pop("commit", False)
+        self._invalidate(pdb)
         pdb.delete(self)
-        return commit and pdb.commit()
+        _end(pdb, commit)
+
+    def _invalidate(self, pdb: Session):
+        # New records have no id until flushed, but were not cached either
+        if self.cached and self.id is not None:
+            entity_cache.invalidate(pdb, type(self), self.id)
 
     def expire(self, pdb: Session):
         """Expire the record."""
         pdb.expire(self)
 
+    # Awaitable variants, they run the sync implementation through the
+    # AsyncSession so that subclasses only need to override the sync methods
+
+    @classmethod
+    async def acreate(cls, pdb: AsyncSession, **kwargs):
+        """Awaitable variant of `create`."""
+        return await pdb.run_sync(cls.create, **kwargs)
+
+    @classmethod
+    async def aget(cls, pdb: AsyncSession, *args, **kwargs):
+        """Awaitable variant of `get`."""
+        return await pdb.run_sync(cls.get, *args, **kwargs)
+
+    @classmethod
+    async def aget_many(cls, pdb: AsyncSession, *args, **kwargs):
+        """Awaitable variant of `get_many`."""
+        return await pdb.run_sync(cls.get_many, *args, **kwargs)
+
+    @classmethod
+    async def asearch(cls, pdb: AsyncSession, **kwargs):
+        """Awaitable variant of `search`."""
+        return await pdb.run_sync(cls.search, **kwargs)
+
+    async def aupdate(self, pdb: AsyncSession, **kwargs):
+        """Awaitable variant of `update`."""
+        return await pdb.run_sync(self.update, **kwargs)
+
+    async def asave(self, pdb: AsyncSession, commit: bool = False):
+        """Awaitable variant of `save`."""
+        return await pdb.run_sync(self.save, commit=commit)
+
+    async def adelete(self, pdb: AsyncSession, **kwargs):
+        """Awaitable variant of `delete`."""
+        return await pdb.run_sync(self.delete, **kwargs)
+
     def __init__(self, **kwargs):
         for attr, value in kwargs.items():
             setattr(self, attr, value)
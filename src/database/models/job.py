@@ -0,0 +1,171 @@
+import datetime
+import random
+from typing import List, Optional
+
+from sqlalchemy import Column, DateTime, Index, Integer, String, func, or_, select
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.orm import Session
+
+from .crud_template import CRUDMixin
+from ...constants import (
+    JOBS_BACKOFF_BASE,
+    JOBS_BACKOFF_MAX,
+    JOBS_LEASE,
+    JOBS_MAX_ATTEMPTS,
+)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobModel(CRUDMixin):
+    """A side effect to run outside of the request, e.g. deleting a blob.
+
+    Jobs are inserted in the transaction of the request that causes them, so
+    they only exist if its changes are committed, and run by src.jobs.Worker
+    """
+
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False, index=True)
+    payload = Column(JSONB, nullable=False)
+    # Enqueueing a job with the key of an existing one does nothing
+    idempotency_key = Column(String, nullable=True, unique=True)
+    status = Column(String, nullable=False, default=PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    run_at = Column(DateTime, nullable=False)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+    @classmethod
+    def enqueue(
+        cls,
+        pdb: Session,
+        kind: str,
+        key: Optional[str] = None,
+        delay: float = 0,
+        max_attempts: int = JOBS_MAX_ATTEMPTS,
+        **payload,
+    ) -> bool:
+        """Adds a job to the transaction of the session, False if a job with
+        the same key already exists"""
+        now = datetime.datetime.now()
+        statement = (
+            insert(cls.__table__)
+            .values(
+                kind=kind,
+                payload=payload,
+                idempotency_key=key,
+                status=PENDING,
+                attempts=0,
+                max_attempts=max_attempts,
+                run_at=now + datetime.timedelta(seconds=delay),
+                created_at=now,
+            )
+            .on_conflict_do_nothing(index_elements=[cls.idempotency_key])
+            .returning(cls.id)
+        )
+        return pdb.execute(statement).first() is not None
+
+    @classmethod
+    def claim(
+        cls, pdb: Session, limit: int, now: datetime.datetime
+    ) -> List["JobModel"]:
+        """Marks as running up to `limit` jobs that are due, along with running
+        ones whose lease expired. Jobs claimed by other workers are skipped"""
+        lease_expired = now - datetime.timedelta(seconds=JOBS_LEASE)
+        due = (
+            select(cls.id)
+            .where(
+                or_(
+                    (cls.status == PENDING) & (cls.run_at <= now),
+                    (cls.status == RUNNING) & (cls.locked_at < lease_expired),
+                )
+            )
+            .order_by(cls.run_at, cls.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        statement = (
+            cls.__table__.update()
+            .where(cls.id.in_(due.scalar_subquery()))
+            .values(status=RUNNING, locked_at=now, attempts=cls.attempts + 1)
+            .returning(cls.id)
+        )
+        ids = pdb.execute(statement).scalars().all()
+        if not ids:
+            return []
+        return (
+            pdb.query(cls)
+            .filter(cls.id.in_(ids))
+            .order_by(cls.run_at, cls.id)
+            .populate_existing()
+            .all()
+        )
+
+    def succeed(self, pdb: Session, now: datetime.datetime):
+        self.status = DONE
+        self.finished_at = now
+        self.last_error = None
+        self.save(pdb)
+
+    def fail(self, pdb: Session, error: str, now: datetime.datetime):
+        """Schedules the job again with an exponential backoff, or gives up
+        once it ran out of attempts"""
+        self.last_error = error
+        self.locked_at = None
+        if self.attempts >= self.max_attempts:
+            self.status = FAILED
+            self.finished_at = now
+        else:
+            self.status = PENDING
+            self.run_at = now + datetime.timedelta(seconds=self.backoff(self.attempts))
+        self.save(pdb)
+
+    @staticmethod
+    def backoff(attempts: int) -> float:
+        """Seconds to wait before the next attempt, with some jitter so that
+        jobs failing together are not retried together"""
+        ceiling = min(JOBS_BACKOFF_MAX, JOBS_BACKOFF_BASE * 2 ** (attempts - 1))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def retry(self, pdb: Session):
+        """Runs a job again right away, with all of its attempts"""
+        self.status = PENDING
+        self.attempts = 0
+        self.run_at = datetime.datetime.now()
+        self.locked_at = None
+        self.finished_at = None
+        self.save(pdb)
+
+    @classmethod
+    def stats(cls, pdb: Session):
+        """Amount of jobs by kind and status"""
+        return (
+            pdb.query(cls.kind, cls.status, func.count(cls.id))
+            .group_by(cls.kind, cls.status)
+            .order_by(cls.kind, cls.status)
+            .all()
+        )
+
+    @classmethod
+    def purge(cls, pdb: Session, before: datetime.datetime) -> int:
+        """Deletes the jobs that were done before the date"""
+        statement = cls.__table__.delete().where(
+            cls.status == DONE, cls.finished_at < before
+        )
+        return pdb.execute(statement).rowcount
+
+
+# Backs `claim`, which only looks for pending and running jobs
+Index(
+    "ix_jobs_due",
+    JobModel.run_at,
+    postgresql_where=JobModel.status.in_([PENDING, RUNNING]),
+)
@@ -1,18 +1,52 @@
+from typing import List, Optional
+
 from src.exceptions import MessageException
-from sqlalchemy import Column, ForeignKey, String
-from sqlalchemy.orm import relationship, Session, contains_eager
+from sqlalchemy import Column, ForeignKey, Index, String, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import relationship, Session
 from sqlalchemy.orm.query import Query
-from sqlalchemy.sql import or_
+from sqlalchemy.sql import or_, tuple_
 from fastapi import status
 from . import templates, tables
 from .song import SongModel
 from .user import UserModel
+from src.constants import NESTED_LIMIT
+from src.database.search import search_vector, trigram_index
+from src.schemas.loading import bound
+from src.schemas.pagination import CustomPage, TotalKind
+from .crud_template import count_total, decode_rank_cursor
+
+entries = tables.song_playlist_association_table
+
+# Distance between the positions of consecutive songs. Inserting or moving a
+# song takes a position between its neighbours, so it only writes its own
+# entry until two neighbours are left without a gap
+POSITION_GAP = 1024
 
 
 class PlaylistModel(templates.ResourceModel):
+    """
+    The songs of a playlist are ordered by the `position` of their entries,
+    integers with gaps between them. Adding or moving a song changes only its
+    entry, the whole playlist is renumbered only when there is no room left
+    between two songs.
+
+    The changes of positions lock the row of the playlist first, so that two
+    of them do not take the same position. Positions are still not unique
+    (entries from before the lock may share one), so songs are ordered and
+    paged by position and then song id.
+    """
+
     __tablename__ = "playlists"
+    cached = True
 
-    songs = relationship("SongModel", secondary=tables.song_playlist_association_table)
+    # Written through the entries, which need their position
+    songs = relationship(
+        "SongModel",
+        secondary=entries,
+        order_by=[entries.c.position, entries.c.song_id],
+        viewonly=True,
+    )
 
     colabs = relationship(
         "UserModel",
@@ -37,9 +71,9 @@ class PlaylistModel(templates.ResourceModel):
             query = pdb.query(cls)
 
         if colab is not None:
-            query = query.filter(or_(UserModel.id == colab, cls.creator_id == colab))
-
-        query = query.join(cls.colabs, isouter=True)
+            query = query.filter(
+                or_(cls.colabs.any(UserModel.id == colab), cls.creator_id == colab)
+            )
 
         return super().search(pdb, query=query, **kwargs)
 
@@ -49,23 +83,11 @@ class PlaylistModel(templates.ResourceModel):
         playlist_id = kwargs.get("_id")
         requester_id = kwargs.get("requester_id")
 
-        join_conditions = []
-        filters = [playlist_id == cls.id]
-
-        if not role.can_see_blocked():
-            join_conditions.append(SongModel.blocked == False)
-        playlists = (
-            pdb.query(cls)
-            .options(contains_eager("songs"))
-            .join(cls.songs.and_(*join_conditions), isouter=True)
-            .filter(*filters)
-            .all()
-        )
-        if len(playlists) == 0:
+        playlist = cls.lookup(pdb, playlist_id)
+        if playlist is None:
             raise MessageException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Playlist not found"
             )
-        playlist = playlists[0]
         if (
             playlist.blocked
             and not role.can_see_blocked()
@@ -76,38 +98,246 @@ class PlaylistModel(templates.ResourceModel):
             )
         return playlist
 
-    def add_song(self, pdb: Session, song: SongModel):
-        if song not in self.songs:
-            self.songs.append(song)
-            self.save(pdb)
-        else:
+    @classmethod
+    def create(cls, pdb: Session, **kwargs):
+        songs = kwargs.pop("songs", [])
+        playlist = super().create(pdb, **kwargs)
+        playlist.set_songs(pdb, songs)
+        return playlist
+
+    def update(self, pdb: Session, **kwargs):
+        role = kwargs.get("role")
+        songs = kwargs.pop("songs", None)
+        if songs is not None:
+            # Blocked songs are not seen by the role, so they are kept
+            self.set_songs(pdb, songs, keep_blocked=not role.can_see_blocked())
+        return super().update(pdb, **kwargs)
+
+    def _lock(self, pdb: Session):
+        """Waits for the other changes of the positions of the playlist, until
+        the end of the transaction"""
+        pdb.execute(
+            select(PlaylistModel.id)
+            .where(PlaylistModel.id == self.id)
+            .with_for_update()
+        )
+
+    def set_songs(self, pdb: Session, songs: List[SongModel], keep_blocked=False):
+        """Replaces the songs of the playlist, in the order given. Entries
+        already at their position are not written"""
+        self._lock(pdb)
+        ids = [song.id for song in songs]
+        removed = entries.delete().where(
+            entries.c.playlist_id == self.id, entries.c.song_id.notin_(ids)
+        )
+        if keep_blocked:
+            blocked = select(SongModel.id).where(SongModel.blocked == True)
+            removed = removed.where(entries.c.song_id.notin_(blocked))
+        pdb.execute(removed)
+        if ids:
+            statement = insert(entries).values(
+                [
+                    {"playlist_id": self.id, "song_id": song_id, "position": position}
+                    for song_id, position in zip(
+                        ids,
+                        range(
+                            POSITION_GAP, POSITION_GAP * (len(ids) + 1), POSITION_GAP
+                        ),
+                    )
+                ]
+            )
+            pdb.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[entries.c.playlist_id, entries.c.song_id],
+                    set_={"position": statement.excluded.position},
+                    where=entries.c.position != statement.excluded.position,
+                )
+            )
+        pdb.expire(self, ["songs"])
+
+    def get_songs(self, pdb: Session, **kwargs):
+        """Page of the songs in the order of the playlist. Offsets are the
+        position and id of a song ("position:song_id"), the page starts after
+        it"""
+        role = kwargs.pop("role")
+        limit = kwargs.pop("limit")
+        offset = kwargs.pop("offset", None)
+        include_total = kwargs.pop("include_total", TotalKind.exact)
+
+        query = (
+            pdb.query(SongModel)
+            .join(entries, entries.c.song_id == SongModel.id)
+            .filter(entries.c.playlist_id == self.id)
+        )
+        if not role.can_see_blocked():
+            query = query.filter(SongModel.blocked == False)
+        total = count_total(query, include_total)
+        if offset is not None:
+            last_position, last_id = decode_rank_cursor(offset, int)
+            query = query.filter(
+                tuple_(entries.c.position, entries.c.song_id)
+                > tuple_(last_position, last_id)
+            )
+        rows = (
+            query.add_columns(entries.c.position)
+            .order_by(entries.c.position, entries.c.song_id)
+            .limit(limit)
+            .all()
+        )
+        return CustomPage(
+            items=[song for song, _ in rows],
+            total=total,
+            limit=limit,
+            offset=f"{rows[-1][1]}:{rows[-1][0].id}" if rows else None,
+            total_kind=include_total,
+        )
+
+    def _positions(self, pdb: Session, index: int, limit: int, song: SongModel):
+        query = select(entries.c.position).where(entries.c.playlist_id == self.id)
+        if song is not None:
+            query = query.where(entries.c.song_id != song.id)
+        query = query.order_by(entries.c.position, entries.c.song_id)
+        return pdb.execute(query.offset(index).limit(limit)).scalars().all()
+
+    def _position_at(
+        self, pdb: Session, index: Optional[int], song: Optional[SongModel] = None
+    ) -> int:
+        """Position of a song put at the index (from 0) of the playlist, or at
+        its end if None. `song` is left out of the playlist, for moves"""
+        if index is None:
+            query = select(func.max(entries.c.position)).where(
+                entries.c.playlist_id == self.id
+            )
+            if song is not None:
+                query = query.where(entries.c.song_id != song.id)
+            return (pdb.execute(query).scalar() or 0) + POSITION_GAP
+        if index == 0:
+            after = self._positions(pdb, 0, 1, song)
+            return after[0] - POSITION_GAP if after else POSITION_GAP
+
+        neighbours = self._positions(pdb, index - 1, 2, song)
+        if not neighbours:
+            # Past the end of the playlist
+            return self._position_at(pdb, None, song)
+        if len(neighbours) == 1:
+            return neighbours[0] + POSITION_GAP
+        before, after = neighbours
+        if after - before > 1:
+            return (before + after) // 2
+        self._renumber(pdb)
+        return self._position_at(pdb, index, song)
+
+    def _renumber(self, pdb: Session):
+        """Spreads the positions of the playlist again, keeping its order"""
+        numbered = (
+            select(
+                entries.c.song_id,
+                (
+                    func.row_number().over(
+                        order_by=[entries.c.position, entries.c.song_id]
+                    )
+                    * POSITION_GAP
+                ).label("position"),
+            )
+            .where(entries.c.playlist_id == self.id)
+            .subquery()
+        )
+        pdb.execute(
+            entries.update()
+            .where(
+                entries.c.playlist_id == self.id,
+                entries.c.song_id == numbered.c.song_id,
+            )
+            .values(position=numbered.c.position)
+        )
+
+    def bound_songs(self, pdb: Session, role):
+        """Loads the first songs of the playlist for its response, without
+        the blocked ones unless the role can see them"""
+        filters = [] if role.can_see_blocked() else [SongModel.blocked == False]
+        bound(pdb, [self], "songs", NESTED_LIMIT, *filters)
+
+    def add_song(self, pdb: Session, song: SongModel, index: Optional[int] = None):
+        """Adds the song at the index (from 0) of the playlist, or at its end"""
+        self._lock(pdb)
+        if not tables.link(
+            pdb,
+            entries,
+            playlist_id=self.id,
+            song_id=song.id,
+            position=self._position_at(pdb, index),
+        ):
             raise MessageException(
                 status_code=status.HTTP_409_CONFLICT, detail="Song already in playlist"
             )
+        # The association changed behind the loaded collection, if any
+        pdb.expire(self, ["songs"])
+
+    def move_song(self, pdb: Session, song: SongModel, index: int):
+        """Moves the song to the index (from 0) of the playlist, writing only
+        its entry"""
+        self._lock(pdb)
+        if not tables.is_linked(pdb, entries, playlist_id=self.id, song_id=song.id):
+            raise MessageException(
+                status_code=status.HTTP_409_CONFLICT, detail="Song not in playlist"
+            )
+        pdb.execute(
+            entries.update()
+            .where(entries.c.playlist_id == self.id, entries.c.song_id == song.id)
+            .values(position=self._position_at(pdb, index, song))
+        )
+        pdb.expire(self, ["songs"])
 
     def remove_song(self, pdb: Session, song: SongModel):
-        if song in self.songs:
-            self.songs.remove(song)
-            self.save(pdb)
-        else:
+        if not tables.unlink(
+            pdb,
+            tables.song_playlist_association_table,
+            playlist_id=self.id,
+            song_id=song.id,
+        ):
             raise MessageException(
                 status_code=status.HTTP_409_CONFLICT, detail="Song not in playlist"
             )
+        pdb.expire(self, ["songs"])
+
+    def has_colab(self, pdb: Session, colab_id: str) -> bool:
+        return tables.is_linked(
+            pdb,
+            tables.colab_playlist_association_table,
+            playlist_id=self.id,
+            user_id=colab_id,
+        )
 
     def add_colab(self, pdb: Session, colab: UserModel):
-        if colab not in self.colabs:
-            self.colabs.append(colab)
-            self.save(pdb)
-        else:
+        if not tables.link(
+            pdb,
+            tables.colab_playlist_association_table,
+            playlist_id=self.id,
+            user_id=colab.id,
+        ):
             raise MessageException(
                 status_code=status.HTTP_409_CONFLICT, detail="Colab already in playlist"
             )
+        pdb.expire(self, ["colabs"])
 
     def remove_colab(self, pdb: Session, colab: UserModel):
-        if colab in self.colabs:
-            self.colabs.remove(colab)
-            self.save(pdb)
-        else:
+        if not tables.unlink(
+            pdb,
+            tables.colab_playlist_association_table,
+            playlist_id=self.id,
+            user_id=colab.id,
+        ):
             raise MessageException(
                 status_code=status.HTTP_409_CONFLICT, detail="Colab not in playlist"
             )
+        pdb.expire(self, ["colabs"])
+
+
+# GIN indexes backing the prefix search of `matches`
+Index(
+    "ix_playlists_name_search",
+    search_vector(PlaylistModel.name),
+    postgresql_using="gin",
+)
+# and the trigram ones backing its substring search
+trigram_index(PlaylistModel.__table__, "name")
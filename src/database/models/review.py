@@ -1,13 +1,16 @@
 from src.exceptions import MessageException
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import Column, ForeignKey, Integer, String, event, inspect
 from sqlalchemy.orm import relationship, Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 
 from . import AlbumModel
-from .crud_template import CRUDMixin
+from .crud_template import CRUDMixin, count_total
+from ..cache import entity_cache
 from fastapi import status
 from .user import UserModel
 
-from ...schemas.pagination import CustomPage
+from ...schemas.pagination import CustomPage, TotalKind
 
 
 class ReviewModel(CRUDMixin):
@@ -41,17 +44,65 @@ class ReviewModel(CRUDMixin):
 
     @classmethod
     def get_by_reviewer(
-        cls, pdb: Session, reviewer: UserModel, limit: int, offset: int
+        cls,
+        pdb: Session,
+        reviewer: UserModel,
+        limit: int,
+        offset: int,
+        include_total: TotalKind = TotalKind.exact,
     ):
-        query = (
-            pdb.query(cls)
-            .filter(cls.reviewer == reviewer)
-            .join(AlbumModel.reviews)
-            .order_by(AlbumModel.id)
+        query = pdb.query(cls).filter(cls.reviewer == reviewer).join(AlbumModel.reviews)
+
+        items = (
+            query.order_by(AlbumModel.id)
             .filter(AlbumModel.id > offset)
             .limit(limit)
+            .all()
+        )
+        total = count_total(query, include_total)
+        return CustomPage(
+            items=items,
+            total=total,
+            offset=offset,
+            limit=limit,
+            total_kind=include_total,
         )
 
-        items = query.all()
-        total = query.count()
-        return CustomPage(items=items, total=total, offset=offset, limit=limit)
+
+# The score aggregates of the albums are updated in the same flush (and so in
+# the same transaction) as the reviews, whichever path creates, updates or
+# deletes them (e.g. the cascade when deleting a user)
+
+
+def _add_score(connection, review: ReviewModel, score, amount: int):
+    aggregates = AlbumModel.add_score(connection, review.album_id, score, amount)
+    if aggregates is None:
+        return
+    session = inspect(review).session
+    entity_cache.invalidate(session, AlbumModel, review.album_id)
+    # Keeps a loaded album in sync without expiring it, so that it can still be
+    # read outside of the greenlet of the async session
+    album = session.identity_map.get(identity_key(AlbumModel, review.album_id))
+    if album is not None:
+        set_committed_value(album, "score_sum", aggregates.score_sum)
+        set_committed_value(album, "score_count", aggregates.score_count)
+
+
+@event.listens_for(ReviewModel, "after_insert")
+def _add_review_score(_mapper, connection, review: ReviewModel):
+    _add_score(connection, review, review.score, 1)
+
+
+@event.listens_for(ReviewModel, "after_update")
+def _update_review_score(_mapper, connection, review: ReviewModel):
+    history = inspect(review).attrs.score.history
+    if not history.has_changes():
+        return
+    if history.deleted:
+        _add_score(connection, review, history.deleted[0], -1)
+    _add_score(connection, review, review.score, 1)
+
+
+@event.listens_for(ReviewModel, "before_delete")
+def _remove_review_score(_mapper, connection, review: ReviewModel):
+    _add_score(connection, review, review.score, -1)
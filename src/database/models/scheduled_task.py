@@ -0,0 +1,37 @@
+import datetime
+
+from sqlalchemy import Column, DateTime, String
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from .crud_template import CRUDMixin
+
+
+class ScheduledTaskModel(CRUDMixin):
+    """When each task of src/scheduler.py last ran, shared by every worker so
+    that a task runs once per interval no matter which worker ticks"""
+
+    __tablename__ = "scheduled_tasks"
+
+    name = Column(String, primary_key=True)
+    last_run = Column(DateTime, nullable=False)
+
+    @classmethod
+    def claim(
+        cls, pdb: Session, name: str, now: datetime.datetime, interval: float
+    ) -> bool:
+        """Records `now` as the last run of the task if it did not run in the
+        last `interval` seconds, False if it did. The record is part of the
+        transaction of the session, so it is undone if the task fails"""
+        table = cls.__table__
+        statement = (
+            insert(table)
+            .values(name=name, last_run=now)
+            .on_conflict_do_update(
+                index_elements=[table.c.name],
+                set_={"last_run": now},
+                where=table.c.last_run <= now - datetime.timedelta(seconds=interval),
+            )
+            .returning(table.c.name)
+        )
+        return pdb.execute(statement).first() is not None
@@ -1,16 +1,16 @@
 from typing import List
 
-from fastapi import HTTPException
-
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import Column, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import relationship, Session
 from . import templates, tables
 from .artist import ArtistModel
 from sqlalchemy.orm.query import Query
+from src.database.search import TextMatch, matches, search_vector, trigram_index
 
 
 class SongModel(templates.ResourceWithFile):
     __tablename__ = "songs"
+    cached = True
 
     sub_level = Column(Integer, nullable=False)
 
@@ -18,10 +18,9 @@ class SongModel(templates.ResourceWithFile):
         "ArtistModel",
         secondary=tables.song_artist_association_table,
         back_populates="songs",
-        lazy="joined",
     )
 
-    album = relationship("AlbumModel", back_populates="songs", lazy="joined")
+    album = relationship("AlbumModel", back_populates="songs")
     album_id = Column(
         Integer, ForeignKey("albums.id", ondelete="SET NULL"), nullable=True
     )
@@ -41,25 +40,32 @@ class SongModel(templates.ResourceWithFile):
         if query is None:
             query = pdb.query(cls)
         sub_level = kwargs.pop("sub_level", None)
+        max_sub_level = kwargs.pop("max_sub_level", None)
         artist = kwargs.pop("artist", None)
+        album_id = kwargs.pop("album_id", None)
+        match = kwargs.get("match", TextMatch.substring)
 
         if sub_level is not None:
             query = query.filter(cls.sub_level == sub_level)
+        if max_sub_level is not None:
+            # A level or an SQL expression, e.g. the level of the requester
+            query = query.filter(cls.sub_level <= max_sub_level)
         if artist is not None:
-            query = (
-                query.distinct()
-                .join(cls.artists)
-                .filter(ArtistModel.name.ilike(f"%{artist}%"))
+            query = query.filter(
+                cls.artists.any(matches(ArtistModel.name, artist, match))
             )
+        if album_id is not None:
+            query = query.filter(cls.album_id == album_id)
 
         return super().search(pdb, query=query, **kwargs)
 
     def _update_artists(self, pdb: Session, artists_names: List[str]):
-        artists = []
-        for artist_name in artists_names:
-            try:
-                artist = ArtistModel.get(pdb, _id=artist_name)
-            except (HTTPException, IndexError):
-                artist = ArtistModel.create(pdb, name=artist_name, commit=False)
-            artists.append(artist)
-        self.artists = artists
+        self.artists = ArtistModel.get_or_create_many(pdb, artists_names)
+
+
+# GIN indexes backing the prefix search of `matches`
+Index("ix_songs_name_search", search_vector(SongModel.name), postgresql_using="gin")
+Index("ix_songs_genre_search", search_vector(SongModel.genre), postgresql_using="gin")
+# and the trigram ones backing its substring search
+trigram_index(SongModel.__table__, "name")
+trigram_index(SongModel.__table__, "genre")
@@ -1,3 +1,5 @@
+import datetime
+
 from src.exceptions import MessageException
 
 from sqlalchemy import Column, ForeignKey, String
@@ -5,6 +7,8 @@ from sqlalchemy.orm import relationship, Session
 from typing.io import IO
 
 from .crud_template import CRUDMixin
+from .job import JobModel
+from ...firebase.access import run_blob
 from fastapi import status
 
 from ...constants import SUPPRESS_BLOB_ERRORS
@@ -23,8 +27,8 @@ class StreamingModel(CRUDMixin):
     def upload_img(self, pdb: Session, img_id: str, img: IO, bucket):
         try:
             blob = bucket.blob(f"streaming_imgs/{img_id}")
-            blob.upload_from_file(img)
-            blob.make_public()
+            run_blob(blob.upload_from_file, img)
+            run_blob(blob.make_public)
             self.img_url = blob.public_url
         except Exception as e:
             if not SUPPRESS_BLOB_ERRORS:
@@ -35,16 +39,15 @@ class StreamingModel(CRUDMixin):
                 )
 
     @staticmethod
-    def delete_img(img_id: str, bucket):
-        try:
-            blob = bucket.blob(f"streaming_imgs/{img_id}")
-            blob.delete()
-        except Exception as e:
-            if not SUPPRESS_BLOB_ERRORS:
-                raise MessageException(
-                    status_code=status.HTTP_507_INSUFFICIENT_STORAGE,
-                    detail=f"Could not upload streaming img: {e}",
-                )
+    def delete_img(pdb: Session, img_id: str):
+        """Deletes the blob in the background, once the deletion of the
+        streaming is committed"""
+        JobModel.enqueue(
+            pdb,
+            "delete_blob",
+            blob_name=f"streaming_imgs/{img_id}",
+            deleted_at=datetime.datetime.now().timestamp(),
+        )
 
     @classmethod
     def create(cls, pdb: Session, **kwargs):
@@ -69,7 +72,7 @@ class StreamingModel(CRUDMixin):
         return streaming
 
     def delete(self, pdb: Session, **kwargs):
-        bucket = kwargs.pop("bucket")
+        kwargs.pop("bucket", None)
         if self.img_url is not None:
-            self.delete_img(self.artist.id, bucket)
+            self.delete_img(pdb, self.artist_id)
         return super().delete(pdb, **kwargs)
@@ -1,4 +1,15 @@
-from sqlalchemy import Column, Table, ForeignKey
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Index,
+    Table,
+    ForeignKey,
+    and_,
+    exists,
+    select,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
 from src.database.access import Base
 
 
@@ -41,6 +52,9 @@ song_playlist_association_table = Table(
         ForeignKey("songs.id", ondelete="CASCADE", onupdate="CASCADE"),
         primary_key=True,
     ),
+    # Order of the song in the playlist, see PlaylistModel
+    Column("position", BigInteger, nullable=False),
+    Index("ix_song_playlist_association_position", "playlist_id", "position"),
 )
 
 song_favorites_association_table = Table(
@@ -67,3 +81,37 @@ playlist_favorite_association_table = Table(
         "playlist_id", ForeignKey("playlists.id", onupdate="CASCADE"), primary_key=True
     ),
 )
+
+
+# Membership of association tables, checked and changed with a single
+# statement on their primary key instead of loading the whole collection
+
+
+def _matches(table: Table, keys: dict):
+    return and_(*[table.c[column] == value for column, value in keys.items()])
+
+
+def is_linked(pdb: Session, table: Table, **keys) -> bool:
+    """Whether the row exists"""
+    return pdb.execute(select(exists().where(_matches(table, keys)))).scalar()
+
+
+def link(pdb: Session, table: Table, **keys) -> bool:
+    """Inserts the row, False if it already existed"""
+    statement = (
+        insert(table)
+        .values(**keys)
+        .on_conflict_do_nothing()
+        .returning(*table.primary_key.columns)
+    )
+    return pdb.execute(statement).first() is not None
+
+
+def unlink(pdb: Session, table: Table, **keys) -> bool:
+    """Deletes the row, False if it did not exist"""
+    statement = (
+        table.delete()
+        .where(_matches(table, keys))
+        .returning(*table.primary_key.columns)
+    )
+    return pdb.execute(statement).first() is not None
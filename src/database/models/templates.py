@@ -6,6 +6,10 @@ from typing.io import IO
 from src import roles
 from src.constants import SUPPRESS_BLOB_ERRORS
 from src.database.models.crud_template import CRUDMixin
+from src.database.models.job import JobModel
+from src.firebase.access import run_blob
+from src.database.search import TextMatch, has_trigrams, matches, relevance
+from src.firebase.uploads import finalize_upload
 from sqlalchemy.orm import Session
 from fastapi import status
 from sqlalchemy.orm.query import Query
@@ -46,15 +50,10 @@ class ResourceModel(CRUDMixin):
     @classmethod
     def get_many(cls, pdb: Session, *args, **kwargs):
         role: roles.Role = kwargs.pop("role")
-        resources = super().get_many(pdb, *args, **kwargs)
+        filters = kwargs.pop("filters", [])
         if not role.can_see_blocked():
-            for resource in resources:
-                if resource.blocked:
-                    raise MessageException(
-                        status_code=status.HTTP_404_NOT_FOUND,
-                        detail="Resource not found",
-                    )
-        return resources
+            filters.append(cls.blocked == False)
+        return super().get_many(pdb, *args, filters=filters, **kwargs)
 
     @classmethod
     def search(cls, pdb: Session, **kwargs):
@@ -63,13 +62,17 @@ class ResourceModel(CRUDMixin):
             query = pdb.query(cls)
 
         name = kwargs.pop("name", None)
+        match = kwargs.pop("match", TextMatch.substring)
         role: roles.Role = kwargs.pop("role")
         creator_id = kwargs.pop("creator_id", None)
 
         if not role.can_see_blocked():
             query = query.filter(cls.blocked == False)
         if name is not None:
-            query = query.filter(cls.name.ilike(f"%{name}%"))
+            query = query.filter(matches(cls.name, name, match))
+            rank = relevance(cls.name, name, match, has_trigrams(pdb))
+            if rank is not None:
+                kwargs.setdefault("relevance", []).append(rank)
         if creator_id is not None:
             query = query.filter(cls.creator_id == creator_id)
         query = query.order_by(cls.id)
@@ -98,8 +101,12 @@ class ResourceCreatorModel(ResourceModel):
             query = pdb.query(cls)
 
         genre = kwargs.pop("genre", None)
+        match = kwargs.get("match", TextMatch.substring)
         if genre is not None:
-            query = query.filter(cls.genre.ilike(f"%{genre}%"))
+            query = query.filter(matches(cls.genre, genre, match))
+            rank = relevance(cls.genre, genre, match, has_trigrams(pdb))
+            if rank is not None:
+                kwargs.setdefault("relevance", []).append(rank)
 
         return super().search(pdb, query=query, **kwargs)
 
@@ -109,11 +116,15 @@ class ResourceWithFile(ResourceCreatorModel):
 
     file_url = Column(String, nullable=True)
 
+    @property
+    def file_blob_name(self):
+        return f"{self.__tablename__}/{self.id}"
+
     def upload_file(self, pdb: Session, file: IO, bucket):
         try:
-            blob = bucket.blob(f"{self.__tablename__}/{self.id}")
-            blob.upload_from_file(file)
-            blob.make_public()
+            blob = bucket.blob(self.file_blob_name)
+            run_blob(blob.upload_from_file, file)
+            run_blob(blob.make_public)
             timestamp = (
                 f"?t={str(int(datetime.datetime.timestamp(datetime.datetime.now())))}"
             )
@@ -127,25 +138,32 @@ class ResourceWithFile(ResourceCreatorModel):
                     detail=f"Could not upload file for for resource {self.__class__.name} with id {self.id}: {e}",
                 )
 
-    def delete_file(self, bucket):
-        try:
-            blob = bucket.blob(f"{self.__tablename__}/{self.id}")
-            blob.delete()
-        except Exception as e:
-            if not SUPPRESS_BLOB_ERRORS:
-                raise MessageException(
-                    status_code=status.HTTP_507_INSUFFICIENT_STORAGE,
-                    detail=f"Could not delete file for for resource {self.__class__.name} with id {self.id}: {e}",
-                )
+    def finalize_file(self, pdb: Session, bucket, upload_id: str):
+        """Records the file the client uploaded to a signed url"""
+        self.file_url = finalize_upload(bucket, self.file_blob_name, upload_id)
+        self.save(pdb)
+
+    def delete_file(self, pdb: Session):
+        """Deletes the blob in the background, once the deletion of the
+        resource is committed"""
+        if self.file_url is not None:
+            JobModel.enqueue(
+                pdb,
+                "delete_blob",
+                key=f"delete_blob:{self.file_url}",
+                blob_name=self.file_blob_name,
+                deleted_at=datetime.datetime.now().timestamp(),
+            )
 
     @classmethod
     def create(cls, pdb: Session, **kwargs):
         bucket = kwargs.pop("bucket")
-        file = kwargs.pop("file")
-        commit = kwargs.pop("commit", True)
+        file = kwargs.pop("file", None)
+        commit = kwargs.pop("commit", False)
 
         resource = super().create(pdb, commit=False, **kwargs)
-        resource.upload_file(pdb, file, bucket)
+        if file is not None:
+            resource.upload_file(pdb, file, bucket)
         resource.save(pdb, commit=commit)
         return resource
 
@@ -157,7 +175,7 @@ class ResourceWithFile(ResourceCreatorModel):
         return super().update(pdb, **kwargs)
 
     def delete(self, pdb: Session, **kwargs):
-        bucket = kwargs.get("bucket")
-        self.delete_file(bucket)
+        kwargs.pop("bucket", None)
+        self.delete_file(pdb)
 
         return super().delete(pdb, **kwargs)
@@ -1,23 +1,30 @@
 from src.exceptions import MessageException
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, String, DateTime
+from typing import List, Optional
+
+from sqlalchemy import Column, Index, Integer, String, DateTime, case, select
 from sqlalchemy.orm import relationship, Session, Query
 from typing.io import IO
 
 from . import tables
 from .song import SongModel
 from .album import AlbumModel
-from .crud_template import CRUDMixin
+from .crud_template import CRUDMixin, count_total
+from .job import JobModel
+from ...firebase.access import run_blob
+from ..cache import entity_cache
+from ...firebase.uploads import finalize_upload
 from fastapi import status
 
 from ... import roles
-from ...constants import SUPPRESS_BLOB_ERRORS
-from ...schemas.pagination import CustomPage
+from ...constants import SUB_LEVEL_FREE, SUPPRESS_BLOB_ERRORS
+from ...schemas.pagination import CustomPage, TotalKind
 
 
 class UserModel(CRUDMixin):
     __tablename__ = "users"
+    cached = True
 
     id = Column(String, primary_key=True, index=True, autoincrement=False)
     name = Column(String, index=True)
@@ -70,11 +77,15 @@ class UserModel(CRUDMixin):
         cascade="all, delete-orphan",
     )
 
+    @property
+    def pfp_blob_name(self):
+        return f"pfp/{self.id}"
+
     def upload_pfp(self, pdb: Session, pfp: IO, bucket):
         try:
-            blob = bucket.blob(f"pfp/{self.id}")
-            blob.upload_from_file(pfp)
-            blob.make_public()
+            blob = bucket.blob(self.pfp_blob_name)
+            run_blob(blob.upload_from_file, pfp)
+            run_blob(blob.make_public)
             timestamp = f"?t={str(int(datetime.timestamp(datetime.now())))}"
             self.pfp_url = blob.public_url + timestamp
         except Exception as e:
@@ -85,21 +96,26 @@ class UserModel(CRUDMixin):
                     detail=f"Could not upload pfp for for User with id {self.id}: {e}",
                 )
 
-    def delete_pfp(self, bucket):
-        try:
-            blob = bucket.blob(f"pfp/{self.id}")
-            blob.delete()
-        except Exception as e:
-            if not SUPPRESS_BLOB_ERRORS:
-                raise MessageException(
-                    status_code=status.HTTP_507_INSUFFICIENT_STORAGE,
-                    detail=f"Could not delete pfp for for User with id {self.id}: {e}",
-                )
+    def finalize_pfp(self, pdb: Session, bucket, upload_id: str):
+        """Records the pfp the client uploaded to a signed url"""
+        self.pfp_url = finalize_upload(bucket, self.pfp_blob_name, upload_id)
+        self.save(pdb)
+
+    def delete_pfp(self, pdb: Session):
+        """Deletes the blob in the background, once the deletion of the user
+        is committed"""
+        JobModel.enqueue(
+            pdb,
+            "delete_blob",
+            key=f"delete_blob:{self.pfp_url}",
+            blob_name=self.pfp_blob_name,
+            deleted_at=datetime.now().timestamp(),
+        )
 
     @classmethod
     def create(cls, pdb: Session, **kwargs):
         if "sub_level" not in kwargs:
-            kwargs["sub_level"] = 0
+            kwargs["sub_level"] = SUB_LEVEL_FREE
 
         pfp = kwargs.pop("pfp", None)
         user = super().create(pdb, **kwargs, commit=False)
@@ -120,8 +136,59 @@ class UserModel(CRUDMixin):
         expiration_date = kwargs.pop("expiration_date", None)
         if expiration_date is not None:
             query = query.filter(cls.sub_expires < expiration_date)
+        colab_of = kwargs.pop("colab_of", None)
+        if colab_of is not None:
+            colabs = tables.colab_playlist_association_table
+            query = query.join(colabs, colabs.c.user_id == cls.id).filter(
+                colabs.c.playlist_id == colab_of
+            )
         return super().search(pdb, query=query, **kwargs)
 
+    def effective_sub_level(self, now: datetime) -> int:
+        """Level the user can use at `now`. The stored one is only lowered
+        when the subscription is revoked, which may not have happened yet"""
+        if self.sub_expires is not None and self.sub_expires < now:
+            return SUB_LEVEL_FREE
+        return self.sub_level
+
+    @classmethod
+    def effective_sub_level_of(cls, uid: str, now: datetime):
+        """SQL expression of `effective_sub_level` of the user `uid`, NULL if
+        it does not exist"""
+        level = case(
+            (cls.sub_expires < now, SUB_LEVEL_FREE),
+            else_=cls.sub_level,
+        )
+        return select(level).where(cls.id == uid).scalar_subquery()
+
+    @classmethod
+    def revoke_expired(
+        cls,
+        pdb: Session,
+        now: datetime,
+        limit: int,
+        sub_level: int,
+        sub_expires: Optional[datetime],
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """Sets the level and expiration of up to `limit` users whose
+        subscription expired before `now` with a single statement, returns
+        their ids. Users locked by another revocation are left to it. `ids`
+        restricts it to those users"""
+        expired = select(cls.id).where(cls.sub_expires < now)
+        if ids is not None:
+            expired = expired.where(cls.id.in_(ids))
+        expired = expired.limit(limit).with_for_update(skip_locked=True)
+        statement = (
+            cls.__table__.update()
+            .where(cls.id.in_(expired.scalar_subquery()))
+            .values(sub_level=sub_level, sub_expires=sub_expires)
+            .returning(cls.id)
+        )
+        revoked = pdb.execute(statement).scalars().all()
+        entity_cache.invalidate(pdb, cls, *revoked)
+        return revoked
+
     def update(self, pdb: Session, **kwargs):
         pfp = kwargs.pop("pfp", None)
         if pfp is not None:
@@ -130,10 +197,10 @@ class UserModel(CRUDMixin):
         return super().update(pdb, **kwargs)
 
     def delete(self, pdb: Session, **kwargs):
-        bucket = kwargs.pop("bucket")
+        kwargs.pop("bucket", None)
 
         if self.pfp_url is not None:
-            self.delete_pfp(bucket)
+            self.delete_pfp(pdb)
         return super().delete(pdb, **kwargs)
 
     def get_favorite_songs(self, **kwargs):
@@ -147,14 +214,30 @@ class UserModel(CRUDMixin):
 
     def add_favorite_song(self, pdb: Session, **kwargs):
         song = kwargs.pop("song")
-        self.favorite_songs.append(song)
-        self.save(pdb)
+        if not tables.link(
+            pdb,
+            tables.song_favorites_association_table,
+            user_id=self.id,
+            song_id=song.id,
+        ):
+            raise MessageException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Song already in favorites",
+            )
         return self
 
     def remove_favorite_song(self, pdb: Session, **kwargs):
         song = kwargs.pop("song")
-        self.favorite_songs.remove(song)
-        self.save(pdb)
+        if not tables.unlink(
+            pdb,
+            tables.song_favorites_association_table,
+            user_id=self.id,
+            song_id=song.id,
+        ):
+            raise MessageException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Song not in favorites",
+            )
 
     def get_favorite_albums(self, **kwargs):
         role: roles.Role = kwargs.pop("role")
@@ -170,21 +253,44 @@ class UserModel(CRUDMixin):
     def paginate(query: Query, model, **kwargs):
         offset = kwargs.pop("offset")
         limit = kwargs.pop("limit")
-        total = query.count()
+        include_total = kwargs.pop("include_total", TotalKind.exact)
+        total = count_total(query, include_total)
         query = query.order_by(model.id).filter(model.id > offset).limit(limit)
         items = query.all()
-        return CustomPage(items=items, total=total, offset=offset, limit=limit)
+        return CustomPage(
+            items=items,
+            total=total,
+            offset=offset,
+            limit=limit,
+            total_kind=include_total,
+        )
 
     def add_favorite_album(self, pdb: Session, **kwargs):
         album = kwargs.pop("album")
-        self.favorite_albums.append(album)
-        self.save(pdb)
+        if not tables.link(
+            pdb,
+            tables.album_favorites_association_table,
+            user_id=self.id,
+            album_id=album.id,
+        ):
+            raise MessageException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Album already in favorites",
+            )
         return self
 
     def remove_favorite_album(self, pdb: Session, **kwargs):
         album = kwargs.pop("album")
-        self.favorite_albums.remove(album)
-        self.save(pdb)
+        if not tables.unlink(
+            pdb,
+            tables.album_favorites_association_table,
+            user_id=self.id,
+            album_id=album.id,
+        ):
+            raise MessageException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Album not in favorites",
+            )
 
     def get_favorite_playlists(self, **kwargs):
         role: roles.Role = kwargs.pop("role")
@@ -199,11 +305,35 @@ class UserModel(CRUDMixin):
 
     def add_favorite_playlist(self, pdb: Session, **kwargs):
         playlist = kwargs.pop("playlist")
-        self.favorite_playlists.append(playlist)
-        self.save(pdb)
+        if not tables.link(
+            pdb,
+            tables.playlist_favorite_association_table,
+            user_id=self.id,
+            playlist_id=playlist.id,
+        ):
+            raise MessageException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Playlist already in favorites",
+            )
         return self
 
     def remove_favorite_playlist(self, pdb: Session, **kwargs):
         playlist = kwargs.pop("playlist")
-        self.favorite_playlists.remove(playlist)
-        self.save(pdb)
+        if not tables.unlink(
+            pdb,
+            tables.playlist_favorite_association_table,
+            user_id=self.id,
+            playlist_id=playlist.id,
+        ):
+            raise MessageException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Playlist not in favorites",
+            )
+
+
+# Backs `revoke_expired`, only users with a paid subscription have an expiration
+Index(
+    "ix_users_sub_expires",
+    UserModel.sub_expires,
+    postgresql_where=UserModel.sub_expires.isnot(None),
+)
@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+from sqlalchemy import event, exc, text
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from src.constants import (
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_TIMEOUT,
+    DB_POOL_WARMUP,
+)
+
+
+class PoolMetrics:
+    """Counters of a connection pool that are not exposed by SQLAlchemy itself"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.connects = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.overflow_max = 0
+
+    def record_wait(self, seconds: float):
+        self.wait_time_total += seconds
+        self.wait_time_max = max(self.wait_time_max, seconds)
+
+    def snapshot(self, pool):
+        return {
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "overflow_max": self.overflow_max,
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "timeouts": self.timeouts,
+            "wait_time_total": self.wait_time_total,
+            "wait_time_max": self.wait_time_max,
+        }
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection
+    and how many of them gave up because the pool was exhausted"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.record_wait(time.perf_counter() - start)
+            self.metrics.overflow_max = max(self.metrics.overflow_max, self.overflow())
+
+
+def engine_options():
+    """Keyword arguments for create_async_engine with the configured pool"""
+    return {
+        "poolclass": MeteredQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": {
+            "server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT)}
+        },
+    }
+
+
+def sync_engine_options():
+    """Keyword arguments for the (psycopg2) tooling engine, it shares the
+    statement timeout but keeps a small pool since it does not serve requests"""
+    return {
+        "pool_size": 1,
+        "max_overflow": 1,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"},
+    }
+
+
+def instrument(async_engine):
+    """Attaches the pool event listeners that feed the metrics of the engine"""
+    engine = async_engine.sync_engine
+    metrics = engine.pool.metrics
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(_dbapi_connection, _connection_record):
+        metrics.connects += 1
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(_dbapi_connection, _connection_record, _connection_proxy):
+        metrics.checkouts += 1
+
+
+def pool_status(async_engine):
+    return async_engine.pool.metrics.snapshot(async_engine.pool)
+
+
+async def warm_up(async_engine, connections: int = DB_POOL_WARMUP, tries: int = 10):
+    """Opens up to `connections` connections so that the first requests do not
+    pay for them. Retries while the database is not reachable (e.g. it is still
+    booting), but never blocks the application from starting"""
+    connections = min(connections, DB_POOL_SIZE)
+    for attempt in range(tries):
+        print("Warming up DB pool - " + str(attempt))
+        opened = []
+        try:
+            for _ in range(connections):
+                connection = await async_engine.connect()
+                opened.append(connection)
+                await connection.execute(text("SELECT 1"))
+            return True
+        except (exc.DBAPIError, OSError, asyncio.TimeoutError):
+            await asyncio.sleep(1)
+        finally:
+            for connection in opened:
+                await connection.close()
+    print("Could not warm up DB pool, database is not reachable")
+    return False
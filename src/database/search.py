@@ -0,0 +1,120 @@
+import re
+import string
+from enum import Enum
+from typing import Dict, Optional
+
+from sqlalchemy import DDL, event, func, literal_column, text
+from sqlalchemy.orm import Session
+
+# The text search configuration and the punctuation replaced before parsing
+# are rendered as literals, so that the expressions match the ones of the
+# GIN indexes and the planner can use them
+_CONFIG = text("'simple'")
+_PUNCTUATION = text("'[[:punct:][:space:]]+'")
+
+# Divides the rank by 1 + the logarithm of the document length
+_LENGTH_NORMALIZATION = 1
+
+_SPLIT = re.compile(f"[{re.escape(string.punctuation)}\\s]+")
+
+
+class TextMatch(str, Enum):
+    """How the text filters match a column"""
+
+    # Anywhere in the column, e.g. 'appy' matches 'unhappy', ranked by
+    # similarity where pg_trgm is installed
+    substring = "substring"
+    # Words starting with every word of the term, ranked by relevance
+    prefix = "prefix"
+
+
+def search_vector(column):
+    """Full text vector of a column. Names like 'my_song-name' are
+    split in the words 'my', 'song' and 'name'"""
+    return func.to_tsvector(
+        _CONFIG,
+        func.regexp_replace(column, _PUNCTUATION, text("' '"), text("'g'")),
+    )
+
+
+def search_words(term: str):
+    return [word for word in _SPLIT.split(term.lower()) if word]
+
+
+def search_query(term: str) -> Optional[str]:
+    """Prefix query that matches every word of the term, e.g. 'gen' matches
+    'my_genre'. Returns None when the term has no words"""
+    words = search_words(term)
+    if not words:
+        return None
+    return " & ".join(f"{word}:*" for word in words)
+
+
+def matches(column, term: str, match: TextMatch = TextMatch.substring):
+    """Filter of the rows whose column contains the term, through its trigram
+    index. With `TextMatch.prefix`, of the rows whose column has words starting
+    with every word of the term, through its text search index"""
+    if match == TextMatch.prefix:
+        query = search_query(term)
+        if query is not None:
+            return search_vector(column).op("@@")(func.to_tsquery(_CONFIG, query))
+    return column.ilike(f"%{term}%")
+
+
+def relevance(
+    column, term: str, match: TextMatch = TextMatch.prefix, trigrams: bool = True
+):
+    """How well the column matches the term, higher is better. Substring
+    matches are ranked by the trigram similarity of the column and the term,
+    None without pg_trgm (`trigrams=False`), which leaves them ordered by id"""
+    if match == TextMatch.substring:
+        # Also normalized by length, 'love' is more similar to 'love' than
+        # 'my love song remix' is
+        return func.similarity(column, term) if trigrams else None
+    query = search_query(term)
+    if query is None:
+        return literal_column("0.0")
+    # Normalized by the length of the column, so that 'love' ranks better
+    # than 'my love song remix' when searching for 'love'
+    return func.ts_rank(
+        search_vector(column), func.to_tsquery(_CONFIG, query), _LENGTH_NORMALIZATION
+    )
+
+
+# Whether pg_trgm is installed in each database, by url
+_installed_trigrams: Dict[str, bool] = {}
+
+
+def has_trigrams(pdb: Session) -> bool:
+    """Whether the database of the session has the pg_trgm extension
+    installed, checked once for each database"""
+    url = str(pdb.get_bind().engine.url)
+    if url not in _installed_trigrams:
+        _installed_trigrams[url] = bool(
+            pdb.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            ).scalar()
+        )
+    return _installed_trigrams[url]
+
+
+def _has_trigrams(ddl, target, bind, **kw):
+    return bind.dialect.name == "postgresql" and bool(
+        bind.execute(
+            text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        ).scalar()
+    )
+
+
+def trigram_index(table, column: str):
+    """GIN index of the trigrams of a column, backing the substring ILIKE of
+    `matches`. Skipped where the pg_trgm extension is not available, the
+    filters still work without it"""
+    for statement in (
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        f"CREATE INDEX ix_{table.name}_{column}_trgm "
+        f"ON {table.name} USING gin ({column} gin_trgm_ops)",
+    ):
+        event.listen(
+            table, "after_create", DDL(statement).execute_if(callable_=_has_trigrams)
+        )
@@ -0,0 +1,138 @@
+"""Statements sent to the database: how many a request sends, the time they
+take and a log of the slow ones, with their plans"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.constants import (
+    MAX_STATEMENTS_PER_REQUEST,
+    SLOW_STATEMENT_EXPLAIN,
+    SLOW_STATEMENT_THRESHOLD,
+)
+
+logger = logging.getLogger(__name__)
+
+# Statements allowed per request, 0 means no limit. Tests change it through
+# the `max_statements` fixture
+max_statements = MAX_STATEMENTS_PER_REQUEST
+
+# Statements that take longer than this many milliseconds are logged (0 logs
+# none) and, with `explain_slow`, so are their plans
+slow_threshold = SLOW_STATEMENT_THRESHOLD
+explain_slow = SLOW_STATEMENT_EXPLAIN
+
+
+# Transaction bookkeeping, sent around the queries of a nested transaction
+_SAVEPOINT_STATEMENTS = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+class TooManyStatementsError(AssertionError):
+    pass
+
+
+class StatementCounter:
+    def __init__(self, limit: int = 0):
+        self.limit = limit
+        self.count = 0
+        # Seconds the statements took, all of them and the slowest one
+        self.time = 0.0
+        self.slowest_time = 0.0
+        self.slowest: Optional[str] = None
+
+    def record(self, statement: str, seconds: float):
+        self.time += seconds
+        if seconds > self.slowest_time:
+            self.slowest_time = seconds
+            self.slowest = statement
+
+
+_counter: ContextVar[Optional[StatementCounter]] = ContextVar(
+    "statement_counter", default=None
+)
+
+
+@contextmanager
+def count_statements(limit: int = 0):
+    """Counts the statements sent to the database inside the block, from any
+    engine, but savepoints. Raises TooManyStatementsError at the statement that goes over the
+    limit, if there is one"""
+    counter = StatementCounter(limit)
+    token = _counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _counter.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(_conn, _cursor, statement, _parameters, context, _executemany):
+    if statement.startswith(_SAVEPOINT_STATEMENTS):
+        return
+    counter = _counter.get()
+    if counter is not None:
+        counter.count += 1
+        if counter.limit and counter.count > counter.limit:
+            raise TooManyStatementsError(
+                f"More than {counter.limit} statements in a request, "
+                f"the last one was: {statement}"
+            )
+    if context is not None:
+        context._statement_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _time_statement(conn, _cursor, statement, parameters, context, _executemany):
+    start = getattr(context, "_statement_start", None)
+    if start is None:
+        return
+    seconds = time.perf_counter() - start
+    counter = _counter.get()
+    if counter is not None:
+        counter.record(statement, seconds)
+    if slow_threshold and seconds * 1000 >= slow_threshold:
+        _log_slow_statement(conn, statement, parameters, seconds)
+
+
+def _log_slow_statement(conn, statement, parameters, seconds: float):
+    plan = None
+    if explain_slow and _explainable(statement):
+        plan = _explain(conn, statement, parameters)
+    logger.warning(
+        "Slow statement (%.1fms): %s\nParameters: %r%s",
+        seconds * 1000,
+        statement,
+        parameters,
+        f"\nPlan:\n{plan}" if plan else "",
+    )
+
+
+def _explainable(statement: str) -> bool:
+    # EXPLAIN ANALYZE runs the statement again, so only the reads are
+    # explained. Advisory locks are kept even if the savepoint rolls back
+    statement = statement.lstrip().upper()
+    return statement.startswith("SELECT") and "ADVISORY" not in statement
+
+
+def _explain(conn, statement: str, parameters) -> Optional[str]:
+    """Plan of the statement, as run on the connection. It runs inside a
+    savepoint that is always rolled back, so that a failing EXPLAIN does not
+    break the transaction of the statement"""
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute("SAVEPOINT explain_slow_statement")
+        try:
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+            return "\n".join(row[0] for row in cursor.fetchall())
+        finally:
+            cursor.execute("ROLLBACK TO SAVEPOINT explain_slow_statement")
+            cursor.execute("RELEASE SAVEPOINT explain_slow_statement")
+    except Exception:
+        logger.exception("Could not explain the slow statement")
+        return None
+    finally:
+        cursor.close()
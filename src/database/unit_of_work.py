@@ -0,0 +1,21 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import Request
+
+# Key of the request state where the session of the request is kept
+_STATE_KEY = "unit_of_work"
+
+
+def track(request: Request, pdb: AsyncSession):
+    """Makes the session the unit of work of the request: its changes are only
+    flushed while the request is handled and committed once, by
+    UnitOfWorkMiddleware, when the handler is done"""
+    setattr(request.state, _STATE_KEY, pdb)
+
+
+async def commit(scope) -> bool:
+    """Commits the unit of work of the request, if it has one"""
+    pdb = scope.get("state", {}).get(_STATE_KEY)
+    if pdb is None:
+        return False
+    await pdb.commit()
+    return True
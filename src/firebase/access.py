@@ -1,21 +1,33 @@
-import firebase_admin
+"""Clients of Firebase auth and the storage bucket.
+
+They are built on the first call of `get_bucket` or `get_auth` instead of on
+import: reading the credentials and importing the Google libraries take a
+good part of the startup of a process, and most of them never need both.
+Tests get the mocks of src/mocks/firebase instead.
+"""
 import json
-from src.constants import TESTING, ENVIRONTMENT
-from firebase_admin import credentials, storage, auth
-from src.mocks.firebase.bucket import bucket_mock
-from src.mocks.firebase.auth import auth_mock
-from google.cloud.storage.bucket import Bucket
+import threading
+import time
 
 from dotenv import load_dotenv
 
+from src import metrics
+from src.constants import ENVIRONTMENT, TESTING
+from src.database.access import run_blocking
+from src.mocks.firebase.auth import auth_mock
+from src.mocks.firebase.bucket import bucket_mock
+
 load_dotenv()
 
-bucket = bucket_mock
-_auth = auth_mock
+BUCKET_NAME = "rostov-spotifiuby.appspot.com"
+
+bucket = bucket_mock if TESTING else None
+_auth = auth_mock if TESTING else None
+_lock = threading.Lock()
 
 
 class BucketMuxDemux:
-    def __int__(self, _bucket):
+    def __init__(self, _bucket):
         self._bucket = _bucket
 
     def blob(
@@ -26,20 +38,39 @@ class BucketMuxDemux:
         kms_key_name=None,
         generation=None,
     ):
+        return self._bucket.blob(
+            self._name(blob_name), chunk_size, encryption_key, kms_key_name, generation
+        )
+
+    def get_blob(self, blob_name):
+        return self._bucket.get_blob(self._name(blob_name))
+
+    def copy_blob(self, blob, destination_bucket, new_name):
+        if destination_bucket is self:
+            destination_bucket = self._bucket
+        return self._bucket.copy_blob(blob, destination_bucket, self._name(new_name))
+
+    @staticmethod
+    def _name(blob_name):
         if ENVIRONTMENT == "dev":
-            folder_name, file_name = blob_name.split("/")
+            folder_name, file_name = blob_name.split("/", 1)
             folder_name += "_dev"
             blob_name = f"{folder_name}/{file_name}"
-
-        return self._bucket.blob(
-            blob_name, chunk_size, encryption_key, kms_key_name, generation
-        )
+        return blob_name
 
     def __getattr__(self, item):
         return getattr(self._bucket, item)
 
 
-if not TESTING:
+def _initialize_app():
+    import firebase_admin
+    from firebase_admin import credentials
+
+    try:
+        return firebase_admin.get_app()
+    except ValueError:
+        pass
+
     # Use a service account
     # Si tira error porque no encuentra el archivo, copiar el google-credentials.json a /src
     with open("google-credentials.json") as json_file:
@@ -47,19 +78,43 @@ if not TESTING:
 
     cred = credentials.Certificate(cert_dict)
 
-    firebase_admin.initialize_app(
-        cred, {"storageBucket": "rostov-spotifiuby.appspot.com/"}
-    )
-
-    real_bucket = storage.bucket("rostov-spotifiuby.appspot.com")
-    bucket = BucketMuxDemux()
-    bucket._bucket = real_bucket
-    _auth = auth
+    return firebase_admin.initialize_app(cred, {"storageBucket": f"{BUCKET_NAME}/"})
 
 
 def get_bucket():
+    global bucket
+    if bucket is None:
+        with _lock:
+            if bucket is None:
+                from firebase_admin import storage
+
+                _initialize_app()
+                bucket = BucketMuxDemux(storage.bucket(BUCKET_NAME))
     return bucket
 
 
 def get_auth():
+    global _auth
+    if _auth is None:
+        with _lock:
+            if _auth is None:
+                from firebase_admin import auth
+
+                _initialize_app()
+                _auth = auth
     return _auth
+
+
+def run_blob(fn, *args, **kwargs):
+    """Runs a blocking call of a blob (e.g. `blob.delete`) like run_blocking,
+    recording how long it took by the name of the method"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        result = run_blocking(fn, *args, **kwargs)
+        outcome = "ok"
+        return result
+    finally:
+        metrics.BLOB_DURATION.observe(
+            time.perf_counter() - start, operation=fn.__name__, outcome=outcome
+        )
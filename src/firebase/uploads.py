@@ -0,0 +1,74 @@
+"""Uploads that go from the client straight to the bucket.
+
+Instead of sending the file through the API, the client asks for a signed
+url, uploads the file to it with a PUT and then finalizes the upload, which
+checks the blob and records its public url. The url is of a staging blob of
+its own (uploads/{blob name}/{upload id}), so the file being served is not
+touched until the upload passes the checks and is copied over it.
+"""
+import datetime
+import uuid
+
+from fastapi import status
+
+from src.constants import MAX_UPLOAD_SIZE, UPLOAD_URL_EXPIRATION
+from src.firebase.access import run_blob
+from src.exceptions import MessageException
+
+
+def staging_blob_name(blob_name: str, upload_id: str) -> str:
+    return f"uploads/{blob_name}/{upload_id}"
+
+
+def signed_upload_url(bucket, blob_name: str) -> dict:
+    """A url the client can PUT the file of the blob to, until it expires,
+    and the id of the upload to finalize it with"""
+    expiration = datetime.timedelta(seconds=UPLOAD_URL_EXPIRATION)
+    upload_id = uuid.uuid4().hex
+    blob = bucket.blob(staging_blob_name(blob_name, upload_id))
+    upload_url = blob.generate_signed_url(
+        version="v4", expiration=expiration, method="PUT"
+    )
+    return {
+        "upload_url": upload_url,
+        "upload_id": upload_id,
+        "method": "PUT",
+        "expires_at": datetime.datetime.now() + expiration,
+    }
+
+
+def _reject(staging, status_code: int, detail: str):
+    run_blob(staging.delete)
+    raise MessageException(status_code=status_code, detail=detail)
+
+
+def finalize_upload(bucket, blob_name: str, upload_id: str) -> str:
+    """Checks the file of the upload, copies it over the blob, makes it public
+    and returns its url. The staging blob is deleted either way. Meant to be
+    called inside AsyncSession.run_sync"""
+    staging = bucket.blob(staging_blob_name(blob_name, upload_id))
+    if not run_blob(staging.exists):
+        raise MessageException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No file was uploaded for {blob_name} with id {upload_id}",
+        )
+
+    run_blob(staging.reload)
+    if not staging.size:
+        _reject(
+            staging,
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            f"The file uploaded for {blob_name} is empty",
+        )
+    if staging.size > MAX_UPLOAD_SIZE:
+        _reject(
+            staging,
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            f"The file uploaded for {blob_name} is larger than {MAX_UPLOAD_SIZE} bytes",
+        )
+
+    blob = run_blob(bucket.copy_blob, staging, bucket, blob_name)
+    run_blob(blob.make_public)
+    run_blob(staging.delete)
+    timestamp = f"?t={str(int(datetime.datetime.timestamp(datetime.datetime.now())))}"
+    return blob.public_url + timestamp
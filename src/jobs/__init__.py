@@ -0,0 +1,9 @@
+"""Background jobs: side effects that are not needed to answer a request
+(e.g. deleting the blob of a deleted song) are enqueued as rows of the jobs
+table in the transaction of the request, and run later by a Worker.
+
+Run a worker with `python -m src.jobs work`, see `python -m src.jobs -h`.
+"""
+from .registry import handler, HANDLERS
+from . import handlers  # noqa: F401 # Registers the handlers
+from .worker import Worker
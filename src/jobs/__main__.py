@@ -0,0 +1,143 @@
+"""Runs and inspects the job queue.
+
+Usage:
+    python -m src.jobs work [--once]
+    python -m src.jobs stats
+    python -m src.jobs list [--status STATUS] [--kind KIND] [--limit N]
+    python -m src.jobs retry ID [ID ...] | --failed
+    python -m src.jobs purge [--days N]
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import signal
+
+# Loads the schemas before the models, which import them
+from src import schemas  # noqa: F401 pylint: disable=unused-import
+from src.constants import METRICS_DIR, METRICS_WRITE_INTERVAL
+from src.database import models
+from src.database.access import AsyncSessionLocal, SessionLocal
+from src.database.models.job import FAILED
+from src.jobs import Worker
+from src.metrics import registry as metrics_registry
+
+
+def work(args):
+    worker = Worker(AsyncSessionLocal)
+    if args.once:
+        ran = asyncio.run(worker.run_pending())
+        print(f"Ran {ran} jobs")
+        return
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, worker.stop)
+        # Its metrics (e.g. of the blobs it deletes) are served by the server
+        if METRICS_DIR:
+            metrics_registry.share(METRICS_DIR)
+            metrics_registry.start(METRICS_WRITE_INTERVAL)
+        try:
+            await worker.run_forever()
+        finally:
+            await metrics_registry.stop()
+
+    asyncio.run(run())
+
+
+def stats(pdb, _args):
+    for kind, status, amount in models.JobModel.stats(pdb):
+        print(f"{kind:<20} {status:<10} {amount}")
+
+
+def list_jobs(pdb, args):
+    query = pdb.query(models.JobModel)
+    if args.status is not None:
+        query = query.filter(models.JobModel.status == args.status)
+    if args.kind is not None:
+        query = query.filter(models.JobModel.kind == args.kind)
+    jobs = query.order_by(models.JobModel.id.desc()).limit(args.limit)
+    for job in jobs:
+        print(
+            f"{job.id:<8} {job.kind:<20} {job.status:<10} "
+            f"attempts={job.attempts}/{job.max_attempts} run_at={job.run_at:%Y-%m-%d %H:%M:%S} "
+            f"payload={job.payload}"
+        )
+        if job.last_error and args.errors:
+            print(f"         {job.last_error.strip().splitlines()[-1]}")
+
+
+def retry(pdb, args):
+    query = pdb.query(models.JobModel)
+    if args.failed:
+        query = query.filter(models.JobModel.status == FAILED)
+    else:
+        query = query.filter(models.JobModel.id.in_(args.ids))
+    jobs = query.all()
+    for job in jobs:
+        job.retry(pdb)
+    pdb.commit()
+    print(f"Retrying {len(jobs)} jobs")
+
+
+def purge(pdb, args):
+    before = datetime.datetime.now() - datetime.timedelta(days=args.days)
+    deleted = models.JobModel.purge(pdb, before)
+    pdb.commit()
+    print(f"Deleted {deleted} jobs")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m src.jobs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    work_parser = commands.add_parser("work", help="run a worker")
+    work_parser.add_argument(
+        "--once", action="store_true", help="run the due jobs and exit"
+    )
+
+    commands.add_parser("stats", help="amount of jobs by kind and status")
+
+    list_parser = commands.add_parser("list", help="last jobs")
+    list_parser.add_argument("--status")
+    list_parser.add_argument("--kind")
+    list_parser.add_argument("--limit", type=int, default=20)
+    list_parser.add_argument(
+        "--errors", action="store_true", help="show the last error of each job"
+    )
+
+    retry_parser = commands.add_parser("retry", help="run jobs again")
+    retry_parser.add_argument("ids", nargs="*", type=int)
+    retry_parser.add_argument("--failed", action="store_true", help="all failed jobs")
+
+    purge_parser = commands.add_parser("purge", help="delete old done jobs")
+    purge_parser.add_argument("--days", type=int, default=7)
+
+    args = parser.parse_args()
+    if args.command == "retry" and not args.ids and not args.failed:
+        parser.error("retry needs job ids or --failed")
+    return args
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    if args.command == "work":
+        work(args)
+    else:
+        command = {
+            "stats": stats,
+            "list": list_jobs,
+            "retry": retry,
+            "purge": purge,
+        }[args.command]
+        pdb = SessionLocal()
+        try:
+            command(pdb, args)
+        finally:
+            pdb.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import datetime
+from typing import Optional
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from sqlalchemy.orm import Session
+
+# Loads the schemas before the models, which import them
+from src import schemas  # noqa: F401 pylint: disable=unused-import
+from src.database import models
+from src.database.access import run_blocking
+from src.firebase.access import get_auth, get_bucket, run_blob
+from .registry import handler
+
+
+@handler("delete_blob")
+def delete_blob(_pdb: Session, blob_name: str, deleted_at: Optional[float] = None):
+    """Deletes the blob of a deleted resource. Its name is used again by the
+    resource created next with the same id, so a blob uploaded after
+    `deleted_at` is not the one that was deleted and is kept"""
+    bucket = get_bucket()
+    try:
+        if deleted_at is None:
+            run_blob(bucket.blob(blob_name).delete)
+            return
+        blob = run_blob(bucket.get_blob, blob_name)
+        if blob is None or blob.time_created >= datetime.datetime.fromtimestamp(
+            deleted_at, datetime.timezone.utc
+        ):
+            return
+        # Fails if the blob was uploaded again since it was read
+        run_blob(blob.delete, if_generation_match=blob.generation)
+    except (NotFound, PreconditionFailed):
+        pass
+
+
+@handler("sync_auth_user")
+def sync_auth_user(pdb: Session, uid: str):
+    """Copies the name and pfp of the user to its Firebase account. They are
+    read when the job runs, so jobs running out of order still sync the last
+    values"""
+    user = models.UserModel.get(pdb, _id=uid, raise_if_not_found=False)
+    if user is None:
+        return
+    run_blocking(
+        get_auth().update_user,
+        uid=user.id,
+        display_name=user.name,
+        photo_url=user.pfp_url,
+    )
@@ -0,0 +1,15 @@
+from typing import Callable, Dict
+
+# Functions that run the jobs of each kind, called with the session of the
+# worker and the payload of the job as keyword arguments
+HANDLERS: Dict[str, Callable] = {}
+
+
+def handler(kind: str):
+    """Registers the decorated function as the handler of the jobs of a kind"""
+
+    def register(fn: Callable):
+        HANDLERS[kind] = fn
+        return fn
+
+    return register
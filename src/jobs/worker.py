@@ -0,0 +1,106 @@
+import asyncio
+import datetime
+import logging
+import traceback
+from typing import Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.constants import JOBS_BATCH_SIZE, JOBS_POLL_INTERVAL
+from src.database import models
+from .registry import HANDLERS
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    """Runs the jobs of the queue. Several workers can run at once, each job
+    is claimed by a single one.
+
+    Every job runs in its own transaction, which also marks it as done, so
+    the changes a handler makes to the database are kept only if it succeeds.
+    A failing job is retried with backoff until it runs out of attempts.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        batch_size: int = JOBS_BATCH_SIZE,
+        poll_interval: float = JOBS_POLL_INTERVAL,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._stopped = asyncio.Event()
+
+    async def run_pending(self, limit: Optional[int] = None) -> int:
+        """Runs the jobs that are due until there are none left (or `limit` of
+        them ran), returns how many ran. Used in-process by tests and by
+        `python -m src.jobs work --once`"""
+        ran = 0
+        while limit is None or ran < limit:
+            batch_size = self.batch_size
+            if limit is not None:
+                batch_size = min(batch_size, limit - ran)
+            jobs = await self._claim(batch_size)
+            if not jobs:
+                break
+            for job_id in jobs:
+                await self._run(job_id)
+            ran += len(jobs)
+        return ran
+
+    async def run_forever(self):
+        while not self._stopped.is_set():
+            try:
+                ran = await self.run_pending()
+            except Exception:
+                logger.exception("Could not claim jobs")
+                ran = 0
+            if not ran:
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def stop(self):
+        """Makes run_forever return once the jobs it is running are done"""
+        self._stopped.set()
+
+    async def _claim(self, limit: int):
+        async with self.session_factory() as pdb:
+            jobs = await pdb.run_sync(
+                models.JobModel.claim, limit, datetime.datetime.now()
+            )
+            await pdb.commit()
+            return [job.id for job in jobs]
+
+    async def _run(self, job_id: int):
+        async with self.session_factory() as pdb:
+            try:
+                await pdb.run_sync(self._handle, job_id)
+                await pdb.commit()
+                return
+            except Exception:
+                error = traceback.format_exc(limit=5)
+                await pdb.rollback()
+
+            job = await models.JobModel.aget(pdb, job_id)
+            logger.warning(
+                "Job %s (%s) failed on attempt %s: %s",
+                job.id,
+                job.kind,
+                job.attempts,
+                error,
+            )
+            await pdb.run_sync(job.fail, error, datetime.datetime.now())
+            await pdb.commit()
+
+    @staticmethod
+    def _handle(pdb, job_id: int):
+        job = models.JobModel.get(pdb, job_id)
+        handler = HANDLERS.get(job.kind)
+        if handler is None:
+            raise LookupError(f"No handler for jobs of kind {job.kind}")
+        handler(pdb, **job.payload)
+        job.succeed(pdb, datetime.datetime.now())
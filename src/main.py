@@ -9,9 +9,22 @@ from src.app import (
     comments,
     streamings,
     subscriptions,
+    health,
+    metrics,
 )
+from src import payments
+from src.database import pool
+from src.database import invalidation
+from src.database.access import async_engine
+from src.database.cache import entity_cache
+from src.constants import METRICS_WRITE_INTERVAL, TESTING
 from src.exceptions import MessageException
-from src.middleware.utils import get_api_key
+from src.metrics import registry as metrics_registry
+from src.middleware.metrics import MetricsMiddleware
+from src.middleware.statements import StatementsMiddleware
+from src.middleware.unit_of_work import UnitOfWorkMiddleware
+from src.middleware.utils import get_api_key, get_metrics_access
+from src.scheduler import scheduler
 from fastapi.responses import JSONResponse
 
 API_VERSION_PREFIX = "/api/v3"
@@ -20,18 +33,86 @@ app = FastAPI(
     title="Songs API",
     description="Spotifiuby's API to manage songs, albums, playlists and users",
     version="3.6.0",
-    dependencies=[Depends(get_api_key)],
 )
 
-app.include_router(songs.router, prefix=API_VERSION_PREFIX)
-app.include_router(albums.router, prefix=API_VERSION_PREFIX)
-app.include_router(users.router, prefix=API_VERSION_PREFIX)
-app.include_router(playlists.router, prefix=API_VERSION_PREFIX)
-app.include_router(favorites.router, prefix=API_VERSION_PREFIX)
-app.include_router(reviews.router, prefix=API_VERSION_PREFIX)
-app.include_router(comments.router, prefix=API_VERSION_PREFIX)
-app.include_router(streamings.router, prefix=API_VERSION_PREFIX)
-app.include_router(subscriptions.router, prefix=API_VERSION_PREFIX)
+app.add_middleware(UnitOfWorkMiddleware)
+app.add_middleware(StatementsMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+# Every endpoint of the API needs the API key. /metrics and the readiness
+# check of /health/db are outside of it, for scrapers and probes that cannot
+# send it (see get_metrics_access)
+for router in (
+    songs.router,
+    albums.router,
+    users.router,
+    playlists.router,
+    favorites.router,
+    reviews.router,
+    comments.router,
+    streamings.router,
+    subscriptions.router,
+    health.router,
+):
+    app.include_router(
+        router, prefix=API_VERSION_PREFIX, dependencies=[Depends(get_api_key)]
+    )
+app.include_router(
+    health.probes_router,
+    prefix=API_VERSION_PREFIX,
+    dependencies=[Depends(get_metrics_access)],
+)
+app.include_router(metrics.router, dependencies=[Depends(get_metrics_access)])
+
+
+@app.on_event("startup")
+async def warm_up_db_pool():
+    await pool.warm_up(async_engine)
+
+
+@app.on_event("startup")
+async def start_scheduler():
+    if not TESTING:
+        scheduler.start()
+
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+
+
+@app.on_event("startup")
+async def start_invalidation_listener():
+    # Whenever the cache is on, also with TESTING (e.g. the servers of
+    # benchmarks.load): without it the workers would serve each other's
+    # stale rows until they expire
+    if entity_cache.enabled:
+        invalidation.listener.start()
+
+
+@app.on_event("shutdown")
+async def stop_invalidation_listener():
+    await invalidation.listener.stop()
+
+
+@app.on_event("startup")
+async def start_metrics_writer():
+    metrics_registry.start(METRICS_WRITE_INTERVAL)
+
+
+@app.on_event("shutdown")
+async def stop_metrics_writer():
+    await metrics_registry.stop()
+
+
+@app.on_event("shutdown")
+async def dispose_db_pool():
+    await async_engine.dispose()
+
+
+@app.on_event("shutdown")
+async def close_payments_client():
+    await payments.get_client().aclose()
 
 
 @app.exception_handler(MessageException)
@@ -0,0 +1,71 @@
+"""Metrics of the application, served by `GET /metrics` in the Prometheus text
+format. See src/metrics/registry.py for how the processes add them up"""
+from .registry import Counter, Gauge, Histogram, Registry, render
+
+registry = Registry()
+
+# Requests, by route template, e.g. /api/v3/songs/{song_id}
+REQUESTS = registry.counter(
+    "http_requests_total", "Requests served", ["method", "route", "status"]
+)
+REQUEST_ERRORS = registry.counter(
+    "http_request_errors_total",
+    "Requests that failed with a server error",
+    ["method", "route"],
+)
+REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds",
+    "Time to serve a request, until its body was sent",
+    ["method", "route"],
+)
+REQUESTS_IN_PROGRESS = registry.gauge(
+    "http_requests_in_progress", "Requests being served", ["method"]
+)
+
+# Calls to the bucket, by blob method, e.g. upload_from_file or delete
+BLOB_DURATION = registry.histogram(
+    "blob_operation_duration_seconds",
+    "Time a call to the storage bucket took",
+    ["operation", "outcome"],
+)
+
+# Calls to the payments service, see src/payments
+PAYMENTS_DURATION = registry.histogram(
+    "payments_call_duration_seconds",
+    "Time a call to the payments service took, its retries included",
+    ["operation", "outcome"],
+)
+PAYMENTS_RETRY_ATTEMPTS = registry.counter(
+    "payments_call_retries_total",
+    "Attempts of calls to the payments service that were retried",
+    ["operation"],
+)
+
+# Connection pool of the database, see src/database/pool.py
+DB_POOL_CONNECTIONS = registry.gauge(
+    "db_pool_connections", "Connections of the pool", ["state"]
+)
+DB_POOL_CHECKOUTS = registry.counter(
+    "db_pool_checkouts_total", "Connections handed out by the pool"
+)
+DB_POOL_CONNECTS = registry.counter(
+    "db_pool_connects_total", "Connections opened by the pool"
+)
+DB_POOL_TIMEOUTS = registry.counter(
+    "db_pool_timeouts_total", "Checkouts that gave up waiting for a connection"
+)
+DB_POOL_WAIT = registry.counter(
+    "db_pool_wait_seconds_total", "Time checkouts waited for a connection"
+)
+
+# Entity cache, see src/database/cache.py. The hit ratio is the rate of the
+# hits over the rate of all the lookups
+ENTITY_CACHE_LOOKUPS = registry.counter(
+    "entity_cache_lookups_total", "Lookups of the entity cache", ["result"]
+)
+ENTITY_CACHE_REMOVALS = registry.counter(
+    "entity_cache_removals_total", "Entries removed from the entity cache", ["reason"]
+)
+ENTITY_CACHE_ENTRIES = registry.gauge(
+    "entity_cache_entries", "Entries of the entity cache"
+)
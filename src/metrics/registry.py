@@ -0,0 +1,346 @@
+"""Metrics rendered in the Prometheus text format, added up across the worker
+processes of the server.
+
+Every process keeps its own values. Once the registry is shared (see
+`Registry.share`, which src/server.py calls before forking its workers),
+each process writes them to a file of its own in a common directory: every
+few seconds, when it stops and before it renders them. `render` then adds up
+the files of every process. Those of the processes that exited are folded
+into a single archive, so that their counters and histograms are kept while
+their gauges are dropped.
+"""
+import asyncio
+import contextlib
+import fcntl
+import json
+import logging
+import math
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Prometheus' default buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+ARCHIVE = "archive.json"
+LOCK = ".lock"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes the labels {self.labels}")
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "help": self.documentation,
+                "labels": list(self.labels),
+                "values": [[list(key), value] for key, value in self._values.items()],
+            }
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        """For totals counted elsewhere, e.g. by the entity cache"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            observed = self._values.get(key)
+            if observed is None:
+                observed = self._values[key] = {
+                    # Not cumulative, the last one is +Inf
+                    "buckets": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            index = next(
+                (i for i, bound in enumerate(self.buckets) if value <= bound),
+                len(self.buckets),
+            )
+            observed["buckets"][index] += 1
+            observed["sum"] += value
+            observed["count"] += 1
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot["bounds"] = list(self.buckets)
+        snapshot["values"] = [
+            [key, {**value, "buckets": list(value["buckets"])}]
+            for key, value in snapshot["values"]
+        ]
+        return snapshot
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        # Called before the values are read, to copy state kept elsewhere
+        # (e.g. the connection pool) into the metrics
+        self.collectors: List[Callable[[], None]] = []
+        self.directory: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def counter(self, name, documentation, labels=()) -> Counter:
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()) -> Gauge:
+        return self._add(Gauge(name, documentation, labels))
+
+    def histogram(
+        self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} already exists")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def collector(self, fn: Callable[[], None]):
+        """Registers the decorated function as a collector"""
+        self.collectors.append(fn)
+        return fn
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+
+    def snapshot(self):
+        """Values of the metrics of this process"""
+        for collect in self.collectors:
+            try:
+                collect()
+            except Exception:
+                logger.exception("Metrics collector %s failed", collect.__name__)
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    # Processes
+
+    def share(self, directory: str):
+        """Makes every process that shares the directory render the metrics
+        of all of them. Meant to be called before forking them"""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def write(self):
+        """Writes the values of this process to its file, if shared"""
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(self.snapshot(), file)
+        os.replace(temporary, path)
+
+    def start(self, interval: float):
+        """Writes the values of this process every `interval` seconds"""
+        if self.directory is not None and interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._write_forever(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        self.write()
+
+    async def _write_forever(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.write()
+            except OSError:
+                logger.exception("Could not write the metrics of the process")
+
+    def collect(self) -> Dict[str, dict]:
+        """Values of the metrics of every process sharing the directory, or of
+        this one if it is not shared"""
+        if self.directory is None:
+            return self.snapshot()
+
+        self.write()
+        with open(os.path.join(self.directory, LOCK), "w", encoding="utf-8") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive_path = os.path.join(self.directory, ARCHIVE)
+            archive = _load(archive_path) or {}
+            live = []
+            exited = False
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json") or name == ARCHIVE:
+                    continue
+                path = os.path.join(self.directory, name)
+                snapshot = _load(path)
+                if snapshot is None:
+                    continue
+                if _alive(int(name[: -len(".json")])):
+                    live.append(snapshot)
+                    continue
+                # Gauges of exited processes no longer hold
+                _merge(archive, snapshot, gauges=False)
+                os.remove(path)
+                exited = True
+            if exited:
+                with open(f"{archive_path}.tmp", "w", encoding="utf-8") as file:
+                    json.dump(archive, file)
+                os.replace(f"{archive_path}.tmp", archive_path)
+
+        merged: Dict[str, dict] = {}
+        _merge(merged, archive, gauges=False)
+        for snapshot in live:
+            _merge(merged, snapshot, gauges=True)
+        return merged
+
+    def render(self) -> str:
+        return render(self.collect())
+
+
+def _load(path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(into: Dict[str, dict], snapshot: Dict[str, dict], gauges: bool):
+    """Adds the values of the snapshot to `into`"""
+    for name, metric in snapshot.items():
+        if metric["kind"] == "gauge" and not gauges:
+            continue
+        merged = into.setdefault(name, {**metric, "values": []})
+        values = {tuple(key): value for key, value in merged["values"]}
+        for key, value in metric["values"]:
+            key = tuple(key)
+            current = values.get(key)
+            if current is None:
+                values[key] = value
+            elif metric["kind"] == "histogram":
+                values[key] = {
+                    "buckets": [
+                        a + b for a, b in zip(current["buckets"], value["buckets"])
+                    ],
+                    "sum": current["sum"] + value["sum"],
+                    "count": current["count"] + value["count"],
+                }
+            else:
+                values[key] = current + value
+        merged["values"] = [[list(key), value] for key, value in values.items()]
+
+
+def render(metrics: Dict[str, dict]) -> str:
+    """The metrics in the Prometheus text format"""
+    lines = []
+    for name, metric in sorted(metrics.items()):
+        lines.append(f"# HELP {name} {_escape_help(metric['help'])}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        labels = metric["labels"]
+        for key, value in sorted(metric["values"], key=lambda entry: entry[0]):
+            pairs = list(zip(labels, key))
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+                continue
+            cumulative = 0
+            bounds = [_number(bound) for bound in metric["bounds"]] + ["+Inf"]
+            for bound, count in zip(bounds, value["buckets"]):
+                cumulative += count
+                bucket_labels = _labels(pairs + [("le", bound)])
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{_labels(pairs)} {_number(value['sum'])}")
+            lines.append(f"{name}_count{_labels(pairs)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    escaped = (f'{label}="{_escape_value(value)}"' for label, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", r"\\").replace("\n", r"\n")
+
+
+def _escape_value(text: str) -> str:
+    return _escape_help(text).replace('"', r"\"")
+
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if value.is_integer():
+            return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
@@ -0,0 +1,46 @@
+import time
+
+from src import metrics
+
+
+class MetricsMiddleware:
+    """Counts and times the requests by route template, e.g.
+    /api/v3/songs/{song_id}, so that the ids in the paths do not make a
+    series of each request. Requests that match no route are labeled
+    `unmatched`"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        metrics.REQUESTS_IN_PROGRESS.inc(method=method)
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            status_code = 500
+            raise
+        finally:
+            metrics.REQUESTS_IN_PROGRESS.dec(method=method)
+            # Set by the router on the scope it shares with the middlewares
+            route = scope.get("route")
+            route = getattr(route, "path_format", None) or "unmatched"
+            metrics.REQUESTS.inc(method=method, route=route, status=status_code)
+            metrics.REQUEST_DURATION.observe(
+                time.perf_counter() - start, method=method, route=route
+            )
+            if status_code >= 500:
+                metrics.REQUEST_ERRORS.inc(method=method, route=route)
@@ -1,5 +1,4 @@
 from starlette.middleware.cors import CORSMiddleware
-from starlette.requests import Request
 
 from src.main import app
 
@@ -10,10 +9,3 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    response = await call_next(request)
-    response.headers["Access-Control-Allow-Origin"] = str("*")
-    return response
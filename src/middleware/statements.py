@@ -0,0 +1,45 @@
+import time
+
+from starlette.datastructures import MutableHeaders
+
+from src.database import statements
+
+
+class StatementsMiddleware:
+    """Counts and times the statements of each request, failing the ones that
+    issue more than `statements.max_statements` (which catches N+1 queries in
+    tests).
+
+    The response reports them in the `X-DB-Queries` header and in
+    `Server-Timing`, along with the time the request took until its response
+    started. Statements sent after that, e.g. by background tasks, are not
+    counted in them"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        with statements.count_statements(statements.max_statements) as counter:
+
+            async def send_with_statements(message):
+                if message["type"] == "http.response.start":
+                    elapsed = time.perf_counter() - start
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", server_timing(counter, elapsed))
+                    headers.append("X-DB-Queries", str(counter.count))
+                await send(message)
+
+            await self.app(scope, receive, send_with_statements)
+
+
+def server_timing(counter: statements.StatementCounter, elapsed: float) -> str:
+    return (
+        f'db;dur={counter.time * 1000:.1f};desc="{counter.count} queries", '
+        f"db-slowest;dur={counter.slowest_time * 1000:.1f}, "
+        f"app;dur={elapsed * 1000:.1f}"
+    )
@@ -0,0 +1,23 @@
+from src.database import unit_of_work
+
+
+class UnitOfWorkMiddleware:
+    """Commits the unit of work of a request right before its response starts,
+    so a failed commit is still reported to the client as an error. Responses
+    with an error status are not committed, their session rolls back when it
+    is closed"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_after_commit(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                await unit_of_work.commit(scope)
+            await send(message)
+
+        await self.app(scope, receive, send_after_commit)
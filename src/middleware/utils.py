@@ -1,8 +1,16 @@
+import ipaddress
+
 from src.exceptions import MessageException
-from fastapi import Security
+from fastapi import Request, Security
 from fastapi.security import APIKeyHeader
 
-from src.constants import API_KEY_NAME, API_KEY
+from src.constants import API_KEY_NAME, API_KEY, METRICS_ALLOWED_NETWORKS
+
+_metrics_networks = [
+    ipaddress.ip_network(network.strip())
+    for network in METRICS_ALLOWED_NETWORKS.split(",")
+    if network.strip()
+]
 
 
 async def get_api_key(
@@ -12,3 +20,24 @@ async def get_api_key(
         return api_key_header
     else:
         raise MessageException(status_code=403, detail="API key is not valid")
+
+
+def _in_metrics_networks(host) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in _metrics_networks)
+
+
+async def get_metrics_access(
+    request: Request,
+    api_key_header: str = Security(APIKeyHeader(name=API_KEY_NAME, auto_error=False)),
+):
+    """Scrapers and readiness probes can rarely send headers, so those
+    connecting from METRICS_ALLOWED_NETWORKS need no API key"""
+    if api_key_header == API_KEY:
+        return
+    if request.client is not None and _in_metrics_networks(request.client.host):
+        return
+    raise MessageException(status_code=403, detail="API key is not valid")
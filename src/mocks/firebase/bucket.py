@@ -1,32 +1,68 @@
+import datetime
+from urllib.parse import parse_qs, urlparse
+
+# Host of the signed urls handed out by the mock, uploads to it are stored in
+# the blobs of `bucket_mock` (see `Bucket.receive_signed_upload`)
+SIGNED_URL_HOST = "https://storage.mock"
+
+
 class Blob:
-    def __init__(self):
+    def __init__(self, name=None):
+        self.name = name
         self.data = None
+        self.content_type = None
         self.public_url = "https://example.com"
+        # Set by every upload, as the bucket does
+        self.generation = None
+        self.time_created = None
+
+    @property
+    def size(self):
+        if isinstance(self.data, (bytes, str)):
+            return len(self.data)
+        return None
 
     def download_as_bytes(self):
         assert self.data is not None
         return self.data
 
+    def write(self, data):
+        """Stores the data as a new generation of the blob"""
+        self.data = data
+        self.generation = (self.generation or 0) + 1
+        self.time_created = datetime.datetime.now(datetime.timezone.utc)
+
     def upload_from_string(self, data_string):
-        self.data = data_string
+        self.write(data_string)
 
     def upload_from_file(self, data):
-        self.data = data
+        self.write(data)
 
-    def delete(self):
+    def delete(self, if_generation_match=None):
+        if if_generation_match is not None and if_generation_match != self.generation:
+            # Imported here, the mocks are loaded without Firebase
+            from google.api_core.exceptions import PreconditionFailed
+
+            raise PreconditionFailed(f"{self.name} has another generation")
         self.data = None
 
     def make_public(self):
         pass
 
+    def reload(self):
+        pass
+
     def generate_signed_url(
-        self, version, expiration, method
+        self, version, expiration, method, content_type=None
     ):  # pylint: disable=unused-argument
+        if method == "GET":
+            return self.public_url
 
-        return self.public_url
+        expires = int(datetime.datetime.now().timestamp() + expiration.total_seconds())
+        return f"{SIGNED_URL_HOST}/{self.name}?method={method}&expires={expires}"
 
     def exists(self):
-        return True
+        return self.data is not None
 
 
 class Bucket:
@@ -35,8 +71,33 @@ class Bucket:
 
     def blob(self, file_id):
         if file_id not in self.files:
-            self.files[file_id] = Blob()
+            self.files[file_id] = Blob(file_id)
         return self.files[file_id]
 
+    def copy_blob(self, blob, destination_bucket, new_name):
+        copy = destination_bucket.blob(new_name)
+        copy.write(blob.data)
+        copy.content_type = blob.content_type
+        return copy
+
+    def get_blob(self, file_id):
+        blob = self.files.get(file_id)
+        return blob if blob is not None and blob.exists() else None
+
+    def receive_signed_upload(self, method, url, data, content_type=None):
+        """Stores an upload to a signed url as the bucket would, returns the
+        HTTP status the bucket would answer with"""
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        if query.get("method") != [method]:
+            return 403
+        if int(query["expires"][0]) < datetime.datetime.now().timestamp():
+            return 400
+
+        blob = self.blob(parsed.path.lstrip("/"))
+        blob.write(data or b"")
+        blob.content_type = content_type
+        return 200
+
 
 bucket_mock = Bucket()
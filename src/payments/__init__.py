@@ -0,0 +1,13 @@
+"""Client of the payments service, which keeps the wallets of the users and
+takes the payments of the subscriptions"""
+from src.constants import PAYMENTS_URL
+from .breaker import CircuitBreaker, CircuitOpenError
+from .client import PaymentsClient
+
+# Shared by the whole process, so calls reuse its connections. Tests point
+# it to a local stand-in of the service
+client = PaymentsClient(PAYMENTS_URL)
+
+
+def get_client() -> PaymentsClient:
+    return client
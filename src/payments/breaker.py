@@ -0,0 +1,66 @@
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Stops calling a service that keeps failing.
+
+    After `failures` consecutive failures the circuit opens and calls are
+    rejected right away. Once `reset_timeout` seconds passed, a single call is
+    let through: the circuit closes if it succeeds and opens again if not.
+    Shared by the sync and async calls, so it is guarded by a lock.
+    """
+
+    def __init__(self, failures: int, reset_timeout: float, clock=time.monotonic):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._can_try():
+                return HALF_OPEN
+            return self._state
+
+    def _can_try(self):
+        return self.clock() - self._opened_at >= self.reset_timeout
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call must not be made"""
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            if self._state == OPEN and self._can_try():
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+            raise CircuitOpenError()
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            self._trial_running = False
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failures:
+                self._state = OPEN
+                self._opened_at = self.clock()
@@ -0,0 +1,346 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Optional
+
+import httpx
+from fastapi import status
+
+from src.constants import (
+    PAYMENTS_API_KEY,
+    PAYMENTS_BACKOFF_BASE,
+    PAYMENTS_BREAKER_FAILURES,
+    PAYMENTS_BREAKER_RESET,
+    PAYMENTS_CONNECT_TIMEOUT,
+    PAYMENTS_DEADLINE,
+    PAYMENTS_POOL_SIZE,
+    PAYMENTS_RETRIES,
+)
+from src.exceptions import MessageException
+from src.metrics import PAYMENTS_DURATION, PAYMENTS_RETRY_ATTEMPTS
+from .breaker import CircuitBreaker, CircuitOpenError
+
+# Errors raised before the request reached the service, retrying them is
+# safe even for calls that are not idempotent
+_NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+_ssl_context = None
+
+
+def _get_ssl_context():
+    """Loading the certificates takes a while, so every client shares them"""
+    global _ssl_context  # pylint: disable=global-statement
+    if _ssl_context is None:
+        _ssl_context = httpx.create_ssl_context()
+    return _ssl_context
+
+
+class PaymentsMetrics:
+    """Latency and outcome of the calls to the payments service, by operation"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.operations = {}
+
+    def _metrics(self, operation: str):
+        return self.operations.setdefault(
+            operation,
+            {
+                "calls": 0,
+                "retries": 0,
+                "outcomes": {},
+                "time_total": 0.0,
+                "time_max": 0.0,
+            },
+        )
+
+    def record(self, operation: str, outcome: str, seconds: float):
+        """Records a call once it is done, `seconds` include its retries"""
+        with self._lock:
+            metrics = self._metrics(operation)
+            metrics["calls"] += 1
+            metrics["outcomes"][outcome] = metrics["outcomes"].get(outcome, 0) + 1
+            metrics["time_total"] += seconds
+            metrics["time_max"] = max(metrics["time_max"], seconds)
+        PAYMENTS_DURATION.observe(seconds, operation=operation, outcome=outcome)
+
+    def record_retry(self, operation: str):
+        with self._lock:
+            self._metrics(operation)["retries"] += 1
+        PAYMENTS_RETRY_ATTEMPTS.inc(operation=operation)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                operation: {**metrics, "outcomes": dict(metrics["outcomes"])}
+                for operation, metrics in self.operations.items()
+            }
+
+
+class _Call:
+    """State of a call through its attempts: the time left until its deadline
+    and whether a failure can be retried"""
+
+    def __init__(self, operation: str, idempotent: bool, deadline: float, retries: int):
+        self.operation = operation
+        self.idempotent = idempotent
+        self.retries = retries
+        self.attempt = 0
+        self.start = time.monotonic()
+        self.expires = self.start + deadline
+
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+    def timeout(self) -> httpx.Timeout:
+        remaining = max(self.remaining(), 0.001)
+        return httpx.Timeout(
+            remaining, connect=min(remaining, PAYMENTS_CONNECT_TIMEOUT)
+        )
+
+    def retry_delay(self, error: Exception) -> Optional[float]:
+        """Seconds to wait before retrying, None if it must not be retried"""
+        if self.attempt > self.retries:
+            return None
+        if not self.idempotent and not isinstance(error, _NOT_SENT):
+            return None
+        # Full jitter, so that calls failing together do not retry together
+        delay = random.uniform(0, PAYMENTS_BACKOFF_BASE * 2 ** (self.attempt - 1))
+        if delay >= self.remaining():
+            return None
+        return delay
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+
+class _ServerError(Exception):
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"{response.status_code} {response.text}")
+        self.response = response
+
+
+def _check_server_error(response: httpx.Response):
+    if response.status_code >= 500:
+        raise _ServerError(response)
+
+
+def _idempotency_headers(idempotency_key: Optional[str]):
+    if idempotency_key is None:
+        return {}
+    return {"Idempotency-Key": idempotency_key}
+
+
+def _wallet_address(response: httpx.Response) -> str:
+    try:
+        return response.json()["address"]
+    except (ValueError, KeyError, TypeError):
+        # ValueError is a body that is not JSON, the rest one without address
+        raise MessageException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Payments service sent a malformed wallet: {response.text}",
+        )
+
+
+class PaymentsClient:
+    """Client of the payments service, usable from sync and async code.
+
+    Calls share a keep-alive connection pool (one for each kind of code), have
+    a deadline that covers their retries and go through a circuit breaker.
+    Idempotent calls are retried with jittered backoff on timeouts and server
+    errors, the rest only when the request could not be sent.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str = PAYMENTS_API_KEY,
+        deadline: float = PAYMENTS_DEADLINE,
+        retries: int = PAYMENTS_RETRIES,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.deadline = deadline
+        self.retries = retries
+        self.breaker = breaker or CircuitBreaker(
+            PAYMENTS_BREAKER_FAILURES, PAYMENTS_BREAKER_RESET
+        )
+        self.metrics = PaymentsMetrics()
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    def _options(self):
+        return {
+            "base_url": self.base_url,
+            "headers": {"api_key": self.api_key},
+            "verify": _get_ssl_context(),
+            "limits": httpx.Limits(
+                max_connections=PAYMENTS_POOL_SIZE,
+                max_keepalive_connections=PAYMENTS_POOL_SIZE,
+            ),
+        }
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = httpx.Client(**self._options())
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._options())
+        return self._async_client
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    # Operations of the service
+
+    def create_wallet(self, uid: str, idempotency_key: Optional[str] = None) -> str:
+        """Address of the wallet of the user. Only retried once sent with an
+        `idempotency_key`, which lets the service create the wallet once"""
+        response = self.request(
+            "create_wallet",
+            "POST",
+            f"/wallets/{uid}",
+            idempotency_key is not None,
+            headers=_idempotency_headers(idempotency_key),
+        )
+        return _wallet_address(response)
+
+    async def acreate_wallet(
+        self, uid: str, idempotency_key: Optional[str] = None
+    ) -> str:
+        """Awaitable variant of `create_wallet`."""
+        response = await self.arequest(
+            "create_wallet",
+            "POST",
+            f"/wallets/{uid}",
+            idempotency_key is not None,
+            headers=_idempotency_headers(idempotency_key),
+        )
+        return _wallet_address(response)
+
+    def deposit(self, uid: str, amount: str):
+        self.request(
+            "deposit", "POST", f"/deposit/{uid}", False, json={"amountInEthers": amount}
+        )
+
+    async def adeposit(self, uid: str, amount: str):
+        """Awaitable variant of `deposit`."""
+        await self.arequest(
+            "deposit", "POST", f"/deposit/{uid}", False, json={"amountInEthers": amount}
+        )
+
+    # Calls
+
+    def request(self, operation, method, url, idempotent, **kwargs) -> httpx.Response:
+        call = _Call(operation, idempotent, self.deadline, self.retries)
+        while True:
+            self._before_attempt(call)
+            try:
+                response = self.client.request(
+                    method, url, timeout=call.timeout(), **kwargs
+                )
+                _check_server_error(response)
+            except (httpx.TransportError, _ServerError) as e:
+                delay = self._after_error(call, e)
+            except BaseException:
+                self._after_unexpected_error(call)
+                raise
+            else:
+                return self._after_response(call, response)
+            time.sleep(delay)
+
+    async def arequest(
+        self, operation, method, url, idempotent, **kwargs
+    ) -> httpx.Response:
+        """Awaitable variant of `request`."""
+        call = _Call(operation, idempotent, self.deadline, self.retries)
+        while True:
+            self._before_attempt(call)
+            try:
+                response = await self.async_client.request(
+                    method, url, timeout=call.timeout(), **kwargs
+                )
+                _check_server_error(response)
+            except (httpx.TransportError, _ServerError) as e:
+                delay = self._after_error(call, e)
+            except BaseException:
+                self._after_unexpected_error(call)
+                raise
+            else:
+                return self._after_response(call, response)
+            await asyncio.sleep(delay)
+
+    def _before_attempt(self, call: _Call):
+        call.attempt += 1
+        if call.remaining() <= 0:
+            self._give_up(call, "deadline", status.HTTP_504_GATEWAY_TIMEOUT)
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._give_up(call, "circuit_open", status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def _after_response(self, call: _Call, response: httpx.Response):
+        self.breaker.record_success()
+        if response.status_code != status.HTTP_200_OK:
+            # Rejected by the service, e.g. not enough funds
+            self.metrics.record(call.operation, "rejected", call.elapsed())
+            raise MessageException(
+                status_code=response.status_code, detail=response.text
+            )
+        self.metrics.record(call.operation, "ok", call.elapsed())
+        return response
+
+    def _after_error(self, call: _Call, error: Exception) -> float:
+        self.breaker.record_failure()
+        delay = call.retry_delay(error)
+        if delay is not None:
+            self.metrics.record_retry(call.operation)
+            return delay
+
+        if isinstance(error, _ServerError):
+            self.metrics.record(call.operation, "server_error", call.elapsed())
+            raise MessageException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"Payments service failed: {error.response.text}",
+            )
+        if isinstance(error, httpx.TimeoutException):
+            self._give_up(call, "timeout", status.HTTP_504_GATEWAY_TIMEOUT)
+        self.metrics.record(call.operation, "unreachable", call.elapsed())
+        raise MessageException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Payments service unreachable: {error.__class__.__name__}",
+        )
+
+    def _after_unexpected_error(self, call: _Call):
+        """Counts anything else that ended the attempt, e.g. the request being
+        cancelled or a response that could not be decoded, as a failure.
+        Otherwise the trial call of a half-open circuit would never end and
+        the circuit would reject every call from then on"""
+        self.breaker.record_failure()
+        self.metrics.record(call.operation, "error", call.elapsed())
+
+    def _give_up(self, call: _Call, outcome: str, status_code: int):
+        self.metrics.record(call.operation, outcome, call.elapsed())
+        detail = {
+            "deadline": "Payments service timed out",
+            "timeout": "Payments service timed out",
+            "circuit_open": "Payments service unavailable",
+        }[outcome]
+        raise MessageException(status_code=status_code, detail=detail)
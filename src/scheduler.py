@@ -0,0 +1,150 @@
+"""Periodic tasks run by the application itself, e.g. revoking the expired
+subscriptions.
+
+Every worker process runs a Scheduler, and on each tick they compete for a
+Postgres advisory lock: the one that gets it runs the tasks, the rest skip
+them. The lock is released when the tasks are done, so a worker that ticks
+right after could get it too: holding it, each task is claimed in the
+scheduled_tasks table, which records when the task last ran, and the task is
+skipped if it ran less than an interval ago. Tasks registered with
+`exclusive=False` work on state of the process, so every process runs them
+on each tick, without the lock.
+"""
+import asyncio
+import contextlib
+import datetime
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Loads the schemas before the models, which import them
+from src import schemas  # noqa: F401 pylint: disable=unused-import
+from src.constants import SCHEDULER_INTERVAL
+from src.database.access import async_engine
+from src.database.models import ScheduledTaskModel
+from src.utils import subscription
+from src.utils.subscription import revoke_subscription
+
+logger = logging.getLogger(__name__)
+
+# Key of the advisory lock of the leader of a tick
+LOCK_KEY = 7_348_201
+
+# Coroutine functions run on each tick, they get the session of the tick
+# and return how many rows they touched
+Task = Callable[[AsyncSession], Awaitable[int]]
+TASKS: Dict[str, Task] = {}
+LOCAL_TASKS: Dict[str, Task] = {}
+
+
+def task(name: str, exclusive: bool = True):
+    """Registers the decorated coroutine function as a task"""
+
+    def register(fn: Task):
+        (TASKS if exclusive else LOCAL_TASKS)[name] = fn
+        return fn
+
+    return register
+
+
+@contextlib.asynccontextmanager
+async def pinned_session():
+    """A session that keeps a single connection through its commits, which
+    session level advisory locks need"""
+    async with async_engine.connect() as connection:
+        pdb = AsyncSession(bind=connection, autoflush=False, expire_on_commit=False)
+        try:
+            yield pdb
+        finally:
+            await pdb.close()
+
+
+class Scheduler:
+    def __init__(
+        self,
+        session=pinned_session,
+        interval: float = SCHEDULER_INTERVAL,
+    ):
+        self.session = session
+        self.interval = interval
+        # When the last tick that ran the tasks ended and what they returned
+        self.last_run: Optional[datetime.datetime] = None
+        self.last_results: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def tick(self) -> Dict[str, int]:
+        """Runs the local tasks, and the rest if no other worker is running
+        them. Returns the results of the tasks that ran"""
+        results = {}
+        async with self.session() as pdb:
+            await self._run(pdb, LOCAL_TASKS, results)
+            locked = await pdb.scalar(select(func.pg_try_advisory_lock(LOCK_KEY)))
+            await pdb.commit()
+            if locked:
+                try:
+                    await self._run(pdb, TASKS, results, self.interval)
+                finally:
+                    await pdb.execute(select(func.pg_advisory_unlock(LOCK_KEY)))
+                    await pdb.commit()
+
+        self.last_run = datetime.datetime.now()
+        self.last_results = results
+        return results
+
+    @staticmethod
+    async def _run(
+        pdb: AsyncSession,
+        tasks: Dict[str, Task],
+        results: Dict[str, int],
+        interval: Optional[float] = None,
+    ):
+        """Runs the tasks, each in its own transaction. With an interval, the
+        tasks that ran less than it ago are skipped"""
+        for name, run in tasks.items():
+            try:
+                if interval is not None and not await pdb.run_sync(
+                    ScheduledTaskModel.claim, name, datetime.datetime.now(), interval
+                ):
+                    await pdb.rollback()
+                    continue
+                results[name] = await run(pdb)
+                await pdb.commit()
+            except Exception:
+                await pdb.rollback()
+                logger.exception("Scheduled task %s failed", name)
+                continue
+            logger.info("Scheduled task %s touched %s rows", name, results[name])
+
+    async def run_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("Could not run the scheduled tasks")
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+scheduler = Scheduler()
+
+
+@task("revoke_subscriptions")
+async def revoke_subscriptions(pdb: AsyncSession) -> int:
+    return await pdb.run_sync(revoke_subscription, datetime.datetime.now(), commit=True)
+
+
+@task("revoke_seen_subscriptions", exclusive=False)
+async def revoke_seen_subscriptions(pdb: AsyncSession) -> int:
+    return await subscription.expired_users.flush(pdb)
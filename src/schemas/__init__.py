@@ -7,3 +7,5 @@ from .review import *
 from .comment import *
 from .streaming import *
 from .subscription import *
+from .health import *
+from .upload import *
@@ -1,5 +1,6 @@
 from src.exceptions import MessageException
-from typing import Optional, List
+from enum import Enum
+from typing import Dict, Optional, List
 
 from pydantic.fields import Field
 
@@ -15,6 +16,7 @@ from fastapi import Form, status
 
 
 __all__ = [
+    "AlbumSort",
     "AlbumBase",
     "Album",
     "AlbumGet",
@@ -24,17 +26,24 @@ __all__ = [
     "AlbumUpdateCollector",
 ]
 
+from .loading import BoundedGetter, LoadProfile
 from .utils import as_form, decode_json_list
 from .. import roles
 from ..database import models
 
 
+class AlbumSort(str, Enum):
+    id = "id"
+    # Average score of the reviews, best rated first
+    rating = "rating"
+
+
 class AlbumBase(ResourceBase):
     genre: str
 
 
 class Album(AlbumBase):
-    file_url: str = Field(alias="cover")
+    file_url: Optional[str] = Field(None, alias="cover")
     score: float
     scores_amount: int
 
@@ -46,6 +55,11 @@ class AlbumGet(Album):
     from .song import SongBase
 
     songs: List[SongBase]
+    offsets: Dict[str, str] = {}
+
+    class Config:
+        load_profile = LoadProfile("songs.artists", bounded=["songs"])
+        getter_dict = BoundedGetter
 
 
 @as_form
@@ -75,15 +89,15 @@ class AlbumCreate(ResourceCreate):
             )
         super().__init__(creator_id=creator_id, **kwargs)
         songs_ids = decode_json_list(songs_ids, True)
-        songs = []
-        for song_id in songs_ids:
-            song = models.SongModel.get(pdb, song_id, role=role)
+        songs = models.SongModel.get_many(
+            pdb, ids=[int(song_id) for song_id in songs_ids], role=role
+        )
+        for song in songs:
             if song.creator_id != creator_id:
                 raise MessageException(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail="You can't add songs from other users",
                 )
-            songs.append(song)
         self.songs = songs
         self.genre = genre
 
@@ -117,9 +131,10 @@ class AlbumUpdate(ResourceUpdate):
         super().__init__(creator_id=creator_id, **kwargs)
         if songs_ids is not None:
             songs_ids = decode_json_list(songs_ids, True)
-            songs = []
-            for song_id in songs_ids:
-                song = models.SongModel.get(pdb, _id=song_id, role=role)
+            songs = models.SongModel.get_many(
+                pdb, ids=[int(song_id) for song_id in songs_ids], role=role
+            )
+            for song in songs:
                 if song.creator_id != creator_id:
                     raise MessageException(
                         status_code=status.HTTP_403_FORBIDDEN,
@@ -130,7 +145,6 @@ class AlbumUpdate(ResourceUpdate):
                         status_code=status.HTTP_403_FORBIDDEN,
                         detail="You can't add songs that belong to another album",
                     )
-                songs.append(song)
             self.songs = songs
         else:
             self.songs = None
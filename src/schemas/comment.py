@@ -1,8 +1,9 @@
 from datetime import datetime
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
 from .album import AlbumBase
 from .user import UserBase
+from .loading import BoundedGetter, LoadProfile
 
 
 class CommentGet(BaseModel):
@@ -12,9 +13,19 @@ class CommentGet(BaseModel):
     commenter: Optional[UserBase]
     responses: List["CommentGet"]
     album: AlbumBase
+    offsets: Dict[str, str] = {}
 
     class Config:
         orm_mode = True
+        # Every level of responses is loaded with the same profile
+        load_profile = LoadProfile(
+            "commenter",
+            "album",
+            joined=["commenter", "album"],
+            recursive=["responses"],
+            bounded=["responses"],
+        )
+        getter_dict = BoundedGetter
 
 
 class CommentPost(BaseModel):
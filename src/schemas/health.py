@@ -0,0 +1,55 @@
+from typing import Dict, Optional
+
+from pydantic import BaseModel
+
+
+class PoolStatus(BaseModel):
+    size: int
+    max_overflow: int
+    checked_out: int
+    checked_in: int
+    overflow: int
+    overflow_max: int
+    checkouts: int
+    connects: int
+    timeouts: int
+    wait_time_total: float
+    wait_time_max: float
+
+
+class DatabaseHealth(BaseModel):
+    status: str
+    pool: PoolStatus
+
+
+class PaymentsOperation(BaseModel):
+    calls: int
+    retries: int
+    outcomes: Dict[str, int]
+    time_total: float
+    time_max: float
+
+
+class PaymentsHealth(BaseModel):
+    circuit: str
+    operations: Dict[str, PaymentsOperation]
+
+
+class InvalidationBusHealth(BaseModel):
+    connected: bool
+    reconnects: int
+    messages: int
+    lag_last: Optional[float]
+    lag_max: float
+    last_message_at: Optional[float]
+
+
+class EntityCacheHealth(BaseModel):
+    enabled: bool
+    size: int
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    invalidations: int
+    bus: InvalidationBusHealth
@@ -0,0 +1,276 @@
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pydantic.utils import GetterDict
+from sqlalchemy import event, func, inspect, select, tuple_
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import Session, aliased, joinedload, selectinload
+
+from src.constants import NESTED_DEPTH, NESTED_LIMIT
+
+
+class LoadProfile:
+    """
+    Relationships a response model needs. They are loaded in bulk, a level at
+    a time, before building the response, so that serializing a page costs the
+    same amount of queries whatever the size of the page.
+
+    Declared in the Config of the schema, e.g. `load_profile = LoadProfile("songs.artists")`
+
+    Args:
+        paths: Dotted relationship paths, loaded with selectinload.
+        joined: Paths (among `paths`) loaded with joinedload instead, for
+            many-to-one relationships.
+        recursive: Relationships whose items are loaded with the whole
+            profile again, e.g. the responses of a comment.
+        bounded: Collections (among `paths` and `recursive`) of which only
+            the first `limit` items are loaded, see `bound`. Schemas reading
+            them need `BoundedGetter`.
+        limit: Items loaded of each bounded collection.
+        depth: Levels of recursive relationships loaded, the items of the
+            last level get no children.
+        strict: Whether any other relationship lazy loaded while building the
+            response raises, as with raiseload.
+
+    """
+
+    def __init__(
+        self,
+        *paths: str,
+        joined: Sequence[str] = (),
+        recursive: Sequence[str] = (),
+        bounded: Sequence[str] = (),
+        limit: int = NESTED_LIMIT,
+        depth: int = NESTED_DEPTH,
+        strict: bool = True,
+    ):
+        self.joined = set(joined)
+        self.recursive = set(recursive)
+        self.bounded = set(bounded)
+        self.limit = limit
+        self.depth = depth
+        self.strict = strict
+        self.tree = {}
+        for path in [*paths, *recursive]:
+            node = self.tree
+            for attr in path.split("."):
+                node = node.setdefault(attr, {})
+
+    def load(self, pdb: Session, objects: Iterable):
+        self._load_level(pdb, list(objects), self.tree, "", 1)
+
+    def _load_level(
+        self, pdb: Session, objects: List, tree: dict, prefix: str, depth: int
+    ):
+        # Pending or detached objects can not be selected again
+        objects = _unique(
+            [obj for obj in objects if obj is not None and inspect(obj).persistent]
+        )
+        if not objects or not tree:
+            return
+
+        for cls in {type(obj) for obj in objects}:
+            group = [obj for obj in objects if type(obj) is cls]
+            options = [
+                self._options(cls, attr, tree[attr], prefix)
+                for attr in tree
+                if prefix + attr not in self.bounded
+                and any(attr in inspect(obj).unloaded for obj in group)
+            ]
+            if options:
+                # Already loaded objects keep their state, only their unloaded
+                # relationships are populated by the loaders
+                pdb.query(cls).filter(_identity_filter(cls, group)).options(
+                    *options
+                ).all()
+            for attr in tree:
+                path = prefix + attr
+                if path in self.bounded:
+                    last_level = path in self.recursive and depth >= self.depth
+                    bound(pdb, group, attr, 0 if last_level else self.limit)
+
+        for attr, subtree in tree.items():
+            children = []
+            for obj in objects:
+                if prefix + attr in self.bounded:
+                    value = bounded_of(obj)[attr][0]
+                else:
+                    value = getattr(obj, attr)
+                children.extend(value if isinstance(value, list) else [value])
+            if prefix + attr in self.recursive:
+                self._load_level(pdb, children, self.tree, "", depth + 1)
+            else:
+                self._load_level(pdb, children, subtree, f"{prefix}{attr}.", depth)
+
+    def _options(self, cls, attr: str, subtree: dict, prefix: str):
+        """Loader of the relationship chained with the loaders of the paths
+        under it, so that a whole path is loaded by the same query"""
+        path = prefix + attr
+        loader = (joinedload if path in self.joined else selectinload)(
+            getattr(cls, attr)
+        )
+        if path in self.recursive:
+            return loader
+        target = inspect(cls).relationships[attr].mapper.class_
+        return loader.options(
+            *[
+                self._options(target, child, subtree[child], f"{path}.")
+                for child in subtree
+                # Bounded collections under it are loaded on their own
+                if f"{path}.{child}" not in self.bounded
+            ]
+        )
+
+    @contextmanager
+    def enforce(self, pdb: Session):
+        """Raises if a relationship outside the profile is lazy loaded"""
+        if not self.strict:
+            yield
+            return
+
+        def _raise_on_lazy_load(orm_execute_state):
+            if orm_execute_state.is_relationship_load:
+                raise InvalidRequestError(
+                    "Lazy load outside of the load profile of the response: "
+                    f"{orm_execute_state.statement}"
+                )
+
+        event.listen(pdb, "do_orm_execute", _raise_on_lazy_load)
+        try:
+            yield
+        finally:
+            event.remove(pdb, "do_orm_execute", _raise_on_lazy_load)
+
+
+def bounded_of(obj) -> Dict[str, Tuple[List, Optional[str]]]:
+    """Bounded collections of the object by relationship: their items and the
+    offset of the page after them, None if there are no more items"""
+    return obj.__dict__.setdefault("_bounded", {})
+
+
+def bound(pdb: Session, objects: List, attr: str, limit: int, *filters):
+    """
+    Loads the first `limit` items of the collection `attr` of each
+    object (of the same class), with a single query. `filters` on the items
+    leave some out, e.g. blocked songs.
+
+    The items are kept apart from the relationship, which is left unloaded,
+    so that changes to the collection still see all of its items. Objects
+    whose collection was already bounded are left as they are.
+
+    Items are in the order of the relationship, by id if it has none, and
+    offsets are the value of the column of the order as a string, or the
+    values of its columns joined by ":" if it has more than one (e.g.
+    "position:song_id"), as the endpoints of the collections take them.
+    """
+    objects = [obj for obj in objects if attr not in bounded_of(obj)]
+    if not objects:
+        return
+    cls = type(objects[0])
+    relationship = inspect(cls).relationships[attr]
+    target = relationship.mapper.class_
+    order = list(relationship.order_by or [inspect(target).primary_key[0]])
+
+    loaded = [obj for obj in objects if attr not in inspect(obj).unloaded]
+    if not filters and not relationship.order_by:
+        # Collections already in memory, e.g. of a new album, are cut there
+        for obj in loaded:
+            items = sorted(getattr(obj, attr), key=lambda item: item.id)
+            _set_bounded(obj, attr, items, [item.id for item in items], limit)
+        objects = [obj for obj in objects if attr not in bounded_of(obj)]
+        if not objects:
+            return
+
+    if relationship.secondary is not None:
+        # Joined by hand, as joining the relationship aliases the secondary
+        # table, which its order (e.g. positions of playlist songs) is on
+        parent = cls
+        joined = (
+            select()
+            .select_from(cls)
+            .join(relationship.secondary, relationship.primaryjoin)
+            .join(target, relationship.secondaryjoin)
+        )
+    else:
+        # Aliased, so that self referential relationships (e.g. the responses
+        # of a comment) join the table to itself
+        parent = aliased(cls)
+        joined = select().select_from(parent).join(getattr(parent, attr))
+    parent_key = inspect(parent).mapper.primary_key[0]
+    parent_id = getattr(parent, parent_key.key)
+    position = func.row_number().over(partition_by=parent_id, order_by=order)
+    keys = [column.label(f"bound_key_{i}") for i, column in enumerate(order)]
+    ranked = (
+        joined.add_columns(
+            target,
+            parent_id.label("bound_parent"),
+            position.label("bound_position"),
+            *keys,
+        )
+        .where(parent_id.in_([inspect(obj).identity[0] for obj in objects]), *filters)
+        .subquery()
+    )
+    item = aliased(target, ranked)
+    # One item more than the limit tells whether there are more
+    rows = (
+        pdb.query(item, ranked.c.bound_parent, *[ranked.c[key.name] for key in keys])
+        .filter(ranked.c.bound_position <= limit + 1)
+        .order_by(ranked.c.bound_parent, ranked.c.bound_position)
+        .all()
+    )
+    items_by_parent = {}
+    for child, parent_identity, *values in rows:
+        items, keys = items_by_parent.setdefault(parent_identity, ([], []))
+        items.append(child)
+        keys.append(":".join(str(value) for value in values))
+    for obj in objects:
+        items, keys = items_by_parent.get(inspect(obj).identity[0], ([], []))
+        _set_bounded(obj, attr, items, keys, limit)
+
+
+def _set_bounded(obj, attr: str, items: List, keys: List, limit: int):
+    offset = None
+    if len(items) > limit:
+        # Items after the last one returned, or from the start if none was
+        offset = str(keys[limit - 1]) if limit else "0"
+    bounded_of(obj)[attr] = (items[:limit], offset)
+
+
+class BoundedGetter(GetterDict):
+    """Reads the bounded collections of the object instead of its
+    relationships, and their `offsets`: for each collection with more items,
+    the offset of its next page in the endpoint of the collection"""
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        bounded = bounded_of(self._obj)
+        if key in bounded:
+            return bounded[key][0]
+        if key == "offsets":
+            return {
+                attr: offset
+                for attr, (_, offset) in bounded.items()
+                if offset is not None
+            }
+        return super().get(key, default)
+
+
+def _unique(objects: List) -> List:
+    seen = set()
+    unique = []
+    for obj in objects:
+        if id(obj) not in seen:
+            seen.add(id(obj))
+            unique.append(obj)
+    return unique
+
+
+def _identity_filter(cls, objects: List):
+    primary_key = inspect(cls).primary_key
+    identities = [inspect(obj).identity for obj in objects]
+    if len(primary_key) == 1:
+        return primary_key[0].in_([identity[0] for identity in identities])
+    return tuple_(*primary_key).in_(identities)
+
+
+def load_profile_of(schema):
+    return getattr(getattr(schema, "Config", None), "load_profile", None)
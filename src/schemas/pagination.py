@@ -1,4 +1,5 @@
 from __future__ import annotations
+from enum import Enum
 from pydantic.generics import GenericModel
 from typing import List, Optional, Union
 from typing import TypeVar, Generic
@@ -6,14 +7,35 @@ from typing import TypeVar, Generic
 T = TypeVar("T")
 
 
+class TotalKind(str, Enum):
+    """How the total of a page is computed"""
+
+    # Counted with COUNT(*)
+    exact = "exact"
+    # Taken from the row estimate of the Postgres planner
+    estimated = "estimated"
+    # Not computed at all
+    none = "none"
+
+
 class CustomPage(GenericModel, Generic[T]):
     items: List[T]
-    total: int
+    total: Optional[int]
     limit: int
     offset: Optional[Union[int, str]] = None
+    total_kind: TotalKind = TotalKind.exact
 
-    def __init__(self, items: List[T], total: int, limit: int, offset: int):
-        super().__init__(items=items, total=total, limit=limit, offset=offset)
+    def __init__(
+        self,
+        items: List[T],
+        total: Optional[int],
+        limit: int,
+        offset: int,
+        total_kind: TotalKind = TotalKind.exact,
+    ):
+        super().__init__(
+            items=items, total=total, limit=limit, offset=offset, total_kind=total_kind
+        )
 
     def __iter__(self):
         return self.items.__iter__()
@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Dict, Optional, List
 from .resource import (
     ResourceBase,
     ResourceUpdate,
@@ -19,6 +19,7 @@ __all__ = [
     "PlaylistCreateCollector",
 ]
 
+from .loading import BoundedGetter, LoadProfile
 from .utils import as_form, decode_json_list
 from .. import roles
 from ..database import models
@@ -44,17 +45,10 @@ class PlaylistCreate(ResourceCreate):
         songs_ids = decode_json_list(songs_ids, True)
         colabs_ids = decode_json_list(colabs_ids, True)
 
-        songs = []
-        colabs = []
-
-        for song_id in songs_ids:
-            song = models.SongModel.get(pdb, _id=song_id, role=role)
-            songs.append(song)
-        self.songs = songs
-        for colab_id in colabs_ids:
-            colab = models.UserModel.get(pdb, colab_id)
-            colabs.append(colab)
-        self.colabs = colabs
+        self.songs = models.SongModel.get_many(
+            pdb, ids=[int(song_id) for song_id in songs_ids], role=role
+        )
+        self.colabs = models.UserModel.get_many(pdb, ids=colabs_ids)
         super().__init__(**kwargs)
 
     def dict(self, exclude_none=False):
@@ -75,6 +69,13 @@ class PlaylistGet(PlaylistBase):
 
     colabs: List[UserBase]
     songs: List[SongBase]
+    offsets: Dict[str, str] = {}
+
+    class Config:
+        load_profile = LoadProfile(
+            "colabs", "songs.artists", bounded=["colabs", "songs"]
+        )
+        getter_dict = BoundedGetter
 
 
 class PlaylistUpdateCollector(ResourceUpdateCollector):
@@ -95,17 +96,11 @@ class PlaylistUpdate(ResourceUpdate):
         **kwargs
     ):
         if songs_ids is not None:
-            songs = []
-            for song_id in songs_ids:
-                song = models.SongModel.get(pdb, _id=song_id, role=role)
-                songs.append(song)
-            self.songs = songs
+            self.songs = models.SongModel.get_many(
+                pdb, ids=[int(song_id) for song_id in songs_ids], role=role
+            )
         if colabs_ids is not None:
-            colabs = []
-            for colab_id in colabs_ids:
-                colab = models.UserModel.get(pdb, _id=colab_id)
-                colabs.append(colab)
-            self.colabs = colabs
+            self.colabs = models.UserModel.get_many(pdb, ids=colabs_ids)
         super().__init__(**kwargs)
 
     def dict(self, exclude_none=False):
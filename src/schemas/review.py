@@ -2,6 +2,7 @@ from pydantic import BaseModel
 from typing import Optional
 from .user import UserBase
 from .album import AlbumBase
+from .loading import LoadProfile
 
 
 __all__ = [
@@ -24,10 +25,16 @@ class ReviewBase(BaseModel):
 class ReviewGet(ReviewBase):
     reviewer: UserBase
 
+    class Config:
+        load_profile = LoadProfile("reviewer", joined=["reviewer"])
+
 
 class ReviewMyReviews(ReviewBase):
     album: AlbumBase
 
+    class Config:
+        load_profile = LoadProfile("album", joined=["album"])
+
 
 # This is identical to ReviewBase, but
 # they are conceptually different
@@ -27,6 +27,7 @@ __all__ = [
     "SongResponse",
 ]
 
+from .loading import LoadProfile
 from .utils import as_form, decode_json_list
 from .. import roles
 
@@ -51,26 +52,33 @@ class SongBase(ResourceBase):
     sub_level: int
     genre: str
 
+    class Config:
+        load_profile = LoadProfile("artists")
+
 
 class SongMySongs(SongBase):
     album: Optional[AlbumInfo]
 
+    class Config:
+        load_profile = LoadProfile("artists", "album", joined=["album"])
+
 
 class SongGet(SongBase):
     from .album import AlbumBase
 
     album: Optional[AlbumBase] = None
-    file_url: str = Field(..., alias="file")
+    file_url: Optional[str] = Field(None, alias="file")
 
     class Config:
         allow_population_by_field_name = True
+        load_profile = LoadProfile("artists", "album", joined=["album"])
 
 
 @as_form
 class SongCreateCollector(ResourceCreateCollector):
     # json encoded
     artists: str = Form(...)
-    album_id: Optional[str] = Form(None)
+    album_id: Optional[int] = Form(None)
     sub_level: Optional[int] = Form(0)
     genre: str = Form(...)
 
@@ -85,7 +93,7 @@ class SongCreate(ResourceCreate):
         self,
         pdb: Session,
         artists: str,
-        album_id: Optional[str],
+        album_id: Optional[int],
         sub_level: int,
         genre: str,
         role: roles.Role,
@@ -97,12 +105,7 @@ class SongCreate(ResourceCreate):
                 detail="You are not allowed to post content",
             )
         artists_names = decode_json_list(artists, False)
-
-        artists = []
-        for artist_name in artists_names:
-            artist = models.ArtistModel.get_or_create(pdb, artist_name)
-            artists.append(artist)
-        self.artists = artists
+        self.artists = models.ArtistModel.get_or_create_many(pdb, artists_names)
         if album_id is not None:
             album = models.AlbumModel.get(pdb, _id=album_id, role=role)
             self.album = album
@@ -148,11 +151,7 @@ class SongUpdate(ResourceUpdate):
         super().__init__(**kwargs)
         if artists is not None:
             artists_names = decode_json_list(artists, False)
-            artists = []
-            for artist_name in artists_names:
-                artist = models.ArtistModel.get_or_create(pdb, name=artist_name)
-                artists.append(artist)
-            self.artists = artists
+            self.artists = models.ArtistModel.get_or_create_many(pdb, artists_names)
         else:
             self.artists = None
         self.sub_level = sub_level
@@ -2,6 +2,7 @@ from pydantic import BaseModel
 from pydantic.utils import GetterDict
 from typing import Optional, Any
 from .user import UserBase
+from .loading import LoadProfile
 
 
 class StreamingGetter(GetterDict):
@@ -25,3 +26,4 @@ class StreamingBase(BaseModel):
     class Config:
         orm_mode = True
         getter_dict = StreamingGetter
+        load_profile = LoadProfile("artist", joined=["artist"])
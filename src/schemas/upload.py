@@ -0,0 +1,13 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+__all__ = ["UploadUrl"]
+
+
+class UploadUrl(BaseModel):
+    upload_url: str
+    # Sent back to finalize the upload
+    upload_id: str
+    method: str
+    expires_at: datetime
@@ -1,12 +1,14 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, root_validator
 from pydantic.fields import Field
 from pydantic.networks import HttpUrl
 from pydantic.utils import GetterDict
-from typing import Optional, List, Any
+from typing import Dict, Optional, List, Any
 from datetime import datetime
 from .song import SongBase
 from .album import AlbumBase
 from .playlist import PlaylistBase
+from .loading import BoundedGetter, LoadProfile
+from src.constants import SUB_LEVEL_FREE
 
 
 __all__ = [
@@ -70,7 +72,25 @@ class UserGetById(UserGet):
     songs: List[SongBase]
     albums: List[AlbumBase]
     my_playlists: List[PlaylistBase]
+    offsets: Dict[str, str] = {}
 
     wallet: str
     sub_level: int
     sub_expires: Optional[datetime]
+
+    @root_validator(skip_on_failure=True)
+    def effective_sub_level(cls, values):  # pylint: disable=no-self-argument
+        """The subscription may have expired without being revoked yet"""
+        sub_expires = values.get("sub_expires")
+        if sub_expires is not None and sub_expires < datetime.now():
+            values["sub_level"] = SUB_LEVEL_FREE
+        return values
+
+    class Config:
+        load_profile = LoadProfile(
+            "songs.artists",
+            "albums",
+            "my_playlists",
+            bounded=["songs", "albums", "my_playlists"],
+        )
+        getter_dict = BoundedGetter
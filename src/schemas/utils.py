@@ -1,11 +1,15 @@
 from src.exceptions import MessageException
-from typing import Type, Any
+from typing import Type, Any, Optional
 from pydantic import BaseModel
 import inspect
 from fastapi import Form
 import json
 from fastapi import Depends
 from pydantic.fields import ModelField
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .loading import LoadProfile, load_profile_of
+from .pagination import CustomPage
 
 
 def as_form(cls: Type[BaseModel]) -> Type[BaseModel]:
@@ -75,3 +79,45 @@ def decode_json_list(json_string: str, can_be_empty: bool):
             status_code=422, detail="Artists string is not well encoded"
         ) from e
     return elements
+
+
+async def serialize(
+    pdb: AsyncSession,
+    schema: Type[BaseModel],
+    obj: Any,
+    profile: Optional[LoadProfile] = None,
+) -> BaseModel:
+    """
+    Builds a response schema from ORM objects inside the session. The
+    relationships in the load profile of the schema (or of the items of a
+    page) are loaded in bulk first, see `LoadProfile`.
+
+    Args:
+        pdb: The session the objects belong to.
+        schema: The schema to build, e.g. `SongGet` or `CustomPage[SongBase]`.
+        obj: The ORM object, or the page of ORM objects, to convert.
+        profile: Overrides the load profile declared by the schema.
+
+    Returns:
+        The built schema.
+
+    """
+    is_page = isinstance(obj, CustomPage)
+    if profile is None:
+        item_schema = schema.__fields__["items"].type_ if is_page else schema
+        profile = load_profile_of(item_schema)
+
+    def _serialize(session):
+        if profile is None:
+            return _build(schema, obj, is_page)
+        profile.load(session, obj.items if is_page else [obj])
+        with profile.enforce(session):
+            return _build(schema, obj, is_page)
+
+    return await pdb.run_sync(_serialize)
+
+
+def _build(schema: Type[BaseModel], obj: Any, is_page: bool) -> BaseModel:
+    if is_page:
+        return schema(**obj.dict())
+    return schema.from_orm(obj)
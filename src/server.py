@@ -0,0 +1,327 @@
+"""Runs the application.
+
+Usage:
+    python -m src.server [--app MODULE:ATTRIBUTE] [--host HOST] [--port PORT]
+
+A supervisor process imports the application once and forks the workers from
+it, so that they share its memory until they write to it. Every worker serves
+the same listening socket with uvicorn and exits once it served about
+SERVER_MAX_REQUESTS requests, giving back whatever memory it leaked, and the
+supervisor forks a new one in its place.
+
+On SIGTERM or SIGINT the workers stop accepting connections and finish the
+requests they were serving, those still open after SERVER_GRACEFUL_TIMEOUT
+seconds are dropped.
+
+With --jobs (or SERVER_JOBS=1) the supervisor also runs the jobs worker of
+src/jobs, starting it again whenever it exits.
+
+With SERVER_RELOAD=1 it runs a single uvicorn process that restarts when the
+code changes instead, for development.
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+import random
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+
+from src.constants import (
+    METRICS_DIR,
+    SERVER_GRACEFUL_TIMEOUT,
+    SERVER_JOBS,
+    SERVER_MAX_REQUESTS,
+    SERVER_MAX_REQUESTS_JITTER,
+    SERVER_RELOAD,
+    SERVER_WORKER_MEMORY,
+    SERVER_WORKERS,
+)
+from src.metrics import registry as metrics_registry
+
+# The one uvicorn configures, so that the supervisor logs like its workers
+logger = logging.getLogger("uvicorn.error")
+
+# Exit code of a worker whose application failed to start. Forking it again
+# would fail the same way, so the supervisor stops instead
+BOOT_FAILED = 3
+
+# Seconds between the checks of the supervisor on its workers
+CHECK_INTERVAL = 0.1
+
+JOBS_COMMAND = [sys.executable, "-m", "src.jobs", "work"]
+# Seconds before the jobs worker is started again after it exited, so that
+# one failing on start is not restarted in a loop
+JOBS_RESTART_DELAY = 5
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, encoding="utf-8") as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def exit_code(status: int) -> int:
+    """Exit code of a wait status, or minus the signal that killed the
+    process, like os.waitstatus_to_exitcode of Python 3.9"""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def cpu_count() -> int:
+    """CPUs the process may run on, bounded by the quota of its container"""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    # cgroup v2, e.g. "200000 100000" for two CPUs or "max 100000"
+    quota = _read("/sys/fs/cgroup/cpu.max")
+    if quota and not quota.startswith("max"):
+        limit, period = quota.split()
+        cpus = min(cpus, max(1, math.ceil(int(limit) / int(period))))
+    return cpus
+
+
+def memory() -> int:
+    """Bytes of memory the process may use, bounded by the limit of its
+    container"""
+    total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    # cgroup v2 and v1, the latter reports a huge number when there is no limit
+    for path in (
+        "/sys/fs/cgroup/memory.max",
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+    ):
+        limit = _read(path)
+        if limit and limit.isdigit():
+            return min(total, int(limit))
+    return total
+
+
+def default_workers(cpus: Optional[int] = None, available: Optional[int] = None):
+    """One worker for each CPU, as many as fit in the memory"""
+    cpus = cpu_count() if cpus is None else cpus
+    available = memory() if available is None else available
+    return max(1, min(cpus, available // (SERVER_WORKER_MEMORY * 1024 * 1024)))
+
+
+class _WorkerServer(uvicorn.Server):
+    def __init__(self, config: uvicorn.Config, graceful_timeout: float):
+        super().__init__(config)
+        self.graceful_timeout = graceful_timeout
+
+    async def shutdown(self, sockets: Optional[List[socket.socket]] = None):
+        # Drops the connections still open after the timeout, also when the
+        # worker is recycled, which the supervisor does not wait for
+        asyncio.get_running_loop().call_later(
+            self.graceful_timeout, setattr, self, "force_exit", True
+        )
+        await super().shutdown(sockets)
+
+
+class Supervisor:
+    """Forks the workers, replaces the ones that exit and stops them. Runs the
+    jobs worker too when given its command"""
+
+    def __init__(
+        self,
+        config: uvicorn.Config,
+        workers: int,
+        max_requests: int = SERVER_MAX_REQUESTS,
+        max_requests_jitter: int = SERVER_MAX_REQUESTS_JITTER,
+        graceful_timeout: float = SERVER_GRACEFUL_TIMEOUT,
+        jobs_command: Optional[List[str]] = None,
+        jobs_restart_delay: float = JOBS_RESTART_DELAY,
+    ):
+        self.config = config
+        self.size = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.workers: Dict[int, float] = {}  # When each of them started
+        self.jobs_command = jobs_command
+        self.jobs_restart_delay = jobs_restart_delay
+        self.jobs_pid: Optional[int] = None
+        # When the jobs worker may be started (again)
+        self.jobs_start_at = 0.0
+        # When the workers that did not stop by then are killed
+        self.deadline: Optional[float] = None
+        self.exit_code = 0
+
+    def run(self) -> int:
+        # Loading the application here is what the workers share
+        self.config.load()
+        sock = self.config.bind_socket()
+        # So that each worker serves the metrics of all of them
+        metrics_dir = METRICS_DIR or tempfile.mkdtemp(prefix="metrics-")
+        metrics_registry.share(metrics_dir)
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self.stop)
+        logger.info("Starting %s workers, pid %s", self.size, os.getpid())
+
+        while True:
+            self._reap()
+            if self.deadline is None:
+                while len(self.workers) < self.size and self.deadline is None:
+                    self._spawn(sock)
+                self._start_jobs()
+            elif not self.workers and self.jobs_pid is None:
+                break
+            elif time.monotonic() > self.deadline:
+                self._signal(signal.SIGKILL)
+            time.sleep(CHECK_INTERVAL)
+
+        sock.close()
+        if not METRICS_DIR:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+        logger.info("Stopped")
+        return self.exit_code
+
+    def stop(self, _signum=None, _frame=None):
+        """Stops the workers gracefully, the supervisor exits once they did"""
+        if self.deadline is not None:
+            return
+        logger.info("Stopping the workers")
+        # The workers drop their connections by themselves first
+        self.deadline = time.monotonic() + self.graceful_timeout + 5
+        self._signal(signal.SIGTERM)
+
+    def _signal(self, sig: int):
+        pids = list(self.workers)
+        if self.jobs_pid is not None:
+            pids.append(self.jobs_pid)
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self):
+        while self.workers or self.jobs_pid is not None:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                return
+            code = exit_code(status)
+            if pid == self.jobs_pid:
+                self.jobs_pid = None
+                if self.deadline is None:
+                    logger.error(
+                        "Jobs worker %s exited with code %s, starting it again in"
+                        " %s seconds",
+                        pid,
+                        code,
+                        self.jobs_restart_delay,
+                    )
+                    self.jobs_start_at = time.monotonic() + self.jobs_restart_delay
+                continue
+            started = self.workers.pop(pid, None)
+            if started is None:
+                continue
+            if code == BOOT_FAILED and self.deadline is None:
+                logger.error("Worker %s could not start the application", pid)
+                self.exit_code = BOOT_FAILED
+                self.stop()
+            elif code:
+                logger.warning("Worker %s exited with code %s", pid, code)
+            else:
+                logger.info(
+                    "Worker %s exited after %.0f seconds",
+                    pid,
+                    time.monotonic() - started,
+                )
+
+    def _start_jobs(self):
+        if (
+            self.jobs_command is None
+            or self.jobs_pid is not None
+            or time.monotonic() < self.jobs_start_at
+        ):
+            return
+        pid = os.fork()
+        if pid:
+            self.jobs_pid = pid
+            logger.info("Started the jobs worker, pid %s", pid)
+            return
+        try:
+            os.execv(self.jobs_command[0], self.jobs_command)
+        except Exception:
+            logger.exception("Could not start the jobs worker")
+        finally:
+            os._exit(1)
+
+    def _spawn(self, sock: socket.socket):
+        limit = None
+        if self.max_requests:
+            # So that the workers are not all recycled at once
+            limit = self.max_requests + random.randint(0, self.max_requests_jitter)
+
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            if self.deadline is not None:
+                # Stopped while forking it
+                os.kill(pid, signal.SIGTERM)
+            return
+
+        code = 1
+        try:
+            code = self._serve(sock, limit)
+        except Exception:
+            logger.exception("Worker %s failed", os.getpid())
+        finally:
+            # Never returns to the loop of the supervisor
+            os._exit(code)
+
+    def _serve(self, sock: socket.socket, limit: Optional[int]) -> int:
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+        self.config.limit_max_requests = limit
+        server = _WorkerServer(self.config, self.graceful_timeout)
+        server.run(sockets=[sock])
+        return 0 if server.started else BOOT_FAILED
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m src.server")
+    parser.add_argument("--app", default="src.main:app")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8080)))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=SERVER_WORKERS,
+        help="defaults to what the CPUs and memory fit",
+    )
+    parser.add_argument(
+        "--jobs",
+        action="store_true",
+        default=SERVER_JOBS,
+        help="also run the jobs worker, started again when it exits",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    if SERVER_RELOAD:
+        uvicorn.run(args.app, host=args.host, port=args.port, reload=True)
+        return 0
+
+    config = uvicorn.Config(args.app, host=args.host, port=args.port)
+    workers = args.workers or default_workers()
+    jobs_command = JOBS_COMMAND if args.jobs else None
+    return Supervisor(config, workers, jobs_command=jobs_command).run()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,5 +1,6 @@
 from . import (
     user,
+    context,
     song,
     album,
     comment,
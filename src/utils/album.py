@@ -1,44 +1,46 @@
 from src.database import models
 from fastapi import Depends
-from .. import roles, utils
 from src import schemas
-from src.database.access import get_db
-from sqlalchemy.orm import Session
+from .context import RequestContext, get_context
 
-from ..roles import get_role
 
-
-def get_album(
+async def get_album(
     album_id: int,
-    role: roles.Role = Depends(get_role),
-    pdb: Session = Depends(get_db),
-    uid: str = Depends(utils.user.retrieve_uid),
+    context: RequestContext = Depends(get_context),
 ):
-    return models.AlbumModel.get(pdb, _id=album_id, role=role, requester_id=uid)
+    uid = await context.get_uid()
+    return await models.AlbumModel.aget(
+        context.pdb, _id=album_id, role=context.role, requester_id=uid
+    )
 
 
-def retrieve_album_update(
+async def retrieve_album_update(
     album_update_collector: schemas.AlbumUpdateCollector = Depends(
         schemas.AlbumUpdateCollector.as_form
     ),
     album: models.AlbumModel = Depends(get_album),
-    role: roles.Role = Depends(get_role),
-    pdb: Session = Depends(get_db),
-    uid: str = Depends(utils.user.retrieve_uid),
+    context: RequestContext = Depends(get_context),
 ):
-    return schemas.AlbumUpdate(
-        pdb, **album_update_collector.dict(), creator_id=uid, role=role, album=album
+    uid = await context.get_uid()
+    return await context.pdb.run_sync(
+        schemas.AlbumUpdate,
+        **album_update_collector.dict(),
+        creator_id=uid,
+        role=context.role,
+        album=album,
     )
 
 
-def retrieve_album(
+async def retrieve_album(
     album_create_collector: schemas.AlbumCreateCollector = Depends(
         schemas.AlbumCreateCollector.as_form
     ),
-    pdb: Session = Depends(get_db),
-    uid: str = Depends(utils.user.retrieve_uid),
-    role: roles.Role = Depends(get_role),
+    context: RequestContext = Depends(get_context),
 ):
-    return schemas.AlbumCreate(
-        pdb, **album_create_collector.dict(), creator_id=uid, role=role
+    uid = await context.get_uid()
+    return await context.pdb.run_sync(
+        schemas.AlbumCreate,
+        **album_create_collector.dict(),
+        creator_id=uid,
+        role=context.role,
     )
@@ -1,30 +1,46 @@
-from sqlalchemy.orm import Session
+from typing import Optional
 
-from fastapi import Depends, Body
+from fastapi import Depends, Body, Query
 
-from src import roles, utils
+from src import utils
+from src.constants import THREAD_MAX_DEPTH
 from src.database import models
 from src import schemas
-from src.database.access import get_db
+from src.schemas.loading import load_profile_of
+from .context import RequestContext, get_context
 
 
-def retrieve_comment_post(
+async def retrieve_comment_post(
     text: str = Body(..., embed=True),
     parent_id: int = Body(None, embed=True),
-    uid: str = Depends(utils.user.retrieve_uid),
     album: models.AlbumModel = Depends(utils.album.get_album),
+    context: RequestContext = Depends(get_context),
 ):
+    uid = await context.get_uid()
     return schemas.CommentPost(
         text=text, parent_id=parent_id, commenter_id=uid, album_id=album.id, uid=uid
     )
 
 
-def get_comment(
+async def get_comment(
     comment_id: int,
-    pdb: Session = Depends(get_db),
-    role: roles.Role = Depends(roles.get_role),
+    context: RequestContext = Depends(get_context),
 ):
-    comment: models.CommentModel = models.CommentModel.get(
-        pdb, _id=comment_id, role=role
+    comment: models.CommentModel = await models.CommentModel.aget(
+        context.pdb, _id=comment_id, role=context.role
     )
     return comment
+
+
+async def retrieve_thread_window(
+    max_depth: Optional[int] = Query(None, ge=1, le=THREAD_MAX_DEPTH),
+    responses_limit: Optional[int] = Query(None, ge=0, le=100),
+):
+    """Levels of comments, counting the ones of the page, and responses of
+    each comment that thread endpoints return. Those of `CommentGet` unless
+    given"""
+    profile = load_profile_of(schemas.CommentGet)
+    return {
+        "depth": profile.depth if max_depth is None else max_depth,
+        "limit": profile.limit if responses_limit is None else responses_limit,
+    }
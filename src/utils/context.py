@@ -0,0 +1,81 @@
+import datetime
+from typing import Optional
+
+from fastapi import Depends, Header, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import roles
+from src.database import models
+from src.database.access import get_db
+from src.exceptions import MessageException
+from src.roles import get_role
+from src.utils import subscription
+
+
+class RequestContext:
+    """
+    Who makes the request. The user is loaded the first time it is needed and
+    then kept, FastAPI resolves `get_context` once per request so every
+    dependency of the request shares the same context.
+    """
+
+    def __init__(self, pdb: AsyncSession, uid: Optional[str], role: roles.Role):
+        self.pdb = pdb
+        self.role = role
+        self._uid = uid
+        self._user = None
+
+    @property
+    def uid(self) -> str:
+        """Id sent in the uid header, 422 if missing. Unlike `get_uid` it does
+        not load the user, so an unknown id is not a 404. Only compare it with
+        the id of a loaded user when no role can bypass the check: an id equal
+        to it exists. Checks that a role can bypass (e.g. admins editing any
+        song) need `get_uid`, or any made up id with that role would pass"""
+        if self._uid is None:
+            raise MessageException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Missing uid header",
+            )
+        return self._uid
+
+    async def get_user(self) -> models.UserModel:
+        """The requester, 404 if it does not exist"""
+        if self._user is None:
+            self._user = await models.UserModel.aget(self.pdb, _id=self.uid)
+        return self._user
+
+    async def get_uid(self) -> str:
+        """Id of the requester, once it is known to exist"""
+        return (await self.get_user()).id
+
+    async def get_sub_level(self) -> int:
+        """Subscription level the requester can currently use. An expired
+        subscription is enforced right away and revoked later, in a batch"""
+        user = await self.get_user()
+        sub_level = user.effective_sub_level(datetime.datetime.now())
+        if sub_level != user.sub_level:
+            subscription.expired_users.add(user.id)
+        return sub_level
+
+    def max_sub_level(self):
+        """SQL expression of the highest level of the songs the requester can
+        play, None if it can play all of them. It does not load the user"""
+        if self.role.ignore_sub_level():
+            return None
+        return models.UserModel.effective_sub_level_of(
+            self.uid, datetime.datetime.now()
+        )
+
+    async def can_access_sub_level(self, sub_level: int) -> bool:
+        if self.role.ignore_sub_level():
+            return True
+        return sub_level <= await self.get_sub_level()
+
+
+async def get_context(
+    uid: Optional[str] = Header(None),
+    role: roles.Role = Depends(get_role),
+    pdb: AsyncSession = Depends(get_db),
+) -> RequestContext:
+    return RequestContext(pdb, uid, role)
@@ -7,13 +7,16 @@ from src import roles, utils
 from src import schemas
 from typing import Optional, List
 from fastapi import Depends, Form
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from src.roles import get_role
+from .context import RequestContext, get_context
 
 
-def get_colab_from_form(pdb: Session = Depends(get_db), colab_id: str = Form(...)):
-    return models.UserModel.get(pdb, _id=colab_id)
+async def get_colab_from_form(
+    pdb: AsyncSession = Depends(get_db), colab_id: str = Form(...)
+):
+    return await models.UserModel.aget(pdb, _id=colab_id)
 
 
 def retrieve_colabs_ids(colabs_ids: Optional[str] = Form(None)):
@@ -29,48 +32,52 @@ def retrieve_colabs_ids(colabs_ids: Optional[str] = Form(None)):
     return colabs_ids
 
 
-def retrieve_playlist(
+async def retrieve_playlist(
     playlist_create_collector: schemas.PlaylistCreateCollector = Depends(
         schemas.PlaylistCreateCollector.as_form
     ),
-    pdb: Session = Depends(get_db),
-    uid: str = Depends(utils.user.retrieve_uid),
-    role: roles.Role = Depends(get_role),
+    context: RequestContext = Depends(get_context),
 ):
-    return schemas.PlaylistCreate(
-        pdb, creator_id=uid, role=role, **playlist_create_collector.dict()
+    uid = await context.get_uid()
+    return await context.pdb.run_sync(
+        schemas.PlaylistCreate,
+        creator_id=uid,
+        role=context.role,
+        **playlist_create_collector.dict()
     )
 
 
-def get_playlist(
+async def get_playlist(
     playlist_id: int,
-    pdb: Session = Depends(get_db),
-    role: roles.Role = Depends(get_role),
-    uid: str = Depends(utils.user.retrieve_uid),
+    context: RequestContext = Depends(get_context),
 ):
-    return models.PlaylistModel.get(pdb, _id=playlist_id, role=role, requester_id=uid)
+    uid = await context.get_uid()
+    return await models.PlaylistModel.aget(
+        context.pdb, _id=playlist_id, role=context.role, requester_id=uid
+    )
 
 
-def can_edit_playlist(playlist: models.PlaylistModel, role: roles.Role, uid: str):
+def can_edit_playlist(
+    pdb: Session, playlist: models.PlaylistModel, role: roles.Role, uid: str
+):
     return (
         uid == playlist.creator_id
-        or uid in [colab.id for colab in playlist.colabs]
         or role.can_edit_everything()
+        or playlist.has_colab(pdb, uid)
     )
 
 
-def retrieve_playlist_update(
+async def retrieve_playlist_update(
     playlist_update_collector: schemas.ResourceUpdateCollector = Depends(
         schemas.ResourceUpdateCollector.as_form
     ),
     songs_ids: Optional[List[int]] = Depends(utils.song.retrieve_songs_ids_update),
     colabs_ids: Optional[List[str]] = Depends(retrieve_colabs_ids),
-    pdb: Session = Depends(get_db),
-    role: roles.Role = Depends(get_role),
+    context: RequestContext = Depends(get_context),
 ):
-    return schemas.PlaylistUpdate(
-        pdb,
-        role=role,
+    return await context.pdb.run_sync(
+        schemas.PlaylistUpdate,
+        role=context.role,
         songs_ids=songs_ids,
         colabs_ids=colabs_ids,
         **playlist_update_collector.dict()
@@ -1,16 +1,15 @@
 from fastapi import Depends
-from sqlalchemy.orm import Session
 
-from src.database.access import get_db
 from src import utils
 from src.database import models
+from .context import RequestContext, get_context
 
 
-def get_review(
+async def get_review(
     album: models.AlbumModel = Depends(utils.album.get_album),
-    pdb: Session = Depends(get_db),
-    user: models.UserModel = Depends(utils.user.retrieve_user),
+    context: RequestContext = Depends(get_context),
 ):
-    reviews = models.ReviewModel.get(pdb, album=album, reviewer=user)
+    user = await context.get_user()
+    reviews = await models.ReviewModel.aget(context.pdb, album=album, reviewer=user)
 
     return reviews
@@ -3,12 +3,12 @@ import json
 from src.database import models
 from fastapi import Depends, Form
 from src import schemas
-from sqlalchemy.orm import Session
-from .. import roles, utils
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import utils
 from typing import Optional
 
 from src.database.access import get_db
-from ..roles import get_role
+from .context import RequestContext, get_context
 
 
 def retrieve_songs_ids(songs_ids: Optional[str] = Form(None)):
@@ -30,24 +30,22 @@ def retrieve_songs_ids_update(songs_ids: Optional[str] = Form(None)):
         return retrieve_songs_ids(songs_ids=songs_ids)
 
 
-def retrieve_song_update(
+async def retrieve_song_update(
     song_update_collector: schemas.SongUpdateCollector = Depends(
         schemas.SongUpdateCollector.as_form
     ),
-    pdb: Session = Depends(get_db),
+    pdb: AsyncSession = Depends(get_db),
 ):
-    return schemas.SongUpdate(pdb, **song_update_collector.dict())
+    return await pdb.run_sync(schemas.SongUpdate, **song_update_collector.dict())
 
 
-def get_song(
+async def get_song(
     song_id: int,
-    role: roles.Role = Depends(get_role),
-    pdb: Session = Depends(get_db),
-    user: models.UserModel = Depends(utils.user.retrieve_user),
+    context: RequestContext = Depends(get_context),
 ):
-    song = models.SongModel.get(pdb, role=role, _id=song_id)
+    song = await models.SongModel.aget(context.pdb, role=context.role, _id=song_id)
 
-    if song.sub_level > user.sub_level and not role.ignore_sub_level():
+    if not await context.can_access_sub_level(song.sub_level):
         raise MessageException(
             status_code=403,
             detail=f"You need a {utils.subscription.sub_level_name(song.sub_level)} subscription",
@@ -55,24 +53,24 @@ def get_song(
     return song
 
 
-def get_song_from_form(
+async def get_song_from_form(
     song_id: int = Form(...),
-    role: roles.Role = Depends(get_role),
-    pdb: Session = Depends(get_db),
-    user: models.UserModel = Depends(utils.user.retrieve_user),
+    context: RequestContext = Depends(get_context),
 ):
-    return get_song(song_id=song_id, role=role, pdb=pdb, user=user)
+    return await get_song(song_id=song_id, context=context)
 
 
-def retrieve_song(
+async def retrieve_song(
     song_create_collector: schemas.SongCreateCollector = Depends(
         schemas.SongCreateCollector.as_form
     ),
-    pdb: Session = Depends(get_db),
-    uid: str = Depends(utils.user.retrieve_uid),
-    role: roles.Role = Depends(get_role),
+    context: RequestContext = Depends(get_context),
 ):
-    song = schemas.SongCreate(
-        pdb, **song_create_collector.dict(), creator_id=uid, role=role
+    uid = await context.get_uid()
+    song = await context.pdb.run_sync(
+        schemas.SongCreate,
+        **song_create_collector.dict(),
+        creator_id=uid,
+        role=context.role,
     )
     return song
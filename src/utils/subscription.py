@@ -1,21 +1,20 @@
 from src.exceptions import MessageException
 import datetime
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi import status
-import requests
 
-from src.constants import PAYMENTS_API_KEY
+from src import payments
+from src.constants import (
+    REVOKE_BATCH_SIZE,
+    SUB_LEVEL_FREE,
+    SUB_LEVEL_GOD,
+    SUB_LEVEL_PREMIUM,
+    SUB_LEVEL_PRO,
+)
 from src.database import models
 
-DEPOSIT_ENDPOINT = "https://rostov-payments-server.herokuapp.com/api/v1/deposit"
-CREATE_WALLET_ENDPOINT = "https://rostov-payments-server.herokuapp.com/api/v1/wallets"
-
-
-SUB_LEVEL_FREE = 0
-SUB_LEVEL_PREMIUM = 1
-SUB_LEVEL_PRO = 2
-SUB_LEVEL_GOD = 3
-
 SUBSCRIPTIONS = [
     {"name": "Free", "price": "0", "level": SUB_LEVEL_FREE},
     {"name": "Premium", "price": "0.0000001", "level": SUB_LEVEL_PREMIUM},
@@ -47,14 +46,8 @@ def sub_level_name(sub_level: int):
     )
 
 
-def create_wallet(uid: str):
-    response = requests.post(
-        f"{CREATE_WALLET_ENDPOINT}/{uid}", headers={"api_key": PAYMENTS_API_KEY}
-    )
-
-    if response.status_code != status.HTTP_200_OK:
-        raise MessageException(status_code=response.status_code, detail=response.text)
-    return response.json()["address"]
+async def create_wallet(uid: str, idempotency_key: Optional[str] = None):
+    return await payments.get_client().acreate_wallet(uid, idempotency_key)
 
 
 def get_expiration_date(sub_level: int, subscription_date: datetime.datetime):
@@ -78,34 +71,86 @@ def get_sub_price(sub_level: int):
     )
 
 
-def _make_payment(user: models.UserModel, sub_level: int):
-    payment_response = requests.post(
-        f"{DEPOSIT_ENDPOINT}/{user.id}",
-        json={"amountInEthers": get_sub_price(sub_level)},
-        headers={"api_key": PAYMENTS_API_KEY},
-    )
-
-    if payment_response.status_code != status.HTTP_200_OK:
-        raise MessageException(
-            status_code=payment_response.status_code, detail=payment_response.text
-        )
+async def make_payment(user: models.UserModel, sub_level: int):
+    await payments.get_client().adeposit(user.id, get_sub_price(sub_level))
 
 
-def subscribe(user: models.UserModel, sub_level: int, pdb: Session) -> models.UserModel:
+async def subscribe(
+    user: models.UserModel, sub_level: int, pdb: AsyncSession
+) -> models.UserModel:
     if sub_level > SUB_LEVEL_FREE:
-        _make_payment(user, sub_level)
+        await make_payment(user, sub_level)
 
     expiration_date = get_expiration_date(sub_level, datetime.datetime.now())
 
-    return user.update(pdb, sub_level=sub_level, sub_expires=expiration_date)
-
+    # Committed right away, the payment was already made
+    return await user.aupdate(
+        pdb, sub_level=sub_level, sub_expires=expiration_date, commit=True
+    )
 
-def revoke_subscription(pdb: Session, now: datetime.datetime):
-    users = models.UserModel.search(pdb, expiration_date=now, do_pagination=False)
 
-    for user in users:
-        user.update(
+def revoke_subscription(
+    pdb: Session,
+    now: datetime.datetime,
+    batch_size: int = REVOKE_BATCH_SIZE,
+    commit: bool = False,
+) -> int:
+    """Returns the users whose subscription expired before `now` to the free
+    level, `batch_size` of them per statement, and returns how many. With
+    `commit` each batch is committed on its own, so a large wave of
+    expirations does not keep a long transaction open"""
+    revoked = 0
+    while True:
+        ids = models.UserModel.revoke_expired(
             pdb,
+            now,
+            batch_size,
             sub_level=SUB_LEVEL_FREE,
-            sub_expires=get_expiration_date(SUB_LEVEL_FREE, datetime.datetime.now()),
+            sub_expires=get_expiration_date(SUB_LEVEL_FREE, now),
         )
+        revoked += len(ids)
+        if commit:
+            pdb.commit()
+        if len(ids) < batch_size:
+            return revoked
+
+
+class ExpiredUsers:
+    """Users that requests found with an expired subscription but still at a
+    paid level. Requests check the effective level, so revoking them can wait:
+    `flush` revokes all the ones seen since the last flush with a single
+    statement, instead of one write per request"""
+
+    def __init__(self):
+        self._ids = set()
+
+    def add(self, uid: str):
+        self._ids.add(uid)
+
+    def pending(self) -> int:
+        return len(self._ids)
+
+    async def flush(self, pdb: AsyncSession) -> int:
+        """Revokes the subscriptions of the users seen, returns how many.
+        If it fails they are kept for the next flush"""
+        ids, self._ids = self._ids, set()
+        if not ids:
+            return 0
+        now = datetime.datetime.now()
+        try:
+            return len(
+                await pdb.run_sync(
+                    models.UserModel.revoke_expired,
+                    now,
+                    len(ids),
+                    sub_level=SUB_LEVEL_FREE,
+                    sub_expires=get_expiration_date(SUB_LEVEL_FREE, now),
+                    ids=sorted(ids),
+                )
+            )
+        except Exception:
+            self._ids |= ids
+            raise
+
+
+expired_users = ExpiredUsers()
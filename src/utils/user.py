@@ -1,4 +1,5 @@
 from fastapi import Header, Depends, Form, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from src.exceptions import MessageException
 
@@ -7,23 +8,15 @@ from src.database import models
 from src.database.access import get_db
 
 
-def retrieve_user(uid: str = Header(...), pdb=Depends(get_db)):
-    return models.UserModel.get(pdb, _id=uid)
-
-
-def retrieve_uid(uid: str = Header(...), pdb=Depends(get_db)):
-    return retrieve_user(uid=uid, pdb=pdb).id
-
-
-def retrieve_user_info(
+async def retrieve_user_info(
     uid: str = Header(...),
     name: str = Form(...),
     location: str = Form(...),
     interests: str = Form(...),
-    pdb: Session = Depends(get_db),
+    pdb: AsyncSession = Depends(get_db),
 ) -> schemas.UserCreate:
 
-    user = models.UserModel.get(pdb, _id=uid, raise_if_not_found=False)
+    user = await models.UserModel.aget(pdb, _id=uid, raise_if_not_found=False)
     if user is not None:
         raise MessageException(
             status_code=status.HTTP_409_CONFLICT, detail="User already exists"
@@ -41,13 +34,15 @@ def retrieve_user_update(
     return user_update
 
 
-def retrieve_user_to_modify(uid_to_modify: str, pdb: Session = Depends(get_db)):
-    user_to_modify = models.UserModel.get(pdb, _id=uid_to_modify)
+async def retrieve_user_to_modify(
+    uid_to_modify: str, pdb: AsyncSession = Depends(get_db)
+):
+    user_to_modify = await models.UserModel.aget(pdb, _id=uid_to_modify)
 
     return user_to_modify
 
 
-def give_ownership_of_playlists_to_colabs(user: models.UserModel):
+def give_ownership_of_playlists_to_colabs(_pdb: Session, user: models.UserModel):
     for playlist in user.my_playlists:
         if len(playlist.colabs) > 0:
             playlist.creator = playlist.colabs[0]
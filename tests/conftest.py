@@ -1,8 +1,15 @@
+import contextlib
 import datetime
+import signal
+import socket
+import subprocess
+import sys
+import time
 
 import sqlalchemy as sa
-from fastapi import HTTPException
-from sqlalchemy.orm import sessionmaker
+from fastapi import HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
 
 from fastapi import status
 import requests
@@ -12,77 +19,49 @@ from fastapi.testclient import TestClient
 
 from src.app.subscriptions import get_time_now
 from src.main import app, API_VERSION_PREFIX
-from src.database.access import get_db, Base
-from src.utils.subscription import CREATE_WALLET_ENDPOINT, DEPOSIT_ENDPOINT
+from src.database.access import get_db, Base, async_url
+from src.database import cache, statements, unit_of_work
+from src.jobs import Worker
+from src.mocks.firebase.bucket import SIGNED_URL_HOST, bucket_mock
+from src import metrics, payments, schemas
+from src.database.models import album as album_model
+from src.database.models import playlist as playlist_model
+from src.schemas.loading import load_profile_of
+from src.utils import subscription
+from tests.payments_server import PaymentsServer
 import json
 
 import os
 
 SQLALCHEMY_DATABASE_URL = os.environ.get("TEST_POSTGRES_URL")
 engine = sa.create_engine(SQLALCHEMY_DATABASE_URL)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine(
+    async_url(SQLALCHEMY_DATABASE_URL), poolclass=NullPool
+)
 
 Base.metadata.drop_all(engine)
 Base.metadata.create_all(bind=engine)
 
-SUCCESSFUL_PAYMENT_RESPONSE = {
-    "nonce": 2,
-    "gasPrice": {"type": "BigNumber", "hex": "0x4190ab08"},
-    "gasLimit": {"type": "BigNumber", "hex": "0x6d78"},
-    "to": "0xE9f7F026355d691238F628Cd8BCBb39Bf7F4f8E2",
-    "value": {"type": "BigNumber", "hex": "0x5af3107a4000"},
-    "data": "0xd0e30db0",
-    "chainId": 4,
-    "v": 43,
-    "r": "0xc8fc145f611e8e5552374c3dedc2f588458d7214a523b095d70f5478bf06bdf8",
-    "s": "0x0ff83c7c81028bfa59aa8375b489daaa77787aa80ba4d7421a1ea09621abc607",
-    "from": "0xaa994f63f812A136158aC937aCC806E40b85739d",
-    "hash": "0xcc9c8acb976d44bc96e4a10f6c89d7431ab5e08fc681db5a6e682c213ab5c101",
-}
-
-
-def successful_payment_matcher(request):
-    if request.url.startswith(DEPOSIT_ENDPOINT):
-        resp = requests.models.Response()
-        resp.status_code = status.HTTP_200_OK
-        resp._content = json.dumps(SUCCESSFUL_PAYMENT_RESPONSE, indent=2).encode(
-            "utf-8"
-        )
-        return resp
-    return None
-
-
-def failed_payment_matcher(request):
-    if request.url.startswith(DEPOSIT_ENDPOINT):
-        resp = requests.models.Response()
-        resp.status_code = status.HTTP_400_BAD_REQUEST
-        resp._content = b'{"error": "Payment failed"}'
-        return resp
-    return None
 
-
-def successful_wallet_creation_matcher(request):
-    if request.url.startswith(CREATE_WALLET_ENDPOINT) and request.method == "POST":
+def bucket_upload_matcher(request):
+    if request.url.startswith(SIGNED_URL_HOST):
         resp = requests.models.Response()
-        resp.status_code = status.HTTP_200_OK
-        resp._content = (
-            b'{"address": "0xA143", "id": "user_id", "private_key": "11111"}'
+        resp.status_code = bucket_mock.receive_signed_upload(
+            request.method,
+            request.url,
+            request.body,
+            request.headers.get("Content-Type"),
         )
         return resp
     return None
 
 
-def failed_wallet_creation_matcher(request):
-    if request.url.startswith(CREATE_WALLET_ENDPOINT) and request.method == "POST":
-        resp = requests.models.Response()
-        resp.status_code = status.HTTP_400_BAD_REQUEST
-        resp._content = b'{"error": "Wallet creation failed"}'
-        return resp
-    return None
+# Endpoints served outside of the versioned API
+NON_API_PATHS = ("/metrics",)
 
 
 def api_matcher(request):
-    if API_VERSION_PREFIX not in request.url:
+    if API_VERSION_PREFIX not in request.url and request.path not in NON_API_PATHS:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Attepmted to call non-api endpoint",
@@ -95,8 +74,7 @@ def custom_requests_mock():
     m = requests_mock.Mocker(real_http=True)
     m.start()
     m.add_matcher(api_matcher)
-    m.add_matcher(successful_wallet_creation_matcher)
-    m.add_matcher(successful_payment_matcher)
+    m.add_matcher(bucket_upload_matcher)
 
     try:
         yield m
@@ -104,52 +82,199 @@ def custom_requests_mock():
         m.stop()
 
 
-@pytest.fixture(autouse=True)
-def session():
-    connection = engine.connect()
-    transaction = connection.begin()
-    session = TestingSessionLocal(bind=connection)
+@pytest.fixture(scope="session")
+def payments_server():
+    server = PaymentsServer()
+    server.start()
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+@pytest.fixture
+def run_server():
+    """Starts `python -m src.server` serving tests/server_app.py (or `app`) with
+    the given environment, returns its process and url once it accepts
+    connections"""
+    processes = []
+
+    def start(workers=2, app="tests.server_app:app", **env):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        process = subprocess.Popen(
+            [sys.executable, "-m", "src.server", "--app", app]
+            + ["--host", "127.0.0.1", "--port", str(port)]
+            + ["--workers", str(workers)],
+            env={**os.environ, "SERVER_RELOAD": "0", **env},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        processes.append(process)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or process.poll() is not None:
+                    raise
+                time.sleep(0.1)
+        return process, f"http://127.0.0.1:{port}"
 
-    # Begin a nested transaction (using SAVEPOINT).
-    nested = connection.begin_nested()
+    try:
+        yield start
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGKILL)
+                process.wait()
 
-    # If the application code calls session.commit, it will end the nested
-    # transaction. Need to start a new one when that happens.
-    @sa.event.listens_for(session, "after_transaction_end")
-    def end_savepoint(session, transaction):
-        nonlocal nested
-        if not nested.is_active:
-            nested = connection.begin_nested()
 
-    yield session
+@pytest.fixture
+def metrics_registry():
+    """The registry of the metrics, without the values of the previous tests"""
+    registry = metrics.registry
+    registry.reset()
+    try:
+        yield registry
+    finally:
+        registry.reset()
 
-    # Rollback the overall transaction, restoring the state before the test ran.
-    session.close()
-    transaction.rollback()
-    connection.close()
 
+@pytest.fixture(autouse=True)
+def payments_client(payments_server, monkeypatch):
+    """Points the payments client to the stand-in server, with a fresh pool,
+    circuit and metrics for each test"""
+    payments_server.reset()
+    client = payments.PaymentsClient(payments_server.url)
+    monkeypatch.setattr(payments, "client", client)
+    try:
+        yield client
+    finally:
+        client.close()
 
-# For some reason, nested transactions don't work with playlists tests,
-# so I need to drop the tables and create them again in that module
-@pytest.fixture()
-def drop_tables():
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+
+@pytest.fixture(autouse=True)
+def expired_users(monkeypatch):
+    """Users seen with an expired subscription by the requests of the test"""
+    users = subscription.ExpiredUsers()
+    monkeypatch.setattr(subscription, "expired_users", users)
+    return users
 
 
 @pytest.fixture(autouse=True)
-def client(session):
+def client(payments_client):
+    # The client is used as a context manager so every request of a test runs
+    # in the same event loop, which is the one the test connection belongs to
+    with TestClient(app) as client:
+        yield client
 
-    # Dependency override
 
-    def override_get_db():
-        yield session
+def bound_session(connection):
+    """A session bound to the connection of the test"""
+
+    # If the application code calls session.commit, it will end the nested
+    # transaction. Need to start a new one when that happens.
+    def end_savepoint(session, transaction):
+        if not connection.sync_connection.in_nested_transaction():
+            connection.sync_connection.begin_nested()
+
+    db = AsyncSession(bind=connection, autoflush=False, expire_on_commit=False)
+    sa.event.listen(db.sync_session, "after_transaction_end", end_savepoint)
+    return db
+
+
+@pytest.fixture(autouse=True)
+def session(client):
+    async def begin():
+        connection = await async_engine.connect()
+        await connection.begin()
+        # Begin a nested transaction (using SAVEPOINT).
+        await connection.begin_nested()
+        return connection
+
+    async def rollback():
+        await connection.rollback()
+        await connection.close()
+
+    portal = client.portal
+    connection = portal.call(begin)
+
+    # Dependency override, each request gets its own session bound to the
+    # connection of the test
+
+    async def override_get_db(request: Request):
+        db = bound_session(connection)
+        unit_of_work.track(request, db)
+        try:
+            yield db
+        finally:
+            await db.close()
 
     app.dependency_overrides[get_db] = override_get_db
     try:
-        yield TestClient(app)
+        yield connection
     finally:
         del app.dependency_overrides[get_db]
+        # Rollback the overall transaction, restoring the state before the test ran.
+        portal.call(rollback)
+
+
+@pytest.fixture()
+def run_jobs(client, session):
+    """Runs the due jobs in-process with the connection of the test, returns
+    how many ran"""
+    worker = Worker(lambda: bound_session(session))
+
+    def run(limit: int = None):
+        return client.portal.call(worker.run_pending, limit)
+
+    return run
+
+
+@pytest.fixture()
+def nested_limit(monkeypatch):
+    """Sets how many items of each nested collection detail responses have"""
+
+    def set_limit(limit: int):
+        for schema in (
+            schemas.AlbumGet,
+            schemas.PlaylistGet,
+            schemas.UserGetById,
+            schemas.CommentGet,
+        ):
+            monkeypatch.setattr(load_profile_of(schema), "limit", limit)
+        monkeypatch.setattr(playlist_model, "NESTED_LIMIT", limit)
+        monkeypatch.setattr(album_model, "NESTED_LIMIT", limit)
+
+    return set_limit
+
+
+@pytest.fixture()
+def max_statements():
+    """Limits the statements of the requests made inside the block, e.g.
+    `with max_statements(4): client.get(...)`"""
+
+    @contextlib.contextmanager
+    def limit(amount: int):
+        previous = statements.max_statements
+        statements.max_statements = amount
+        try:
+            yield
+        finally:
+            statements.max_statements = previous
+
+    return limit
+
+
+# For some reason, nested transactions don't work with playlists tests,
+# so I need to drop the tables and create them again in that module
+@pytest.fixture()
+def drop_tables():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
 
 
 @pytest.fixture()
@@ -170,3 +295,13 @@ def time_now_40_days_future():
         return datetime.datetime.now() + datetime.timedelta(days=40)
 
     app.dependency_overrides[get_time_now] = get_time_now_40_days_future
+
+
+@pytest.fixture()
+def entity_cache(monkeypatch):
+    """Turns on the entity cache, which is off in tests, empty"""
+    monkeypatch.setattr(cache.entity_cache, "enabled", True)
+    cache.entity_cache.reset()
+    yield cache.entity_cache
+    # Rows are rolled back after each test, so are their entries
+    cache.entity_cache.reset()
@@ -0,0 +1,133 @@
+"""Local stand-in of the payments service, served over HTTP from a thread so
+that tests go through the real client: its pool, timeouts and retries"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUCCESSFUL_PAYMENT_RESPONSE = {
+    "nonce": 2,
+    "gasPrice": {"type": "BigNumber", "hex": "0x4190ab08"},
+    "gasLimit": {"type": "BigNumber", "hex": "0x6d78"},
+    "to": "0xE9f7F026355d691238F628Cd8BCBb39Bf7F4f8E2",
+    "value": {"type": "BigNumber", "hex": "0x5af3107a4000"},
+    "data": "0xd0e30db0",
+    "chainId": 4,
+    "v": 43,
+    "r": "0xc8fc145f611e8e5552374c3dedc2f588458d7214a523b095d70f5478bf06bdf8",
+    "s": "0x0ff83c7c81028bfa59aa8375b489daaa77787aa80ba4d7421a1ea09621abc607",
+    "from": "0xaa994f63f812A136158aC937aCC806E40b85739d",
+    "hash": "0xcc9c8acb976d44bc96e4a10f6c89d7431ab5e08fc681db5a6e682c213ab5c101",
+}
+
+
+class PaymentsServer:
+    """Answers like the payments service. `respond` overrides the answer of an
+    endpoint, e.g. to fail the next payments or make them slow"""
+
+    def __init__(self):
+        self.requests = []
+        # Headers of the requests in the same order, by their lowercase names
+        self.headers = []
+        # Client ports the requests came from, one for each connection
+        self.connections = set()
+        self._overrides = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/api/v1"
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.requests = []
+            self.headers = []
+            self.connections = set()
+            self._overrides = {}
+
+    def respond(self, endpoint, status_code, body, delay=0.0, times=None):
+        """Answers the requests to the endpoint ("wallets" or "deposit") with
+        the status and body after `delay` seconds, the next `times` of them or
+        all of them if None. Bodies are sent as JSON, unless they are bytes"""
+        with self._lock:
+            self._overrides[endpoint] = [status_code, body, delay, times]
+
+    def received(self, endpoint):
+        return [
+            path for path in self.requests if path.startswith(f"/api/v1/{endpoint}")
+        ]
+
+    def received_headers(self, endpoint):
+        return [
+            headers
+            for path, headers in zip(self.requests, self.headers)
+            if path.startswith(f"/api/v1/{endpoint}")
+        ]
+
+    def _answer(self, path, headers, port):
+        endpoint = path.split("/")[3]
+        with self._lock:
+            self.requests.append(path)
+            self.headers.append(headers)
+            self.connections.add(port)
+            override = self._overrides.get(endpoint)
+            if override is not None:
+                status_code, response, delay, times = override
+                if times is not None:
+                    override[3] -= 1
+                    if override[3] == 0:
+                        del self._overrides[endpoint]
+                return status_code, response, delay
+
+        if endpoint == "wallets":
+            uid = path.split("/")[4]
+            return 200, {"address": "0xA143", "id": uid, "private_key": "11111"}, 0
+        if endpoint == "deposit":
+            return 200, SUCCESSFUL_PAYMENT_RESPONSE, 0
+        return 404, {"error": "Not found"}, 0
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self.rfile.read(length)
+                status_code, response, delay = server._answer(
+                    self.path,
+                    {name.lower(): value for name, value in self.headers.items()},
+                    self.client_address[1],
+                )
+                if delay:
+                    time.sleep(delay)
+                if isinstance(response, bytes):
+                    content = response
+                else:
+                    content = json.dumps(response).encode("utf-8")
+                try:
+                    self.send_response(status_code)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(content)))
+                    self.end_headers()
+                    self.wfile.write(content)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up waiting
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
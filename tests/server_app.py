@@ -0,0 +1,19 @@
+"""Application served by the workers of src/server.py in its tests, it answers
+with the pid of the worker that served the request"""
+import asyncio
+import os
+
+
+async def app(scope, receive, send):
+    if scope["type"] != "http":
+        return
+    if scope["path"] == "/slow":
+        await asyncio.sleep(1)
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain")],
+        }
+    )
+    await send({"type": "http.response.body", "body": str(os.getpid()).encode()})
@@ -313,3 +313,68 @@ def test_admin_can_edit_album_of_another_user(client, custom_requests_mock):
     )
 
     assert response_put.status_code == 200
+
+
+def test_admin_with_unknown_uid_cannot_edit_or_delete_album(
+    client, custom_requests_mock
+):
+    post_user(client, "album_creator_id")
+    album_id = post_album(client, uid="album_creator_id")
+
+    response_put = utils.put_album(
+        client, album_id, {"name": "new_name"}, "unknown_id", role="admin"
+    )
+    response_delete = utils.delete_album(client, album_id, "unknown_id", role="admin")
+
+    assert response_put.status_code == 404
+    assert response_delete.status_code == 404
+    response_get = utils.get_album(client, album_id, uid="album_creator_id")
+    assert response_get.status_code == 200
+
+
+def test_post_album_fetches_its_songs_at_once(
+    client, custom_requests_mock, max_statements
+):
+    uid = utils.get_uid_or_create(client)
+    songs_ids = [post_song(client, uid=uid, name=f"song_{i}") for i in range(10)]
+
+    # The requester and the songs, three statements to save the album and
+    # two to load the response, however many songs there are
+    with max_statements(7):
+        response_post = post_album(
+            client, uid=uid, songs_ids=songs_ids, unwrap_id=False
+        )
+
+    assert response_post.status_code == 200
+    album = utils.get_album(client, response_post.json()["id"], uid=uid, unwrap=True)
+    assert len(album["songs"]) == 10
+
+
+def test_cannot_post_album_with_blocked_song(client, custom_requests_mock):
+    uid = utils.get_uid_or_create(client)
+    song_id = post_song(client, uid=uid)
+    blocked_song_id = post_song(client, uid=uid, name="blocked", blocked=True)
+
+    response_post = post_album(
+        client, uid=uid, songs_ids=[song_id, blocked_song_id], unwrap_id=False
+    )
+
+    assert response_post.status_code == 404
+
+
+def test_get_album_has_first_songs_and_offset_of_the_rest(client, nested_limit):
+    nested_limit(2)
+    post_user(client, "creator_id", "creator_name")
+    songs_ids = [
+        post_song(client, uid="creator_id", name=f"song_{i}") for i in range(3)
+    ]
+    album_id = post_album(client, uid="creator_id", songs_ids=songs_ids)
+
+    album = utils.get_album(client, album_id, uid="creator_id").json()
+    page = utils.get_album_songs(
+        client, album_id, uid="creator_id", offset=album["offsets"]["songs"]
+    )
+
+    assert [song["id"] for song in album["songs"]] == songs_ids[:2]
+    assert [song["id"] for song in page["items"]] == songs_ids[2:]
+    assert page["total"] == 3
@@ -0,0 +1,366 @@
+import asyncio
+import json
+import os
+import time
+
+import asyncpg
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.util import identity_key
+
+from src import main
+from src.database import cache, invalidation
+from src.database.models import SongModel, UserModel
+from tests import utils
+from tests.conftest import async_engine
+
+
+def test_song_lookups_are_served_from_the_cache(client, entity_cache, max_statements):
+    song_id = utils.post_song(client)
+    utils.get_song(client, song_id)
+    misses = entity_cache.stats()["misses"]
+
+    # Only the artists and album of the song are read
+    with max_statements(2):
+        response = utils.get_song(client, song_id)
+
+    assert response.status_code == 200
+    assert response.json()["id"] == song_id
+    assert entity_cache.stats()["misses"] == misses
+    assert entity_cache.stats()["hits"] > 0
+
+
+def test_updates_invalidate_the_cached_entity(client, entity_cache):
+    uid = utils.get_uid_or_create(client)
+    song_id = utils.post_song(client, uid=uid, name="old_name")
+    utils.get_song(client, song_id)
+
+    response = utils.put_song(client, song_id, {"name": "new_name"}, uid=uid)
+    assert response.status_code == 200
+
+    assert utils.get_song(client, song_id).json()["name"] == "new_name"
+    assert entity_cache.stats()["invalidations"] > 0
+
+
+def test_blocking_a_cached_song_hides_it(client, entity_cache):
+    song_id = utils.post_song(client)
+    assert utils.get_song(client, song_id).status_code == 200
+
+    utils.block_song(client, song_id)
+
+    assert utils.get_song(client, song_id).status_code == 404
+    assert utils.get_song(client, song_id, role="admin").status_code == 200
+
+
+def test_deleted_entities_are_not_served_from_the_cache(client, entity_cache):
+    uid = utils.get_uid_or_create(client)
+    playlist_id = utils.post_playlist(client, uid=uid)
+    assert utils.get_playlist(client, playlist_id, uid=uid).status_code == 200
+
+    utils.delete_playlist(client, playlist_id, uid=uid)
+
+    assert utils.get_playlist(client, playlist_id, uid=uid).status_code == 404
+
+
+def test_reviews_invalidate_the_score_of_the_cached_album(client, entity_cache):
+    album_id = utils.post_album(client)
+    assert utils.get_album(client, album_id).json()["score"] == 0
+    utils.post_users(client, "reviewer_id")
+
+    utils.post_review(client, album_id, uid="reviewer_id", score=4)
+
+    album = utils.get_album(client, album_id).json()
+    assert album["score"] == 4
+    assert album["scores_amount"] == 1
+
+
+def test_cached_album_leaves_out_blocked_songs(client, entity_cache):
+    uid = utils.get_uid_or_create(client)
+    songs_ids = [utils.post_song(client, uid=uid, name=f"song_{i}") for i in range(2)]
+    album_id = utils.post_album(client, uid=uid, songs_ids=songs_ids)
+    utils.get_album(client, album_id)
+
+    utils.block_song(client, songs_ids[0])
+    album = utils.get_album(client, album_id).json()
+    as_admin = utils.get_album(client, album_id, role="admin").json()
+
+    assert [song["id"] for song in album["songs"]] == songs_ids[1:]
+    assert [song["id"] for song in as_admin["songs"]] == songs_ids
+
+
+def test_least_recently_used_entities_are_evicted(client, entity_cache, monkeypatch):
+    monkeypatch.setattr(entity_cache, "size", 2)
+    songs_ids = [utils.post_song(client, name=f"song_{i}") for i in range(2)]
+    entity_cache.reset()
+
+    for song_id in [songs_ids[0], songs_ids[1], songs_ids[0]]:
+        utils.get_song(client, song_id)
+
+    # The user of the requests is the most recently used
+    stats = entity_cache.stats()
+    assert stats["size"] == 2
+    assert stats["evictions"] > 0
+    assert stats["hits"] == 2
+
+
+def test_entities_expire_after_the_ttl(client, entity_cache, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(entity_cache, "clock", lambda: now[0])
+    song_id = utils.post_song(client)
+    utils.get_song(client, song_id)
+    hits = entity_cache.stats()["hits"]
+
+    now[0] += entity_cache.ttl + 1
+    utils.get_song(client, song_id)
+
+    assert entity_cache.stats()["expirations"] > 0
+    assert entity_cache.stats()["hits"] == hits
+
+
+def test_row_dropped_while_being_read_is_not_cached(client, entity_cache, monkeypatch):
+    song_id = utils.post_song(client)
+    values_of = cache._values_of
+
+    def dropped_meanwhile(item):
+        # As if a write committed, or its invalidation arrived from another
+        # process, after the row was read and before it was stored
+        if isinstance(item, SongModel):
+            entity_cache.drop(SongModel, song_id)
+        return values_of(item)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(cache, "_values_of", dropped_meanwhile)
+        assert utils.get_song(client, song_id).status_code == 200
+
+    assert identity_key(SongModel, song_id) not in entity_cache._entries
+    # Lookups that start afterwards cache it again
+    utils.get_song(client, song_id)
+    assert identity_key(SongModel, song_id) in entity_cache._entries
+    assert entity_cache._dropped == {}
+
+
+def test_cache_health_has_the_counters(client, entity_cache):
+    song_id = utils.post_song(client)
+    utils.get_song(client, song_id)
+
+    health = utils.get_cache_health(client)
+
+    assert health["enabled"] is True
+    assert health["misses"] > 0
+    assert health["size"] > 0
+
+
+def test_cache_is_off_in_tests(client):
+    song_id = utils.post_song(client)
+    utils.get_song(client, song_id)
+
+    health = utils.get_cache_health(client)
+
+    assert health["enabled"] is False
+    assert health["size"] == 0
+
+
+def wait_until(client, condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        client.portal.call(asyncio.sleep, 0.02)
+
+
+def run_listener(client, entity_cache):
+    listener = invalidation.InvalidationListener(cache=entity_cache, reconnect_delay=0)
+
+    async def start():
+        listener.start()
+
+    client.portal.call(start)
+    wait_until(client, lambda: listener.connected)
+    return listener
+
+
+def test_app_listens_to_the_invalidations_when_the_cache_is_on(client, entity_cache):
+    client.portal.call(main.start_invalidation_listener)
+    try:
+        wait_until(client, lambda: invalidation.listener.connected)
+    finally:
+        client.portal.call(invalidation.listener.stop)
+
+
+def notify(client, payload):
+    """Sends the message from outside the transaction of the test, as another
+    process would"""
+
+    async def send():
+        async with async_engine.connect() as connection:
+            await connection.execute(
+                sa.select(sa.func.pg_notify(invalidation.CHANNEL, json.dumps(payload)))
+            )
+            await connection.commit()
+
+    client.portal.call(send)
+
+
+def test_listener_drops_the_entries_other_processes_invalidated(client, entity_cache):
+    songs_ids = [utils.post_song(client, name=f"song_{i}") for i in range(2)]
+    for song_id in songs_ids:
+        utils.get_song(client, song_id)
+    listener = run_listener(client, entity_cache)
+    # Entries cached while not listening are dropped when it connects
+    assert entity_cache.stats()["size"] == 0
+    for song_id in songs_ids:
+        utils.get_song(client, song_id)
+    size = entity_cache.stats()["size"]
+
+    try:
+        notify(
+            client,
+            {
+                "origin": "other_process",
+                "sent": time.time(),
+                "rows": [["songs", songs_ids[0]]],
+                "tables": [],
+            },
+        )
+        wait_until(client, lambda: listener.messages == 1)
+
+        assert entity_cache.stats()["size"] == size - 1
+        assert listener.lag_last is not None and listener.lag_last < 5
+        notify(
+            client,
+            {
+                "origin": "other_process",
+                "sent": time.time(),
+                "rows": [],
+                "tables": ["songs"],
+            },
+        )
+        wait_until(client, lambda: listener.messages == 2)
+        assert entity_cache.stats()["size"] == size - 2
+    finally:
+        client.portal.call(listener.stop)
+
+
+def test_listener_ignores_its_own_messages(client, entity_cache):
+    song_id = utils.post_song(client)
+    listener = run_listener(client, entity_cache)
+    utils.get_song(client, song_id)
+    size = entity_cache.stats()["size"]
+
+    try:
+        notify(
+            client,
+            {
+                "origin": invalidation.ORIGIN,
+                "sent": time.time(),
+                "rows": [["songs", song_id]],
+                "tables": [],
+            },
+        )
+        notify(
+            client,
+            {"origin": "other_process", "sent": time.time(), "rows": [], "tables": []},
+        )
+        wait_until(client, lambda: listener.messages == 1)
+
+        assert entity_cache.stats()["size"] == size
+    finally:
+        client.portal.call(listener.stop)
+
+
+def forked_message(written) -> str:
+    """Invalidation message of the writes as a worker forked from this process,
+    like those of src/server.py, would publish it"""
+    read, write = os.pipe()
+    pid = os.fork()
+    if not pid:
+        try:
+            os.close(read)
+            os.write(write, invalidation.message(written, time.time()).encode())
+        finally:
+            os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as pipe:
+        payload = pipe.read()
+    os.waitpid(pid, 0)
+    return payload
+
+
+def test_listener_applies_the_messages_of_forked_siblings(client, entity_cache):
+    song_id = utils.post_song(client)
+    listener = run_listener(client, entity_cache)
+    utils.get_song(client, song_id)
+    size = entity_cache.stats()["size"]
+    payload = json.loads(forked_message({(SongModel, (song_id,), None)}))
+
+    try:
+        assert payload["origin"] != invalidation.ORIGIN
+        notify(client, payload)
+        wait_until(client, lambda: listener.messages == 1)
+
+        assert entity_cache.stats()["size"] == size - 1
+    finally:
+        client.portal.call(listener.stop)
+
+
+def test_committed_invalidations_are_published(client, entity_cache):
+    received = []
+
+    async def write(commit):
+        async with async_engine.connect() as connection:
+            pdb = AsyncSession(bind=connection)
+            await pdb.run_sync(
+                lambda session: entity_cache.invalidate(session, SongModel, 7, 8)
+            )
+            await pdb.run_sync(
+                lambda session: entity_cache.invalidate_all(session, UserModel)
+            )
+            await (pdb.commit() if commit else pdb.rollback())
+            await pdb.close()
+
+    async def listen():
+        connection = await asyncpg.connect(invalidation.listen_dsn())
+        await connection.add_listener(
+            invalidation.CHANNEL,
+            lambda _connection, _pid, _channel, payload: received.append(
+                json.loads(payload)
+            ),
+        )
+        return connection
+
+    connection = client.portal.call(listen)
+    try:
+        client.portal.call(write, False)
+        client.portal.call(write, True)
+        wait_until(client, lambda: received)
+        client.portal.call(asyncio.sleep, 0.1)
+    finally:
+        client.portal.call(connection.close)
+
+    assert len(received) == 1
+    assert sorted(received[0]["rows"]) == [["songs", 7], ["songs", 8]]
+    assert received[0]["tables"] == ["users"]
+    assert received[0]["origin"] == invalidation.ORIGIN
+
+
+def test_big_invalidations_are_published_as_whole_tables(client):
+    written = {
+        (SongModel, (song_id,), None) for song_id in range(invalidation.MAX_PAYLOAD)
+    }
+
+    message = json.loads(invalidation.message(written, time.time()))
+
+    assert message["rows"] == []
+    assert message["tables"] == ["songs"]
+
+
+def test_cache_health_has_the_lag_of_the_bus(client, entity_cache):
+    bus = utils.get_cache_health(client)["bus"]
+
+    assert set(bus) == {
+        "connected",
+        "reconnects",
+        "messages",
+        "lag_last",
+        "lag_max",
+        "last_message_at",
+    }
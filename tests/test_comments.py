@@ -1,4 +1,5 @@
 from src.main import API_VERSION_PREFIX
+from src import schemas
 from tests import utils
 
 
@@ -471,3 +472,124 @@ def test_delete_album_with_comments(client, custom_requests_mock):
 
     response_get = utils.get_album_comments(client, album_id)
     assert response_get.status_code == 404
+
+
+def test_comment_has_first_responses_and_offset_of_the_rest(client, nested_limit):
+    nested_limit(1)
+    album_id = utils.post_album(client)
+    comment_id = utils.post_comment(client, album_id)
+    responses_ids = [
+        utils.post_comment(client, album_id, f"response_{i}", parent_id=comment_id)
+        for i in range(2)
+    ]
+
+    comment = utils.get_album_comments(client, album_id).json()[0]
+    page = utils.get_comment_responses(
+        client, comment_id, offset=comment["offsets"]["responses"]
+    )
+
+    assert [response["id"] for response in comment["responses"]] == responses_ids[:1]
+    assert [response["id"] for response in page["items"]] == responses_ids[1:]
+
+
+def test_comment_responses_are_cut_after_the_last_level(client, monkeypatch):
+    monkeypatch.setattr(schemas.CommentGet.Config.load_profile, "depth", 2)
+    album_id = utils.post_album(client)
+    comments_ids = [utils.post_comment(client, album_id)]
+    for i in range(3):
+        comments_ids.append(
+            utils.post_comment(client, album_id, parent_id=comments_ids[-1])
+        )
+
+    comment = utils.get_album_comments(client, album_id).json()[0]
+
+    response = comment["responses"][0]
+    assert response["id"] == comments_ids[1]
+    assert response["responses"] == []
+    assert response["offsets"] == {"responses": "0"}
+    page = utils.get_comment_responses(client, comments_ids[1], offset="0")
+    assert [response["id"] for response in page["items"]] == comments_ids[2:3]
+
+
+def post_thread(client, album_id, depth, width):
+    """Comments `depth` levels deep, each one with `width` responses, by level"""
+    levels = [[utils.post_comment(client, album_id)]]
+    for _ in range(depth - 1):
+        levels.append(
+            [
+                utils.post_comment(client, album_id, parent_id=parent_id)
+                for parent_id in levels[-1]
+                for _ in range(width)
+            ]
+        )
+    return levels
+
+
+def test_album_thread_is_loaded_with_the_same_statements_whatever_its_size(
+    client, max_statements
+):
+    album_id = utils.post_album(client)
+    post_thread(client, album_id, depth=2, width=1)
+    with max_statements(5):
+        utils.get_album_thread(client, album_id, max_depth=2)
+
+    album_id = utils.post_album(client)
+    levels = post_thread(client, album_id, depth=4, width=2)
+    with max_statements(5):
+        response = utils.get_album_thread(client, album_id, max_depth=4)
+
+    assert response.status_code == 200
+    comment = response.json()["items"][0]
+    for level in levels[1:]:
+        assert [response["id"] for response in comment["responses"]] == level[:2]
+        comment = comment["responses"][0]
+    assert comment["responses"] == []
+    assert comment["offsets"] == {}
+
+
+def test_album_thread_is_cut_by_max_depth_and_responses_limit(client):
+    album_id = utils.post_album(client)
+    levels = post_thread(client, album_id, depth=3, width=3)
+
+    response = utils.get_album_thread(client, album_id, max_depth=2, responses_limit=2)
+
+    assert response.status_code == 200
+    root = response.json()["items"][0]
+    assert [response["id"] for response in root["responses"]] == levels[1][:2]
+    assert root["offsets"] == {"responses": str(levels[1][1])}
+    for response in root["responses"]:
+        assert response["responses"] == []
+        assert response["offsets"] == {"responses": "0"}
+
+    # The cut branches go on from their offsets
+    rest = utils.get_comment_responses(
+        client, root["id"], offset=root["offsets"]["responses"]
+    )
+    assert [response["id"] for response in rest["items"]] == levels[1][2:]
+    deeper = utils.get_comment_responses(client, levels[1][0], offset="0")
+    assert [response["id"] for response in deeper["items"]] == levels[2][:3]
+
+
+def test_album_thread_with_no_responses_has_offsets_of_all(client):
+    album_id = utils.post_album(client)
+    levels = post_thread(client, album_id, depth=2, width=1)
+    lonely_id = utils.post_comment(client, album_id)
+
+    roots = utils.get_album_thread(client, album_id, max_depth=1).json()["items"]
+    without_responses = utils.get_album_thread(
+        client, album_id, responses_limit=0
+    ).json()["items"]
+
+    assert [root["offsets"] for root in roots] == [{"responses": "0"}, {}]
+    assert [root["responses"] for root in roots] == [[], []]
+    assert [root["id"] for root in without_responses] == [levels[0][0], lonely_id]
+    assert [root["offsets"] for root in without_responses] == [{"responses": "0"}, {}]
+
+
+def test_album_thread_with_invalid_window_should_fail(client):
+    album_id = utils.post_album(client)
+
+    assert utils.get_album_thread(client, album_id, max_depth=0).status_code == 422
+    assert (
+        utils.get_album_thread(client, album_id, responses_limit=-1).status_code == 422
+    )
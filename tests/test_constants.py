@@ -0,0 +1,33 @@
+import pytest
+
+from src.constants import env_bool
+
+
+@pytest.mark.parametrize("value", ["1", "true", "True", "YES", "on", " true "])
+def test_env_bool_is_true(monkeypatch, value):
+    monkeypatch.setenv("FLAG", value)
+
+    assert env_bool("FLAG", False) is True
+
+
+@pytest.mark.parametrize("value", ["0", "false", "False", "NO", "off"])
+def test_env_bool_is_false(monkeypatch, value):
+    monkeypatch.setenv("FLAG", value)
+
+    assert env_bool("FLAG", True) is False
+
+
+@pytest.mark.parametrize("default", [True, False])
+def test_env_bool_defaults_when_unset_or_empty(monkeypatch, default):
+    monkeypatch.delenv("FLAG", raising=False)
+    assert env_bool("FLAG", default) is default
+
+    monkeypatch.setenv("FLAG", "")
+    assert env_bool("FLAG", default) is default
+
+
+def test_env_bool_rejects_other_values(monkeypatch):
+    monkeypatch.setenv("FLAG", "maybe")
+
+    with pytest.raises(ValueError, match="FLAG"):
+        env_bool("FLAG", False)
@@ -169,6 +169,36 @@ def test_remove_song_from_favorites_song_that_is_not_in_favorites(
     assert songs[0]["name"] == "first_song"
 
 
+def test_add_song_to_favorites_twice(client, custom_requests_mock):
+    utils.post_user(client, "user_id")
+    song_id = utils.post_song(client, uid="user_id")
+    utils.add_song_to_favorites(client, uid="user_id", song_id=song_id)
+
+    response_post = utils.add_song_to_favorites(client, uid="user_id", song_id=song_id)
+
+    assert response_post.status_code == 409
+    assert len(utils.get_favorite_songs(client, uid="user_id").json()) == 1
+
+
+def test_add_song_to_favorites_does_not_load_the_favorites(
+    client, custom_requests_mock, max_statements
+):
+    utils.post_user(client, "user_id")
+    for i in range(5):
+        song_id = utils.post_song(client, name=f"song_{i}", uid="user_id")
+        utils.add_song_to_favorites(client, uid="user_id", song_id=song_id)
+    song_id = utils.post_song(client, name="new_song", uid="user_id")
+
+    # The song, the user, the insert and the artists of the response
+    with max_statements(5):
+        response_post = utils.add_song_to_favorites(
+            client, uid="user_id", song_id=song_id
+        )
+
+    assert response_post.status_code == 200
+    assert len(utils.get_favorite_songs(client, uid="user_id").json()) == 6
+
+
 def test_user_cann_add_to_favorites_songs_of_another_user(client, custom_requests_mock):
     utils.post_user(client, "creator_id", "creator_name")
     utils.post_user(client, "listener_id", "listener_name")
@@ -0,0 +1,86 @@
+import httpx
+import pytest
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.constants import DB_POOL_SIZE, DB_POOL_WARMUP
+from src.database import pool
+from src.database.access import get_db, async_url
+from src.main import app
+from tests import utils
+from tests.conftest import SQLALCHEMY_DATABASE_URL
+
+
+def test_db_health(client, custom_requests_mock):
+    response = utils.get_db_health(client)
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "ok"
+
+
+def test_db_health_reports_pool_warmed_up_on_startup(client, custom_requests_mock):
+    response = utils.get_db_health(client)
+    pool_status = response.json()["pool"]
+
+    assert pool_status["size"] == DB_POOL_SIZE
+    assert pool_status["checked_in"] == min(DB_POOL_WARMUP, DB_POOL_SIZE)
+    assert pool_status["checked_out"] == 0
+    assert pool_status["checkouts"] > 0
+
+
+def test_db_health_unavailable(client, custom_requests_mock):
+    unreachable_engine = create_async_engine(
+        "postgresql+asyncpg://test:test@/test?host=/nonexistent", poolclass=NullPool
+    )
+
+    async def override_get_db():
+        db = AsyncSession(bind=unreachable_engine)
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    response = utils.get_db_health(client)
+
+    assert response.status_code == 503
+    assert response.json()["message"].startswith("Database unavailable")
+
+
+def test_pool_metrics_count_checkouts_and_timeouts(client):
+    options = pool.engine_options()
+    options.update(pool_size=1, max_overflow=0, pool_timeout=0.1)
+    engine = create_async_engine(async_url(SQLALCHEMY_DATABASE_URL), **options)
+    pool.instrument(engine)
+
+    async def exhaust_pool():
+        connection = await engine.connect()
+        try:
+            held = pool.pool_status(engine)
+            with pytest.raises(exc.TimeoutError):
+                await engine.connect()
+        finally:
+            await connection.close()
+            await engine.dispose()
+        return held
+
+    held = client.portal.call(exhaust_pool)
+    status = pool.pool_status(engine)
+
+    assert held["checked_out"] == 1
+    assert status["checked_out"] == 0
+    assert status["checkouts"] == 1
+    assert status["connects"] == 1
+    assert status["timeouts"] == 1
+    assert status["wait_time_max"] >= 0.1
+
+
+def test_db_health_needs_no_api_key_from_allowed_networks(run_server):
+    _, url = run_server(
+        workers=1, app="src.main:app", POSTGRES_URL=SQLALCHEMY_DATABASE_URL
+    )
+
+    # Readiness probes from loopback, like scrapers of /metrics
+    assert httpx.get(f"{url}/api/v3/health/db").status_code == 200
+    assert httpx.get(f"{url}/api/v3/health/cache").status_code == 403
@@ -0,0 +1,191 @@
+import datetime
+
+import sqlalchemy as sa
+
+from src.database import models
+from src.database.models.job import DONE, FAILED, PENDING, RUNNING
+from src.jobs import handler, HANDLERS
+from src.mocks.firebase.auth import auth_mock
+from src.mocks.firebase.bucket import bucket_mock
+from tests import utils
+from tests.conftest import bound_session
+from tests.utils import post_song, post_user
+
+
+def get_jobs(client, session, kind=None):
+    async def select_jobs():
+        query = sa.select(models.JobModel.__table__).order_by(models.JobModel.id)
+        if kind is not None:
+            query = query.where(models.JobModel.kind == kind)
+        result = await session.execute(query)
+        return result.mappings().all()
+
+    return client.portal.call(select_jobs)
+
+
+def enqueue(client, session, kind, **kwargs):
+    async def insert_job():
+        async with bound_session(session) as pdb:
+            enqueued = await pdb.run_sync(models.JobModel.enqueue, kind, **kwargs)
+            await pdb.commit()
+            return enqueued
+
+    return client.portal.call(insert_job)
+
+
+def update_jobs(client, session, **values):
+    async def update():
+        await session.execute(models.JobModel.__table__.update().values(**values))
+
+    client.portal.call(update)
+
+
+def test_deleting_a_song_deletes_its_blob_in_the_background(
+    client, custom_requests_mock, session, run_jobs
+):
+    post_user(client, "creator_id", "creator_name")
+    song_id = post_song(client, uid="creator_id")
+
+    response_delete = utils.delete(client, f"/songs/{song_id}", uid="creator_id")
+
+    assert response_delete.status_code == 200
+    assert bucket_mock.blob(f"songs/{song_id}").exists()
+    [job] = get_jobs(client, session, kind="delete_blob")
+    assert job["status"] == PENDING
+    assert job["payload"]["blob_name"] == f"songs/{song_id}"
+
+    run_jobs()
+
+    assert not bucket_mock.blob(f"songs/{song_id}").exists()
+    [job] = get_jobs(client, session, kind="delete_blob")
+    assert job["status"] == DONE
+    assert job["attempts"] == 1
+
+
+def test_late_deletion_keeps_the_pfp_of_a_user_created_again(
+    client, custom_requests_mock, run_jobs
+):
+    post_user(client, "user_id", include_pfp=True)
+    utils.delete_user(client, "user_id")
+    # The user signs up again with the same uid before the job runs
+    post_user(client, "user_id", include_pfp=True)
+
+    run_jobs()
+
+    assert bucket_mock.get_blob("pfp/user_id") is not None
+
+
+def test_failed_request_does_not_enqueue_jobs(client, custom_requests_mock, session):
+    utils.post_users(client, "creator_id", "other_id")
+    song_id = post_song(client, uid="creator_id")
+
+    response_delete = utils.delete(client, f"/songs/{song_id}", uid="other_id")
+
+    assert response_delete.status_code == 403
+    assert get_jobs(client, session, kind="delete_blob") == []
+
+
+def test_user_name_is_synced_to_firebase_in_the_background(
+    client, custom_requests_mock, run_jobs
+):
+    post_user(client, "user_id", "user_name")
+    utils.put(client, "/users/user_id", {"name": "new_name"}, uid="user_id")
+
+    run_jobs()
+
+    assert auth_mock.user["uid"] == "user_id"
+    assert auth_mock.user["display_name"] == "new_name"
+
+
+def test_enqueueing_with_the_same_key_twice_adds_one_job(
+    client, custom_requests_mock, session
+):
+    assert enqueue(client, session, "delete_blob", key="key", blob_name="a")
+    assert not enqueue(client, session, "delete_blob", key="key", blob_name="a")
+
+    assert len(get_jobs(client, session)) == 1
+
+
+def test_failing_job_is_retried_with_backoff(
+    client, custom_requests_mock, session, run_jobs
+):
+    calls = []
+
+    @handler("test_failing")
+    def failing(pdb, value):
+        calls.append(value)
+        raise RuntimeError("could not do it")
+
+    try:
+        enqueue(client, session, "test_failing", max_attempts=2, value=1)
+
+        assert run_jobs() == 1
+        [job] = get_jobs(client, session)
+        assert job["status"] == PENDING
+        assert job["attempts"] == 1
+        assert "could not do it" in job["last_error"]
+        assert job["run_at"] > datetime.datetime.now()
+
+        # Not due yet
+        assert run_jobs() == 0
+
+        update_jobs(client, session, run_at=datetime.datetime.now())
+        assert run_jobs() == 1
+        [job] = get_jobs(client, session)
+        assert job["status"] == FAILED
+        assert job["attempts"] == 2
+        assert calls == [1, 1]
+    finally:
+        del HANDLERS["test_failing"]
+
+
+def test_changes_of_failing_job_are_rolled_back(
+    client, custom_requests_mock, session, run_jobs
+):
+    post_user(client, "user_id", "user_name")
+
+    @handler("test_rename")
+    def rename(pdb, uid):
+        models.UserModel.get(pdb, uid).name = "renamed"
+        pdb.flush()
+        raise RuntimeError("could not do it")
+
+    try:
+        enqueue(client, session, "test_rename", uid="user_id")
+        run_jobs()
+    finally:
+        del HANDLERS["test_rename"]
+
+    user = utils.get(client, "/users/user_id", uid="user_id", unwrap=True)
+    assert user["name"] == "user_name"
+
+
+def test_running_job_with_expired_lease_is_run_again(
+    client, custom_requests_mock, session, run_jobs
+):
+    bucket_mock.blob("tests/leased").upload_from_string(b"data")
+    enqueue(client, session, "delete_blob", blob_name="tests/leased")
+    update_jobs(
+        client,
+        session,
+        status=RUNNING,
+        attempts=1,
+        locked_at=datetime.datetime.now() - datetime.timedelta(days=1),
+    )
+
+    assert run_jobs() == 1
+
+    [job] = get_jobs(client, session)
+    assert job["status"] == DONE
+    assert job["attempts"] == 2
+    assert not bucket_mock.blob("tests/leased").exists()
+
+
+def test_job_without_handler_fails(client, custom_requests_mock, session, run_jobs):
+    enqueue(client, session, "unknown", max_attempts=1)
+
+    run_jobs()
+
+    [job] = get_jobs(client, session)
+    assert job["status"] == FAILED
+    assert "No handler" in job["last_error"]
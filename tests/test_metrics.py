@@ -0,0 +1,183 @@
+import json
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+from src.database.statements import TooManyStatementsError
+from src.metrics import Registry
+from tests import utils
+from tests.conftest import SQLALCHEMY_DATABASE_URL
+
+
+def samples(text):
+    """Values of the samples of a Prometheus text page, by name and labels"""
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            sample, value = line.rsplit(" ", 1)
+            values[sample] = float(value)
+    return values
+
+
+def get_metrics(client):
+    response = client.get("/metrics", headers={"api_key": "key"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    return samples(response.text)
+
+
+def test_requests_are_labeled_by_route_template(
+    client, custom_requests_mock, drop_tables, metrics_registry
+):
+    song_ids = [utils.post_song(client, name=f"song_{i}") for i in range(2)]
+    for song_id in song_ids:
+        utils.get_song(client, song_id)
+    utils.get_song(client, 1000)
+
+    values = get_metrics(client)
+
+    route = "/api/v3/songs/{song_id}"
+    assert (
+        values[f'http_requests_total{{method="GET",route="{route}",status="200"}}'] == 2
+    )
+    assert (
+        values[f'http_requests_total{{method="GET",route="{route}",status="404"}}'] == 1
+    )
+    assert (
+        values[f'http_request_duration_seconds_count{{method="GET",route="{route}"}}']
+        == 3
+    )
+    assert (
+        values[
+            f'http_request_duration_seconds_bucket{{method="GET",route="{route}",le="+Inf"}}'
+        ]
+        == 3
+    )
+
+
+def test_requests_that_match_no_route(
+    client, custom_requests_mock, drop_tables, metrics_registry
+):
+    client.get("/api/v3/nowhere/", headers={"api_key": "key"})
+
+    values = get_metrics(client)
+
+    assert (
+        values['http_requests_total{method="GET",route="unmatched",status="404"}'] == 1
+    )
+
+
+def test_server_errors_are_counted(
+    client, custom_requests_mock, drop_tables, metrics_registry, max_statements
+):
+    uid = utils.get_uid_or_create(client)
+    utils.post_song(client, uid=uid)
+
+    with max_statements(1), pytest.raises(TooManyStatementsError):
+        utils.search_songs(client, uid=uid)
+
+    values = get_metrics(client)
+
+    route = "/api/v3/songs/"
+    assert values[f'http_request_errors_total{{method="GET",route="{route}"}}'] == 1
+    assert (
+        values[f'http_requests_total{{method="GET",route="{route}",status="500"}}'] == 1
+    )
+
+
+def test_pool_cache_blob_and_payments_metrics(
+    client, custom_requests_mock, drop_tables, metrics_registry, payments_client
+):
+    utils.post_song(client)
+    payments_client.create_wallet("user_id")
+
+    values = get_metrics(client)
+
+    assert values['db_pool_connections{state="checked_in"}'] >= 1
+    assert values["db_pool_checkouts_total"] > 0
+    assert 'entity_cache_lookups_total{result="hit"}' in values
+    assert 'entity_cache_lookups_total{result="miss"}' in values
+    assert (
+        values[
+            'blob_operation_duration_seconds_count{operation="upload_from_file",outcome="ok"}'
+        ]
+        >= 1
+    )
+    assert (
+        values[
+            'payments_call_duration_seconds_count{operation="create_wallet",outcome="ok"}'
+        ]
+        >= 1
+    )
+
+
+def test_metrics_need_the_api_key_outside_of_the_allowed_networks(client):
+    # The test client connects from no network at all
+    assert client.get("/metrics").status_code == 403
+    assert client.get("/metrics", headers={"api_key": "other"}).status_code == 403
+    assert client.get("/api/v3/health/db").status_code == 403
+
+
+def test_shared_registry_adds_up_the_processes(tmp_path):
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ["route"])
+    connections = registry.gauge("connections", "Connections")
+    registry.share(str(tmp_path))
+    requests.inc(route="/a")
+    connections.set(2)
+
+    # A process that exited, and one that is still running
+    exited = subprocess.run(
+        [sys.executable, "-c", "import os; print(os.getpid())"],
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+    running = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        for pid, amount in ((exited, 3), (running.pid, 5)):
+            snapshot = registry.snapshot()
+            snapshot["requests_total"]["values"] = [[["/a"], amount]]
+            (tmp_path / f"{pid}.json").write_text(json.dumps(snapshot))
+
+        values = samples(registry.render())
+        # Once folded into the archive, the exited process is still counted
+        values_again = samples(registry.render())
+    finally:
+        running.kill()
+        running.wait()
+
+    assert values['requests_total{route="/a"}'] == 1 + 3 + 5
+    assert values_again == values
+    # The gauge of the exited process is dropped
+    assert values["connections"] == 2 + 2
+    assert not (tmp_path / f"{exited}.json").exists()
+    assert (tmp_path / "archive.json").exists()
+
+
+def test_workers_serve_the_metrics_of_all_of_them(run_server):
+    _, url = run_server(
+        workers=2,
+        app="src.main:app",
+        METRICS_WRITE_INTERVAL="0.1",
+        POSTGRES_URL=SQLALCHEMY_DATABASE_URL,
+    )
+
+    for _ in range(10):
+        # New connections, so that both workers serve some of them
+        response = httpx.get(f"{url}/api/v3/health/db", headers={"api_key": "key"})
+        assert response.status_code == 200
+    time.sleep(0.5)
+
+    # Scrapers from loopback need no API key
+    response = httpx.get(f"{url}/metrics")
+    assert response.status_code == 200
+    values = samples(response.text)
+
+    route = "/api/v3/health/db"
+    assert (
+        values[f'http_requests_total{{method="GET",route="{route}",status="200"}}']
+        == 10
+    )
@@ -563,3 +563,192 @@ def test_get_reviews_of_album_second_page(client, custom_requests_mock, drop_tab
     assert response_get.status_code == 200
     assert len(reviews) == 1
     assert reviews[0]["text"] == "review_2"
+
+
+def test_get_songs_page_has_exact_total_by_default(
+    client, custom_requests_mock, drop_tables
+):
+    for i in range(3):
+        utils.post_song(client, name=f"song_{i}")
+
+    response_get = utils.search_songs(client, offset=0, limit=2)
+
+    page = response_get.json()
+    assert response_get.status_code == 200
+    assert len(page["items"]) == 2
+    assert page["total"] == 3
+    assert page["total_kind"] == "exact"
+
+
+def test_get_songs_page_without_total(client, custom_requests_mock, drop_tables):
+    for i in range(3):
+        utils.post_song(client, name=f"song_{i}")
+
+    response_get = utils.get(client, "/songs/?include_total=none", offset=0, limit=2)
+
+    page = response_get.json()
+    assert response_get.status_code == 200
+    assert len(page["items"]) == 2
+    assert page["total"] is None
+    assert page["total_kind"] == "none"
+
+
+def test_get_songs_page_with_estimated_total(client, custom_requests_mock, drop_tables):
+    for i in range(3):
+        utils.post_song(client, name=f"song_{i}")
+
+    response_get = utils.get(
+        client, "/songs/?name=song&include_total=estimated", offset=0, limit=2
+    )
+
+    page = response_get.json()
+    assert response_get.status_code == 200
+    assert len(page["items"]) == 2
+    assert isinstance(page["total"], int)
+    assert page["total_kind"] == "estimated"
+
+
+def test_get_songs_with_invalid_include_total(
+    client, custom_requests_mock, drop_tables
+):
+    response_get = utils.get(client, "/songs/?include_total=some", offset=0, limit=2)
+
+    assert response_get.status_code == 422
+
+
+def test_get_favorite_songs_page_without_total(
+    client, custom_requests_mock, drop_tables
+):
+    utils.post_user(client, "user_id")
+    song_id = utils.post_song(client, name="song")
+    utils.add_song_to_favorites(client, "user_id", song_id)
+
+    response_get = utils.get(
+        client,
+        "/users/user_id/favorites/songs/?include_total=none",
+        uid="user_id",
+        offset=0,
+        limit=1,
+    )
+
+    page = response_get.json()
+    assert response_get.status_code == 200
+    assert len(page["items"]) == 1
+    assert page["total"] is None
+
+
+def test_get_album_comments_page_with_estimated_total(
+    client, custom_requests_mock, drop_tables
+):
+    utils.post_user(client, "user_id")
+    album_id = utils.post_album(client)
+    utils.post_comment(client, album_id, uid="user_id")
+
+    response_get = utils.get(
+        client,
+        f"/albums/{album_id}/comments/?include_total=estimated",
+        uid="user_id",
+        offset=0,
+        limit=1,
+    )
+
+    page = response_get.json()
+    assert response_get.status_code == 200
+    assert len(page["items"]) == 1
+    assert page["total_kind"] == "estimated"
+
+
+def test_get_user_reviews_total_counts_every_page(
+    client, custom_requests_mock, drop_tables
+):
+    utils.post_user(client, "user_id")
+    album_id_1 = utils.post_album(client, name="album_1")
+    album_id_2 = utils.post_album(client, name="album_2")
+    utils.post_review(client, album_id_1, "user_id")
+    utils.post_review(client, album_id_2, "user_id")
+
+    response_get = utils.get_user_reviews(client, "user_id", offset=0, limit=1)
+
+    page = response_get.json()
+    assert response_get.status_code == 200
+    assert len(page["items"]) == 1
+    assert page["total"] == 2
+
+
+def test_get_albums_filtered_by_artist_pages_have_each_album_once(
+    client, custom_requests_mock, drop_tables
+):
+    # Every song of the albums matches the artist twice
+    albums_ids = []
+    for i in range(3):
+        songs_ids = [
+            utils.post_song(
+                client, name=f"song_{i}_{j}", artists=["artist_1", "artist_2"]
+            )
+            for j in range(2)
+        ]
+        albums_ids.append(
+            utils.post_album(client, name=f"album_{i}", songs_ids=songs_ids)
+        )
+
+    first = utils.search_albums(client, limit=2, artist="artist").json()
+    second = utils.search_albums(
+        client, offset=first["offset"], limit=2, artist="artist"
+    ).json()
+
+    assert [album["id"] for album in first["items"]] == albums_ids[:2]
+    assert [album["id"] for album in second["items"]] == albums_ids[2:]
+
+
+def test_get_albums_filtered_by_artist_and_ranked_pages_have_each_album_once(
+    client, custom_requests_mock, drop_tables
+):
+    albums_ids = []
+    for i in range(3):
+        songs_ids = [
+            utils.post_song(
+                client, name=f"song_{i}_{j}", artists=["artist_1", "artist_2"]
+            )
+            for j in range(2)
+        ]
+        albums_ids.append(
+            utils.post_album(client, name=f"album_{i}", songs_ids=songs_ids)
+        )
+
+    endpoint = "/albums/?artist=artist&sort_by=rating"
+    first = utils.get(client, endpoint, offset=0, limit=2).json()
+    second = utils.get(client, endpoint, offset=first["offset"], limit=2).json()
+
+    # Without scores they tie, and are ordered by id
+    assert [album["id"] for album in first["items"]] == albums_ids[:2]
+    assert [album["id"] for album in second["items"]] == albums_ids[2:]
+
+
+def test_get_playlists_filtered_by_colab_pages_have_each_playlist_once(
+    client, custom_requests_mock, drop_tables
+):
+    utils.post_users(client, "owner_id", "colab_1", "colab_2")
+    playlists_ids = [
+        utils.post_playlist(
+            client, "owner_id", f"playlist_{i}", colabs_ids=["colab_1", "colab_2"]
+        )
+        for i in range(3)
+    ]
+
+    first = utils.search_playlists(client, offset=0, limit=2, colab="colab_1").json()
+    second = utils.search_playlists(
+        client, offset=first["offset"], limit=2, colab="colab_1"
+    ).json()
+
+    assert [playlist["id"] for playlist in first["items"]] == playlists_ids[:2]
+    assert [playlist["id"] for playlist in second["items"]] == playlists_ids[2:]
+
+
+def test_get_albums_with_rank_offset_and_no_rank(
+    client, custom_requests_mock, drop_tables
+):
+    utils.post_album(client)
+
+    response = utils.search_albums(client, offset="1.5:3", limit=2)
+
+    assert response.status_code == 422
@@ -0,0 +1,251 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from src.exceptions import MessageException
+from src.payments import CircuitBreaker, PaymentsClient
+from tests import utils
+
+
+def test_create_wallet(payments_client, payments_server):
+    assert payments_client.create_wallet("user_id") == "0xA143"
+    assert payments_server.received("wallets") == ["/api/v1/wallets/user_id"]
+
+
+def test_async_create_wallet(payments_client, payments_server):
+    async def create_wallet():
+        try:
+            return await payments_client.acreate_wallet("user_id")
+        finally:
+            await payments_client.aclose()
+
+    assert asyncio.run(create_wallet()) == "0xA143"
+
+
+def test_calls_reuse_connections(payments_client, payments_server):
+    for i in range(5):
+        payments_client.deposit(f"user_{i}", "1")
+
+    assert len(payments_server.received("deposit")) == 5
+    assert len(payments_server.connections) == 1
+
+
+def test_rejected_call_keeps_status_and_body(payments_client, payments_server):
+    payments_server.respond("deposit", 400, {"error": "Payment failed"})
+
+    with pytest.raises(MessageException) as e:
+        payments_client.deposit("user_id", "1")
+
+    assert e.value.status_code == 400
+    assert e.value.message == '{"error": "Payment failed"}'
+    assert payments_client.breaker.state == "closed"
+
+
+def test_slow_call_times_out_at_its_deadline(payments_server):
+    client = PaymentsClient(payments_server.url, deadline=0.3)
+    payments_server.respond("deposit", 200, {}, delay=2)
+
+    start = time.monotonic()
+    with pytest.raises(MessageException) as e:
+        client.deposit("user_id", "1")
+
+    assert e.value.status_code == 504
+    assert time.monotonic() - start < 1
+    assert client.metrics.snapshot()["deposit"]["outcomes"] == {"timeout": 1}
+    client.close()
+
+
+def test_idempotent_call_is_retried(payments_client, payments_server):
+    payments_server.respond("wallets", 503, {"error": "Unavailable"}, times=1)
+
+    assert payments_client.create_wallet("user_id", "key") == "0xA143"
+
+    headers = payments_server.received_headers("wallets")
+    assert [h["idempotency-key"] for h in headers] == ["key", "key"]
+    metrics = payments_client.metrics.snapshot()["create_wallet"]
+    assert metrics["retries"] == 1
+    assert metrics["outcomes"] == {"ok": 1}
+
+
+def test_wallet_is_not_retried_without_idempotency_key(
+    payments_client, payments_server
+):
+    payments_server.respond("wallets", 503, {"error": "Unavailable"}, times=1)
+
+    with pytest.raises(MessageException) as e:
+        payments_client.create_wallet("user_id")
+
+    assert e.value.status_code == 502
+    headers = payments_server.received_headers("wallets")
+    assert len(headers) == 1
+    assert "idempotency-key" not in headers[0]
+
+
+@pytest.mark.parametrize(
+    "body", [b"<html>Bad gateway</html>", {"id": "user_id"}, ["0xA143"]]
+)
+def test_malformed_wallet_is_an_upstream_error(payments_client, payments_server, body):
+    payments_server.respond("wallets", 200, body)
+
+    with pytest.raises(MessageException) as e:
+        payments_client.create_wallet("user_id")
+
+    assert e.value.status_code == 502
+
+
+def test_async_malformed_wallet_is_an_upstream_error(payments_client, payments_server):
+    payments_server.respond("wallets", 200, b"not json")
+
+    async def create_wallet():
+        try:
+            return await payments_client.acreate_wallet("user_id")
+        finally:
+            await payments_client.aclose()
+
+    with pytest.raises(MessageException) as e:
+        asyncio.run(create_wallet())
+
+    assert e.value.status_code == 502
+
+
+def test_payment_is_not_retried_once_sent(payments_client, payments_server):
+    payments_server.respond("deposit", 500, {"error": "Internal"}, times=1)
+
+    with pytest.raises(MessageException) as e:
+        payments_client.deposit("user_id", "1")
+
+    assert e.value.status_code == 502
+    assert len(payments_server.received("deposit")) == 1
+
+
+def test_unreachable_service_is_retried_and_fails(payments_server):
+    # Nothing listens on the port once the server is gone
+    client = PaymentsClient("http://127.0.0.1:9/api/v1", retries=2)
+
+    with pytest.raises(MessageException) as e:
+        client.deposit("user_id", "1")
+
+    assert e.value.status_code == 502
+    metrics = client.metrics.snapshot()["deposit"]
+    assert metrics["retries"] == 2
+    assert metrics["outcomes"] == {"unreachable": 1}
+
+
+def test_circuit_opens_after_consecutive_failures(payments_server):
+    now = [0.0]
+    breaker = CircuitBreaker(failures=2, reset_timeout=30, clock=lambda: now[0])
+    client = PaymentsClient(payments_server.url, retries=0, breaker=breaker)
+    payments_server.respond("deposit", 500, {"error": "Internal"})
+
+    for _ in range(2):
+        with pytest.raises(MessageException):
+            client.deposit("user_id", "1")
+
+    with pytest.raises(MessageException) as e:
+        client.deposit("user_id", "1")
+    assert e.value.status_code == 503
+    assert len(payments_server.received("deposit")) == 2
+
+    # A single trial call goes through once the circuit can be reset
+    now[0] = 30
+    payments_server.respond("deposit", 200, {})
+    assert breaker.state == "half_open"
+    client.deposit("user_id", "1")
+    assert breaker.state == "closed"
+    client.close()
+
+
+def test_failed_trial_call_opens_the_circuit_again():
+    now = [0.0]
+    breaker = CircuitBreaker(failures=1, reset_timeout=30, clock=lambda: now[0])
+    breaker.before_call()
+    breaker.record_failure()
+
+    now[0] = 30
+    breaker.before_call()
+    with pytest.raises(Exception):
+        # Only one trial call at a time
+        breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+
+
+def open_circuit(payments_server):
+    """Client whose circuit is half-open, with its clock"""
+    now = [0.0]
+    breaker = CircuitBreaker(failures=1, reset_timeout=30, clock=lambda: now[0])
+    client = PaymentsClient(payments_server.url, retries=0, breaker=breaker)
+    payments_server.respond("deposit", 500, {"error": "Internal"}, times=1)
+    with pytest.raises(MessageException):
+        client.deposit("user_id", "1")
+    now[0] = 30
+    assert breaker.state == "half_open"
+    return client, now
+
+
+def test_cancelled_trial_call_opens_the_circuit_again(payments_server):
+    client, now = open_circuit(payments_server)
+    payments_server.respond("deposit", 200, {}, delay=1, times=1)
+
+    async def deposit():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.adeposit("user_id", "1"), 0.1)
+        await client.aclose()
+
+    asyncio.run(deposit())
+
+    assert client.breaker.state == "open"
+    # Another trial call is let through later
+    now[0] = 60
+    client.deposit("user_id", "1")
+    assert client.breaker.state == "closed"
+    client.close()
+
+
+def test_trial_call_failing_unexpectedly_opens_the_circuit_again(
+    payments_server, monkeypatch
+):
+    client, now = open_circuit(payments_server)
+
+    def undecodable(*args, **kwargs):
+        raise httpx.DecodingError("Invalid gzip")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(client.client, "request", undecodable)
+        with pytest.raises(httpx.DecodingError):
+            client.deposit("user_id", "1")
+
+    assert client.breaker.state == "open"
+    assert client.metrics.snapshot()["deposit"]["outcomes"]["error"] == 1
+    now[0] = 60
+    client.deposit("user_id", "1")
+    assert client.breaker.state == "closed"
+    client.close()
+
+
+def test_payments_health_reports_calls(client, custom_requests_mock):
+    utils.post_user(client, "user_id", "user_name")
+
+    response = utils.get(client, "/health/payments", uid="user_id", unwrap=False)
+
+    assert response.status_code == 200
+    assert response.json()["circuit"] == "closed"
+    assert response.json()["operations"]["create_wallet"]["outcomes"] == {"ok": 1}
+
+
+def test_post_user_passes_idempotency_key_to_wallet(client, payments_server):
+    payments_server.respond("wallets", 503, {"error": "Unavailable"}, times=1)
+
+    response = client.post(
+        utils.API_VERSION_PREFIX + "/users/",
+        headers={"api_key": "key", "uid": "user_id", "Idempotency-Key": "key"},
+        data={"name": "name", "location": "location", "interests": "interests"},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["wallet"] == "0xA143"
+    headers = payments_server.received_headers("wallets")
+    assert [h["idempotency-key"] for h in headers] == ["key", "key"]
@@ -1,4 +1,10 @@
+import json
+
+import sqlalchemy as sa
+
+from src.database.models import playlist as playlist_model
 from tests import utils
+from tests.conftest import bound_session
 from tests.utils import (
     API_VERSION_PREFIX,
     post_song,
@@ -286,6 +292,35 @@ def test_owner_can_delete_song_from_playlist(client, custom_requests_mock, drop_
     assert response_delete.status_code == 200
 
 
+def test_owner_can_not_add_the_same_song_twice(
+    client, custom_requests_mock, drop_tables
+):
+    playlist_id = wrap_post_playlist(client)
+    song_id = post_song(client, uid="user_playlist_owner", name="new_song_for_playlist")
+    utils.add_playlist_song(client, playlist_id, song_id, "user_playlist_owner")
+
+    response_post = utils.add_playlist_song(
+        client, playlist_id, song_id, "user_playlist_owner"
+    )
+
+    assert response_post.status_code == 409
+    playlist = utils.get_playlist(client, playlist_id).json()
+    assert len(playlist["songs"]) == 3
+
+
+def test_owner_can_not_delete_song_that_is_not_in_playlist(
+    client, custom_requests_mock, drop_tables
+):
+    playlist_id = wrap_post_playlist(client)
+    song_id = post_song(client, uid="user_playlist_owner", name="new_song_for_playlist")
+
+    response_delete = utils.remove_playlist_song(
+        client, playlist_id, song_id, "user_playlist_owner"
+    )
+
+    assert response_delete.status_code == 409
+
+
 def test_get_my_playlists_returns_playlists_in_which_i_am_colab(
     client, custom_requests_mock, drop_tables
 ):
@@ -482,6 +517,26 @@ def test_admin_can_delete_playlist_of_another_user(
     assert response_get.status_code == 404
 
 
+def test_admin_with_unknown_uid_cannot_delete_playlist(
+    client, custom_requests_mock, drop_tables
+):
+    post_user(client, "user_playlist_owner", user_name="Paquito")
+    playlist_id = utils.post_playlist(
+        client,
+        playlist_name="playlist_name",
+        uid="user_playlist_owner",
+    )
+
+    response_delete = utils.delete_playlist(
+        client, playlist_id, uid="unknown_id", role="admin"
+    )
+    assert response_delete.status_code == 404
+
+    response_get = utils.get_playlist(client, playlist_id, uid="user_playlist_owner")
+
+    assert response_get.status_code == 200
+
+
 def test_admin_can_edit_playlist_of_another_user(
     client, custom_requests_mock, drop_tables
 ):
@@ -580,3 +635,255 @@ def test_update_playlist_colabs(client):
 
     assert response_get.status_code == 200
     assert len(playlist["colabs"]) == 0
+
+
+def test_get_playlist_has_first_songs_and_colabs(client, nested_limit):
+    nested_limit(2)
+    utils.post_users(client, "creator_id", "colab_1", "colab_2", "colab_3")
+    songs_ids = [
+        utils.post_song(client, uid="creator_id", name=f"song_{i}") for i in range(3)
+    ]
+    playlist_id = utils.post_playlist(
+        client,
+        uid="creator_id",
+        songs_ids=songs_ids,
+        colabs_ids=["colab_1", "colab_2", "colab_3"],
+    )
+
+    playlist = utils.get_playlist(client, playlist_id, uid="creator_id").json()
+
+    assert [song["id"] for song in playlist["songs"]] == songs_ids[:2]
+    assert [colab["id"] for colab in playlist["colabs"]] == ["colab_1", "colab_2"]
+    # Songs are paged by their position in the playlist
+    assert set(playlist["offsets"]) == {"songs", "colabs"}
+    assert playlist["offsets"]["colabs"] == "colab_2"
+
+    songs = utils.get_playlist_songs(
+        client, playlist_id, uid="creator_id", offset=playlist["offsets"]["songs"]
+    )
+    colabs = utils.get_playlist_colabs(
+        client, playlist_id, uid="creator_id", offset=playlist["offsets"]["colabs"]
+    )
+    assert [song["id"] for song in songs["items"]] == songs_ids[2:]
+    assert [colab["id"] for colab in colabs["items"]] == ["colab_3"]
+
+
+def test_get_playlist_leaves_out_blocked_songs(client):
+    utils.post_users(client, "creator_id")
+    songs_ids = [utils.post_song(client, uid="creator_id") for i in range(2)]
+    utils.block_song(client, songs_ids[0])
+    playlist_id = utils.post_playlist(client, uid="creator_id")
+    for song_id in songs_ids:
+        utils.add_playlist_song(
+            client, playlist_id, song_id, uid="creator_id", role="admin"
+        )
+
+    playlist = utils.get_playlist(client, playlist_id, uid="creator_id").json()
+    songs = utils.get_playlist_songs(client, playlist_id, uid="creator_id")
+    as_admin = utils.get_playlist(
+        client, playlist_id, uid="creator_id", role="admin"
+    ).json()
+
+    assert [song["id"] for song in playlist["songs"]] == songs_ids[1:]
+    assert [song["id"] for song in songs["items"]] == songs_ids[1:]
+    assert [song["id"] for song in as_admin["songs"]] == songs_ids
+
+
+def playlist_order(client, playlist_id):
+    songs = utils.get_playlist_songs(client, playlist_id, uid="creator_id")
+    return [song["id"] for song in songs["items"]]
+
+
+def positions(client, session, playlist_id):
+    async def select_positions():
+        async with bound_session(session) as pdb:
+            rows = await pdb.execute(
+                sa.text(
+                    "SELECT song_id, position FROM song_playlist_association "
+                    "WHERE playlist_id = :playlist_id"
+                ),
+                {"playlist_id": playlist_id},
+            )
+            return dict(rows.all())
+
+    return client.portal.call(select_positions)
+
+
+def post_songs_playlist(client, amount):
+    utils.post_users(client, "creator_id")
+    songs_ids = [
+        utils.post_song(client, uid="creator_id", name=f"song_{i}")
+        for i in range(amount)
+    ]
+    playlist_id = utils.post_playlist(client, uid="creator_id", songs_ids=songs_ids)
+    return playlist_id, songs_ids
+
+
+def test_playlist_songs_keep_the_order_they_were_given(client):
+    playlist_id, songs_ids = post_songs_playlist(client, 3)
+    utils.put_playlist(
+        client,
+        playlist_id,
+        {"songs_ids": json.dumps(songs_ids[::-1])},
+        uid="creator_id",
+    )
+
+    playlist = utils.get_playlist(client, playlist_id, uid="creator_id").json()
+
+    assert [song["id"] for song in playlist["songs"]] == songs_ids[::-1]
+    assert playlist_order(client, playlist_id) == songs_ids[::-1]
+
+
+def test_add_song_to_playlist_at_index(client):
+    playlist_id, songs_ids = post_songs_playlist(client, 3)
+    first = utils.post_song(client, uid="creator_id", name="first")
+    second = utils.post_song(client, uid="creator_id", name="second")
+    last = utils.post_song(client, uid="creator_id", name="last")
+
+    for song_id, index in [(second, 1), (first, 0), (last, 10)]:
+        response = utils.add_playlist_song(
+            client, playlist_id, song_id, uid="creator_id", index=index
+        )
+        assert response.status_code == 200
+
+    assert playlist_order(client, playlist_id) == [
+        first,
+        songs_ids[0],
+        second,
+        *songs_ids[1:],
+        last,
+    ]
+
+
+def test_move_playlist_song_writes_only_its_entry(client, session):
+    playlist_id, songs_ids = post_songs_playlist(client, 4)
+    before = positions(client, session, playlist_id)
+
+    response = utils.move_playlist_song(
+        client, playlist_id, songs_ids[3], 1, uid="creator_id"
+    )
+    assert response.status_code == 200
+
+    after = positions(client, session, playlist_id)
+    assert {song for song in before if before[song] != after[song]} == {songs_ids[3]}
+    assert playlist_order(client, playlist_id) == [
+        songs_ids[0],
+        songs_ids[3],
+        songs_ids[1],
+        songs_ids[2],
+    ]
+
+    utils.move_playlist_song(client, playlist_id, songs_ids[0], 3, uid="creator_id")
+    utils.move_playlist_song(client, playlist_id, songs_ids[2], 0, uid="creator_id")
+    assert playlist_order(client, playlist_id) == [
+        songs_ids[2],
+        songs_ids[3],
+        songs_ids[1],
+        songs_ids[0],
+    ]
+
+
+def test_move_song_not_in_playlist_should_fail(client):
+    playlist_id, _ = post_songs_playlist(client, 1)
+    song_id = utils.post_song(client, uid="creator_id", name="other")
+
+    response = utils.move_playlist_song(
+        client, playlist_id, song_id, 0, uid="creator_id"
+    )
+
+    assert response.status_code == 409
+
+
+def test_move_playlist_song_without_permission_should_fail(client):
+    playlist_id, songs_ids = post_songs_playlist(client, 2)
+    utils.post_users(client, "other_user")
+
+    response = utils.move_playlist_song(
+        client, playlist_id, songs_ids[1], 0, uid="other_user"
+    )
+
+    assert response.status_code == 403
+
+
+def test_playlist_is_renumbered_when_there_is_no_room_between_songs(
+    client, session, monkeypatch
+):
+    # Room for a single song between each two
+    monkeypatch.setattr(playlist_model, "POSITION_GAP", 2)
+    playlist_id, songs_ids = post_songs_playlist(client, 3)
+    inserted = [
+        utils.post_song(client, uid="creator_id", name=f"between_{i}") for i in range(2)
+    ]
+
+    for song_id in inserted:
+        utils.add_playlist_song(client, playlist_id, song_id, uid="creator_id", index=1)
+
+    assert playlist_order(client, playlist_id) == [
+        songs_ids[0],
+        inserted[1],
+        inserted[0],
+        *songs_ids[1:],
+    ]
+    assert len(set(positions(client, session, playlist_id).values())) == 5
+
+
+def test_get_playlist_songs_pages_in_playlist_order(client):
+    playlist_id, songs_ids = post_songs_playlist(client, 5)
+    utils.move_playlist_song(client, playlist_id, songs_ids[4], 0, uid="creator_id")
+    expected = [songs_ids[4], *songs_ids[:4]]
+
+    ids = []
+    offset = None
+    while True:
+        page = utils.get_playlist_songs(
+            client, playlist_id, uid="creator_id", offset=offset, limit=2
+        )
+        ids += [song["id"] for song in page["items"]]
+        if not page["items"]:
+            break
+        offset = page["offset"]
+
+    assert ids == expected
+    assert page["total"] == 5
+
+
+def test_get_playlist_songs_pages_songs_that_share_a_position(client, session):
+    playlist_id, songs_ids = post_songs_playlist(client, 5)
+
+    async def same_position():
+        await session.execute(
+            sa.text(
+                "UPDATE song_playlist_association SET position = 1 "
+                "WHERE playlist_id = :playlist_id"
+            ),
+            {"playlist_id": playlist_id},
+        )
+
+    client.portal.call(same_position)
+
+    ids = []
+    offset = None
+    while True:
+        page = utils.get_playlist_songs(
+            client, playlist_id, uid="creator_id", offset=offset, limit=2
+        )
+        ids += [song["id"] for song in page["items"]]
+        if not page["items"]:
+            break
+        offset = page["offset"]
+
+    assert ids == sorted(songs_ids)
+
+
+def test_get_playlist_songs_rejects_invalid_offsets(client):
+    playlist_id, _songs_ids = post_songs_playlist(client, 2)
+
+    for offset in ["1024", "a:1", "1024:a"]:
+        response = utils.get(
+            client,
+            f"/playlists/{playlist_id}/songs/",
+            uid="creator_id",
+            offset=offset,
+            limit=10,
+        )
+        assert response.status_code == 422
@@ -1,3 +1,7 @@
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from src.database import models
 from tests import utils
 from tests.utils import (
     API_VERSION_PREFIX,
@@ -388,3 +392,126 @@ def test_delete_album_deletes_reviews(client, custom_requests_mock):
     response_delete = utils.delete_album(client, album_id, "creator_id")
 
     assert response_delete.status_code == 200
+
+
+def test_edit_review_updates_album_score(client, custom_requests_mock):
+    post_user(client, "creator_id", user_name="creator_name")
+    post_user(client, "reviewer_id", user_name="reviewer_name")
+
+    album_id = post_album(client, uid="creator_id")
+    post_review(client, album_id, "reviewer_id", "bad song", 2)
+    utils.put_review_of_album(client, album_id, "good song", 4, "reviewer_id")
+
+    album = utils.get_album(client, album_id, unwrap=True)
+    assert album["score"] == 4
+    assert album["scores_amount"] == 1
+
+
+def test_delete_review_updates_album_score(client, custom_requests_mock):
+    post_user(client, "creator_id", user_name="creator_name")
+    post_user(client, "first_reviewer_id", user_name="first_reviewer_name")
+    post_user(client, "second_reviewer_id", user_name="second_reviewer_name")
+
+    album_id = post_album(client, uid="creator_id")
+    post_review(client, album_id, "first_reviewer_id", "bad song", 2)
+    post_review(client, album_id, "second_reviewer_id", "good song", 5)
+    utils.delete_review_of_album(client, album_id, uid="first_reviewer_id")
+
+    album = utils.get_album(client, album_id, unwrap=True)
+    assert album["score"] == 5
+    assert album["scores_amount"] == 1
+
+
+def test_review_without_score_does_not_affect_album_score(client, custom_requests_mock):
+    post_user(client, "creator_id", user_name="creator_name")
+    post_user(client, "first_reviewer_id", user_name="first_reviewer_name")
+    post_user(client, "second_reviewer_id", user_name="second_reviewer_name")
+
+    album_id = post_album(client, uid="creator_id")
+    post_review(client, album_id, "first_reviewer_id", "bad song", 2)
+    post_review(client, album_id, "second_reviewer_id", "no score", None)
+
+    album = utils.get_album(client, album_id, unwrap=True)
+    assert album["score"] == 2
+    assert album["scores_amount"] == 1
+
+
+def test_delete_reviewer_updates_album_score(client, custom_requests_mock):
+    post_user(client, "creator_id", user_name="creator_name")
+    post_user(client, "reviewer_id", user_name="reviewer_name")
+
+    album_id = post_album(client, uid="creator_id")
+    post_review(client, album_id, "reviewer_id", "bad song", 2)
+    utils.delete_user(client, "reviewer_id")
+
+    album = utils.get_album(client, album_id, uid="creator_id", unwrap=True)
+    assert album["score"] == 0
+    assert album["scores_amount"] == 0
+
+
+def test_get_albums_sorted_by_rating(client, custom_requests_mock):
+    post_user(client, "creator_id", user_name="creator_name")
+    post_user(client, "reviewer_id", user_name="reviewer_name")
+
+    album_id_1 = post_album(client, uid="creator_id", name="album_1")
+    album_id_2 = post_album(client, uid="creator_id", name="album_2")
+    post_album(client, uid="creator_id", name="album_3")
+    post_review(client, album_id_1, "reviewer_id", "bad album", 2)
+    post_review(client, album_id_2, "reviewer_id", "good album", 5)
+
+    response_get = utils.get(
+        client, "/albums/?sort_by=rating", uid="reviewer_id", offset=0, limit=2
+    )
+    first_page = response_get.json()
+    response_get = utils.get(
+        client,
+        "/albums/?sort_by=rating",
+        uid="reviewer_id",
+        offset=first_page["offset"],
+        limit=2,
+    )
+    second_page = response_get.json()
+
+    assert response_get.status_code == 200
+    assert [album["name"] for album in first_page["items"]] == ["album_2", "album_1"]
+    assert [album["name"] for album in second_page["items"]] == ["album_3"]
+
+
+def test_get_albums_filtered_by_min_score(client, custom_requests_mock):
+    post_user(client, "creator_id", user_name="creator_name")
+    post_user(client, "reviewer_id", user_name="reviewer_name")
+
+    album_id_1 = post_album(client, uid="creator_id", name="album_1")
+    album_id_2 = post_album(client, uid="creator_id", name="album_2")
+    post_review(client, album_id_1, "reviewer_id", "bad album", 2)
+    post_review(client, album_id_2, "reviewer_id", "good album", 5)
+
+    response_get = utils.get(client, "/albums/?min_score=3", uid="reviewer_id")
+    albums = response_get.json()
+
+    assert response_get.status_code == 200
+    assert [album["name"] for album in albums] == ["album_2"]
+
+
+def test_backfill_recomputes_album_scores(client, custom_requests_mock, session):
+    post_user(client, "creator_id", user_name="creator_name")
+    post_user(client, "reviewer_id", user_name="reviewer_name")
+
+    album_id = post_album(client, uid="creator_id")
+    post_review(client, album_id, "reviewer_id", "good song", 4)
+
+    async def backfill():
+        await session.execute(
+            sa.text("UPDATE albums SET score_sum = 0, score_count = 0")
+        )
+        await session.run_sync(backfill_scores)
+
+    def backfill_scores(connection):
+        with Session(bind=connection) as pdb:
+            models.AlbumModel.backfill_scores(pdb)
+
+    client.portal.call(backfill)
+
+    album = utils.get_album(client, album_id, unwrap=True)
+    assert album["score"] == 4
+    assert album["scores_amount"] == 1
@@ -0,0 +1,120 @@
+import os
+import signal
+import sys
+import threading
+import time
+
+import httpx
+
+from src import server
+
+
+def test_default_workers_one_for_each_cpu():
+    assert server.default_workers(cpus=4, available=8 * 1024**3) == 4
+
+
+def test_default_workers_fit_in_memory(monkeypatch):
+    monkeypatch.setattr(server, "SERVER_WORKER_MEMORY", 256)
+
+    assert server.default_workers(cpus=8, available=512 * 1024**2) == 2
+
+
+def test_default_workers_at_least_one():
+    assert server.default_workers(cpus=4, available=0) == 1
+
+
+def test_workers_serve_the_same_socket(run_server):
+    process, url = run_server(workers=2, SERVER_MAX_REQUESTS="0")
+
+    pids = set()
+    for _ in range(20):
+        response = httpx.get(url)
+        assert response.status_code == 200
+        pids.add(response.text)
+
+    assert str(process.pid) not in pids
+    assert len(pids) == 2
+
+
+def test_worker_is_recycled_after_max_requests(run_server):
+    _, url = run_server(
+        workers=1, SERVER_MAX_REQUESTS="2", SERVER_MAX_REQUESTS_JITTER="0"
+    )
+
+    pids = []
+    for _ in range(6):
+        response = httpx.get(url, timeout=10)
+        assert response.status_code == 200
+        pids.append(response.text)
+        # Workers check the amount of requests every 0.1 seconds
+        time.sleep(0.2)
+
+    assert len(set(pids)) >= 2
+
+
+def test_stop_finishes_requests_being_served(run_server):
+    process, url = run_server(workers=1)
+    responses = []
+    request = threading.Thread(
+        target=lambda: responses.append(httpx.get(f"{url}/slow", timeout=10))
+    )
+    request.start()
+    # The request reaches the worker before it is stopped
+    time.sleep(0.3)
+
+    process.send_signal(signal.SIGTERM)
+    request.join()
+
+    assert responses[0].status_code == 200
+    assert process.wait(timeout=10) == 0
+
+
+def test_stop_drops_requests_after_graceful_timeout(run_server):
+    process, url = run_server(workers=1, SERVER_GRACEFUL_TIMEOUT="0.2")
+    request = threading.Thread(target=lambda: _get_ignoring_errors(f"{url}/slow"))
+    request.start()
+    time.sleep(0.3)
+
+    process.send_signal(signal.SIGTERM)
+
+    assert process.wait(timeout=0.9) == 0
+    request.join()
+
+
+def _get_ignoring_errors(url):
+    try:
+        httpx.get(url, timeout=10)
+    except httpx.HTTPError:
+        pass
+
+
+def test_exit_code_of_killed_process():
+    pid = os.fork()
+    if not pid:
+        os.kill(os.getpid(), signal.SIGKILL)
+    _, status = os.waitpid(pid, 0)
+
+    assert server.exit_code(status) == -signal.SIGKILL
+
+
+def test_jobs_worker_is_started_again_when_it_exits():
+    supervisor = server.Supervisor(
+        config=None,
+        workers=0,
+        jobs_command=[sys.executable, "-c", "pass"],
+        jobs_restart_delay=0,
+    )
+
+    supervisor._start_jobs()
+    first = supervisor.jobs_pid
+    deadline = time.monotonic() + 5
+    while supervisor.jobs_pid in (None, first) and time.monotonic() < deadline:
+        supervisor._reap()
+        supervisor._start_jobs()
+        time.sleep(0.05)
+    second = supervisor.jobs_pid
+    supervisor._signal(signal.SIGKILL)
+    os.waitpid(second, 0)
+
+    assert first is not None
+    assert second not in (None, first)
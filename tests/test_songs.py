@@ -1,7 +1,8 @@
+import sqlalchemy as sa
 import time
 
 from tests import utils
-from tests.utils import post_song, post_user, post_album
+from tests.utils import post_song, post_user, post_album, post_users
 from tests.utils import API_VERSION_PREFIX
 from urllib.parse import urlparse
 from urllib.parse import parse_qs
@@ -230,6 +231,34 @@ def test_admin_can_edit_song_of_another_user(client, custom_requests_mock):
     assert response_put.status_code == 200
 
 
+def test_unknown_user_cannot_edit_song(client, custom_requests_mock):
+    post_user(client, "song_creator_id")
+    song_id = post_song(client, uid="song_creator_id")
+
+    response_put = utils.put_song(
+        client, song_id, {"name": "new_name"}, uid="unknown_id", role="artist"
+    )
+
+    assert response_put.status_code == 404
+
+
+def test_admin_with_unknown_uid_cannot_edit_or_delete_song(
+    client, custom_requests_mock
+):
+    post_user(client, "song_creator_id")
+    song_id = post_song(client, uid="song_creator_id")
+
+    response_put = utils.put_song(
+        client, song_id, {"name": "new_name"}, uid="unknown_id", role="admin"
+    )
+    response_delete = utils.delete_song(client, song_id, uid="unknown_id", role="admin")
+
+    assert response_put.status_code == 404
+    assert response_delete.status_code == 404
+    song = utils.get_song(client, song_id, uid="song_creator_id").json()
+    assert song["name"] == "song_name"
+
+
 def test_post_song_with_album(client, custom_requests_mock):
     post_user(client, "song_creator_id")
     album_id = post_album(client)
@@ -240,3 +269,84 @@ def test_post_song_with_album(client, custom_requests_mock):
 
     assert response.status_code == 200
     assert song["album"]["id"] == album_id
+
+
+def test_get_song_without_uid_header(client, custom_requests_mock):
+    song_id = post_song(client)
+
+    response = client.get(
+        f"{API_VERSION_PREFIX}/songs/{song_id}", headers={"api_key": "key"}
+    )
+
+    assert response.status_code == 422
+
+
+def test_get_song_of_unknown_user(client, custom_requests_mock):
+    song_id = post_song(client)
+
+    response = utils.get_song(client, song_id, uid="unknown_user_id")
+
+    assert response.status_code == 404
+
+
+def test_song_update_loads_the_requester_once(
+    client, custom_requests_mock, max_statements
+):
+    post_user(client, "song_creator_id")
+    song_id = post_song(client, uid="song_creator_id")
+
+    # The requester, the song and the update
+    with max_statements(3):
+        response_put = utils.put_song(
+            client, song_id, {"name": "new_name"}, uid="song_creator_id"
+        )
+
+    assert response_put.status_code == 200
+
+
+def test_forbidden_song_update_does_not_keep_its_changes(
+    client, custom_requests_mock, session
+):
+    post_users(client, "song_creator_id", "other_user_id")
+    song_id = post_song(client, uid="song_creator_id")
+
+    response_put = utils.put_song(
+        client, song_id, {"artists": '["ghost_artist"]'}, uid="other_user_id"
+    )
+
+    async def count_artists():
+        result = await session.execute(
+            sa.text("SELECT count(*) FROM artists WHERE name = 'ghost_artist'")
+        )
+        return result.scalar()
+
+    assert response_put.status_code == 403
+    assert client.portal.call(count_artists) == 0
+
+
+def test_post_song_is_not_reloaded_after_saving(
+    client, custom_requests_mock, max_statements
+):
+    uid = utils.get_uid_or_create(client)
+
+    # The requester, the artist lookup and insert, the song insert with its
+    # artists, the file url update
+    with max_statements(6):
+        response_post = post_song(client, uid=uid, unwrap_id=False)
+
+    assert response_post.status_code == 200
+
+
+def test_post_song_creates_its_artists_at_once(
+    client, custom_requests_mock, max_statements
+):
+    uid = utils.get_uid_or_create(client)
+    post_song(client, uid=uid, artists=["artist_0", "artist_1"])
+    artists = [f"artist_{i}" for i in range(10)]
+
+    with max_statements(6):
+        response_post = post_song(client, uid=uid, artists=artists, unwrap_id=False)
+
+    assert response_post.status_code == 200
+    song = utils.get_song(client, response_post.json()["id"], uid=uid, unwrap=True)
+    assert sorted(artist["name"] for artist in song["artists"]) == artists
@@ -250,3 +250,111 @@ def test_search_song_by_name(client, custom_requests_mock):
     assert response.status_code == 200
     assert len(songs) == 1
     assert songs[0]["name"] == "my_song_name"
+
+
+def test_search_song_by_name_matches_substrings(client, custom_requests_mock):
+    post_song(client, name="Happy-Birthday song")
+    post_song(client, name="unhappy")
+    post_song(client, name="sad")
+
+    response = utils.search_songs(client, name="APPY")
+    songs = response.json()
+
+    assert response.status_code == 200
+    assert sorted(song["name"] for song in songs) == ["Happy-Birthday song", "unhappy"]
+
+
+def test_search_song_by_artist_matches_substrings(client, custom_requests_mock):
+    post_song(client, name="happy", artists=["the beatles"])
+    post_song(client, name="sad", artists=["queen"])
+
+    response = utils.search_songs(client, artist="eatle")
+    songs = response.json()
+
+    assert response.status_code == 200
+    assert [song["name"] for song in songs] == ["happy"]
+
+
+def test_search_song_by_name_matches_word_prefixes(client, custom_requests_mock):
+    post_song(client, name="Happy-Birthday song")
+    post_song(client, name="unhappy")
+
+    response = utils.search_songs(client, name="birth hap", match="prefix")
+    songs = response.json()
+
+    assert response.status_code == 200
+    assert len(songs) == 1
+    assert songs[0]["name"] == "Happy-Birthday song"
+
+
+def test_search_song_with_invalid_match(client, custom_requests_mock):
+    response = utils.search_songs(client, name="love", match="regex")
+
+    assert response.status_code == 422
+
+
+def test_search_song_by_name_orders_by_relevance(client, custom_requests_mock):
+    post_song(client, name="my love song remix")
+    post_song(client, name="love")
+
+    response = utils.search_songs(client, name="love", match="prefix")
+    songs = response.json()
+
+    assert response.status_code == 200
+    assert [song["name"] for song in songs] == ["love", "my love song remix"]
+
+
+def test_search_song_by_name_substring_orders_by_similarity(
+    client, custom_requests_mock
+):
+    post_song(client, name="my love song remix")
+    post_song(client, name="lovely")
+    post_song(client, name="love")
+
+    response = utils.search_songs(client, name="love")
+    songs = response.json()
+
+    assert response.status_code == 200
+    assert [song["name"] for song in songs] == ["love", "lovely", "my love song remix"]
+
+
+def test_search_song_by_name_substring_pages_by_similarity(
+    client, custom_requests_mock
+):
+    post_song(client, name="my love song remix")
+    post_song(client, name="love")
+
+    endpoint = "/songs/?name=love"
+    response = utils.get(client, endpoint, offset=0, limit=1)
+    first_page = response.json()
+    response = utils.get(client, endpoint, offset=first_page["offset"], limit=1)
+    second_page = response.json()
+
+    assert response.status_code == 200
+    assert first_page["items"][0]["name"] == "love"
+    assert second_page["items"][0]["name"] == "my love song remix"
+
+
+def test_search_song_by_name_pages_by_relevance(client, custom_requests_mock):
+    post_song(client, name="my love song remix")
+    post_song(client, name="love")
+
+    endpoint = "/songs/?name=love&match=prefix"
+    response = utils.get(client, endpoint, offset=0, limit=1)
+    first_page = response.json()
+    response = utils.get(client, endpoint, offset=first_page["offset"], limit=1)
+    second_page = response.json()
+
+    assert response.status_code == 200
+    assert first_page["items"][0]["name"] == "love"
+    assert second_page["items"][0]["name"] == "my love song remix"
+
+
+def test_search_song_by_name_with_invalid_offset(client, custom_requests_mock):
+    post_song(client, name="love")
+
+    response = utils.get(
+        client, "/songs/?name=love&match=prefix", offset="invalid", limit=1
+    )
+
+    assert response.status_code == 422
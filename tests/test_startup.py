@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+
+from tests.conftest import SQLALCHEMY_DATABASE_URL
+
+
+def test_importing_the_app_does_not_load_firebase():
+    # Outside of tests, where access.py would build the real clients
+    env = {**os.environ, "TESTING": "0", "POSTGRES_URL": SQLALCHEMY_DATABASE_URL}
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; import src.main; "
+            "print([m for m in sys.modules if m.startswith(('firebase', 'google'))])",
+        ],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+    assert output.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,135 @@
+import logging
+
+import pytest
+
+from tests import utils
+from src.database import statements
+from src.database.statements import TooManyStatementsError
+
+
+def test_songs_page_statements_do_not_grow_with_the_page(
+    client, custom_requests_mock, drop_tables, max_statements
+):
+    for i in range(10):
+        utils.post_song(client, name=f"song_{i}", artists=[f"a_{i}", f"b_{i}"])
+
+    with max_statements(4):
+        response = utils.search_songs(client, limit=10)
+
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 10
+    assert response.json()["items"][0]["artists"] == [
+        {"name": "a_0"},
+        {"name": "b_0"},
+    ]
+
+
+def test_get_album_statements_do_not_grow_with_its_songs(
+    client, custom_requests_mock, drop_tables, max_statements
+):
+    uid = utils.get_uid_or_create(client)
+    songs_ids = [utils.post_song(client, uid=uid, name=f"song_{i}") for i in range(5)]
+    album_id = utils.post_album(client, uid=uid, songs_ids=songs_ids)
+
+    # The album and its first songs are read apart, so that the album can
+    # come from the entity cache
+    with max_statements(5):
+        response = utils.get_album(client, album_id)
+
+    assert response.status_code == 200
+    assert len(response.json()["songs"]) == 5
+    assert response.json()["songs"][0]["artists"] == [{"name": "song_artist_name"}]
+
+
+def test_get_user_statements_do_not_grow_with_its_resources(
+    client, custom_requests_mock, drop_tables, max_statements
+):
+    uid = utils.get_uid_or_create(client)
+    for i in range(3):
+        utils.post_album_with_song(client, uid=uid, album_name=f"album_{i}")
+        utils.post_playlist(client, uid=uid, playlist_name=f"playlist_{i}")
+
+    with max_statements(6):
+        response = utils.get(client, f"/users/{uid}", uid)
+
+    assert response.status_code == 200
+    assert len(response.json()["songs"]) == 3
+    assert len(response.json()["albums"]) == 3
+    assert len(response.json()["my_playlists"]) == 3
+
+
+def test_comment_threads_statements_grow_with_the_depth_only(
+    client, custom_requests_mock, drop_tables, max_statements
+):
+    album_id = utils.post_album(client)
+    for i in range(3):
+        comment_id = utils.post_comment(client, album_id, message=f"comment_{i}")
+        response_id = utils.post_comment(client, album_id, parent_id=comment_id)
+        utils.post_comment(client, album_id, parent_id=response_id)
+
+    with max_statements(10):
+        response = utils.get_album_comments(client, album_id)
+
+    assert response.status_code == 200
+    comments = response.json()
+    assert len(comments) == 3
+    assert len(comments[0]["responses"][0]["responses"]) == 1
+
+
+def test_request_over_the_statements_limit_fails(
+    client, custom_requests_mock, drop_tables, max_statements
+):
+    utils.post_song(client)
+
+    with max_statements(1), pytest.raises(TooManyStatementsError):
+        utils.search_songs(client)
+
+
+def test_response_reports_its_statements(client, custom_requests_mock, drop_tables):
+    utils.post_song(client)
+
+    response = utils.search_songs(client, limit=10)
+
+    assert response.status_code == 200
+    queries = int(response.headers["X-DB-Queries"])
+    assert queries > 0
+    timing = response.headers["Server-Timing"]
+    assert f'desc="{queries} queries"' in timing
+    assert "db;dur=" in timing
+    assert "db-slowest;dur=" in timing
+    assert "app;dur=" in timing
+
+
+def test_slow_statements_are_logged_with_their_plan(
+    client, custom_requests_mock, drop_tables, monkeypatch, caplog
+):
+    song_id = utils.post_song(client)
+    monkeypatch.setattr(statements, "slow_threshold", 0.001)
+    monkeypatch.setattr(statements, "explain_slow", True)
+
+    with caplog.at_level(logging.WARNING, logger=statements.__name__):
+        response = utils.get_song(client, song_id)
+
+    assert response.status_code == 200
+    logs = [
+        r.getMessage() for r in caplog.records if "Slow statement" in r.getMessage()
+    ]
+    assert any("SELECT" in log and "Buffers" in log for log in logs)
+    # The request still sees its data after the plans rolled back
+    assert response.json()["id"] == song_id
+
+
+def test_slow_writes_are_logged_without_running_them_again(
+    client, custom_requests_mock, drop_tables, monkeypatch, caplog
+):
+    monkeypatch.setattr(statements, "slow_threshold", 0.001)
+    monkeypatch.setattr(statements, "explain_slow", True)
+
+    with caplog.at_level(logging.WARNING, logger=statements.__name__):
+        utils.post_song(client, name="once")
+    monkeypatch.setattr(statements, "slow_threshold", 0)
+
+    inserts = [r.getMessage() for r in caplog.records if "INSERT" in r.getMessage()]
+    assert inserts
+    assert not any("Plan:" in log for log in inserts)
+    assert len(utils.search_songs(client, name="once", unwrap=True)) == 1
@@ -1,14 +1,13 @@
+import contextlib
 import datetime
 
+import sqlalchemy as sa
 from dateutil import parser
 
-from src.utils.subscription import SUBSCRIPTIONS
+from src.scheduler import LOCK_KEY, Scheduler
+from src.utils.subscription import SUBSCRIPTIONS, revoke_subscription
 from tests import utils
-from tests.conftest import (
-    successful_payment_matcher,
-    failed_payment_matcher,
-    failed_wallet_creation_matcher,
-)
+from tests.conftest import bound_session, engine
 from tests.utils import API_VERSION_PREFIX, post_user, post_user_with_sub_level
 
 
@@ -39,8 +38,6 @@ def test_post_user_creates_user_with_level_free_and_wallet(
 
 
 def test_user_subscribes_to_premium(client, custom_requests_mock):
-    custom_requests_mock.add_matcher(successful_payment_matcher)
-
     post_user(client, "user_id", "user_name")
     response = client.post(
         f"{API_VERSION_PREFIX}/subscriptions/",
@@ -62,8 +59,6 @@ def test_user_subscribes_to_premium(client, custom_requests_mock):
 
 
 def test_user_subscribes_to_pro(client, custom_requests_mock):
-    custom_requests_mock.add_matcher(successful_payment_matcher)
-
     post_user(client, "user_id", "user_name")
     response = client.post(
         f"{API_VERSION_PREFIX}/subscriptions/",
@@ -104,9 +99,9 @@ def test_user_with_premium_returns_to_free(client, custom_requests_mock):
 
 
 def test_user_attempts_to_subscribe_to_premium_but_payment_fails(
-    client, custom_requests_mock
+    client, custom_requests_mock, payments_server
 ):
-    custom_requests_mock.add_matcher(failed_payment_matcher)
+    payments_server.respond("deposit", 400, {"error": "Payment failed"})
 
     post_user(client, "user_id", "user_name")
     response = client.post(
@@ -125,8 +120,10 @@ def test_user_attempts_to_subscribe_to_premium_but_payment_fails(
     assert user["sub_expires"] is None
 
 
-def test_post_user_but_wallet_creation_fails(client, custom_requests_mock):
-    custom_requests_mock.add_matcher(failed_wallet_creation_matcher)
+def test_post_user_but_wallet_creation_fails(
+    client, custom_requests_mock, payments_server
+):
+    payments_server.respond("wallets", 400, {"error": "Wallet creation failed"})
 
     response = post_user(client, "user_id", "user_name")
 
@@ -292,3 +289,184 @@ def test_only_admin_can_revoke_subscriptions(client, custom_requests_mock):
         headers={"api_key": "key", "uid": "user_id"},
     )
     assert response.status_code == 403
+
+
+def stored_sub_level(client, session, uid):
+    """Level in the table, which is not lowered until the subscription is
+    revoked"""
+
+    async def select():
+        return await session.scalar(
+            sa.text("SELECT sub_level FROM users WHERE id = :id"), {"id": uid}
+        )
+
+    return client.portal.call(select)
+
+
+def expire_subscriptions(client, session):
+    # Committed, so that a later request that fails does not roll it back
+    async def expire():
+        async with bound_session(session) as pdb:
+            await pdb.execute(
+                sa.text(
+                    "UPDATE users SET sub_expires = now() - interval '1 day' "
+                    "WHERE sub_expires IS NOT NULL"
+                )
+            )
+            await pdb.commit()
+
+    client.portal.call(expire)
+
+
+def test_revoke_returns_how_many_subscriptions_it_revoked(
+    client, custom_requests_mock, time_now_40_days_future
+):
+    post_user_with_sub_level(client, "user_id", "user_name", 1)
+    post_user_with_sub_level(client, "user_id_2", "user_name_2", 2)
+    post_user(client, "admin_id", "admin_name")
+
+    response = client.post(
+        f"{API_VERSION_PREFIX}/subscriptions/revoke/",
+        headers={"api_key": "key", "uid": "admin_id", "role": "admin"},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"revoked": 2}
+
+
+def test_revoke_in_batches(client, custom_requests_mock, session):
+    for i in range(5):
+        post_user_with_sub_level(client, f"user_{i}", f"user_name_{i}", 1)
+    expire_subscriptions(client, session)
+
+    async def revoke():
+        async with bound_session(session) as pdb:
+            revoked = await pdb.run_sync(
+                revoke_subscription, datetime.datetime.now(), batch_size=2
+            )
+            await pdb.commit()
+            return revoked
+
+    assert client.portal.call(revoke) == 5
+    for i in range(5):
+        user = utils.get_user(client, f"user_{i}").json()
+        assert user["sub_level"] == 0
+        assert user["sub_expires"] is None
+
+
+def pinned_session(session):
+    @contextlib.asynccontextmanager
+    async def pinned():
+        async with bound_session(session) as pdb:
+            yield pdb
+
+    return pinned
+
+
+def test_scheduler_revokes_expired_subscriptions(client, custom_requests_mock, session):
+    post_user_with_sub_level(client, "user_id", "user_name", 1)
+    post_user_with_sub_level(client, "user_id_2", "user_name_2", 3)
+    expire_subscriptions(client, session)
+    post_user_with_sub_level(client, "user_id_3", "user_name_3", 1)
+
+    results = client.portal.call(Scheduler(pinned_session(session)).tick)
+
+    assert results["revoke_subscriptions"] == 2
+    assert stored_sub_level(client, session, "user_id") == 0
+    assert stored_sub_level(client, session, "user_id_3") == 1
+
+
+def test_scheduler_skips_tick_while_another_worker_runs_it(
+    client, custom_requests_mock, session
+):
+    post_user_with_sub_level(client, "user_id", "user_name", 1)
+    expire_subscriptions(client, session)
+
+    with engine.connect() as other_worker:
+        other_worker.execute(sa.select(sa.func.pg_advisory_lock(LOCK_KEY)))
+        try:
+            results = client.portal.call(Scheduler(pinned_session(session)).tick)
+        finally:
+            other_worker.execute(sa.select(sa.func.pg_advisory_unlock(LOCK_KEY)))
+
+    assert "revoke_subscriptions" not in results
+    assert stored_sub_level(client, session, "user_id") == 1
+
+
+def test_scheduler_skips_tasks_another_worker_ran_this_interval(
+    client, custom_requests_mock, session
+):
+    post_user_with_sub_level(client, "user_id", "user_name", 1)
+    expire_subscriptions(client, session)
+    client.portal.call(Scheduler(pinned_session(session)).tick)
+
+    post_user_with_sub_level(client, "user_id_2", "user_name_2", 1)
+    expire_subscriptions(client, session)
+    results = client.portal.call(Scheduler(pinned_session(session)).tick)
+
+    assert "revoke_subscriptions" not in results
+    assert stored_sub_level(client, session, "user_id_2") == 1
+
+
+def test_expired_subscription_is_enforced_before_it_is_revoked(
+    client, custom_requests_mock, session, expired_users
+):
+    post_user_with_sub_level(client, "user_id", "user_name", 1)
+    post_user(client, "creator_id", "creator_name")
+    song_id = utils.post_song(client, uid="creator_id", name="song_name", sub_level=1)
+    expire_subscriptions(client, session)
+
+    response = utils.get_song(client, song_id, uid="user_id")
+
+    assert response.status_code == 403
+    assert utils.get_user(client, "user_id").json()["sub_level"] == 0
+    assert stored_sub_level(client, session, "user_id") == 1
+    assert expired_users.pending() == 1
+
+
+def test_flush_revokes_subscriptions_seen_expired(
+    client, custom_requests_mock, session, expired_users
+):
+    post_user(client, "creator_id", "creator_name")
+    song_id = utils.post_song(client, uid="creator_id", name="song_name", sub_level=1)
+    for i in range(3):
+        post_user_with_sub_level(client, f"user_{i}", f"user_name_{i}", 1)
+    expire_subscriptions(client, session)
+    for i in range(3):
+        utils.get_song(client, song_id, uid=f"user_{i}")
+
+    async def flush():
+        async with bound_session(session) as pdb:
+            revoked = await expired_users.flush(pdb)
+            await pdb.commit()
+            return revoked
+
+    assert client.portal.call(flush) == 3
+    assert expired_users.pending() == 0
+    for i in range(3):
+        assert stored_sub_level(client, session, f"user_{i}") == 0
+
+
+def test_get_songs_playable_by_the_requester(client, custom_requests_mock, session):
+    post_user_with_sub_level(client, "user_id", "user_name", 2)
+    post_user(client, "creator_id", "creator_name")
+    for sub_level in range(4):
+        utils.post_song(
+            client, uid="creator_id", name=f"song_{sub_level}", sub_level=sub_level
+        )
+
+    def playable(uid, role="listener"):
+        response = client.get(
+            f"{API_VERSION_PREFIX}/songs/",
+            params={"playable": True},
+            headers={"api_key": "key", "uid": uid, "role": role},
+        )
+        assert response.status_code == 200
+        return sorted(song["name"] for song in response.json()["items"])
+
+    assert playable("user_id") == ["song_0", "song_1", "song_2"]
+    assert playable("creator_id") == ["song_0"]
+    assert len(playable("creator_id", role="admin")) == 4
+
+    expire_subscriptions(client, session)
+    assert playable("user_id") == ["song_0"]
@@ -0,0 +1,157 @@
+import requests
+
+from src.firebase import uploads
+from src.mocks.firebase.bucket import bucket_mock
+from tests import utils
+from tests.utils import API_VERSION_PREFIX, header, post_album, post_song, post_user
+
+
+def post_song_without_file(client, uid: str):
+    response_post = client.post(
+        API_VERSION_PREFIX + "/songs/",
+        data={
+            "name": "song_name",
+            "description": "song_desc",
+            "artists": '["song_artist_name"]',
+            "genre": "song_genre",
+        },
+        headers=header(uid, role="artist"),
+    )
+    assert response_post.status_code == 200
+    return response_post.json()["id"]
+
+
+def test_post_song_without_file(client, custom_requests_mock):
+    post_user(client, "creator_id", "creator_name")
+    song_id = post_song_without_file(client, "creator_id")
+
+    song = utils.get_song(client, song_id, uid="creator_id", unwrap=True)
+
+    assert song["file"] is None
+
+
+def test_upload_song_file_through_signed_url(client, custom_requests_mock):
+    post_user(client, "creator_id", "creator_name")
+    song_id = post_song_without_file(client, "creator_id")
+
+    response = utils.upload_file(client, f"songs/{song_id}", "creator_id", b"song")
+
+    assert response.status_code == 200
+    assert response.json()["file"].startswith("https://example.com?t=")
+    assert bucket_mock.blob(f"songs/{song_id}").data == b"song"
+    song = utils.get_song(client, song_id, uid="creator_id", unwrap=True)
+    assert song["file"] == response.json()["file"]
+
+
+def test_cannot_get_upload_url_of_song_of_another_user(client, custom_requests_mock):
+    utils.post_users(client, "creator_id", "other_id")
+    song_id = post_song(client, uid="creator_id")
+
+    response = utils.post(client, f"/songs/{song_id}/upload_url", {}, "other_id")
+
+    assert response.status_code == 403
+
+
+def test_finalize_without_uploading_fails(client, custom_requests_mock):
+    post_user(client, "creator_id", "creator_name")
+    song_id = post_song_without_file(client, "creator_id")
+    upload = utils.post(client, f"/songs/{song_id}/upload_url", {}, "creator_id")
+
+    response = utils.finalize_upload(
+        client, f"songs/{song_id}", "creator_id", upload.json()["upload_id"]
+    )
+
+    assert response.status_code == 404
+    song = utils.get_song(client, song_id, uid="creator_id", unwrap=True)
+    assert song["file"] is None
+
+
+def test_upload_is_kept_apart_until_it_is_finalized(client, custom_requests_mock):
+    post_user(client, "creator_id", "creator_name")
+    song_id = post_song_without_file(client, "creator_id")
+    utils.upload_file(client, f"songs/{song_id}", "creator_id", b"old")
+
+    upload = utils.post(client, f"/songs/{song_id}/upload_url", {}, "creator_id")
+    requests.put(upload.json()["upload_url"], data=b"new")
+
+    # The file served is still the old one
+    assert bucket_mock.blob(f"songs/{song_id}").data == b"old"
+    staging = uploads.staging_blob_name(f"songs/{song_id}", upload.json()["upload_id"])
+    assert bucket_mock.blob(staging).data == b"new"
+
+    response = utils.finalize_upload(
+        client, f"songs/{song_id}", "creator_id", upload.json()["upload_id"]
+    )
+
+    assert response.status_code == 200
+    assert bucket_mock.blob(f"songs/{song_id}").data == b"new"
+    assert not bucket_mock.blob(staging).exists()
+
+
+def test_finalize_empty_upload_fails(client, custom_requests_mock):
+    post_user(client, "creator_id", "creator_name")
+    song_id = post_song_without_file(client, "creator_id")
+
+    response = utils.upload_file(client, f"songs/{song_id}", "creator_id", b"")
+
+    assert response.status_code == 422
+
+
+def test_finalize_too_large_upload_fails(client, custom_requests_mock, monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_SIZE", 3)
+    post_user(client, "creator_id", "creator_name")
+    song_id = post_song_without_file(client, "creator_id")
+    uploaded = utils.upload_file(client, f"songs/{song_id}", "creator_id", b"old")
+
+    response = utils.upload_file(client, f"songs/{song_id}", "creator_id", b"song")
+
+    assert response.status_code == 413
+    # The file already recorded is left as it was
+    assert bucket_mock.blob(f"songs/{song_id}").data == b"old"
+    song = utils.get_song(client, song_id, uid="creator_id", unwrap=True)
+    assert song["file"] == uploaded.json()["file"]
+    assert not [
+        name
+        for name, blob in bucket_mock.files.items()
+        if name.startswith("uploads/") and blob.exists()
+    ]
+
+
+def test_expired_upload_url_is_rejected(client, custom_requests_mock, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_URL_EXPIRATION", -1)
+    post_user(client, "creator_id", "creator_name")
+    song_id = post_song_without_file(client, "creator_id")
+
+    upload = utils.post(client, f"/songs/{song_id}/upload_url", {}, "creator_id")
+    response_put = requests.put(upload.json()["upload_url"], data=b"song")
+
+    assert response_put.status_code == 400
+
+
+def test_upload_album_cover_through_signed_url(client, custom_requests_mock):
+    post_user(client, "creator_id", "creator_name")
+    album_id = post_album(client, uid="creator_id")
+
+    response = utils.upload_file(client, f"albums/{album_id}", "creator_id", b"cover")
+
+    assert response.status_code == 200
+    assert response.json()["cover"].startswith("https://example.com?t=")
+    assert bucket_mock.blob(f"albums/{album_id}").data == b"cover"
+
+
+def test_upload_pfp_through_signed_url(client, custom_requests_mock):
+    post_user(client, "user_id", "user_name")
+
+    response = utils.upload_file(client, "users/user_id", "user_id", b"pfp")
+
+    assert response.status_code == 200
+    assert response.json()["pfp"].startswith("https://example.com?t=")
+    assert bucket_mock.blob("pfp/user_id").data == b"pfp"
+
+
+def test_cannot_upload_pfp_of_another_user(client, custom_requests_mock):
+    utils.post_users(client, "user_id", "other_id")
+
+    response = utils.post(client, "/users/user_id/upload_url", {}, "other_id")
+
+    assert response.status_code == 403
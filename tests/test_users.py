@@ -13,6 +13,8 @@ from tests.utils import (
 from urllib.parse import urlparse
 from urllib.parse import parse_qs
 
+from src.mocks.firebase.auth import auth_mock
+
 
 def test_unauthorized_get(client, custom_requests_mock):
     response = client.get(f"{API_VERSION_PREFIX}/users/")
@@ -264,6 +266,25 @@ def non_listener_cant_become_artist(client, custom_requests_mock):
     assert response.status_code == 405
 
 
+def test_unknown_user_cannot_become_artist(client, custom_requests_mock, monkeypatch):
+    claims = []
+    monkeypatch.setattr(
+        auth_mock, "set_custom_user_claims", lambda *args: claims.append(args)
+    )
+
+    response = client.post(
+        API_VERSION_PREFIX + "/users/make_artist/",
+        headers={
+            "uid": "unknown_id",
+            "role": "listener",
+            "api_key": "key",
+        },
+    )
+
+    assert response.status_code == 404
+    assert claims == []
+
+
 def test_get_all_users_return_users_with_pfp_url(client, custom_requests_mock):
     post_user(client, "user_id", "user_name", include_pfp=True)
     post_user(client, "another_user_id", "another_user_name", include_pfp=True)
@@ -348,3 +369,41 @@ def test_delete_user_that_is_owner_of_playlist_gives_ownership_to_another_user(
 
     assert response_get.status_code == 200
     assert playlist["creator_id"] == "user_playlist_colab"
+
+
+def test_get_user_has_first_songs_and_offset_of_the_rest(client, nested_limit):
+    nested_limit(2)
+    post_user(client, "user_id", "user_name")
+    songs_ids = [
+        utils.post_song(client, uid="user_id", name=f"song_{i}") for i in range(3)
+    ]
+    utils.post_album(client, uid="user_id")
+
+    user = utils.get_user(client, "user_id").json()
+
+    assert [song["id"] for song in user["songs"]] == songs_ids[:2]
+    assert len(user["albums"]) == 1
+    assert user["offsets"] == {"songs": str(songs_ids[1])}
+
+    page = utils.get_user_resources(
+        client, "user_id", "songs", offset=user["offsets"]["songs"]
+    )
+    assert [song["id"] for song in page["items"]] == songs_ids[2:]
+
+
+def test_get_user_albums_and_playlists(client):
+    post_user(client, "user_id", "user_name")
+    post_user(client, "colab_id", "colab_name")
+    post_user(client, "other_colab_id", "other_colab_name")
+    album_id = utils.post_album(client, uid="user_id")
+    playlist_id = utils.post_playlist(
+        client, uid="user_id", colabs_ids=["colab_id", "other_colab_id"]
+    )
+
+    albums = utils.get_user_resources(client, "user_id", "albums")
+    playlists = utils.get_user_resources(client, "user_id", "playlists")
+
+    assert [album["id"] for album in albums["items"]] == [album_id]
+    assert [playlist["id"] for playlist in playlists["items"]] == [playlist_id]
+    response = utils.get(client, "/users/missing_id/songs/", "user_id")
+    assert response.status_code == 404
@@ -400,6 +400,31 @@ def post_user_with_sub_level(client, user_id: str, user_name: str, sub_level: in
     return response
 
 
+def upload_file(
+    client,
+    resource: str,
+    uid: str,
+    data: bytes = b"test",
+    role: str = "listener",
+):
+    """Uploads the file of the resource (e.g. 'songs/1' or 'users/uid')
+    through a signed url and returns the response of finalizing it"""
+    upload = post(client, f"/{resource}/upload_url", {}, uid, role=role)
+    assert upload.status_code == 200
+    response_put = requests.put(upload.json()["upload_url"], data=data)
+    assert response_put.status_code == 200
+
+    return finalize_upload(client, resource, uid, upload.json()["upload_id"], role)
+
+
+def finalize_upload(
+    client, resource: str, uid: str, upload_id: str, role: str = "listener"
+):
+    finalize = {"songs": "file", "albums": "cover", "users": "pfp"}
+    endpoint = f"/{resource}/{finalize[resource.split('/')[0]]}"
+    return post(client, endpoint, {"upload_id": upload_id}, uid, role=role)
+
+
 def delete_user(client, user_id: str):
     return delete(client, f"/users/{user_id}", uid=user_id)
 
@@ -559,6 +584,17 @@ def get_album(
     return get(client, f"/albums/{album_id}", uid, role, unwrap)
 
 
+def get_album_songs(
+    client,
+    album_id: int,
+    uid: Optional[str] = None,
+    role: str = "listener",
+    offset: Optional[str] = None,
+    limit: Optional[int] = 50,
+):
+    return get(client, f"/albums/{album_id}/songs/", uid, role, True, offset, limit)
+
+
 def add_query(endpoint: str, query: str):
     if "?" in endpoint:
         return f"{endpoint}&{query}"
@@ -645,6 +681,7 @@ def search_songs(
     name: Optional[str] = None,
     creator: Optional[str] = None,
     sub_level: Optional[int] = None,
+    match: Optional[str] = None,
     uid: Optional[str] = None,
     role: str = "listener",
     unwrap=False,
@@ -658,6 +695,7 @@ def search_songs(
         ("name", name),
         ("creator", creator),
         ("sub_level", sub_level),
+        ("match", match),
     ):
         if value is not None:
             endpoint = add_query(endpoint, f"{search_term}={value}")
@@ -708,6 +746,32 @@ def get_playlist(
     return get(client, f"/playlists/{playlist_id}", uid, role, unwrap)
 
 
+def get_playlist_songs(
+    client,
+    playlist_id: int,
+    uid: Optional[str] = None,
+    role: str = "listener",
+    offset: Optional[str] = None,
+    limit: Optional[int] = 50,
+):
+    return get(
+        client, f"/playlists/{playlist_id}/songs/", uid, role, True, offset, limit
+    )
+
+
+def get_playlist_colabs(
+    client,
+    playlist_id: int,
+    uid: Optional[str] = None,
+    role: str = "listener",
+    offset: Optional[str] = None,
+    limit: Optional[int] = 50,
+):
+    return get(
+        client, f"/playlists/{playlist_id}/colabs/", uid, role, True, offset, limit
+    )
+
+
 def get_my_playlists(
     client,
     uid: Optional[str] = None,
@@ -767,17 +831,40 @@ def add_playlist_song(
     uid: Optional[str] = None,
     role: str = "listener",
     unwrap=False,
+    index: Optional[int] = None,
 ):
+    data = {"song_id": song_id}
+    if index is not None:
+        data["index"] = index
     return post(
         client,
         f"/playlists/{playlist_id}/songs/",
-        {"song_id": song_id},
+        data,
         uid,
         role,
         unwrap=unwrap,
     )
 
 
+def move_playlist_song(
+    client,
+    playlist_id: int,
+    song_id: int,
+    index: int,
+    uid: Optional[str] = None,
+    role: str = "listener",
+    unwrap=False,
+):
+    return put(
+        client,
+        f"/playlists/{playlist_id}/songs/{song_id}/",
+        {"index": index},
+        uid,
+        role,
+        unwrap,
+    )
+
+
 def remove_playlist_song(
     client,
     playlist_id: int,
@@ -866,6 +953,42 @@ def post_comment(
     return response
 
 
+def get_album_thread(
+    client,
+    album_id: int,
+    max_depth: Optional[int] = None,
+    responses_limit: Optional[int] = None,
+    uid: Optional[str] = None,
+    role: str = "listener",
+):
+    if uid is None:
+        uid = get_uid_or_create(client)
+    return client.get(
+        f"{API_VERSION_PREFIX}/albums/{album_id}/comments/",
+        headers={"api_key": "key", "uid": uid, "role": role},
+        params={"max_depth": max_depth, "responses_limit": responses_limit},
+    )
+
+
+def get_comment_responses(
+    client,
+    comment_id: int,
+    uid: Optional[str] = None,
+    role: str = "listener",
+    offset: Optional[str] = None,
+    limit: Optional[int] = 50,
+):
+    return get(
+        client,
+        f"/albums/comments/{comment_id}/responses/",
+        uid,
+        role,
+        True,
+        offset,
+        limit,
+    )
+
+
 def get_user_comments(
     client,
     uid: Optional[str] = None,
@@ -984,3 +1107,27 @@ def get_streamings(
     limit: Optional[int] = None,
 ):
     return get(client, "/streamings/", uid, role, unwrap, offset, limit)
+
+
+def get_db_health(client):
+    response = client.get(f"{API_VERSION_PREFIX}/health/db", headers={"api_key": "key"})
+    return response
+
+
+def get_cache_health(client):
+    response = client.get(
+        f"{API_VERSION_PREFIX}/health/cache", headers={"api_key": "key"}
+    )
+    return response.json()
+
+
+def get_user_resources(
+    client,
+    uid: str,
+    resource: str,
+    role: str = "listener",
+    offset: Optional[str] = None,
+    limit: Optional[int] = 50,
+):
+    """Page of the songs, albums or playlists of the user"""
+    return get(client, f"/users/{uid}/{resource}/", uid, role, True, offset, limit)